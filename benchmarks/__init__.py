@@ -0,0 +1 @@
+"""Offline benchmarks for mochi, see run_benchmarks.py."""
@@ -0,0 +1,171 @@
+"""A local stand-in for the OpenAI completions API.
+
+It speaks enough of the API for the openai client (and so langchain) to work
+against it, with configurable latency, token rate and failure rate. Point the
+client at it with the OPENAI_API_BASE env var (see FakeOpenAIServer.api_base).
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+Responder = Callable[[str], str]
+
+
+def echo_responder(prompt: str) -> str:
+    """Respond with a fixed length answer (independent of the prompt)."""
+    del prompt
+    return " ".join(f"token{i}" for i in range(64))
+
+
+@dataclass
+class FakeBackendConfig:
+    """How the fake backend behaves."""
+    # Seconds before the first token (or the whole non streamed response).
+    latency: float = 0.0
+    # Streamed tokens per second, 0 streams as fast as possible.
+    tokens_per_second: float = 0.0
+    # Probability (0 to 1) of a request failing with a server error.
+    failure_rate: float = 0.0
+    responder: Responder = echo_responder
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeBackendStats:
+    """What the fake backend has served."""
+    requests: int = 0
+    failures: int = 0
+    tokens: int = 0
+    prompts: list[str] = field(default_factory=list)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeOpenAIServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        pass
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Serve a (possibly streamed) completion."""
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        prompt = request.get("prompt", "")
+        if isinstance(prompt, list):
+            prompt = "\n".join(prompt)
+
+        config = self.server.config
+        if not self.server.record_request(prompt):
+            self._send_json(500, {"error": {"message": "Fake failure"}})
+            return
+
+        time.sleep(config.latency)
+        # Keep the whitespace with the tokens, like the real API does.
+        text = config.responder(prompt)
+        tokens = [t for t in text.replace(" ", "\x00 ").split("\x00") if t]
+        self.server.record_tokens(len(tokens))
+
+        if request.get("stream"):
+            self._stream(tokens, request.get("model", "fake"))
+        else:
+            self._send_json(200, _completion(text, request.get("model",
+                                                               "fake")))
+
+    def _stream(self, tokens: list[str], model: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = (1 / self.server.config.tokens_per_second
+                 if self.server.config.tokens_per_second else 0)
+        for token in tokens:
+            chunk = _completion(token, model, finish_reason=None)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        # pylint: disable-next=attribute-defined-outside-init
+        self.close_connection = True
+
+    def _send_json(self, status: int, body: dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _completion(text: str,
+                model: str,
+                finish_reason: Optional[str] = "stop") -> dict[str, Any]:
+    return {
+        "id": "cmpl-fake",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "text": text,
+            "index": 0,
+            "logprobs": None,
+            "finish_reason": finish_reason
+        }],
+        "usage": {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        },
+    }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Serves fake completions from a background thread.
+
+    Use as a context manager, the server stops when leaving the context.
+    """
+    daemon_threads = True
+
+    def __init__(self, config: Optional[FakeBackendConfig] = None) -> None:
+        self.config = config or FakeBackendConfig()
+        self.stats = FakeBackendStats()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def api_base(self) -> str:
+        """The base url to configure the openai client with."""
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def record_request(self, prompt: str) -> bool:
+        """Record a request, returning False if it should fail."""
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.prompts.append(prompt)
+            if self._random.random() < self.config.failure_rate:
+                self.stats.failures += 1
+                return False
+        return True
+
+    def record_tokens(self, tokens: int) -> None:
+        """Record the number of tokens served."""
+        with self._lock:
+            self.stats.tokens += tokens
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,516 @@
+"""Offline benchmarks for mochi.
+
+Everything runs locally, the model calls go to a fake OpenAI compatible server
+(see fake_openai_server.py). Results are written as JSON so they can be compared
+between releases.
+
+Usage (from the repo root):
+    poetry run python -m benchmarks.run_benchmarks --output results.json
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import itertools
+import json
+import os
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+from unittest.mock import patch
+
+from benchmarks.fake_openai_server import FakeBackendConfig, FakeOpenAIServer
+from mochi_code.code import ProjectDetailsWithDependencies
+from mochi_code.code.code_index import update_code_index
+from mochi_code.code.mochi_config import (create_config,
+                                          get_project_details_path,
+                                          load_project_details,
+                                          search_mochi_config)
+
+_REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class BenchmarkResult:
+    """The samples of a single benchmark."""
+    name: str
+    unit: str
+    samples: list[float]
+    params: dict[str, Any] = field(default_factory=dict)
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Summarise the samples in a JSON serializable dict."""
+        ordered = sorted(self.samples)
+        p95_index = min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))
+        return {
+            "name": self.name,
+            "unit": self.unit,
+            "params": self.params,
+            "runs": len(ordered),
+            "mean": statistics.fmean(ordered),
+            "median": statistics.median(ordered),
+            "p95": ordered[p95_index],
+            "min": ordered[0],
+            "max": ordered[-1],
+            **self.extra,
+        }
+
+
+Benchmark = Callable[[int, bool], list[BenchmarkResult]]
+
+
+def _timed(func: Callable[[], Any], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+@contextlib.contextmanager
+def _fake_backend(config: FakeBackendConfig) -> Iterator[FakeOpenAIServer]:
+    """Run a fake backend and point the model clients at it."""
+    with FakeOpenAIServer(config) as server, \
+            patch.dict(os.environ, {"OPENAI_API_BASE": server.api_base,
+                                    "OPENAI_API_KEY": "sk-fake"}):
+        yield server
+
+
+@contextlib.contextmanager
+def _working_dir(path: pathlib.Path) -> Iterator[None]:
+    previous = pathlib.Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def bench_cli_cold_start(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Start the cli in a fresh interpreter (mochi --help)."""
+    del quick
+    env = {**os.environ, "PYTHONPATH": str(_REPO_ROOT), "MOCHI_NO_DAEMON": "1"}
+    command = [sys.executable, "-m", "mochi_code.mochi", "--help"]
+
+    def run() -> None:
+        subprocess.run(command, env=env, check=True, capture_output=True)
+
+    return [BenchmarkResult("cli_cold_start", "s", _timed(run, repeat))]
+
+
+def _search_repeatedly(start_path: pathlib.Path, root_path: pathlib.Path,
+                       calls: int, found: bool) -> None:
+    for _ in range(calls):
+        result = search_mochi_config(start_path, root_path)
+        assert (result is not None) == found
+
+
+def bench_search_mochi_config(repeat: int,
+                              quick: bool) -> list[BenchmarkResult]:
+    """Search the config from the bottom of deep directory trees."""
+    results = []
+    calls = 100 if quick else 1000
+    for depth in (10, 100):
+        with tempfile.TemporaryDirectory() as root_dir:
+            root_path = pathlib.Path(root_dir).resolve()
+            deepest_path = root_path.joinpath(*(f"d{i}" for i in range(depth)))
+            deepest_path.mkdir(parents=True)
+
+            search = functools.partial(_search_repeatedly, deepest_path,
+                                       root_path, calls)
+
+            search_time = _timed(functools.partial(search, False), repeat)
+            results.append(
+                BenchmarkResult("search_mochi_config_not_found", "s/call",
+                                [s / calls for s in search_time],
+                                {"depth": depth}))
+
+            (root_path / ".mochi").mkdir()
+            search_time = _timed(functools.partial(search, True), repeat)
+            results.append(
+                BenchmarkResult("search_mochi_config_found_at_root", "s/call",
+                                [s / calls for s in search_time],
+                                {"depth": depth}))
+    return results
+
+
+def bench_load_project_details(repeat: int,
+                               quick: bool) -> list[BenchmarkResult]:
+    """Load project details with large dependency lists."""
+    results = []
+    sizes = (100, 1000) if quick else (100, 1000, 10_000)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as root_dir:
+            details = ProjectDetailsWithDependencies(
+                language="python",
+                config_file="pyproject.toml",
+                package_manager="poetry",
+                dependencies=[f"dependency-{i}" for i in range(size)])
+            config_path = create_config(pathlib.Path(root_dir), details)
+            details_path = get_project_details_path(config_path)
+
+            samples = _timed(
+                functools.partial(load_project_details, details_path), repeat)
+            results.append(
+                BenchmarkResult("load_project_details", "s", samples,
+                                {"dependencies": size}))
+    return results
+
+
+def _init_responder(prompt: str) -> str:
+    """Answer the init prompts like a well behaved model."""
+    if "list of files" in prompt:
+        return ('{"language": "python", "config_file": "setup.cfg", ' +
+                '"package_manager": "pip"}')
+    return ", ".join(f"dependency-{i}" for i in range(50))
+
+
+def _make_synthetic_repo(root_path: pathlib.Path, files: int,
+                         known: bool) -> None:
+    """Create a repo with the files spread over a few folders."""
+    for i in range(files):
+        file_path = root_path / f"pkg{i % 10}" / f"module_{i}.py"
+        file_path.parent.mkdir(exist_ok=True)
+        file_path.write_text(f"VALUE = {i}\n", encoding="utf-8")
+
+    if known:
+        dependencies = "\n".join(f'dep-{i} = "^1.0"' for i in range(200))
+        (root_path / "pyproject.toml").write_text(
+            f"[tool.poetry.dependencies]\n{dependencies}\n", encoding="utf-8")
+        (root_path / "poetry.lock").touch()
+    else:
+        (root_path / "setup.cfg").write_text("[metadata]\nname = app\n",
+                                             encoding="utf-8")
+
+
+def _init_from_scratch(root_path: pathlib.Path) -> None:
+    """Run init quietly, removing the created config afterwards."""
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.commands.init import init
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init(root_path)
+    shutil.rmtree(root_path / ".mochi")
+
+
+def bench_init(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Run mochi init on synthetic repos, detected locally or by the model."""
+    results = []
+    sizes = (10, 1000) if quick else (10, 1000, 10_000)
+    config = FakeBackendConfig(latency=0.05, responder=_init_responder)
+    with _fake_backend(config) as server:
+        for files in sizes:
+            for known in (True, False):
+                with tempfile.TemporaryDirectory() as root_dir:
+                    root_path = pathlib.Path(root_dir).resolve()
+                    _make_synthetic_repo(root_path, files, known)
+                    requests_before = server.stats.requests
+
+                    with _working_dir(root_path):
+                        samples = _timed(
+                            functools.partial(_init_from_scratch, root_path),
+                            repeat)
+
+                    model_requests = server.stats.requests - requests_before
+                    params = {
+                        "files": files,
+                        "detection": "local" if known else "model"
+                    }
+                    extra = {"model_requests_per_run": model_requests / repeat}
+                    results.append(
+                        BenchmarkResult("init", "s", samples, params, extra))
+    return results
+
+
+def _ask_once(project_prompt: str) -> tuple[float, float, float]:
+    """Ask a question, returning the total time, time to first token and
+    tokens per second of the stream."""
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.commands.ask import ProjectContext, ask
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.prompts.prompt_assembly import text_section
+
+    token_times: list[float] = []
+    start = time.perf_counter()
+    ask("How do I run the tests?",
+        use_cache=False,
+        project_context=ProjectContext(
+            (text_section("project", project_prompt),), None),
+        on_token=lambda _: token_times.append(time.perf_counter()))
+    end = time.perf_counter()
+
+    streaming_time = end - token_times[0]
+    return (end - start, token_times[0] - start,
+            len(token_times) / streaming_time)
+
+
+def bench_ask_streaming(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Stream ask answers, measuring time to first token and throughput."""
+    results = []
+    rates = (0.0, 200.0) if quick else (0.0, 200.0, 1000.0)
+    project_prompt = "The user is working on a python project."
+    for tokens_per_second in rates:
+        config = FakeBackendConfig(latency=0.05,
+                                   tokens_per_second=tokens_per_second)
+        with _fake_backend(config):
+            samples = [_ask_once(project_prompt) for _ in range(repeat)]
+        totals, first_tokens, throughputs = (list(s) for s in zip(*samples))
+
+        params = {"tokens_per_second": tokens_per_second, "latency": 0.05}
+        results.extend([
+            BenchmarkResult("ask_total", "s", totals, params),
+            BenchmarkResult("ask_time_to_first_token", "s", first_tokens,
+                            params),
+            BenchmarkResult("ask_stream_throughput", "tokens/s", throughputs,
+                            params),
+        ])
+    return results
+
+
+def _ask_batch(questions: int, concurrency: int,
+               requests_per_minute: Optional[int]) -> None:
+    """Answer a batch of questions, discarding the answers."""
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    from mochi_code.commands.ask import ProjectContext
+    from mochi_code.commands.ask_batch import (BatchItem, BatchOptions,
+                                               ask_batch)
+    from mochi_code.rate_limits import RateLimiter
+
+    items = [
+        BatchItem(i, f"What does module {i} do?") for i in range(questions)
+    ]
+    asyncio.run(
+        ask_batch(items,
+                  lambda _: None,
+                  BatchOptions(concurrency=concurrency),
+                  RateLimiter(requests_per_minute),
+                  project_context=ProjectContext((), None)))
+
+
+def bench_ask_batch(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Answer a batch of questions, measuring the throughput at different
+    concurrency levels (and under a rate limit)."""
+    questions = 16 if quick else 64
+    runs: list[tuple[int, Optional[int]]] = [(1, None), (4, None), (16, None)]
+    if not quick:
+        runs.append((16, 300))
+
+    results = []
+    config = FakeBackendConfig(latency=0.05, tokens_per_second=1000.0)
+    with _fake_backend(config):
+        for concurrency, requests_per_minute in runs:
+            run = functools.partial(_ask_batch, questions, concurrency,
+                                    requests_per_minute)
+            samples = _timed(run, repeat)
+            results.append(
+                BenchmarkResult(
+                    "ask_batch", "questions/s",
+                    [questions / s for s in samples], {
+                        "questions": questions,
+                        "concurrency": concurrency,
+                        "requests_per_minute": requests_per_minute
+                    }))
+    return results
+
+
+_CODE_WORDS = ("user", "project", "config", "cache", "request", "response",
+               "token", "stream", "index", "file", "path", "error", "retry",
+               "model", "prompt", "server", "client", "session", "chunk",
+               "query", "result", "value", "parse", "load", "save", "build")
+
+_SEARCH_QUERIES = ("How do I retry a failed request?",
+                   "where is the response cache saved",
+                   "parse_config_file errors", "stream tokens to the client")
+
+
+def _make_synthetic_code(root_path: pathlib.Path, lines: int) -> None:
+    """Create python files totalling the number of lines."""
+    rng = random.Random(0)
+    lines_per_file = 500
+    for i in range(lines // lines_per_file):
+        file_lines = []
+        for _ in range(lines_per_file // 5):
+            name = "_".join(rng.sample(_CODE_WORDS, 3))
+            args = ", ".join(rng.sample(_CODE_WORDS, 2))
+            file_lines.extend([
+                f"def {name}({args}):",
+                f"    {rng.choice(_CODE_WORDS)} = {args.replace(', ', ' + ')}",
+                f"    # {' '.join(rng.sample(_CODE_WORDS, 6))}",
+                f"    return {rng.choice(_CODE_WORDS)}", ""
+            ])
+        file_path = root_path / f"pkg{i % 10}" / f"module_{i}.py"
+        file_path.parent.mkdir(exist_ok=True)
+        file_path.write_text("\n".join(file_lines), encoding="utf-8")
+
+
+def _make_synthetic_project(root_path: pathlib.Path,
+                            lines: int) -> pathlib.Path:
+    """Create an initialized and indexed project of synthetic code.
+
+    Returns:
+        pathlib.Path: The mochi config dir of the project.
+    """
+    _make_synthetic_code(root_path, lines)
+    config_path = pathlib.Path(
+        create_config(
+            root_path,
+            ProjectDetailsWithDependencies(language="python",
+                                           config_file="setup.py",
+                                           package_manager="pip",
+                                           dependencies=[])))
+    update_code_index(config_path)
+    return config_path
+
+
+def bench_lexical_search(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Build the lexical index of synthetic code and search it."""
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.code.lexical_index import (build_lexical_index,
+                                               load_lexical_index)
+
+    results = []
+    sizes = (10_000,) if quick else (10_000, 100_000, 500_000)
+    for lines in sizes:
+        with tempfile.TemporaryDirectory() as root_dir:
+            config_path = _make_synthetic_project(
+                pathlib.Path(root_dir).resolve(), lines)
+
+            build = functools.partial(build_lexical_index, config_path)
+            results.append(
+                BenchmarkResult("lexical_index_build", "s",
+                                _timed(build, repeat), {"lines": lines}))
+
+            index = load_lexical_index(config_path)
+            assert index is not None
+            search_all = functools.partial(_search_all, index.search)
+            samples = _timed(search_all, repeat)
+            results.append(
+                BenchmarkResult("lexical_search", "s/query",
+                                [s / len(_SEARCH_QUERIES) for s in samples],
+                                {"lines": lines}))
+    return results
+
+
+def bench_vector_search(repeat: int, quick: bool) -> list[BenchmarkResult]:
+    """Update the vector store of synthetic code and search it, exhaustively
+    and with IVF, with float32 and int8 vectors."""
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.code.vector_store import (load_vector_store,
+                                              update_vector_store)
+
+    results = []
+    sizes = (10_000,) if quick else (10_000, 100_000, 500_000)
+    for lines in sizes:
+        with tempfile.TemporaryDirectory() as root_dir:
+            config_path = _make_synthetic_project(
+                pathlib.Path(root_dir).resolve(), lines)
+
+            for quantized, ivf in itertools.product((False, True), repeat=2):
+                params = {"lines": lines, "quantized": quantized, "ivf": ivf}
+                # Changing the quantization embeds everything again.
+                start = time.perf_counter()
+                update_vector_store(config_path,
+                                    quantized=quantized,
+                                    ivf_threshold=0 if ivf else 2**31)
+                results.append(
+                    BenchmarkResult("vector_store_update", "s",
+                                    [time.perf_counter() - start], params))
+
+                store = load_vector_store(config_path)
+                assert store is not None
+                samples = _timed(functools.partial(_search_all, store.search),
+                                 repeat)
+                results.append(
+                    BenchmarkResult("vector_search", "s/query",
+                                    [s / len(_SEARCH_QUERIES) for s in samples],
+                                    params))
+    return results
+
+
+def _search_all(search: Callable[[str], Any]) -> None:
+    for query in _SEARCH_QUERIES:
+        search(query)
+
+
+BENCHMARKS: dict[str, Benchmark] = {
+    "cli_cold_start": bench_cli_cold_start,
+    "search_mochi_config": bench_search_mochi_config,
+    "load_project_details": bench_load_project_details,
+    "init": bench_init,
+    "ask_streaming": bench_ask_streaming,
+    "ask_batch": bench_ask_batch,
+    "lexical_search": bench_lexical_search,
+    "vector_search": bench_vector_search,
+}
+
+
+def run_benchmarks(names: list[str], repeat: int,
+                   quick: bool) -> dict[str, Any]:
+    """Run the selected benchmarks.
+
+    Args:
+        names (list[str]): The names of the benchmarks to run.
+        repeat (int): How many samples to take per benchmark.
+        quick (bool): Use smaller inputs, for smoke testing.
+
+    Returns:
+        dict[str, Any]: The JSON serializable report.
+    """
+    results: list[dict[str, Any]] = []
+    for name in names:
+        print(f"⏱️  {name}...", file=sys.stderr)
+        results.extend(r.to_dict() for r in BENCHMARKS[name](repeat, quick))
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "quick": quick,
+        "results": results,
+    }
+
+
+def main() -> None:
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output",
+                        type=pathlib.Path,
+                        help="Where to write the JSON report (default stdout).")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="Samples per benchmark.")
+    parser.add_argument("--quick",
+                        action="store_true",
+                        help="Use smaller inputs.")
+    parser.add_argument("--only",
+                        nargs="+",
+                        choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS),
+                        help="Only run these benchmarks.")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only, args.repeat, args.quick)
+    serialized = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(serialized + "\n", encoding="utf-8")
+    else:
+        print(serialized)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""The model backends answering the prompts.
+
+Backends are registered by name (see register_backend) and selected by the
+config of the project (see load_backend_config). The built-in backends are:
+- "openai": the OpenAI completions API.
+- "local": a local server with an OpenAI compatible API (e.g. llama.cpp or
+  vLLM), no API key needed.
+- "fake": canned answers, to try mochi offline.
+
+Backends are created once per process and config (see get_backend), and the
+HTTP backends share a pooled session: connections are set up once and reused by
+all the requests, whatever the command or thread.
+"""
+
+import json
+import os
+import pathlib
+import threading
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Optional, Protocol, TypeVar
+
+from mochi_code.code.mochi_config import get_backend_config_path
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.resilience import get_request_timeout
+
+# Override the config of the project.
+BACKEND_ENV_VAR = "MOCHI_BACKEND"
+MODEL_ENV_VAR = "MOCHI_MODEL"
+TEMPERATURE_ENV_VAR = "MOCHI_TEMPERATURE"
+TIMEOUT_ENV_VAR = "MOCHI_TIMEOUT"
+API_BASE_ENV_VAR = "MOCHI_API_BASE"
+# The API key, OPENAI_API_KEY (from the env or the keys file) otherwise.
+API_KEY_ENV_VAR = "MOCHI_API_KEY"
+OPENAI_API_KEY_NAME = "OPENAI_API_KEY"
+KEYS_FILE_NAME = ".keys"
+
+DEFAULT_BACKEND_NAME = "openai"
+DEFAULT_MODEL = "text-davinci-003"
+# Seconds per request, shortened to fit the deadline of the command.
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_TOKENS = 256
+LOCAL_API_BASE = "http://localhost:8000/v1"
+
+_POOL_SIZE = 8
+
+TokenCallback = Callable[[str], None]
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """Which model answers, and how."""
+    backend: str = DEFAULT_BACKEND_NAME
+    model: str = DEFAULT_MODEL
+    # Overrides the temperature picked by each command, if set.
+    temperature: Optional[float] = None
+    timeout: float = DEFAULT_TIMEOUT
+    # The url of the API, the default of the backend if None.
+    api_base: Optional[str] = None
+
+    @property
+    def cache_name(self) -> str:
+        """The name the cached responses of the model are keyed by."""
+        if self.backend == DEFAULT_BACKEND_NAME:
+            return self.model
+        return f"{self.backend}/{self.model}"
+
+    def get_temperature(self, default: float) -> float:
+        """Get the temperature of a request.
+
+        Args:
+            default (float): The temperature picked by the command.
+
+        Returns:
+            float: The configured temperature, or the default.
+        """
+        return default if self.temperature is None else self.temperature
+
+
+class ModelBackend(Protocol):  # pylint: disable=too-few-public-methods
+    """Completes prompts with a model."""
+    config: BackendConfig
+
+    def complete(self,
+                 prompt: str,
+                 temperature: float,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 on_token: Optional[TokenCallback] = None) -> str:
+        """Complete the prompt.
+
+        Args:
+            prompt (str): The prompt.
+            temperature (float): The sampling temperature.
+            max_tokens (int): The maximum tokens of the completion.
+            on_token (Optional[TokenCallback]): Receives the completion as it
+            is streamed, not streamed if None.
+
+        Returns:
+            str: The completion.
+        """
+
+
+BackendFactory = Callable[[BackendConfig], ModelBackend]
+_FactoryT = TypeVar("_FactoryT", bound=BackendFactory)
+
+_BACKENDS: dict[str, BackendFactory] = {}
+_instances: dict[BackendConfig, ModelBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(name: str) -> Callable[[_FactoryT], _FactoryT]:
+    """Register a backend factory under a name.
+
+    Args:
+        name (str): The name the backend is selected by in the config.
+
+    Returns:
+        Callable[[_FactoryT], _FactoryT]: The decorator.
+    """
+
+    def decorator(factory: _FactoryT) -> _FactoryT:
+        _BACKENDS[name] = factory
+        return factory
+
+    return decorator
+
+
+def get_backend(config: Optional[BackendConfig] = None) -> ModelBackend:
+    """Get the backend of the config, created once per process.
+
+    Args:
+        config (Optional[BackendConfig]): The config, read from the env if
+        None.
+
+    Returns:
+        ModelBackend: The (shared) backend.
+    """
+    if config is None:
+        config = load_backend_config()
+    with _instances_lock:
+        backend = _instances.get(config)
+        if backend is None:
+            factory = _BACKENDS.get(config.backend)
+            if factory is None:
+                raise MochiCannotContinue(
+                    f"🚫 Unknown model backend '{config.backend}', pick one " +
+                    f"of: {', '.join(sorted(_BACKENDS))}.")
+            backend = _instances[config] = factory(config)
+        return backend
+
+
+def load_backend_config(
+        config_path: Optional[pathlib.PurePath] = None) -> BackendConfig:
+    """Load the backend config of a project.
+
+    The values of the project's backend.json are overridden by the MOCHI_*
+    env vars (e.g. MOCHI_MODEL), and the defaults fill in the rest.
+
+    Args:
+        config_path (Optional[pathlib.PurePath]): The mochi config dir, only
+        the env vars are read if None.
+
+    Returns:
+        BackendConfig: The config.
+    """
+    values: dict[str, Any] = {}
+    if config_path is not None:
+        values.update(_read_config_file(get_backend_config_path(config_path)))
+
+    for name, env_var in [("backend", BACKEND_ENV_VAR),
+                          ("model", MODEL_ENV_VAR),
+                          ("temperature", TEMPERATURE_ENV_VAR),
+                          ("timeout", TIMEOUT_ENV_VAR),
+                          ("api_base", API_BASE_ENV_VAR)]:
+        if os.environ.get(env_var):
+            values[name] = os.environ[env_var]
+
+    backend = str(values.get("backend", DEFAULT_BACKEND_NAME))
+    if "api_base" not in values and backend == DEFAULT_BACKEND_NAME:
+        # The variable of the openai client.
+        values["api_base"] = os.environ.get("OPENAI_API_BASE")
+    try:
+        return BackendConfig(
+            backend=backend,
+            model=str(values.get("model", DEFAULT_MODEL)),
+            temperature=_optional_float(values.get("temperature")),
+            timeout=float(values.get("timeout", DEFAULT_TIMEOUT)),
+            api_base=values.get("api_base") or None)
+    except (TypeError, ValueError) as error:
+        raise MochiCannotContinue(
+            f"🚫 Invalid model backend config: {error}") from error
+
+
+def _read_config_file(path: pathlib.PurePath) -> dict[str, Any]:
+    """Read the backend config file, empty if there is none."""
+    try:
+        with open(path, encoding="utf-8") as config_file:
+            values = json.load(config_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        raise MochiCannotContinue(
+            f"🚫 Cannot read the model backend config '{path}': {error}"
+        ) from error
+
+    known = {field.name for field in fields(BackendConfig)}
+    if not isinstance(values, dict) or not set(values) <= known:
+        raise MochiCannotContinue(
+            f"🚫 Invalid model backend config '{path}', expected an object " +
+            f"with some of: {', '.join(sorted(known))}.")
+    return values
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def get_api_key(required: bool = True) -> Optional[str]:
+    """Get the API key of the model provider.
+
+    Args:
+        required (bool): Raise if there is no key, rather than returning None.
+
+    Returns:
+        Optional[str]: The key from MOCHI_API_KEY, or OPENAI_API_KEY (from the
+        env or the .keys file).
+    """
+    key = (os.environ.get(API_KEY_ENV_VAR) or
+           os.environ.get(OPENAI_API_KEY_NAME) or
+           _read_keys_file().get(OPENAI_API_KEY_NAME))
+    if key is None and required:
+        raise MochiCannotContinue(
+            f"🚫 Missing the API key, set {OPENAI_API_KEY_NAME} in the " +
+            f"{KEYS_FILE_NAME} file (or the env).")
+    return key
+
+
+def _read_keys_file() -> dict[str, Optional[str]]:
+    # dotenv is slow to import, only pay for it when a key is needed.
+    # pylint: disable-next=import-outside-toplevel
+    from dotenv import dotenv_values
+    return dotenv_values(KEYS_FILE_NAME)
+
+
+_session_lock = threading.Lock()
+
+
+def install_pooled_session() -> None:
+    """Share a pooled HTTP session between all the openai client requests.
+
+    The openai client defaults to a session per thread, so concurrent requests
+    (batches, the daemon) would each set up their own connections.
+    """
+    # pylint: disable=import-outside-toplevel
+    import openai
+    import requests
+
+    with _session_lock:
+        if openai.requestssession is not None:
+            return
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=_POOL_SIZE,
+                                                pool_maxsize=_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        openai.requestssession = session
+
+
+@register_backend(DEFAULT_BACKEND_NAME)
+class OpenAIBackend:  # pylint: disable=too-few-public-methods
+    """Completes prompts with the OpenAI (compatible) completions API."""
+    default_api_base: Optional[str] = None
+    api_key_required = True
+
+    def __init__(self, config: BackendConfig) -> None:
+        """Create the backend, with the shared HTTP session.
+
+        Args:
+            config (BackendConfig): The config of the backend.
+        """
+        self.config = config
+        self._api_base = config.api_base or self.default_api_base
+        self._api_key = get_api_key(self.api_key_required) or "none"
+        install_pooled_session()
+
+    def complete(self,
+                 prompt: str,
+                 temperature: float,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 on_token: Optional[TokenCallback] = None) -> str:
+        """Complete the prompt (see ModelBackend.complete)."""
+        # pylint: disable-next=import-outside-toplevel
+        import openai
+
+        params = {
+            "model": self.config.model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "api_key": self._api_key,
+            "api_base": self._api_base,
+            "request_timeout": get_request_timeout(self.config.timeout),
+        }
+        if on_token is None:
+            response: Any = openai.Completion.create(**params)
+            return response["choices"][0]["text"]
+
+        parts = []
+        for chunk in openai.Completion.create(stream=True, **params):
+            text = chunk["choices"][0]["text"] if chunk["choices"] else ""
+            if text:
+                parts.append(text)
+                on_token(text)
+        return "".join(parts)
+
+
+@register_backend("local")
+class LocalBackend(OpenAIBackend):  # pylint: disable=too-few-public-methods
+    """Completes prompts with a local server, with an OpenAI compatible API."""
+    default_api_base = LOCAL_API_BASE
+    api_key_required = False
+
+
+@register_backend("fake")
+class FakeBackend:  # pylint: disable=too-few-public-methods
+    """Answers every prompt the same way, without any model."""
+
+    def __init__(self,
+                 config: BackendConfig,
+                 responder: Optional[Callable[[str], str]] = None) -> None:
+        """Create the backend.
+
+        Args:
+            config (BackendConfig): The config of the backend.
+            responder (Optional[Callable[[str], str]]): Answers a prompt, with
+            a canned answer by default.
+        """
+        self.config = config
+        self._responder = responder or self._canned_answer
+
+    def complete(self,
+                 prompt: str,
+                 temperature: float,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 on_token: Optional[TokenCallback] = None) -> str:
+        """Complete the prompt (see ModelBackend.complete)."""
+        del temperature, max_tokens
+        response = self._responder(prompt)
+        if on_token is not None:
+            # Streamed a word at a time, whitespace included.
+            for word in response.replace(" ", "\x00 ").split("\x00"):
+                if word:
+                    on_token(word)
+        return response
+
+    def _canned_answer(self, prompt: str) -> str:
+        del prompt
+        return (f"This is a fake answer from the '{self.config.model}' " +
+                "model, set MOCHI_BACKEND to use a real one.")
@@ -0,0 +1,182 @@
+"""Incremental index of the project files, stored in the mochi config dir.
+
+The index keeps the size, modification time and content hash of every file that
+isn't ignored. Updating it only hashes the files whose size or modification
+time changed, so the cost is proportional to the change rather than to the size
+of the project.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import pathlib
+from dataclasses import dataclass, field
+from typing import Optional
+
+from mochi_code.code.gitignore import walk_files
+from mochi_code.code.mochi_config import (get_code_index_path,
+                                          write_file_atomically)
+from mochi_code.tracing import annotate, traced
+
+CODE_INDEX_VERSION = 1
+
+# Files larger than this are not indexed (e.g. data files or binaries).
+DEFAULT_MAX_FILE_SIZE = 2 * 1024 * 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    """The indexed state of a file."""
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+# The indexed files, by posix path relative to the project root.
+CodeIndex = dict[str, FileEntry]
+
+
+@dataclass
+class IndexUpdate:
+    """The changes found while updating the index."""
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> list[str]:
+        """The files that were added or modified."""
+        return self.added + self.modified
+
+
+def hash_file(file_path: pathlib.Path) -> str:
+    """Hash the content of a file.
+
+    Args:
+        file_path (pathlib.Path): The file to hash.
+
+    Returns:
+        str: The hex sha256 digest of the content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_code_index(index_path: pathlib.Path) -> CodeIndex:
+    """Load the index from the mochi config.
+
+    Args:
+        index_path (pathlib.Path): The path to the index file.
+
+    Returns:
+        CodeIndex: The indexed files by relative posix path, empty if
+        there is no index (or it was written by an incompatible version).
+    """
+    try:
+        with open(index_path, encoding="utf-8") as index_file:
+            content = json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+    if content.get("version") != CODE_INDEX_VERSION:
+        return {}
+    return {path: FileEntry(*entry) for path, entry in content["files"].items()}
+
+
+def save_code_index(index_path: pathlib.Path, entries: CodeIndex) -> None:
+    """Save the index to the mochi config, replacing the previous one.
+
+    Args:
+        index_path (pathlib.Path): The path to the index file.
+        entries (CodeIndex): The indexed files by relative path.
+    """
+    content = {
+        "version": CODE_INDEX_VERSION,
+        "files": {
+            path: [entry.size, entry.mtime_ns, entry.digest]
+            for path, entry in sorted(entries.items())
+        },
+    }
+    # Readers never see partial indexes.
+    write_file_atomically(index_path, json.dumps(content,
+                                                 separators=(",", ":")))
+
+
+@traced("index.update")
+def update_code_index(
+        config_path: pathlib.Path,
+        max_workers: Optional[int] = None,
+        max_file_size: int = DEFAULT_MAX_FILE_SIZE) -> IndexUpdate:
+    """Update the index of the project owning the mochi config.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir (the
+        project root is its parent).
+        max_workers (Optional[int]): The number of threads hashing files.
+        max_file_size (int): Files larger than this are not indexed.
+
+    Returns:
+        IndexUpdate: The changes found since the last update.
+    """
+    project_path = config_path.parent
+    index_path = pathlib.Path(get_code_index_path(config_path))
+    previous = load_code_index(index_path)
+
+    update = IndexUpdate()
+    entries: CodeIndex = {}
+    to_hash: list[tuple[str, os.stat_result]] = []
+
+    for relative_path, stat in walk_files(project_path):
+        if stat.st_size > max_file_size:
+            continue
+        entry = previous.get(relative_path)
+        if (entry is not None and entry.size == stat.st_size and
+                entry.mtime_ns == stat.st_mtime_ns):
+            entries[relative_path] = entry
+            update.unchanged += 1
+        else:
+            to_hash.append((relative_path, stat))
+
+    # Hashing is mostly IO (and hashlib releases the GIL), threads are enough.
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        digests = executor.map(
+            lambda item: _try_hash_file(project_path / item[0]), to_hash)
+        for (relative_path, stat), digest in zip(to_hash, digests):
+            if digest is None:
+                continue
+            entries[relative_path] = FileEntry(stat.st_size, stat.st_mtime_ns,
+                                               digest)
+            entry = previous.get(relative_path)
+            if entry is None:
+                update.added.append(relative_path)
+            elif entry.digest != digest:
+                update.modified.append(relative_path)
+            else:
+                # Touched, but the content is the same.
+                update.unchanged += 1
+
+    update.removed = sorted(set(previous) - set(entries))
+
+    if to_hash or update.removed or not index_path.exists():
+        save_code_index(index_path, entries)
+
+    annotate(files=len(entries),
+             hashed=len(to_hash),
+             changed=len(update.changed),
+             removed=len(update.removed))
+    return update
+
+
+def _try_hash_file(file_path: pathlib.Path) -> Optional[str]:
+    """Hash the file, or return None if it can't be read (e.g. removed)."""
+    try:
+        return hash_file(file_path)
+    except OSError:
+        return None
@@ -0,0 +1,419 @@
+"""The building blocks shared by the code search indexes.
+
+The indexes split the project files in chunks of lines, and save each build as
+a new generation of numpy arrays (memory mapped when loaded) with a metadata
+file pointing to the current generation. Their tables of strings (e.g. terms
+or paths) and chunks are stored as arrays too, so loading an index only reads
+its small metadata file, whatever the size of the project.
+"""
+
+import json
+import pathlib
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Protocol, Sequence
+
+import numpy as np
+
+from mochi_code.code.mochi_config import write_file_atomically
+
+DEFAULT_CHUNK_LINES = 40
+
+INDEX_META_FILE_NAME = "index.json"
+
+# Generated or minified files only add noise to the results.
+_SKIPPED_SUFFIXES = (".lock", "-lock.json", ".min.js", ".min.css", ".map",
+                     ".svg")
+
+_BINARY_SNIFF_SIZE = 8192
+
+# The usual constant of reciprocal rank fusion.
+_RRF_K = 60
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+@dataclass(frozen=True)
+class CodeChunk:
+    """A range of lines in a project file."""
+    path: str
+    # 1-based, inclusive.
+    start_line: int
+    end_line: int
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """A chunk matching a query."""
+    chunk: CodeChunk
+    score: float
+
+
+class CodeSearchIndex(Protocol):  # pylint: disable=too-few-public-methods
+    """An index finding the chunks of code relevant to a query."""
+    project_path: pathlib.Path
+
+    def search(self, query: str, top_k: int = 5) -> list[SearchResult]:
+        """Find the chunks most relevant to the query, best first."""
+
+
+class StringTable:
+    """Strings stored as flat arrays, e.g. memory mapped from an index.
+
+    The utf-8 encoded strings are concatenated in a byte array, with the offset
+    of each one (and the end of the last one) in another, see pack_strings.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        """Create the table from its arrays.
+
+        Args:
+            data (np.ndarray): The concatenated strings (uint8).
+            offsets (np.ndarray): The start of each string and the end of the
+            last one (int64).
+        """
+        self._data = data
+        self._offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray],
+                    name: str) -> "StringTable":
+        """Get a table from the arrays of an index.
+
+        Args:
+            arrays (dict[str, np.ndarray]): The arrays, see pack_strings.
+            name (str): The name the table was packed with.
+
+        Returns:
+            StringTable: The table.
+        """
+        return cls(arrays[f"{name}_data"], arrays[f"{name}_offsets"])
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self._get_bytes(index).decode("utf-8")
+
+    def find(self, value: str) -> Optional[int]:
+        """Find a string in the table, by binary search.
+
+        Only the (log n) strings compared with are read, but the table must be
+        sorted (see pack_strings).
+
+        Args:
+            value (str): The string to find.
+
+        Returns:
+            Optional[int]: The index of the string, or None if it isn't in the
+            table.
+        """
+        # The order of utf-8 bytes is the order of the code points.
+        target = value.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._get_bytes(low) == target:
+            return low
+        return None
+
+    def _get_bytes(self, index: int) -> bytes:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("String table index out of range.")
+        start, end = self._offsets[index:index + 2]
+        return self._data[int(start):int(end)].tobytes()
+
+
+def pack_strings(name: str, strings: Sequence[str]) -> dict[str, np.ndarray]:
+    """Pack the strings as the arrays of a StringTable.
+
+    Args:
+        name (str): The name of the table, prefixing its arrays.
+        strings (Sequence[str]): The strings, sorted if they are to be found
+        with StringTable.find.
+
+    Returns:
+        dict[str, np.ndarray]: The arrays of the table.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return {
+        f"{name}_data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        f"{name}_offsets": offsets,
+    }
+
+
+class ChunkTable:
+    """The chunks of an index, stored as flat arrays (see pack_chunks)."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        """Create the table from the arrays of an index.
+
+        Args:
+            arrays (dict[str, np.ndarray]): The arrays, see pack_chunks.
+        """
+        self.paths = StringTable.from_arrays(arrays, "paths")
+        self._path_ids = arrays["chunk_path_ids"]
+        self._lines = arrays["chunk_lines"]
+
+    def __len__(self) -> int:
+        return len(self._path_ids)
+
+    def __getitem__(self, index: int) -> CodeChunk:
+        start_line, end_line = self._lines[index]
+        return CodeChunk(self.paths[int(self._path_ids[index])],
+                         int(start_line), int(end_line))
+
+
+def pack_chunks(chunks: Sequence[CodeChunk],
+                paths: Optional[Sequence[str]] = None) -> dict[str, np.ndarray]:
+    """Pack the chunks as the arrays of a ChunkTable.
+
+    Args:
+        chunks (Sequence[CodeChunk]): The chunks, by id.
+        paths (Optional[Sequence[str]]): The paths of the table, including the
+        paths of the chunks. The sorted paths of the chunks by default.
+
+    Returns:
+        dict[str, np.ndarray]: The arrays of the table.
+    """
+    if paths is None:
+        paths = sorted({chunk.path for chunk in chunks})
+    path_ids = {path: path_id for path_id, path in enumerate(paths)}
+    return {
+        **pack_strings("paths", paths),
+        "chunk_path_ids":
+            np.array([path_ids[chunk.path] for chunk in chunks],
+                     dtype=np.int32),
+        "chunk_lines":
+            np.array([[chunk.start_line, chunk.end_line] for chunk in chunks],
+                     dtype=np.int32).reshape(-1, 2),
+    }
+
+
+def tokenize(text: str) -> list[str]:
+    """Split the text in lowercase search terms.
+
+    Identifiers are kept whole and also split in their camelCase or snake_case
+    parts, so both "get_project_prompt" and "project prompt" find them.
+
+    Args:
+        text (str): The code or query to tokenize.
+
+    Returns:
+        list[str]: The terms, in order and with repetitions.
+    """
+    terms = []
+    for word in _WORD_RE.findall(text):
+        if len(word) > 1:
+            terms.append(word.lower())
+        parts = _SUBWORD_RE.findall(word)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts if len(part) > 1)
+    return terms
+
+
+def read_text_lines(file_path: pathlib.Path) -> list[str]:
+    """Read the lines of a text file.
+
+    Args:
+        file_path (pathlib.Path): The file to read.
+
+    Returns:
+        list[str]: The lines (with their line endings), or no lines if the file
+        is binary or can't be read.
+    """
+    try:
+        content = file_path.read_bytes()
+    except OSError:
+        return []
+    if b"\0" in content[:_BINARY_SNIFF_SIZE]:
+        return []
+    return content.decode("utf-8", errors="replace").splitlines(keepends=True)
+
+
+def iter_file_chunks(
+        project_path: pathlib.Path,
+        relative_path: str,
+        chunk_lines: int = DEFAULT_CHUNK_LINES
+) -> Iterator[tuple[CodeChunk, str]]:
+    """Split a project file in chunks of lines.
+
+    Args:
+        project_path (pathlib.Path): The root of the project.
+        relative_path (str): The posix path of the file, relative to the root.
+        chunk_lines (int): The number of lines per chunk.
+
+    Yields:
+        tuple[CodeChunk, str]: Each chunk with its content (nothing for
+        generated, binary or unreadable files).
+    """
+    if relative_path.endswith(_SKIPPED_SUFFIXES):
+        return
+    lines = read_text_lines(project_path / relative_path)
+    for start in range(0, len(lines), chunk_lines):
+        end = min(start + chunk_lines, len(lines))
+        yield (CodeChunk(relative_path, start + 1,
+                         end), "".join(lines[start:end]))
+
+
+def read_chunk(project_path: pathlib.Path, chunk: CodeChunk) -> Optional[str]:
+    """Read the current content of a chunk.
+
+    Args:
+        project_path (pathlib.Path): The root of the project.
+        chunk (CodeChunk): The chunk to read.
+
+    Returns:
+        Optional[str]: The lines of the chunk, or None if the file can't be read
+        anymore.
+    """
+    lines = read_text_lines(project_path / chunk.path)
+    if not lines:
+        return None
+    return "".join(lines[chunk.start_line - 1:chunk.end_line])
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Get the indices of the highest positive scores, highest first.
+
+    Args:
+        scores (np.ndarray): The scores to rank.
+        top_k (int): The maximum number of indices.
+
+    Returns:
+        np.ndarray: The indices of the best scores.
+    """
+    top_k = min(top_k, int(np.count_nonzero(scores > 0)))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def search_all(indexes: Sequence[CodeSearchIndex], query: str,
+               top_k: int) -> list[SearchResult]:
+    """Search several indexes, fusing the rankings of their results.
+
+    The scores of different indexes aren't comparable, so results are ranked
+    by reciprocal rank fusion (the fused score replaces the original one).
+
+    Args:
+        indexes (Sequence[CodeSearchIndex]): The indexes to search.
+        query (str): The user query.
+        top_k (int): The maximum number of results.
+
+    Returns:
+        list[SearchResult]: The best matches, best first.
+    """
+    if len(indexes) == 1:
+        return indexes[0].search(query, top_k)
+
+    scores: dict[CodeChunk, float] = {}
+    for index in indexes:
+        for rank, result in enumerate(index.search(query, top_k)):
+            scores[result.chunk] = (scores.get(result.chunk, 0.0) + 1 /
+                                    (_RRF_K + rank + 1))
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [SearchResult(chunk, score) for chunk, score in ranked[:top_k]]
+
+
+def load_index_generation(
+        index_path: pathlib.Path,
+        version: int) -> Optional[tuple[dict[str, Any], dict[str, np.ndarray]]]:
+    """Load the current generation of an index, memory mapping its arrays.
+
+    Args:
+        index_path (pathlib.Path): The directory of the index.
+        version (int): The version of the index format to accept.
+
+    Returns:
+        Optional[tuple[dict[str, Any], dict[str, np.ndarray]]]: The metadata
+        and arrays by name, or None if there is no index (or it was written by
+        an incompatible version).
+    """
+    try:
+        with open(index_path / INDEX_META_FILE_NAME,
+                  encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != version:
+            return None
+        arrays = {
+            name:
+                np.load(index_path / f"{meta['generation']}.{name}.npy",
+                        mmap_mode="r") for name in meta["arrays"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta, arrays
+
+
+def new_generation_path(index_path: pathlib.Path, generation: str,
+                        name: str) -> pathlib.Path:
+    """Get the path of an array of a (new) generation of an index.
+
+    Args:
+        index_path (pathlib.Path): The directory of the index.
+        generation (str): The generation, see save_index_generation.
+        name (str): The name of the array.
+
+    Returns:
+        pathlib.Path: The path to the .npy file.
+    """
+    return index_path / f"{generation}.{name}.npy"
+
+
+def make_generation() -> str:
+    """Make a new, unique, generation name."""
+    return uuid.uuid4().hex
+
+
+def save_index_generation(index_path: pathlib.Path,
+                          generation: str,
+                          meta: dict[str, Any],
+                          arrays: Optional[dict[str, np.ndarray]] = None,
+                          version: int = 1) -> None:
+    """Save a new generation of an index, then switch readers over to it.
+
+    The arrays of each generation have their own files and the metadata file
+    (replaced atomically) points to the current one, so readers never mix the
+    files of two builds. Arrays already written to the generation's paths (e.g.
+    with np.lib.format.open_memmap) are listed in the metadata as well.
+
+    Args:
+        index_path (pathlib.Path): The directory of the index.
+        generation (str): The generation being saved, see make_generation.
+        meta (dict[str, Any]): The metadata of the index.
+        arrays (Optional[dict[str, np.ndarray]]): The arrays still to write.
+        version (int): The version of the index format.
+    """
+    index_path.mkdir(exist_ok=True)
+    for name, values in (arrays or {}).items():
+        np.save(new_generation_path(index_path, generation, name), values)
+    names = sorted(path.name[len(generation) + 1:-len(".npy")]
+                   for path in index_path.glob(f"{generation}.*.npy"))
+
+    write_file_atomically(
+        index_path / INDEX_META_FILE_NAME,
+        json.dumps(
+            {
+                "version": version,
+                "generation": generation,
+                "arrays": names,
+                **meta
+            },
+            separators=(",", ":")))
+
+    # Readers that already mapped a previous generation keep their mapping.
+    for path in index_path.glob("*.npy"):
+        if not path.name.startswith(generation + "."):
+            path.unlink(missing_ok=True)
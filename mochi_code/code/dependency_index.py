@@ -0,0 +1,530 @@
+"""Index of the APIs of the installed (python) dependencies.
+
+The public modules, classes and functions of each dependency installed in the
+active environment are found from its distribution's file list, and parsed
+statically (the packages are never imported). Their signatures and the first
+paragraph of their docstrings are stored in the user's cache dir, one file per
+`name==version`, so each version is indexed once and reused by every project.
+The packages not indexed yet are parsed in a process pool.
+
+The symbols of the packages a project uses are then merged in an index in its
+config dir, stored as arrays (the symbols and the postings of the terms of their
+names) that are memory mapped when loaded, so loading it neither scans the
+environment nor parses the packages. Lookups only touch the postings of the
+terms of the query and the symbols named like it.
+"""
+
+import ast
+import copy
+import concurrent.futures
+import importlib.metadata
+import json
+import math
+import multiprocessing
+import os
+import pathlib
+import re
+from array import array
+from typing import Any, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from mochi_code.code.code_search import (StringTable, load_index_generation,
+                                         make_generation, pack_strings,
+                                         save_index_generation, tokenize)
+from mochi_code.code.mochi_config import (get_dependency_apis_path,
+                                          get_user_cache_path,
+                                          write_file_atomically)
+from mochi_code.tracing import annotate, traced
+
+DEPENDENCY_INDEX_VERSION = 1
+DEPENDENCIES_CACHE_DIR_NAME = "dependencies"
+
+DEFAULT_TOP_K = 5
+# Bounds the index of huge packages (and of their huge files).
+MAX_SYMBOLS_PER_PACKAGE = 20_000
+MAX_FILE_SIZE = 1 << 20
+MAX_SIGNATURE_LENGTH = 200
+MAX_DOC_LENGTH = 200
+
+# Below this, starting the worker processes costs more than the parsing.
+_MIN_PACKAGES_PER_POOL = 4
+# The parts of a module path that aren't part of the public API (e.g. the
+# vendored stubs of type checkers).
+_PRIVATE_PARTS = frozenset(
+    {"test", "tests", "testing", "conftest", "vendor", "typeshed"})
+
+_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_UNDERLINE_RE = re.compile(r"[=\-~^*#]+")
+
+# The fields of the symbols stored as a string table each (the package names
+# are stored once).
+_SYMBOL_FIELDS = ("module", "name", "kind", "signature", "doc")
+
+_FunctionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+class ApiSymbol(NamedTuple):
+    """A public module, class, function or method of a dependency."""
+    package: str
+    module: str
+    # The name qualified by the enclosing class, if any (e.g. DataFrame.merge).
+    name: str
+    kind: str
+    signature: str
+    doc: str
+
+    def describe(self) -> str:
+        """Describe the symbol in a line, e.g. for a prompt.
+
+        Returns:
+            str: The package, the signature and the start of the docs.
+        """
+        path = (self.module
+                if self.kind == "module" else f"{self.module}.{self.signature}")
+        return f"{self.package}: {path}" + (f" - {self.doc}"
+                                            if self.doc else "")
+
+
+class DependencyIndex:  # pylint: disable=too-few-public-methods
+    """The loaded (memory mapped) API index of the dependencies of a project."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        """Create the index from its (loaded) arrays.
+
+        Args:
+            arrays (dict[str, np.ndarray]): The arrays, see pack_api_symbols.
+        """
+        self._packages = StringTable.from_arrays(arrays, "packages")
+        self._symbol_packages = arrays["symbol_packages"]
+        self._strings = {
+            field: StringTable.from_arrays(arrays, field)
+            for field in _SYMBOL_FIELDS
+        }
+        self._postings = {
+            key: (StringTable.from_arrays(arrays, key),
+                  arrays[f"{key}_posting_offsets"], arrays[f"{key}_symbol_ids"]
+                 ) for key in ("terms", "short_names")
+        }
+
+    def __len__(self) -> int:
+        return len(self._symbol_packages)
+
+    @traced("dependency_apis.search")
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> list[ApiSymbol]:
+        """Find the symbols most relevant to the query, by their names.
+
+        A symbol matches if the query names it (e.g. "read_csv", case
+        sensitive) or has at least two of the words of its name (e.g. "read a
+        csv"), the rarest words count the most.
+
+        Args:
+            query (str): The query, e.g. a question about the code.
+            top_k (int): The maximum number of symbols.
+
+        Returns:
+            list[ApiSymbol]: The symbols, most relevant first.
+        """
+        terms = set(tokenize(query))
+        scores, matched = self._score(terms)
+        named = np.zeros(len(self), dtype=bool)
+        for name in set(_NAME_RE.findall(query)):
+            named[self._get_postings("short_names", name)] = True
+        candidates = np.flatnonzero((matched >= 2) | (named & (matched > 0)))
+        candidate_scores = scores[candidates]
+        mentioned = [
+            package_id for package_id in range(len(self._packages))
+            if _normalize_name(self._packages[package_id]) in terms
+        ]
+        candidate_scores[np.isin(self._symbol_packages[candidates],
+                                 mentioned)] *= 2
+        annotate(symbols=len(self), matches=len(candidates))
+
+        if len(candidates) > top_k > 0:
+            # Only the symbols scoring at least the k-th best one are ranked,
+            # the shortest first among equal scores.
+            threshold = -np.partition(-candidate_scores, top_k - 1)[top_k - 1]
+            kept = candidate_scores >= threshold
+            candidates = candidates[kept]
+            candidate_scores = candidate_scores[kept]
+        ranked = sorted((-score, len(self._strings["module"][symbol_id]) +
+                         len(self._strings["name"][symbol_id]), symbol_id)
+                        for score, symbol_id in zip(candidate_scores.tolist(),
+                                                    candidates.tolist()))
+        return [
+            self._get_symbol(symbol_id) for _, _, symbol_id in ranked[:top_k]
+        ]
+
+    def _score(self, terms: set[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Score the symbols with any of the terms in their name.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The score of each symbol (its terms'
+            inverse frequencies) and its number of matched terms, by id.
+        """
+        scores = np.zeros(len(self), dtype=np.float64)
+        matched = np.zeros(len(self), dtype=np.int32)
+        for term in terms:
+            symbol_ids = self._get_postings("terms", term)
+            # A term appears once per symbol in its postings.
+            scores[symbol_ids] += math.log(1 + len(self) /
+                                           (1 + len(symbol_ids)))
+            matched[symbol_ids] += 1
+        return scores, matched
+
+    def _get_postings(self, key: str, value: str) -> np.ndarray:
+        """Get the ids of the symbols with the value (e.g. a term) as key."""
+        values, offsets, symbol_ids = self._postings[key]
+        value_id = values.find(value)
+        if value_id is None:
+            return symbol_ids[:0]
+        return symbol_ids[int(offsets[value_id]):int(offsets[value_id + 1])]
+
+    def _get_symbol(self, symbol_id: int) -> ApiSymbol:
+        return ApiSymbol(
+            self._packages[int(self._symbol_packages[symbol_id])],
+            *(self._strings[field][symbol_id] for field in _SYMBOL_FIELDS))
+
+
+def pack_api_symbols(symbols: Sequence[ApiSymbol]) -> dict[str, np.ndarray]:
+    """Pack the symbols as the arrays of a DependencyIndex.
+
+    The fields of the symbols are stored as string tables (see StringTable),
+    with the package names once. The ids of the symbols are grouped by the
+    terms of their (short) names and by their short names, in sorted order, so
+    both can be looked up without reading the others.
+
+    Args:
+        symbols (Sequence[ApiSymbol]): The symbols of all the packages.
+
+    Returns:
+        dict[str, np.ndarray]: The arrays of the index.
+    """
+    packages = sorted({symbol.package for symbol in symbols})
+    package_ids = {
+        package: package_id for package_id, package in enumerate(packages)
+    }
+    terms: dict[str, array] = {}
+    short_names: dict[str, array] = {}
+    for symbol_id, symbol in enumerate(symbols):
+        short_name = symbol.name.rsplit(".", 1)[-1]
+        short_names.setdefault(short_name, array("i")).append(symbol_id)
+        for term in set(tokenize(short_name)):
+            terms.setdefault(term, array("i")).append(symbol_id)
+
+    arrays = {
+        **pack_strings("packages", packages),
+        "symbol_packages":
+            np.array([package_ids[symbol.package] for symbol in symbols],
+                     dtype=np.int32),
+        **_pack_postings("terms", terms),
+        **_pack_postings("short_names", short_names),
+    }
+    for field in _SYMBOL_FIELDS:
+        arrays.update(
+            pack_strings(field, [getattr(symbol, field) for symbol in symbols]))
+    return arrays
+
+
+def _pack_postings(key: str, postings: dict[str,
+                                            array]) -> dict[str, np.ndarray]:
+    """Pack the symbol ids of each value, in the order of the sorted values."""
+    values = sorted(postings)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(postings[value]) for value in values], out=offsets[1:])
+    return {
+        **pack_strings(key, values),
+        f"{key}_posting_offsets":
+            offsets,
+        f"{key}_symbol_ids":
+            np.frombuffer(b"".join(
+                postings[value].tobytes() for value in values),
+                          dtype=np.int32),
+    }
+
+
+def get_dependencies_cache_path() -> pathlib.Path:
+    """Get the dir of the indexed packages, shared by all the projects.
+
+    Returns:
+        pathlib.Path: The path to the dir (it may not exist yet).
+    """
+    return get_user_cache_path() / DEPENDENCIES_CACHE_DIR_NAME
+
+
+@traced("dependency_apis.load")
+def load_dependency_index(
+        config_path: pathlib.Path) -> Optional[DependencyIndex]:
+    """Load the API index of the project dependencies, memory mapping it.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+
+    Returns:
+        Optional[DependencyIndex]: The index, or None if the project has no
+        indexed dependencies.
+    """
+    loaded = load_index_generation(
+        pathlib.Path(get_dependency_apis_path(config_path)),
+        DEPENDENCY_INDEX_VERSION)
+    if loaded is None:
+        return None
+    index = DependencyIndex(loaded[1])
+    annotate(symbols=len(index))
+    return index if len(index) else None
+
+
+@traced("dependency_apis.update")
+def update_dependency_index(config_path: pathlib.Path,
+                            dependencies: list[str],
+                            max_workers: Optional[int] = None) -> int:
+    """Index the APIs of the installed dependencies not indexed yet.
+
+    The dependencies that aren't installed in the active environment (or
+    aren't python packages) are skipped. The APIs of the others are then merged
+    in the index of the project.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        dependencies (list[str]): The names of the project dependencies.
+        max_workers (Optional[int]): The number of processes parsing packages.
+
+    Returns:
+        int: The number of packages that were indexed.
+    """
+    installed: dict[str, importlib.metadata.Distribution] = {}
+    for name in dependencies:
+        try:
+            distribution = importlib.metadata.distribution(name)
+        except (importlib.metadata.PackageNotFoundError, ValueError):
+            continue
+        if not distribution.metadata["Name"]:
+            # A broken install.
+            continue
+        installed[_get_package_key(distribution)] = distribution
+
+    missing = [(key, distribution.metadata["Name"],
+                _get_module_paths(distribution))
+               for key, distribution in sorted(installed.items())
+               if not _get_package_path(key).exists()]
+    if len(missing) < _MIN_PACKAGES_PER_POOL or max_workers == 1:
+        for package in missing:
+            _index_package(*package)
+    elif missing:
+        # Other threads (e.g. model requests) may hold locks, forking them would
+        # deadlock the workers.
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context(
+                    "forkserver")) as executor:
+            list(executor.map(_index_package, *zip(*missing)))
+
+    symbols = _load_symbols(sorted(installed))
+    save_index_generation(pathlib.Path(get_dependency_apis_path(config_path)),
+                          make_generation(), {"packages": sorted(installed)},
+                          pack_api_symbols(symbols),
+                          version=DEPENDENCY_INDEX_VERSION)
+    annotate(installed=len(installed),
+             indexed=len(missing),
+             symbols=len(symbols))
+    return len(missing)
+
+
+def parse_module_api(module: str, source: str) -> list[tuple[str, ...]]:
+    """Find the public API of a python module.
+
+    The public names are the ones listed in __all__, or the ones not starting
+    with an underscore.
+
+    Args:
+        module (str): The name of the module, e.g. "pandas.io.parsers".
+        source (str): The source of the module.
+
+    Returns:
+        list[tuple[str, ...]]: The module, name, kind, signature and doc of
+        each symbol, empty if the module can't be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    public = _get_all(tree)
+    symbols: list[tuple[str, ...]] = []
+    # The top level modules are named like their package, which is already
+    # matched on its own.
+    if "." in module and ast.get_docstring(tree):
+        name = module.rsplit(".", 1)[-1]
+        symbols.append((module, name, "module", module, _get_doc(tree)))
+    for node in tree.body:
+        if not isinstance(node, (*_FUNCTION_NODES, ast.ClassDef)):
+            continue
+        if public is not None and node.name not in public:
+            continue
+        if public is None and node.name.startswith("_"):
+            continue
+        if not isinstance(node, ast.ClassDef):
+            symbols.append((module, node.name, "function", _get_signature(node),
+                            _get_doc(node)))
+            continue
+        symbols.append((module, node.name, "class", _get_class_signature(node),
+                        _get_doc(node)))
+        for method in node.body:
+            if (isinstance(method, _FUNCTION_NODES) and
+                    not method.name.startswith("_")):
+                symbols.append(
+                    (module, f"{node.name}.{method.name}", "method",
+                     f"{node.name}.{_get_signature(method)}", _get_doc(method)))
+    return symbols
+
+
+def _get_all(tree: ast.Module) -> Optional[set[str]]:
+    """Get the names listed in the __all__ of a module, None if it has none."""
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == "__all__"
+                for target in node.targets)):
+            try:
+                return set(ast.literal_eval(node.value))
+            except (ValueError, TypeError, SyntaxError):
+                return None
+    return None
+
+
+def _get_signature(node: _FunctionNode) -> str:
+    arguments = node.args
+    if arguments.args and arguments.args[0].arg in ("self", "cls"):
+        # Left out, as the methods are called.
+        arguments = copy.copy(arguments)
+        arguments.args = arguments.args[1:]
+        arguments.defaults = arguments.defaults[
+            max(0,
+                len(arguments.defaults) - len(arguments.args)):]
+    signature = f"{node.name}({ast.unparse(arguments)})"
+    if node.returns is not None:
+        signature += f" -> {ast.unparse(node.returns)}"
+    return _truncate(signature, MAX_SIGNATURE_LENGTH)
+
+
+def _get_class_signature(node: ast.ClassDef) -> str:
+    """Get the signature of a class, as called (from its __init__)."""
+    for child in node.body:
+        if isinstance(child, ast.FunctionDef) and child.name == "__init__":
+            signature = _get_signature(child)
+            return node.name + signature[len("__init__"):].split(" -> ")[0]
+    return node.name
+
+
+def _get_doc(node: Union[ast.Module, ast.ClassDef, _FunctionNode]) -> str:
+    """Get the first paragraph of the docstring of a node, on one line."""
+    doc = ast.get_docstring(node)
+    if not doc:
+        return ""
+    # Without the underlines of the reStructuredText titles.
+    words = [
+        word for word in doc.split("\n\n", 1)[0].split()
+        if not _UNDERLINE_RE.fullmatch(word)
+    ]
+    return _truncate(" ".join(words), MAX_DOC_LENGTH)
+
+
+def _truncate(text: str, max_length: int) -> str:
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+def _normalize_name(name: str) -> str:
+    """Normalize a package name, as pip does (PEP 503)."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _get_package_key(distribution: importlib.metadata.Distribution) -> str:
+    return (f"{_normalize_name(distribution.metadata['Name'])}==" +
+            distribution.version)
+
+
+def _get_package_path(key: str) -> pathlib.Path:
+    return get_dependencies_cache_path() / f"{key}.json"
+
+
+def _get_module_paths(
+        distribution: importlib.metadata.Distribution) -> list[tuple[str, str]]:
+    """Find the public modules of a distribution, from its installed files.
+
+    Returns:
+        list[tuple[str, str]]: The name and (absolute) path of each module.
+    """
+    modules = []
+    for file in distribution.files or []:
+        path = pathlib.PurePosixPath(str(file))
+        if path.suffix not in (".py", ".pyi") or ".." in path.parts:
+            continue
+        parts = list(path.with_suffix("").parts)
+        if parts[-1] == "__init__":
+            parts.pop()
+        if not parts or any(
+                part.startswith("_") or part in _PRIVATE_PARTS or
+                not part.isidentifier() for part in parts):
+            continue
+        modules.append((".".join(parts), str(distribution.locate_file(file))))
+    return modules
+
+
+def _index_package(key: str, name: str, modules: list[tuple[str, str]]) -> int:
+    """Parse the API of a package and save it in the cache, in a worker
+    process.
+
+    Returns:
+        int: The number of symbols found.
+    """
+    symbols: list[tuple[str, ...]] = []
+    seen = set()
+    for module, path in sorted(modules):
+        try:
+            if os.path.getsize(path) > MAX_FILE_SIZE:
+                continue
+            with open(path, encoding="utf-8", errors="replace") as module_file:
+                source = module_file.read()
+        except OSError:
+            continue
+        for symbol in parse_module_api(module, source):
+            # E.g. both a .py and a .pyi file.
+            if symbol[:2] not in seen:
+                seen.add(symbol[:2])
+                symbols.append(symbol)
+        if len(symbols) >= MAX_SYMBOLS_PER_PACKAGE:
+            break
+
+    _write_json(
+        _get_package_path(key), {
+            "version": DEPENDENCY_INDEX_VERSION,
+            "name": name,
+            "symbols": symbols[:MAX_SYMBOLS_PER_PACKAGE]
+        })
+    return len(symbols)
+
+
+def _load_symbols(keys: list[str]) -> list[ApiSymbol]:
+    """Load the symbols of the indexed packages, skipping the missing ones."""
+    symbols: list[ApiSymbol] = []
+    for key in keys:
+        package = _load_package(key)
+        if package is not None:
+            symbols.extend(
+                ApiSymbol(package["name"], *row) for row in package["symbols"])
+    return symbols
+
+
+def _load_package(key: str) -> Optional[dict[str, Any]]:
+    try:
+        with open(_get_package_path(key), encoding="utf-8") as package_file:
+            package = json.load(package_file)
+    except (OSError, ValueError):
+        return None
+    if package.get("version") != DEPENDENCY_INDEX_VERSION:
+        return None
+    return package
+
+
+def _write_json(path: pathlib.Path, content: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_file_atomically(path, json.dumps(content))
@@ -0,0 +1,223 @@
+"""Local parsers extracting the list of dependencies from known config files.
+
+Parsers are registered against file name patterns. Parsing a known config file
+locally is instant and deterministic, the model should only be used for the
+formats without a parser (or when a parser fails).
+"""
+
+import fnmatch
+import json
+import re
+from typing import Any, Callable, Iterable, Optional
+from xml.etree import ElementTree
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, fallback to the backport if installed.
+    try:
+        import tomli as tomllib  # type: ignore
+    except ImportError:
+        tomllib = None  # type: ignore # pylint: disable=invalid-name
+
+DependencyParser = Callable[[str], list[str]]
+
+_PARSERS: list[tuple[tuple[str, ...], DependencyParser]] = []
+
+# Matches the package name at the start of a PEP 508 requirement.
+_REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+class DependencyParserError(Exception):
+    """Raised when a config file cannot be parsed locally."""
+
+
+def register_parser(
+        *patterns: str) -> Callable[[DependencyParser], DependencyParser]:
+    """Register a parser for the config files matching the name patterns.
+
+    Args:
+        *patterns (str): fnmatch style patterns for the config file name (e.g.
+        "requirements*.txt").
+
+    Returns:
+        Callable[[DependencyParser], DependencyParser]: The decorator to
+        register the parser with.
+    """
+
+    def decorator(parser: DependencyParser) -> DependencyParser:
+        _PARSERS.append((patterns, parser))
+        return parser
+
+    return decorator
+
+
+def get_dependency_parser(config_file_name: str) -> Optional[DependencyParser]:
+    """Get the parser registered for the config file.
+
+    Args:
+        config_file_name (str): The name of the config file (without dirs).
+
+    Returns:
+        Optional[DependencyParser]: The parser or None if the format is unknown.
+    """
+    for patterns, parser in _PARSERS:
+        if any(fnmatch.fnmatch(config_file_name, p) for p in patterns):
+            return parser
+    return None
+
+
+def parse_dependencies(config_file_name: str,
+                       config_content: str) -> Optional[list[str]]:
+    """Parse the list of dependencies from a config file locally.
+
+    Args:
+        config_file_name (str): The name of the config file (without dirs).
+        config_content (str): The content of the config file.
+
+    Returns:
+        Optional[list[str]]: The list of dependencies or None if the config
+        file couldn't be parsed locally.
+    """
+    parser = get_dependency_parser(config_file_name)
+    if parser is None:
+        return None
+
+    try:
+        return parser(config_content)
+    except (DependencyParserError, ValueError, TypeError, AttributeError,
+            ElementTree.ParseError):
+        return None
+
+
+def _unique(names: Iterable[str]) -> list[str]:
+    """Remove empty and duplicated names, keeping the original order."""
+    return list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+
+def _requirement_name(requirement: str) -> Optional[str]:
+    """Get the package name from a PEP 508 requirement string."""
+    match = _REQUIREMENT_NAME.match(requirement)
+    return match.group(1) if match else None
+
+
+def _load_toml(config_content: str) -> dict[str, Any]:
+    if tomllib is None:
+        raise DependencyParserError("No toml parser available.")
+    return tomllib.loads(config_content)
+
+
+@register_parser("pyproject.toml")
+def _parse_pyproject(config_content: str) -> list[str]:
+    """Parse poetry and PEP 621 dependencies."""
+    config = _load_toml(config_content)
+    names: list[str] = []
+
+    project = config.get("project", {})
+    requirements = list(project.get("dependencies", []))
+    for optional in project.get("optional-dependencies", {}).values():
+        requirements.extend(optional)
+    names.extend(filter(None, map(_requirement_name, requirements)))
+
+    poetry = config.get("tool", {}).get("poetry", {})
+    sections = [
+        poetry.get("dependencies", {}),
+        poetry.get("dev-dependencies", {})
+    ]
+    sections.extend(
+        group.get("dependencies", {})
+        for group in poetry.get("group", {}).values())
+    for section in sections:
+        names.extend(name for name in section if name.lower() != "python")
+
+    return _unique(names)
+
+
+@register_parser("requirements*.txt", "requirements*.in")
+def _parse_requirements(config_content: str) -> list[str]:
+    """Parse pip requirements files, ignoring options and includes."""
+    names = []
+    for line in config_content.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+        name = _requirement_name(line)
+        if name:
+            names.append(name)
+    return _unique(names)
+
+
+@register_parser("package.json")
+def _parse_package_json(config_content: str) -> list[str]:
+    """Parse the npm/yarn/pnpm dependency sections."""
+    config = json.loads(config_content)
+    names: list[str] = []
+    for section in ("dependencies", "devDependencies", "peerDependencies",
+                    "optionalDependencies"):
+        names.extend(config.get(section, {}))
+    return _unique(names)
+
+
+@register_parser("Cargo.toml")
+def _parse_cargo(config_content: str) -> list[str]:
+    """Parse the cargo dependency sections (including per target ones)."""
+    config = _load_toml(config_content)
+    sections = ("dependencies", "dev-dependencies", "build-dependencies")
+
+    tables = [config, config.get("workspace", {})]
+    tables.extend(config.get("target", {}).values())
+
+    names: list[str] = []
+    for table in tables:
+        for section in sections:
+            names.extend(table.get(section, {}))
+    return _unique(names)
+
+
+@register_parser("go.mod")
+def _parse_go_mod(config_content: str) -> list[str]:
+    """Parse the required modules, both single line and block requires."""
+    names = []
+    in_block = False
+    for line in config_content.splitlines():
+        line = line.split("//", 1)[0].strip()
+        if in_block:
+            if line == ")":
+                in_block = False
+            elif line:
+                names.append(line.split()[0])
+        elif line.startswith("require"):
+            requirement = line[len("require"):].strip()
+            if requirement == "(":
+                in_block = True
+            elif requirement:
+                names.append(requirement.split()[0])
+    return _unique(names)
+
+
+@register_parser("Gemfile")
+def _parse_gemfile(config_content: str) -> list[str]:
+    """Parse the gem declarations."""
+    pattern = re.compile(r"""^\s*gem\s+['"]([^'"]+)['"]""", re.MULTILINE)
+    return _unique(pattern.findall(config_content))
+
+
+def _local_name(tag: str) -> str:
+    """Strip the namespace from an xml tag."""
+    return tag.rsplit("}", 1)[-1]
+
+
+@register_parser("pom.xml")
+def _parse_pom(config_content: str) -> list[str]:
+    """Parse the maven dependencies as groupId:artifactId."""
+    root = ElementTree.fromstring(config_content)
+    # Maven poms are usually namespaced, match the tags by local name.
+    names = []
+    for element in root.iter():
+        if _local_name(element.tag) != "dependency":
+            continue
+        fields = {_local_name(child.tag): child.text for child in element}
+        artifact = fields.get("artifactId")
+        if artifact:
+            group = fields.get("groupId")
+            names.append(f"{group}:{artifact}" if group else artifact)
+    return _unique(names)
@@ -0,0 +1,112 @@
+"""Embedders turning code and queries into vectors for the vector store.
+
+Embedders are registered by name (see register_embedder), the name is saved
+with the vectors so queries are always embedded like the code they search. The
+built-in "hashing" embedder works offline: it hashes the terms (and pairs of
+consecutive terms) of the text into a fixed number of dimensions.
+"""
+
+import functools
+import zlib
+from typing import Callable, Optional, Protocol, Sequence, TypeVar
+
+import numpy as np
+
+from mochi_code.code.code_search import tokenize
+
+DEFAULT_EMBEDDER_NAME = "hashing"
+
+
+class Embedder(Protocol):  # pylint: disable=too-few-public-methods
+    """Embeds texts in vectors of a fixed number of dimensions."""
+    name: str
+    dimensions: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed the texts.
+
+        Args:
+            texts (Sequence[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A float32 matrix with one L2 normalised row per text
+            (rows of texts without features are all zeros).
+        """
+
+
+EmbedderFactory = Callable[[], Embedder]
+_FactoryT = TypeVar("_FactoryT", bound=EmbedderFactory)
+
+_EMBEDDERS: dict[str, EmbedderFactory] = {}
+
+
+def register_embedder(name: str) -> Callable[[_FactoryT], _FactoryT]:
+    """Register an embedder factory under a name.
+
+    Args:
+        name (str): The name the embedder is selected (and saved) by.
+
+    Returns:
+        Callable[[_FactoryT], _FactoryT]: The decorator.
+    """
+
+    def decorator(factory: _FactoryT) -> _FactoryT:
+        _EMBEDDERS[name] = factory
+        return factory
+
+    return decorator
+
+
+def get_embedder(name: str) -> Optional[Embedder]:
+    """Create the embedder registered under the name.
+
+    Args:
+        name (str): The name of the embedder.
+
+    Returns:
+        Optional[Embedder]: The embedder or None if none is registered.
+    """
+    factory = _EMBEDDERS.get(name)
+    return factory() if factory is not None else None
+
+
+@functools.lru_cache(maxsize=65536)
+def _hash_feature(feature: str) -> int:
+    # crc32 is stable across processes, unlike hash().
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+@register_embedder(DEFAULT_EMBEDDER_NAME)
+class HashingEmbedder:  # pylint: disable=too-few-public-methods
+    """Embeds the hashed terms of the text (the "hashing trick")."""
+    name = DEFAULT_EMBEDDER_NAME
+
+    def __init__(self, dimensions: int = 256) -> None:
+        """Create the embedder.
+
+        Args:
+            dimensions (int): The number of dimensions of the vectors.
+        """
+        self.dimensions = dimensions
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed the texts (see Embedder.embed)."""
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = tokenize(text)
+            features = terms + [
+                f"{first} {second}" for first, second in zip(terms, terms[1:])
+            ]
+            if not features:
+                continue
+            hashes = np.fromiter((_hash_feature(f) for f in features),
+                                 dtype=np.uint32,
+                                 count=len(features))
+            # The top bit picks the sign, so collisions tend to cancel out.
+            signs = np.where(hashes >> 31, 1.0, -1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dimensions, signs)
+
+        # Dampen repeated terms, then normalise for cosine similarity.
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
@@ -0,0 +1,339 @@
+"""Searchable git history of the project.
+
+The commits are read from the local git binary (`git log --name-only`) and
+stored in a SQLite database in the mochi config dir, with a full text index of
+their messages and touched files. Updates are incremental: the last indexed
+commit is remembered and only the newer ones are read. The log is streamed and
+written in batches, so even repos with 100k+ commits are ingested in bounded
+memory.
+
+Lookups are a full text query ranked by BM25, they take a few milliseconds and
+don't run git at all.
+"""
+
+import contextlib
+import datetime
+import pathlib
+import sqlite3
+import subprocess
+from dataclasses import dataclass
+from typing import Iterator, NamedTuple, Optional
+
+from mochi_code.code.code_search import tokenize
+from mochi_code.code.mochi_config import get_git_history_path
+from mochi_code.tracing import annotate, traced
+
+# Stored as the user_version of the database, older versions are rebuilt.
+GIT_HISTORY_VERSION = 1
+
+DEFAULT_TOP_K = 5
+# Commits written per transaction while ingesting.
+DEFAULT_BATCH_SIZE = 500
+# Only the first files of huge commits (e.g. vendoring) are kept.
+MAX_FILES_PER_COMMIT = 100
+
+_LAST_COMMIT_KEY = "last_commit"
+
+# The fields of each commit are separated by the unit separator, the commits by
+# the record separator (neither appears in messages in practice).
+_FIELD_SEPARATOR = "\x1f"
+_RECORD_SEPARATOR = "\x1e"
+_LOG_FORMAT = "%x1e%H%x1f%ct%x1f%an%x1f%s%x1f%b%x1f"
+_READ_SIZE = 1 << 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    time INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    file_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commit_files (
+    commit_id INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commit_files_by_path ON commit_files (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS commit_search USING fts5 (
+    message, files, content=''
+);
+"""
+
+
+@dataclass(frozen=True)
+class Commit:
+    """A commit of the project."""
+    hash: str
+    # Seconds since the epoch, when it was committed.
+    time: int
+    author: str
+    subject: str
+    # The first touched files (see MAX_FILES_PER_COMMIT).
+    files: tuple[str, ...]
+    file_count: int
+
+    def describe(self) -> str:
+        """Describe the commit in a line, e.g. for a prompt.
+
+        Returns:
+            str: The short hash, date, subject and touched files.
+        """
+        date = datetime.datetime.fromtimestamp(
+            self.time, datetime.timezone.utc).date().isoformat()
+        files = ", ".join(self.files[:5])
+        if self.file_count > 5:
+            files += f" and {self.file_count - 5} more"
+        return f"{self.hash[:10]} {date} {self.subject} ({files})"
+
+
+class _ParsedCommit(NamedTuple):
+    """A commit read from the log."""
+    hash: str
+    time: int
+    author: str
+    subject: str
+    # The subject and body.
+    message: str
+    files: list[str]
+
+
+class GitHistory:  # pylint: disable=too-few-public-methods
+    """The git history database of a project."""
+
+    def __init__(self, database_path: pathlib.Path) -> None:
+        """Open the history, each search reads its latest state.
+
+        Args:
+            database_path (pathlib.Path): The path to the database.
+        """
+        self.database_path = database_path
+
+    @traced("git_history.search")
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> list[Commit]:
+        """Find the commits most relevant to the query, by their message and
+        touched files.
+
+        Args:
+            query (str): The query, e.g. a question about the code.
+            top_k (int): The maximum number of commits.
+
+        Returns:
+            list[Commit]: The commits, most relevant first.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        try:
+            with contextlib.closing(_connect(self.database_path,
+                                             read_only=True)) as connection:
+                rows = connection.execute(
+                    "SELECT c.id, c.hash, c.time, c.author, c.subject, "
+                    "c.file_count FROM commit_search s "
+                    "JOIN commits c ON c.id = s.rowid "
+                    "WHERE commit_search MATCH ? ORDER BY s.rank LIMIT ?",
+                    (match, top_k)).fetchall()
+                commits = [
+                    Commit(commit_hash, time, author, subject,
+                           _get_files(connection, commit_id), file_count)
+                    for commit_id, commit_hash, time, author, subject,
+                    file_count in rows
+                ]
+        except sqlite3.Error:
+            return []
+        annotate(terms=len(terms), commits=len(commits))
+        return commits
+
+
+def load_git_history(config_path: pathlib.Path) -> Optional[GitHistory]:
+    """Load the git history of the project.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+
+    Returns:
+        Optional[GitHistory]: The history, or None if it wasn't ingested yet.
+    """
+    database_path = pathlib.Path(get_git_history_path(config_path))
+    if not database_path.exists():
+        return None
+    return GitHistory(database_path)
+
+
+@traced("git_history.update")
+def update_git_history(config_path: pathlib.Path,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Ingest the commits made since the last update.
+
+    The project is left without history if it isn't in a git repo (or git
+    isn't installed). If the history was rewritten (e.g. rebased), it is
+    ingested again from scratch.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        batch_size (int): The commits written per transaction.
+
+    Returns:
+        int: The number of new commits.
+    """
+    project_path = config_path.parent
+    head = _run_git(project_path, "rev-parse", "--verify", "-q", "HEAD")
+    if head is None:
+        return 0
+
+    database_path = pathlib.Path(get_git_history_path(config_path))
+    with contextlib.closing(_connect(database_path)) as connection:
+        last_commit = _get_last_commit(connection)
+        if last_commit == head:
+            return 0
+        if last_commit is not None and _run_git(project_path, "merge-base",
+                                                "--is-ancestor", last_commit,
+                                                head) is None:
+            _clear(connection)
+            last_commit = None
+
+        revisions = [head] if last_commit is None else [head, "^" + last_commit]
+        count = 0
+        batch: list[_ParsedCommit] = []
+        for commit in _read_log(project_path, revisions):
+            batch.append(commit)
+            if len(batch) >= batch_size:
+                count += _insert(connection, batch)
+                batch.clear()
+        count += _insert(connection, batch)
+        # Only once all the commits are in, an interrupted update starts over
+        # (the commits already in are skipped).
+        connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                           (_LAST_COMMIT_KEY, head))
+        connection.commit()
+    annotate(commits=count)
+    return count
+
+
+def _connect(database_path: pathlib.Path,
+             read_only: bool = False) -> sqlite3.Connection:
+    """Open the database, creating (or rebuilding) its schema if needed."""
+    if read_only:
+        return sqlite3.connect(database_path.as_uri() + "?mode=ro", uri=True)
+
+    connection = sqlite3.connect(database_path)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version != GIT_HISTORY_VERSION:
+        for table in ("meta", "commits", "commit_files", "commit_search"):
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+        connection.executescript(_SCHEMA)
+        connection.execute(f"PRAGMA user_version = {GIT_HISTORY_VERSION}")
+        connection.commit()
+    return connection
+
+
+def _get_last_commit(connection: sqlite3.Connection) -> Optional[str]:
+    row = connection.execute("SELECT value FROM meta WHERE key = ?",
+                             (_LAST_COMMIT_KEY,)).fetchone()
+    return None if row is None else row[0]
+
+
+def _get_files(connection: sqlite3.Connection,
+               commit_id: int) -> tuple[str, ...]:
+    return tuple(path for path, in connection.execute(
+        "SELECT path FROM commit_files WHERE commit_id = ? ORDER BY rowid", (
+            commit_id,)))
+
+
+def _clear(connection: sqlite3.Connection) -> None:
+    """Forget the ingested history."""
+    connection.execute("DELETE FROM meta")
+    connection.execute("DELETE FROM commits")
+    connection.execute("DELETE FROM commit_files")
+    # Contentless full text tables are cleared with a special command.
+    connection.execute(
+        "INSERT INTO commit_search (commit_search) VALUES ('delete-all')")
+    connection.commit()
+
+
+def _insert(connection: sqlite3.Connection,
+            commits: list[_ParsedCommit]) -> int:
+    """Write the commits (skipping the ones already in), in a transaction.
+
+    Returns:
+        int: The number of commits written.
+    """
+    count = 0
+    for commit_hash, time, author, subject, message, files in commits:
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO commits "
+            "(hash, time, author, subject, file_count) VALUES (?, ?, ?, ?, ?)",
+            (commit_hash, time, author, subject, len(files)))
+        if not cursor.rowcount:
+            continue
+        commit_id = cursor.lastrowid
+        kept = files[:MAX_FILES_PER_COMMIT]
+        connection.executemany(
+            "INSERT INTO commit_files (commit_id, path) VALUES (?, ?)",
+            ((commit_id, path) for path in kept))
+        # Indexed as terms, so identifiers are found whole and by their parts.
+        connection.execute(
+            "INSERT INTO commit_search (rowid, message, files) VALUES "
+            "(?, ?, ?)", (commit_id, " ".join(tokenize(message)), " ".join(
+                term for path in kept for term in tokenize(path))))
+        count += 1
+    connection.commit()
+    return count
+
+
+def _run_git(project_path: pathlib.Path, *args: str) -> Optional[str]:
+    """Run a git command in the project.
+
+    Returns:
+        Optional[str]: The output, or None if the command failed.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(project_path), *args],
+            capture_output=True,
+            check=True,
+            text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _read_log(project_path: pathlib.Path,
+              revisions: list[str]) -> Iterator[_ParsedCommit]:
+    """Stream the commits of the project, newest first.
+
+    Only the commits touching the project dir are read (e.g. in a monorepo),
+    with the paths relative to it.
+    """
+    with subprocess.Popen(
+        [
+            "git", "-C",
+            str(project_path), "log", f"--format={_LOG_FORMAT}", "--name-only",
+            "--relative", "--no-renames", *revisions, "--", "."
+        ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8",
+            errors="replace",
+    ) as process:
+        stdout = process.stdout
+        assert stdout is not None
+        buffer = ""
+        for data in iter(lambda: stdout.read(_READ_SIZE), ""):
+            buffer += data
+            *records, buffer = buffer.split(_RECORD_SEPARATOR)
+            yield from _parse_records(records)
+        yield from _parse_records([buffer])
+
+
+def _parse_records(records: list[str]) -> Iterator[_ParsedCommit]:
+    for record in records:
+        fields = record.split(_FIELD_SEPARATOR)
+        if len(fields) != 6:
+            continue
+        commit_hash, time, author, subject, body, files = fields
+        yield _ParsedCommit(commit_hash, int(time), author, subject,
+                            f"{subject}\n{body}",
+                            [path for path in files.splitlines() if path])
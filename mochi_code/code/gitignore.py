@@ -0,0 +1,272 @@
+"""Gitignore aware traversal of a project.
+
+Supports the commonly used subset of the gitignore syntax: comments, negation,
+directory only patterns, anchored patterns and `*`, `?`, `[...]` and `**`
+wildcards, with a .gitignore file per directory. The ignore files of the
+parent directories apply too, up to the root of the repository (e.g. when
+walking a package of a monorepo).
+"""
+
+import dataclasses
+import os
+import pathlib
+import re
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from mochi_code.code.mochi_config import VCS_DIR_NAMES
+
+GITIGNORE_FILE_NAME = ".gitignore"
+
+# Never worth indexing, whatever the ignore files say.
+ALWAYS_IGNORED_DIRS = frozenset({".git", ".hg", ".svn", ".mochi"})
+# E.g. the config being created by mochi init.
+ALWAYS_IGNORED_DIR_PREFIXES = (".mochi.",)
+# Dependencies installed in the project, never part of its own code (even when
+# the ignore files don't mention them).
+VENDORED_DIRS = frozenset(
+    {"node_modules", "bower_components", "vendor", ".venv", "venv", "target"})
+
+
+@dataclass(frozen=True)
+class IgnoreRule:
+    """A single gitignore pattern."""
+    pattern: re.Pattern[str]
+    negated: bool
+    dir_only: bool
+    # The path of the ignore file's dir, relative to the walk root ("" for the
+    # root itself).
+    base: str
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob to a regex matching relative paths."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif char == "*":
+            regex += "[^/]*"
+            i += 1
+        elif char == "?":
+            regex += "[^/]"
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+                i += 1
+            else:
+                content = pattern[i + 1:end].replace("\\", "\\\\")
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                regex += f"[{content}]"
+                i = end + 1
+        elif char == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(char)
+            i += 1
+    return regex
+
+
+def parse_gitignore(content: str, base: str = "") -> list[IgnoreRule]:
+    """Parse the rules of a gitignore file.
+
+    Args:
+        content (str): The content of the gitignore file.
+        base (str): The posix path of the file's dir, relative to the root.
+
+    Returns:
+        list[IgnoreRule]: The rules, in the order they appear.
+    """
+    rules = []
+    for line in content.splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        # Trailing spaces are ignored unless escaped.
+        line = line.rstrip()
+        if line.endswith("\\"):
+            line += " "
+
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        # Patterns with a slash (other than a trailing one) are anchored to the
+        # ignore file's dir, others match at any depth.
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex = _translate(line)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        rules.append(
+            IgnoreRule(re.compile(f"^{regex}$"), negated, dir_only, base))
+    return rules
+
+
+def is_ignored(rules: list[IgnoreRule], relative_path: str,
+               is_dir: bool) -> bool:
+    """Check if the path is ignored by the rules (the last match wins).
+
+    Args:
+        rules (list[IgnoreRule]): The rules that apply to the path, outermost
+        first.
+        relative_path (str): The posix path, relative to the walk root.
+        is_dir (bool): Whether the path is a directory.
+
+    Returns:
+        bool: True if the path is ignored.
+    """
+    ignored = False
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if rule.base:
+            if not relative_path.startswith(rule.base + "/"):
+                continue
+            path = relative_path[len(rule.base) + 1:]
+        else:
+            path = relative_path
+        if rule.pattern.match(path):
+            ignored = not rule.negated
+    return ignored
+
+
+def is_always_ignored_dir(name: str) -> bool:
+    """Check if a directory is ignored whatever the ignore files say.
+
+    Args:
+        name (str): The name of the directory.
+
+    Returns:
+        bool: True if the directory should never be walked.
+    """
+    return (name in ALWAYS_IGNORED_DIRS or
+            name.startswith(ALWAYS_IGNORED_DIR_PREFIXES))
+
+
+def read_ignore_rules(dir_path: pathlib.Path, base: str) -> list[IgnoreRule]:
+    """Read the rules of the .gitignore file of a directory.
+
+    Args:
+        dir_path (pathlib.Path): The directory.
+        base (str): The posix path of the directory, relative to the walk root.
+
+    Returns:
+        list[IgnoreRule]: The rules, none if there is no (readable) file.
+    """
+    try:
+        content = (dir_path / GITIGNORE_FILE_NAME).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return []
+    return parse_gitignore(content, base)
+
+
+def read_parent_rules(root_path: pathlib.Path) -> tuple[str, list[IgnoreRule]]:
+    """Read the rules of the .gitignore files above a directory.
+
+    Only the files up to the root of its repository are read, a directory
+    outside of any repository has no parent rules.
+
+    Args:
+        root_path (pathlib.Path): The directory, e.g. a package of a monorepo.
+
+    Returns:
+        tuple[str, list[IgnoreRule]]: The posix path of the directory relative
+        to the repository root ("" if it is the root or isn't in a repository),
+        and the rules of the parent directories, outermost first (their bases
+        are relative to the repository root).
+    """
+    path = root_path.resolve()
+    for repository_path in path.parents:
+        if any((repository_path / name).exists() for name in VCS_DIR_NAMES):
+            break
+    else:
+        return "", []
+    if any((path / name).exists() for name in VCS_DIR_NAMES):
+        # The directory is a repository root itself (e.g. a submodule).
+        return "", []
+
+    prefix = path.relative_to(repository_path).as_posix()
+    parts = prefix.split("/")
+    rules = []
+    for depth in range(len(parts)):
+        base = "/".join(parts[:depth])
+        rules += read_ignore_rules(repository_path / base, base)
+    return prefix, rules
+
+
+def walk_files(
+    root_path: pathlib.Path,
+    extra_rules: Optional[list[IgnoreRule]] = None
+) -> Iterator[tuple[str, os.stat_result]]:
+    """Walk the files of the project that aren't ignored.
+
+    Ignored (and vendored, see VENDORED_DIRS) directories are never entered,
+    and symbolic links are skipped. The .gitignore files of the parent
+    directories apply, see read_parent_rules.
+
+    Args:
+        root_path (pathlib.Path): The root of the project.
+        extra_rules (Optional[list[IgnoreRule]]): Rules applied before any of
+        the .gitignore files, with bases relative to the root.
+
+    Yields:
+        tuple[str, os.stat_result]: The posix path of each file relative to
+        the root, with its stat.
+    """
+    # The rules match the paths relative to the repository root.
+    prefix, parent_rules = read_parent_rules(root_path)
+
+    def join(base: str) -> str:
+        return "/".join(part for part in (prefix, base) if part)
+
+    root_rules = [
+        dataclasses.replace(rule, base=join(rule.base))
+        for rule in extra_rules or []
+    ] + parent_rules + read_ignore_rules(root_path, prefix)
+    pending: list[tuple[pathlib.Path, str,
+                        list[IgnoreRule]]] = [(root_path, "", root_rules)]
+
+    while pending:
+        dir_path, base, rules = pending.pop()
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            continue
+
+        for entry in sorted(entries, key=lambda e: e.name):
+            relative_path = f"{base}/{entry.name}" if base else entry.name
+            try:
+                if entry.is_symlink():
+                    continue
+                is_dir = entry.is_dir()
+                if is_dir and (is_always_ignored_dir(entry.name) or
+                               entry.name in VENDORED_DIRS):
+                    continue
+                if is_ignored(rules, join(relative_path), is_dir):
+                    continue
+                if is_dir:
+                    child_path = pathlib.Path(entry.path)
+                    pending.append(
+                        (child_path, relative_path, rules +
+                         read_ignore_rules(child_path, join(relative_path))))
+                elif entry.is_file():
+                    yield relative_path, entry.stat()
+            except OSError:
+                continue
@@ -0,0 +1,230 @@
+"""Lexical (BM25) search over the code of the project.
+
+The indexed files are split in chunks of lines, and the index is stored in the
+mochi config dir as flat postings arrays (one slice of chunk ids and term
+frequencies per term) that are memory mapped when loaded, along with the sorted
+terms and the chunks. A query only touches the postings of its own terms and is
+scored with vectorised numpy operations, so it takes a few milliseconds even on
+large projects, and loading the index reads none of it.
+"""
+
+import math
+import pathlib
+from array import array
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from mochi_code.code.code_index import IndexUpdate, load_code_index
+from mochi_code.code.code_search import (
+    DEFAULT_CHUNK_LINES, INDEX_META_FILE_NAME, ChunkTable, CodeChunk,
+    SearchResult, StringTable, iter_file_chunks, load_index_generation,
+    make_generation, pack_chunks, pack_strings, save_index_generation, tokenize,
+    top_k_indices)
+from mochi_code.code.mochi_config import (get_code_index_path,
+                                          get_lexical_index_path)
+from mochi_code.tracing import annotate, traced
+
+LEXICAL_INDEX_VERSION = 2
+
+# The usual BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class LexicalIndex:  # pylint: disable=too-few-public-methods
+    """A loaded (memory mapped) lexical index."""
+
+    def __init__(self, project_path: pathlib.Path,
+                 arrays: dict[str, np.ndarray]) -> None:
+        """Create the index from its (loaded) arrays.
+
+        Args:
+            project_path (pathlib.Path): The root of the indexed project.
+            arrays (dict[str, np.ndarray]): The sorted "terms" (see
+            StringTable) with the "posting_offsets" of each term, the
+            "doc_ids" and "term_freqs" of all the postings, the chunks (see
+            ChunkTable) and their BM25 "length_norms".
+        """
+        self.project_path = project_path
+        self.chunks = ChunkTable(arrays)
+        self._terms = StringTable.from_arrays(arrays, "terms")
+        self._posting_offsets = arrays["posting_offsets"]
+        self._doc_ids = arrays["doc_ids"]
+        self._term_freqs = arrays["term_freqs"]
+        self._length_norms = arrays["length_norms"]
+
+    @traced("lexical.search")
+    def search(self, query: str, top_k: int = 5) -> list[SearchResult]:
+        """Find the chunks most relevant to the query.
+
+        Args:
+            query (str): The query, in code or natural language.
+            top_k (int): The maximum number of results.
+
+        Returns:
+            list[SearchResult]: The best matches, best first.
+        """
+        chunk_count = len(self.chunks)
+        scores = np.zeros(chunk_count, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            term_id = self._terms.find(term)
+            if term_id is None:
+                continue
+            matched = True
+            start, end = (int(offset)
+                          for offset in self._posting_offsets[term_id:term_id +
+                                                              2])
+            length = end - start
+            doc_ids = self._doc_ids[start:end]
+            term_freqs = self._term_freqs[start:end].astype(np.float32)
+            idf = math.log(1 + (chunk_count - length + 0.5) / (length + 0.5))
+            # A term appears once per chunk in its postings, so there are no
+            # repeated indices to accumulate.
+            scores[doc_ids] += (idf * term_freqs * (BM25_K1 + 1) /
+                                (term_freqs + self._length_norms[doc_ids]))
+
+        if not matched:
+            return []
+        annotate(terms=len(self._terms), chunks=chunk_count)
+        return [
+            SearchResult(self.chunks[chunk_id], float(scores[chunk_id]))
+            for chunk_id in top_k_indices(scores, top_k)
+        ]
+
+
+@traced("lexical.load")
+def load_lexical_index(config_path: pathlib.Path) -> Optional[LexicalIndex]:
+    """Load the lexical index of the project, memory mapping its arrays.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+
+    Returns:
+        Optional[LexicalIndex]: The index, or None if there isn't one (or it was
+        written by an incompatible version).
+    """
+    loaded = load_index_generation(
+        pathlib.Path(get_lexical_index_path(config_path)),
+        LEXICAL_INDEX_VERSION)
+    if loaded is None:
+        return None
+    _, arrays = loaded
+    return LexicalIndex(config_path.parent, arrays)
+
+
+@traced("lexical.build")
+def build_lexical_index(config_path: pathlib.Path,
+                        chunk_lines: int = DEFAULT_CHUNK_LINES) -> int:
+    """Build the lexical index from the files in the code index.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        chunk_lines (int): The number of lines per chunk.
+
+    Returns:
+        int: The number of indexed chunks.
+    """
+    project_path = config_path.parent
+    files = load_code_index(pathlib.Path(get_code_index_path(config_path)))
+
+    builder = _IndexBuilder()
+    for relative_path in sorted(files):
+        for chunk, content in iter_file_chunks(project_path, relative_path,
+                                               chunk_lines):
+            builder.add_chunk(chunk, content)
+
+    arrays = builder.build()
+    save_index_generation(pathlib.Path(get_lexical_index_path(config_path)),
+                          make_generation(), {},
+                          arrays,
+                          version=LEXICAL_INDEX_VERSION)
+
+    annotate(chunks=len(builder.chunks),
+             terms=len(arrays["posting_offsets"]) - 1,
+             postings=len(arrays["doc_ids"]))
+    return len(builder.chunks)
+
+
+class _IndexBuilder:
+    """Collects the postings of the chunks, in the order they're added."""
+
+    def __init__(self) -> None:
+        self.chunks: list[CodeChunk] = []
+        self._chunk_lengths = array("i")
+        self._term_ids: dict[str, int] = {}
+        self._posting_terms = array("i")
+        self._posting_docs = array("i")
+        self._posting_freqs = array("i")
+
+    def add_chunk(self, chunk: CodeChunk, content: str) -> None:
+        """Add the terms of a chunk (chunks without terms are skipped)."""
+        counts = Counter(tokenize(content))
+        if not counts:
+            return
+        chunk_id = len(self.chunks)
+        self.chunks.append(chunk)
+        self._chunk_lengths.append(sum(counts.values()))
+        for term, count in counts.items():
+            self._posting_terms.append(
+                self._term_ids.setdefault(term, len(self._term_ids)))
+            self._posting_docs.append(chunk_id)
+            self._posting_freqs.append(count)
+
+    def build(self) -> dict[str, np.ndarray]:
+        """Group the postings by term, in the order of the sorted terms.
+
+        Returns:
+            dict[str, np.ndarray]: The arrays to save, see LexicalIndex.
+        """
+        terms = sorted(self._term_ids)
+        ranks = np.empty(len(terms), dtype=np.int32)
+        ranks[[self._term_ids[term] for term in terms]] = np.arange(len(terms))
+        posting_ranks = ranks[np.frombuffer(self._posting_terms,
+                                            dtype=np.int32)]
+        order = np.argsort(posting_ranks, kind="stable")
+        posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_ranks, minlength=len(terms)),
+                  out=posting_offsets[1:])
+        # Frequencies over 65535 in a single chunk don't change the ranking.
+        term_freqs = np.minimum(
+            np.frombuffer(self._posting_freqs, dtype=np.int32)[order],
+            np.iinfo(np.uint16).max).astype(np.uint16)
+        return {
+            **pack_strings("terms", terms),
+            **pack_chunks(self.chunks),
+            "posting_offsets": posting_offsets,
+            "doc_ids": np.frombuffer(self._posting_docs, dtype=np.int32)[order],
+            "term_freqs": term_freqs,
+            "length_norms": _get_length_norms(self._chunk_lengths),
+        }
+
+
+def _get_length_norms(chunk_lengths: array) -> np.ndarray:
+    """Get the BM25 length normalisation of each chunk, from its length."""
+    lengths = np.frombuffer(chunk_lengths, dtype=np.int32).astype(np.float32)
+    average_length = float(lengths.mean()) if len(lengths) else 1.0
+    return (BM25_K1 *
+            (1 - BM25_B + BM25_B * lengths / max(average_length, 1.0))).astype(
+                np.float32)
+
+
+def update_lexical_index(config_path: pathlib.Path,
+                         update: IndexUpdate) -> bool:
+    """Rebuild the lexical index if the indexed files changed.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        update (IndexUpdate): The last update of the code index.
+
+    Returns:
+        bool: True if the index was rebuilt.
+    """
+    meta_path = pathlib.Path(
+        get_lexical_index_path(config_path)) / INDEX_META_FILE_NAME
+    if not update.changed and not update.removed and meta_path.exists():
+        return False
+    build_lexical_index(config_path)
+    return True
@@ -1,15 +1,52 @@
 """Module for handling mochi config files."""
 
-import pathlib
+import contextlib
+import fcntl
+import hashlib
 import json
-from typing import Optional, TypeVar
+import os
+import pathlib
+import threading
+import uuid
+from dataclasses import dataclass
+from stat import S_IMODE, S_ISDIR
+from typing import Any, Callable, Generic, Iterator, Optional, TypeVar
 
 from mochi_code.code import ProjectDetailsWithDependencies
+from mochi_code.tracing import traced
 
 MOCHI_DIR_NAME = ".mochi"
 PROJECT_DETAILS_FILE_NAME = "project_details.json"
+RESPONSE_CACHE_DIR_NAME = "response_cache"
+CODE_INDEX_FILE_NAME = "code_index.json"
+LEXICAL_INDEX_DIR_NAME = "lexical_index"
+VECTOR_STORE_DIR_NAME = "vector_store"
+SYMBOL_INDEX_DIR_NAME = "symbol_index"
+GIT_HISTORY_FILE_NAME = "git_history.sqlite"
+DEPENDENCY_APIS_DIR_NAME = "dependency_apis"
+BACKEND_CONFIG_FILE_NAME = "backend.json"
+# The project root whose config is used, wherever mochi runs.
+MOCHI_ROOT_ENV_VAR = "MOCHI_ROOT"
+# The dirs (separated by os.pathsep) the config search stops at.
+CEILING_DIRS_ENV_VAR = "MOCHI_CEILING_DIRS"
+# The roots of the repositories, the config search stops there.
+VCS_DIR_NAMES = (".git", ".hg", ".svn")
+# Overrides the dir of the caches shared by all the projects.
+USER_CACHE_ENV_VAR = "MOCHI_CACHE_DIR"
+# The config is filled in a staging dir, then renamed to MOCHI_DIR_NAME.
+STAGING_DIR_PREFIX = MOCHI_DIR_NAME + ".staging-"
+
+# The version of the project details file format, older files are migrated
+# when loaded (and upgraded when saved again).
+PROJECT_DETAILS_SCHEMA_VERSION = 1
+SCHEMA_VERSION_KEY = "schema_version"
+CHECKSUM_KEY = "checksum"
 
 _PathT = TypeVar("_PathT", pathlib.Path, pathlib.PurePath)
+_T = TypeVar("_T")
+
+# Upgrade the content of a config file from a version to the next one.
+Migration = Callable[[dict[str, Any]], dict[str, Any]]
 
 
 def get_config_path(root_path: _PathT) -> _PathT:
@@ -36,13 +73,127 @@ def get_project_details_path(config_path: _PathT) -> _PathT:
     return config_path / PROJECT_DETAILS_FILE_NAME
 
 
+def get_response_cache_path(config_path: _PathT) -> _PathT:
+    """Get the path to the response cache directory.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the response cache directory.
+    """
+    return config_path / RESPONSE_CACHE_DIR_NAME
+
+
+def get_code_index_path(config_path: _PathT) -> _PathT:
+    """Get the path to the code index file.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the code index file.
+    """
+    return config_path / CODE_INDEX_FILE_NAME
+
+
+def get_lexical_index_path(config_path: _PathT) -> _PathT:
+    """Get the path to the lexical (BM25) index directory.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the lexical index directory.
+    """
+    return config_path / LEXICAL_INDEX_DIR_NAME
+
+
+def get_vector_store_path(config_path: _PathT) -> _PathT:
+    """Get the path to the vector store directory.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the vector store directory.
+    """
+    return config_path / VECTOR_STORE_DIR_NAME
+
+
+def get_symbol_index_path(config_path: _PathT) -> _PathT:
+    """Get the path to the symbol index directory.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the symbol index directory.
+    """
+    return config_path / SYMBOL_INDEX_DIR_NAME
+
+
+def get_git_history_path(config_path: _PathT) -> _PathT:
+    """Get the path to the git history database.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the git history database.
+    """
+    return config_path / GIT_HISTORY_FILE_NAME
+
+
+def get_dependency_apis_path(config_path: _PathT) -> _PathT:
+    """Get the path to the API index directory of the project dependencies.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the dependency API index directory.
+    """
+    return config_path / DEPENDENCY_APIS_DIR_NAME
+
+
+def get_user_cache_path() -> pathlib.Path:
+    """Get the path to the cache directory shared by all the projects.
+
+    Returns:
+        pathlib.Path: The path to MOCHI_CACHE_DIR, or to mochi in the user's
+        cache directory (e.g. ~/.cache/mochi).
+    """
+    override = os.environ.get(USER_CACHE_ENV_VAR)
+    if override:
+        return pathlib.Path(override)
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    return (pathlib.Path(cache_home) if cache_home else pathlib.Path.home() /
+            ".cache") / "mochi"
+
+
+def get_backend_config_path(config_path: _PathT) -> _PathT:
+    """Get the path to the model backend config file.
+
+    Args:
+        config_path (_PathT): The path to the mochi config directory.
+
+    Returns:
+        _PathT: The path to the model backend config file.
+    """
+    return config_path / BACKEND_CONFIG_FILE_NAME
+
+
+@traced("config.search")
 def search_mochi_config(
         start_path: pathlib.Path,
         root_path: Optional[pathlib.Path] = None) -> Optional[pathlib.PurePath]:
     """Find the existing mochi config file if it exists.
     
     This will search up the directory tree from the provided path until it finds
-    a mochi config file or reaches the root directory.
+    a mochi config file or reaches the root directory (or the root of a
+    repository, or a MOCHI_CEILING_DIRS dir). MOCHI_ROOT overrides the search
+    with the project root to use. See ConfigResolver.
 
     Args:
         start_path (pathlib.Path): The path to start searching from.
@@ -52,21 +203,109 @@ def search_mochi_config(
         Optional[pathlib.PurePath]: The path to the mochi config dir or None if
             it does not exist.
     """
+    return _RESOLVER.resolve(start_path, root_path)
 
-    def is_root(path: pathlib.Path) -> bool:
-        return path in [path.parent, root_path]
 
-    current_path = start_path
-    if current_path.is_file():
-        raise ValueError("Cannot search for mochi config in a file.")
+@dataclass(frozen=True)
+class _DirState:
+    """What a dir says about the configs, as of its mtime."""
+    mtime_ns: int
+    has_config: bool
+    # E.g. the root of a git repository, the search stops there.
+    is_boundary: bool
 
-    mochi_path = get_config_path(current_path)
 
-    while not is_root(current_path) and not mochi_path.exists():
-        current_path = current_path.parent
-        mochi_path = get_config_path(current_path)
+class ConfigResolver:
+    """Finds the mochi configs, remembering the dirs it looked at.
 
-    return mochi_path if mochi_path.exists() else None
+    Each dir is stat'ed on every search, but only looked into again if its
+    mtime changed (a .mochi dir created or removed in it changes it), so
+    resolving the configs of many paths (e.g. every question of a batch, or
+    every file of a project) costs a stat call per dir. The configs created or
+    removed by any process are seen straight away.
+    """
+
+    def __init__(self) -> None:
+        """Create a resolver, without anything remembered."""
+        self._lock = threading.Lock()
+        self._dirs: dict[pathlib.Path, _DirState] = {}
+
+    def resolve(
+            self,
+            start_path: pathlib.Path,
+            root_path: Optional[pathlib.Path] = None
+    ) -> Optional[pathlib.PurePath]:
+        """Find the mochi config of a path, see search_mochi_config.
+
+        Args:
+            start_path (pathlib.Path): The path to start searching from.
+            root_path (Optional[pathlib.Path]): The root path to stop.
+
+        Returns:
+            Optional[pathlib.PurePath]: The path to the mochi config dir or None
+            if it does not exist.
+        """
+        override = os.environ.get(MOCHI_ROOT_ENV_VAR)
+        if override:
+            config_path = get_config_path(pathlib.Path(override))
+            return config_path if config_path.is_dir() else None
+
+        ceilings = _get_ceiling_dirs()
+        if root_path is not None:
+            ceilings.add(root_path)
+        current_path = start_path
+        state = self._get_state(current_path)
+        if state is None and current_path.is_file():
+            raise ValueError("Cannot search for mochi config in a file.")
+        while True:
+            if state is not None and state.has_config:
+                return get_config_path(current_path)
+            if ((state is not None and state.is_boundary) or
+                    current_path in ceilings or
+                    current_path == current_path.parent):
+                return None
+            current_path = current_path.parent
+            state = self._get_state(current_path)
+
+    def forget(self, path: pathlib.Path) -> None:
+        """Look at a dir again next time, e.g. after creating its config.
+
+        Args:
+            path (pathlib.Path): The dir.
+        """
+        with self._lock:
+            self._dirs.pop(path, None)
+
+    def _get_state(self, path: pathlib.Path) -> Optional[_DirState]:
+        """Get the state of a dir, None if it isn't one (or doesn't exist)."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISDIR(stat.st_mode):
+            return None
+        with self._lock:
+            state = self._dirs.get(path)
+        if state is None or state.mtime_ns != stat.st_mtime_ns:
+            has_config = get_config_path(path).is_dir()
+            # The search stops at a config anyway.
+            is_boundary = not has_config and any(
+                (path / name).exists() for name in VCS_DIR_NAMES)
+            state = _DirState(mtime_ns=stat.st_mtime_ns,
+                              has_config=has_config,
+                              is_boundary=is_boundary)
+            with self._lock:
+                self._dirs[path] = state
+        return state
+
+
+def _get_ceiling_dirs() -> set[pathlib.Path]:
+    """Get the dirs the config search stops at, from MOCHI_CEILING_DIRS."""
+    value = os.environ.get(CEILING_DIRS_ENV_VAR, "")
+    return {pathlib.Path(path) for path in value.split(os.pathsep) if path}
+
+
+_RESOLVER = ConfigResolver()
 
 
 def create_config(
@@ -88,6 +327,7 @@ def create_config(
 
     mochi_root = get_config_path(project_path)
     mochi_root.mkdir(parents=True)
+    _RESOLVER.forget(project_path)
 
     project_details_path = get_project_details_path(mochi_root)
     save_project_details(project_details_path, project_details)
@@ -95,6 +335,52 @@ def create_config(
     return mochi_root
 
 
+def create_staging_config(project_path: pathlib.Path) -> pathlib.Path:
+    """Create an empty config dir, to fill before publishing it.
+
+    Args:
+        project_path (pathlib.Path): The path to the project to initialize.
+
+    Returns:
+        pathlib.Path: The path to the staging config dir (ignored by the code
+        index).
+    """
+    if project_path.is_file():
+        raise ValueError("Cannot create a mochi config in a file.")
+    staging_path = project_path / f"{STAGING_DIR_PREFIX}{uuid.uuid4().hex}"
+    # Unlike tempfile (0700), the umask applies to the mode of the new dir, and
+    # so to the published config.
+    staging_path.mkdir(0o777)
+    return staging_path
+
+
+def publish_config(
+        staging_path: pathlib.Path,
+        project_details: ProjectDetailsWithDependencies) -> pathlib.PurePath:
+    """Save the project details in a staging config and make it the config.
+
+    The config dir appears complete, or not at all.
+
+    Args:
+        staging_path (pathlib.Path): The staging config dir, see
+        create_staging_config.
+        project_details (ProjectDetailsWithDependencies): The details of the
+        project to save in the config.
+
+    Returns:
+        pathlib.PurePath: The path to the mochi config dir.
+    """
+    save_project_details(get_project_details_path(staging_path),
+                         project_details)
+    mochi_root = get_config_path(staging_path.parent)
+    if mochi_root.exists():
+        raise FileExistsError(f"The mochi config '{mochi_root}' exists.")
+    os.rename(staging_path, mochi_root)
+    _RESOLVER.forget(staging_path.parent)
+    return mochi_root
+
+
+@traced("config.save_project_details")
 def save_project_details(
         project_details_path: _PathT,
         project_details: ProjectDetailsWithDependencies) -> None:
@@ -106,15 +392,18 @@ def save_project_details(
         project_details (ProjectDetailsWithDependencies): The details of the 
         project to save in the config.
     """
-    with open(project_details_path, "w",
-              encoding="utf-8") as project_details_file:
-        project_details_file.write(project_details.json())
+    save_config_file(pathlib.Path(project_details_path), project_details.dict(),
+                     PROJECT_DETAILS_SCHEMA_VERSION)
 
 
+@traced("config.load_project_details")
 def load_project_details(
         project_details_path: _PathT) -> ProjectDetailsWithDependencies:
     """Load the project details from the mochi config file.
 
+    The details are only parsed again when the file changed, and only validated
+    if mochi didn't write them itself (e.g. they were edited by hand).
+
     Args:
         project_details_path (_PathT): The path to the project details file.
 
@@ -122,6 +411,159 @@ def load_project_details(
         ProjectDetailsWithDependencies: The project details loaded from the 
         config.
     """
-    with open(project_details_path, "r",
-              encoding="utf-8") as project_details_file:
-        return ProjectDetailsWithDependencies(**json.load(project_details_file))
+    return _PROJECT_DETAILS_CACHE.load(
+        pathlib.Path(project_details_path)).copy(deep=True)
+
+
+def _parse_project_details(
+        path: pathlib.Path) -> ProjectDetailsWithDependencies:
+    content, trusted = load_config_file(path, PROJECT_DETAILS_SCHEMA_VERSION,
+                                        _PROJECT_DETAILS_MIGRATIONS)
+    if trusted:
+        return ProjectDetailsWithDependencies.construct(**content)
+    return ProjectDetailsWithDependencies(**content)
+
+
+# The project details files written before they had a version have the same
+# fields as the version 1.
+_PROJECT_DETAILS_MIGRATIONS: dict[int, Migration] = {0: dict}
+
+
+def save_config_file(path: pathlib.Path, content: dict[str, Any],
+                     schema_version: int) -> None:
+    """Save a config file atomically, with its schema version and checksum.
+
+    Readers see the previous file or the new one, never a partial file, and
+    concurrent writers (e.g. parallel inits) write one at a time.
+
+    Args:
+        path (pathlib.Path): The path to the config file.
+        content (dict[str, Any]): The content, a JSON object.
+        schema_version (int): The version of the content's format.
+    """
+    content = {
+        **content, SCHEMA_VERSION_KEY: schema_version,
+        CHECKSUM_KEY: _get_checksum(content)
+    }
+    with _lock_dir(path.parent):
+        write_file_atomically(path, json.dumps(content, indent=2))
+
+
+def load_config_file(
+        path: pathlib.Path, schema_version: int,
+        migrations: dict[int, Migration]) -> tuple[dict[str, Any], bool]:
+    """Load a config file, migrating it to the current schema version.
+
+    Args:
+        path (pathlib.Path): The path to the config file.
+        schema_version (int): The current version of the content's format.
+        migrations (dict[int, Migration]): Upgrade the content from each older
+        version (the files without a version are version 0).
+
+    Returns:
+        tuple[dict[str, Any], bool]: The content, and whether it's trusted: it
+        was written by mochi (with the current version) and wasn't changed
+        since, so it doesn't need to be validated again.
+    """
+    with open(path, "r", encoding="utf-8") as config_file:
+        content = json.load(config_file)
+    if not isinstance(content, dict):
+        raise ValueError(f"The config file '{path}' isn't a JSON object.")
+
+    version = content.pop(SCHEMA_VERSION_KEY, 0)
+    checksum = content.pop(CHECKSUM_KEY, None)
+    if version > schema_version:
+        raise ValueError(f"The config file '{path}' was written by a newer " +
+                         "version of mochi.")
+    trusted = (version == schema_version and checksum == _get_checksum(content))
+    while version < schema_version:
+        content = migrations[version](content)
+        version += 1
+    return content, trusted
+
+
+def write_file_atomically(path: pathlib.Path, text: str) -> None:
+    """Write a file atomically, readers never see a partial file.
+
+    The content is flushed to the disk before the file is replaced, so a crash
+    leaves the previous file or the new one. The file keeps the permissions of
+    the one it replaces (new files get the default ones, see umask).
+
+    Args:
+        path (pathlib.Path): The path to the file.
+        text (str): The content of the file.
+    """
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    # Unlike tempfile (0600), the umask applies to the mode of the new file.
+    temp_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with contextlib.suppress(FileNotFoundError):
+            os.fchmod(temp_fd, S_IMODE(os.stat(path).st_mode))
+        with open(temp_fd, "w", encoding="utf-8") as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
+
+
+def _get_checksum(content: dict[str, Any]) -> str:
+    """Get the checksum of the content of a config file, without its
+    checksum."""
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def _lock_dir(path: pathlib.Path) -> Iterator[None]:
+    """Hold an exclusive (advisory) lock on a dir, across processes."""
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(dir_fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the dir releases the lock.
+        os.close(dir_fd)
+
+
+class _ConfigCache(Generic[_T]):  # pylint: disable=too-few-public-methods
+    """Parsed config files, until they change."""
+
+    def __init__(self, parse: Callable[[pathlib.Path], _T]) -> None:
+        """Create an empty cache.
+
+        Args:
+            parse (Callable[[pathlib.Path], _T]): Parses a config file.
+        """
+        self._parse = parse
+        self._lock = threading.Lock()
+        self._entries: dict[pathlib.Path, tuple[tuple[int, int, int], _T]] = {}
+
+    def load(self, path: pathlib.Path) -> _T:
+        """Load a config file, parsed again only if it changed.
+
+        Args:
+            path (pathlib.Path): The path to the config file.
+
+        Returns:
+            _T: The parsed file.
+        """
+        stat = path.stat()
+        # The files are replaced when saved, the inode changes too.
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        key = path.absolute()
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        parsed = self._parse(path)
+        with self._lock:
+            self._entries[key] = (signature, parsed)
+        return parsed
+
+
+_PROJECT_DETAILS_CACHE = _ConfigCache(_parse_project_details)
@@ -0,0 +1,165 @@
+"""Local repair of the JSON outputs of the model.
+
+The model is asked for a single JSON object, but its replies are sometimes
+slightly off: wrapped in prose or code fences, with single quotes, trailing
+commas, unquoted keys, a missing closing brace or capitalised values. These are
+fixed locally, which is much faster (and cheaper) than asking the model again.
+"""
+
+import ast
+import json
+import re
+from typing import Any, Callable, Optional
+
+from pydantic import ValidationError
+
+from mochi_code.code.project_details import ProjectDetails
+
+# Matches a comma followed by a closing bracket.
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Matches an unquoted key, e.g. {language: "python"}.
+_UNQUOTED_KEY = re.compile(r"([{,]\s*)([A-Za-z_][A-Za-z0-9_ -]*?)\s*:")
+
+_CLOSING = {"{": "}", "[": "]"}
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """Extract the first JSON object of the text.
+
+    The object ends at its matching brace (braces in strings are skipped), if
+    it is cut short the missing quote and brackets are added.
+
+    Args:
+        text (str): The text, e.g. a reply of the model.
+
+    Returns:
+        Optional[str]: The object or None if the text has no object.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    open_brackets: list[str] = []
+    quote: Optional[str] = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in _CLOSING:
+            open_brackets.append(_CLOSING[char])
+        elif open_brackets and char == open_brackets[-1]:
+            open_brackets.pop()
+            if not open_brackets:
+                return text[start:index + 1]
+
+    # Cut short, close what is still open.
+    return (text[start:].rstrip() + (quote or "") +
+            "".join(reversed(open_brackets)))
+
+
+def _parse_json(candidate: str) -> Any:
+    return json.loads(candidate, strict=False)
+
+
+def _parse_without_trailing_commas(candidate: str) -> Any:
+    return json.loads(_TRAILING_COMMA.sub(r"\1", candidate), strict=False)
+
+
+def _parse_with_quoted_keys(candidate: str) -> Any:
+    quoted = _UNQUOTED_KEY.sub(r'\1"\2":',
+                               _TRAILING_COMMA.sub(r"\1", candidate))
+    return json.loads(quoted, strict=False)
+
+
+def _parse_python_literal(candidate: str) -> Any:
+    # Single quotes (and True, False or None) are valid python literals.
+    return ast.literal_eval(candidate)
+
+
+# The parsers tried in turn, from the strictest.
+_PARSERS: list[tuple[str, Callable[[str], Any]]] = [
+    ("json", _parse_json),
+    ("trailing_commas", _parse_without_trailing_commas),
+    ("unquoted_keys", _parse_with_quoted_keys),
+    ("python_literal", _parse_python_literal),
+]
+
+
+def repair_json_object(text: str) -> Optional[tuple[dict[str, Any], str]]:
+    """Parse the first JSON object of the text, fixing common syntax issues.
+
+    Args:
+        text (str): The text, e.g. a reply of the model.
+
+    Returns:
+        Optional[tuple[dict[str, Any], str]]: The object and the name of the
+        fix that worked ("json" if none was needed), or None if it couldn't be
+        parsed.
+    """
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None
+    for name, parse in _PARSERS:
+        try:
+            value = parse(candidate)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+        if isinstance(value, dict):
+            return value, name
+    return None
+
+
+def normalise_project_details(details: ProjectDetails) -> ProjectDetails:
+    """Lower case the language and package manager, as the prompt asks.
+
+    The config file is left as is, file names are case sensitive.
+
+    Args:
+        details (ProjectDetails): The details given by the model.
+
+    Returns:
+        ProjectDetails: The normalised details.
+    """
+    return ProjectDetails(
+        language=details.language.strip().lower(),
+        config_file=details.config_file.strip(),
+        package_manager=details.package_manager.strip().lower())
+
+
+def repair_project_details(text: str) -> Optional[tuple[ProjectDetails, str]]:
+    """Parse the project details from a malformed reply of the model.
+
+    Args:
+        text (str): The reply of the model.
+
+    Returns:
+        Optional[tuple[ProjectDetails, str]]: The details and the name of the
+        fix that worked, or None if the reply can't be repaired.
+    """
+    repaired = repair_json_object(text)
+    if repaired is None:
+        return None
+    value, fix = repaired
+
+    # The schema is sometimes echoed back, with the values as its properties.
+    if set(value) == {"properties"} and isinstance(value["properties"], dict):
+        value = value["properties"]
+    fields = {_normalise_key(key): item for key, item in value.items()}
+    try:
+        details = ProjectDetails.parse_obj(fields)
+    except ValidationError:
+        return None
+    return normalise_project_details(details), fix
+
+
+def _normalise_key(key: Any) -> str:
+    """Normalise a key to the field names, e.g. "Config File" to config_file."""
+    return re.sub(r"[\s-]+", "_", str(key).strip()).lower()
@@ -0,0 +1,130 @@
+"""Rule based detection of the project details from its files.
+
+Most projects can be recognised from a few marker files (e.g. a lock file next
+to its config). Each matching rule adds to the score of its candidate details
+and the details are only trusted when a single candidate dominates, otherwise
+the detection is ambiguous and the model should be used instead.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from mochi_code.code.project_details import ProjectDetails
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.75
+
+
+@dataclass(frozen=True)
+class _Rule:
+    """Project details implied by the presence of all the marker files."""
+    markers: frozenset[str]
+    language: str
+    config_file: str
+    package_manager: str
+    weight: float
+
+
+def _rule(markers: Iterable[str], language: str, config_file: str,
+          package_manager: str, weight: float) -> _Rule:
+    return _Rule(frozenset(markers), language, config_file, package_manager,
+                 weight)
+
+
+# Rules with lock files are the most specific, a config file on its own could be
+# used by different package managers.
+_RULES = [
+    _rule(["pyproject.toml", "poetry.lock"], "python", "pyproject.toml",
+          "poetry", 1.0),
+    _rule(["pyproject.toml", "pdm.lock"], "python", "pyproject.toml", "pdm",
+          1.0),
+    _rule(["pyproject.toml", "uv.lock"], "python", "pyproject.toml", "uv", 1.0),
+    _rule(["Pipfile"], "python", "Pipfile", "pipenv", 0.9),
+    _rule(["requirements.txt"], "python", "requirements.txt", "pip", 0.8),
+    _rule(["pyproject.toml"], "python", "pyproject.toml", "pip", 0.6),
+    _rule(["package.json", "package-lock.json"], "javascript", "package.json",
+          "npm", 1.0),
+    _rule(["package.json", "yarn.lock"], "javascript", "package.json", "yarn",
+          1.0),
+    _rule(["package.json", "pnpm-lock.yaml"], "javascript", "package.json",
+          "pnpm", 1.0),
+    _rule(["package.json", "bun.lockb"], "javascript", "package.json", "bun",
+          1.0),
+    _rule(["package.json"], "javascript", "package.json", "npm", 0.6),
+    _rule(["Cargo.toml"], "rust", "Cargo.toml", "cargo", 0.9),
+    _rule(["Cargo.toml", "Cargo.lock"], "rust", "Cargo.toml", "cargo", 1.0),
+    _rule(["go.mod"], "go", "go.mod", "go", 1.0),
+    _rule(["Gemfile"], "ruby", "Gemfile", "bundler", 0.9),
+    _rule(["Gemfile", "Gemfile.lock"], "ruby", "Gemfile", "bundler", 1.0),
+    _rule(["pom.xml"], "java", "pom.xml", "maven", 1.0),
+    _rule(["build.gradle"], "java", "build.gradle", "gradle", 0.9),
+    _rule(["build.gradle.kts"], "kotlin", "build.gradle.kts", "gradle", 0.9),
+    _rule(["composer.json"], "php", "composer.json", "composer", 1.0),
+    _rule(["mix.exs"], "elixir", "mix.exs", "mix", 1.0),
+    _rule(["Package.swift"], "swift", "Package.swift", "swift", 1.0),
+]
+
+# The config files marking the root of a project.
+MANIFEST_FILE_NAMES = frozenset(rule.config_file for rule in _RULES)
+
+
+@dataclass(frozen=True)
+class ProjectDetection:
+    """The project details detected locally."""
+    project_details: ProjectDetails
+    confidence: float
+
+
+def detect_project(
+    project_files: Iterable[str],
+    confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD
+) -> Optional[ProjectDetection]:
+    """Detect the project details from the names of the files in its root.
+
+    Args:
+        project_files (Iterable[str]): The names of the files in the project
+        root.
+        confidence_threshold (float): The minimum confidence (0 to 1) for the
+        detection to be trusted.
+
+    Returns:
+        Optional[ProjectDetection]: The detected details, or None if no rules
+        matched or the result was ambiguous.
+    """
+    file_names = set(project_files)
+    matches = [rule for rule in _RULES if rule.markers <= file_names]
+
+    # A rule is redundant if a more specific rule for the same details matched
+    # (e.g. Cargo.toml alone when Cargo.toml + Cargo.lock matched).
+    candidates: dict[tuple[str, str, str], float] = {}
+    for rule in matches:
+        details = (rule.language, rule.config_file, rule.package_manager)
+        candidates[details] = max(candidates.get(details, 0.0), rule.weight)
+
+    # Config files matched with a lock file are explained by that lock file, so
+    # the weaker rules for the same config file don't compete with it.
+    strongest_per_config: dict[str, float] = {}
+    for (_, config_file, _), weight in candidates.items():
+        strongest_per_config[config_file] = max(
+            strongest_per_config.get(config_file, 0.0), weight)
+    candidates = {
+        details: weight
+        for details, weight in candidates.items()
+        if weight == strongest_per_config[details[1]]
+    }
+
+    if not candidates:
+        return None
+
+    best_details, best_weight = max(candidates.items(), key=lambda c: c[1])
+    confidence = best_weight / sum(candidates.values())
+    if confidence < confidence_threshold:
+        return None
+
+    language, config_file, package_manager = best_details
+    if language == "javascript" and "tsconfig.json" in file_names:
+        language = "typescript"
+
+    return ProjectDetection(
+        ProjectDetails(language=language,
+                       config_file=config_file,
+                       package_manager=package_manager), confidence)
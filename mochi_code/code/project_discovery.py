@@ -0,0 +1,87 @@
+"""Discovery of the projects in a repository (e.g. the packages of a monorepo).
+
+A directory is a project when it has a manifest file (see MANIFEST_FILE_NAMES).
+The directories are scanned in parallel, each one by a worker of a thread pool
+(os.scandir releases the GIL, so the threads overlap their IO), and ignored
+directories are never entered.
+"""
+
+import concurrent.futures
+import os
+import pathlib
+from typing import Optional
+
+from mochi_code.code.gitignore import (VENDORED_DIRS, IgnoreRule,
+                                       is_always_ignored_dir, is_ignored,
+                                       read_ignore_rules)
+from mochi_code.code.project_detection import MANIFEST_FILE_NAMES
+from mochi_code.tracing import annotate, traced
+
+# A directory to scan: its path, relative path and the rules of its parents.
+_PendingDir = tuple[pathlib.Path, str, list[IgnoreRule]]
+
+
+@traced("discovery.projects")
+def discover_projects(root_path: pathlib.Path,
+                      max_workers: Optional[int] = None) -> list[pathlib.Path]:
+    """Find the projects under the root (included), ignoring ignored dirs.
+
+    Args:
+        root_path (pathlib.Path): The root of the repository.
+        max_workers (Optional[int]): The number of threads scanning dirs.
+
+    Returns:
+        list[pathlib.Path]: The project directories, sorted.
+    """
+    projects = []
+    scanned = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {executor.submit(_scan_dir, (root_path, "", []))}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                dir_path, is_project, children = future.result()
+                scanned += 1
+                if is_project:
+                    projects.append(dir_path)
+                pending.update(
+                    executor.submit(_scan_dir, child) for child in children)
+
+    annotate(dirs=scanned, projects=len(projects))
+    return sorted(projects)
+
+
+def _scan_dir(
+        pending_dir: _PendingDir
+) -> tuple[pathlib.Path, bool, list[_PendingDir]]:
+    """Scan a directory for manifest files and the subdirs to scan next.
+
+    Returns:
+        tuple[pathlib.Path, bool, list[_PendingDir]]: The directory, whether it
+        is a project and its subdirs that aren't ignored.
+    """
+    dir_path, base, parent_rules = pending_dir
+    rules = parent_rules + read_ignore_rules(dir_path, base)
+    is_project = False
+    children = []
+    try:
+        entries = list(os.scandir(dir_path))
+    except OSError:
+        return dir_path, False, []
+
+    for entry in entries:
+        try:
+            if entry.is_symlink():
+                continue
+            if not entry.is_dir():
+                is_project = is_project or entry.name in MANIFEST_FILE_NAMES
+                continue
+        except OSError:
+            continue
+        relative_path = f"{base}/{entry.name}" if base else entry.name
+        if (is_always_ignored_dir(entry.name) or entry.name in VENDORED_DIRS or
+                is_ignored(rules, relative_path, True)):
+            continue
+        children.append((pathlib.Path(entry.path), relative_path, rules))
+    return dir_path, is_project, children
@@ -0,0 +1,124 @@
+"""Persistent cache for model responses, stored in the mochi config dir.
+
+Entries are content addressed: the key is a hash of everything that affects the
+response (prompts, model and sampling parameters). The cache is bounded by
+number of entries, total size and age, evicting the least recently used entries
+first. Reading an entry touches it, so the age of an entry is the time since it
+was last used.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import time
+from typing import Any, Optional
+
+from mochi_code.code.mochi_config import write_file_atomically
+
+_ENTRY_SUFFIX = ".json"
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+
+def make_cache_key(**parts: Any) -> str:
+    """Create a stable cache key for the provided request parts.
+
+    Args:
+        **parts (Any): JSON serializable values defining the request (e.g. the
+        prompts, model name and sampling parameters).
+
+    Returns:
+        str: The hex digest identifying the request.
+    """
+    serialized = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """A size and age bounded LRU cache of responses on disk."""
+
+    def __init__(self,
+                 cache_path: pathlib.Path,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS) -> None:
+        """Create a cache stored in the provided directory.
+
+        Args:
+            cache_path (pathlib.Path): The directory to store the entries in,
+            it will be created on the first write.
+            max_entries (int): The maximum number of entries to keep.
+            max_bytes (int): The maximum size of all entries together.
+            max_age_seconds (float): Entries older than this are discarded.
+        """
+        self._cache_path = cache_path
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._max_age_seconds = max_age_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the cached response for the key.
+
+        Args:
+            key (str): The key created with make_cache_key.
+
+        Returns:
+            Optional[str]: The cached response or None if missing or expired.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            last_used = entry_path.stat().st_mtime
+            if time.time() - last_used > self._max_age_seconds:
+                entry_path.unlink(missing_ok=True)
+                return None
+            with open(entry_path, encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+            # Touching the entry marks it as recently used for the eviction.
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            # Missing, unreadable or evicted by another process meanwhile.
+            return None
+        return entry.get("response")
+
+    def put(self, key: str, response: str) -> None:
+        """Store the response for the key, evicting old entries if needed.
+
+        Args:
+            key (str): The key created with make_cache_key.
+            response (str): The response to cache.
+        """
+        self._cache_path.mkdir(parents=True, exist_ok=True)
+        write_file_atomically(self._entry_path(key),
+                              json.dumps({"response": response}))
+
+        self._evict()
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self._cache_path / f"{key}{_ENTRY_SUFFIX}"
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until within the limits."""
+        entries = []
+        for entry_path in self._cache_path.glob(f"*{_ENTRY_SUFFIX}"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        entries.sort()
+        remaining_entries = len(entries)
+        remaining_bytes = sum(size for _, size, _ in entries)
+        oldest_allowed = time.time() - self._max_age_seconds
+
+        for mtime, size, entry_path in entries:
+            within_limits = (remaining_entries <= self._max_entries and
+                             remaining_bytes <= self._max_bytes)
+            if within_limits and mtime >= oldest_allowed:
+                break
+            entry_path.unlink(missing_ok=True)
+            remaining_entries -= 1
+            remaining_bytes -= size
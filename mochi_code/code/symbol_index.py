@@ -0,0 +1,454 @@
+"""Index of the symbols (functions, classes and methods) defined in the code.
+
+The source files are parsed by the parser registered for their suffix (see
+register_symbol_parser), in a process pool as parsing is CPU bound. The symbols
+are stored in the mochi config dir as a table sorted by short name: the names
+in the metadata, and their kind, file and lines (plus the order of the qualified
+names) as memory mapped arrays. Updates only parse the files whose content
+changed since the last one.
+
+Lookups don't need the model: prefixes are a binary search in the sorted names,
+and fuzzy lookups walk the sorted names like a trie, skipping every name that
+shares a prefix too far from the query. A dotted query (e.g. Loader.load) is
+looked up by qualified name, the others by short name.
+"""
+
+import ast
+import bisect
+import concurrent.futures
+import multiprocessing
+import os
+import pathlib
+from dataclasses import dataclass
+from typing import Callable, NamedTuple, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from mochi_code.code.code_index import IndexUpdate, load_code_index
+from mochi_code.code.code_search import (INDEX_META_FILE_NAME,
+                                         load_index_generation, make_generation,
+                                         read_text_lines, save_index_generation)
+from mochi_code.code.mochi_config import (get_code_index_path,
+                                          get_symbol_index_path)
+from mochi_code.tracing import annotate, traced
+
+SYMBOL_INDEX_VERSION = 2
+
+# The kinds of symbols, stored by index.
+SYMBOL_KINDS = ("function", "class", "method")
+
+DEFAULT_MAX_RESULTS = 20
+
+# Below this, starting the worker processes costs more than the parsing.
+_MIN_FILES_PER_POOL = 32
+# Matches everything starting with a prefix, when appended to it.
+_PREFIX_END = "\U0010ffff"
+
+
+class ParsedSymbol(NamedTuple):
+    """A symbol found by a parser."""
+    # The name qualified by its enclosing classes and functions, e.g. A.run.
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+
+
+SymbolParser = Callable[[str], list[ParsedSymbol]]
+_ParserT = TypeVar("_ParserT", bound=SymbolParser)
+
+_PARSERS: dict[str, SymbolParser] = {}
+
+
+def register_symbol_parser(*suffixes: str) -> Callable[[_ParserT], _ParserT]:
+    """Register a parser for the source files with the given suffixes.
+
+    Args:
+        *suffixes (str): The file suffixes, e.g. ".py".
+
+    Returns:
+        Callable[[_ParserT], _ParserT]: The decorator.
+    """
+
+    def decorator(parser: _ParserT) -> _ParserT:
+        for suffix in suffixes:
+            _PARSERS[suffix] = parser
+        return parser
+
+    return decorator
+
+
+def get_symbol_parser(path: str) -> Optional[SymbolParser]:
+    """Get the parser of a source file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Optional[SymbolParser]: The parser, or None if the language isn't
+        supported.
+    """
+    return _PARSERS.get(os.path.splitext(path)[1].lower())
+
+
+@register_symbol_parser(".py", ".pyi")
+def parse_python_symbols(source: str) -> list[ParsedSymbol]:
+    """Find the functions, classes and methods of a python module.
+
+    Args:
+        source (str): The source of the module.
+
+    Returns:
+        list[ParsedSymbol]: The symbols, empty if the module can't be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    symbols: list[ParsedSymbol] = []
+
+    def visit(node: ast.AST, scope: str, in_class: bool) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                kind = "class"
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "method" if in_class else "function"
+            else:
+                visit(child, scope, in_class)
+                continue
+            name = f"{scope}.{child.name}" if scope else child.name
+            symbols.append(
+                ParsedSymbol(name, kind, child.lineno, child.end_lineno or
+                             child.lineno))
+            visit(child, name, kind == "class")
+
+    visit(tree, "", False)
+    return symbols
+
+
+@dataclass(frozen=True)
+class Symbol:
+    """A symbol of the project."""
+    name: str
+    kind: str
+    path: str
+    start_line: int
+    end_line: int
+
+    @property
+    def short_name(self) -> str:
+        """The name without its enclosing classes and functions."""
+        return self.name.rsplit(".", 1)[-1]
+
+
+def _get_key(name: str) -> str:
+    """Get the key a symbol is looked up by, its lower case short name."""
+    return name.rsplit(".", 1)[-1].lower()
+
+
+def _is_qualified(query: str) -> bool:
+    """Check if a query is looked up by qualified name, e.g. Loader.load."""
+    return "." in query
+
+
+class SymbolIndex:  # pylint: disable=too-many-instance-attributes
+    """A loaded symbol index."""
+
+    def __init__(self, names: list[str], paths: list[str],
+                 arrays: dict[str, np.ndarray]) -> None:
+        """Create the index from its (loaded) parts.
+
+        Args:
+            names (list[str]): The qualified names of the symbols, sorted by
+            key (see _get_key).
+            paths (list[str]): The indexed files, by id.
+            arrays (dict[str, np.ndarray]): The "kinds", "files" and "lines"
+            (start and end) of the symbols, and the "qualified" order of their
+            ids (by lower case qualified name).
+        """
+        self._names = names
+        self._keys = [_get_key(name) for name in names]
+        self._qualified_ids = arrays["qualified"]
+        self._qualified_keys = [
+            names[symbol_id].lower() for symbol_id in self._qualified_ids
+        ]
+        self._paths = paths
+        self._kinds = arrays["kinds"]
+        self._files = arrays["files"]
+        self._lines = arrays["lines"]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get(self, symbol_id: int) -> Symbol:
+        """Get a symbol by id.
+
+        Args:
+            symbol_id (int): The position of the symbol in the sorted table.
+
+        Returns:
+            Symbol: The symbol.
+        """
+        start_line, end_line = self._lines[symbol_id]
+        return Symbol(self._names[symbol_id],
+                      SYMBOL_KINDS[self._kinds[symbol_id]],
+                      self._paths[self._files[symbol_id]], int(start_line),
+                      int(end_line))
+
+    def find_prefix(self, prefix: str) -> Sequence[int]:
+        """Find the symbols whose name starts with the prefix.
+
+        Args:
+            prefix (str): The prefix, case insensitive. The qualified names are
+            matched if it's dotted, the short names otherwise.
+
+        Returns:
+            Sequence[int]: The ids of the symbols, by name.
+        """
+        prefix = prefix.lower()
+        keys = self._qualified_keys if _is_qualified(prefix) else self._keys
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + _PREFIX_END, lo=start)
+        if not _is_qualified(prefix):
+            return range(start, end)
+        return [int(i) for i in self._qualified_ids[start:end]]
+
+    def find_fuzzy(self, query: str,
+                   max_distance: int) -> list[tuple[int, int]]:
+        """Find the symbols whose name is close to the query.
+
+        Args:
+            query (str): The query, case insensitive. The qualified names are
+            matched if it's dotted, the short names otherwise.
+            max_distance (int): The maximum edit distance to the names.
+
+        Returns:
+            list[tuple[int, int]]: The ids of the symbols and their distance.
+        """
+        query = query.lower()
+        if not _is_qualified(query):
+            return _find_fuzzy_keys(self._keys, query, max_distance)
+        return [(int(self._qualified_ids[index]), distance) for index, distance
+                in _find_fuzzy_keys(self._qualified_keys, query, max_distance)]
+
+    @traced("symbols.search")
+    def search(self,
+               query: str,
+               max_results: int = DEFAULT_MAX_RESULTS) -> list[Symbol]:
+        """Find the symbols matching the query: exact matches first, then the
+        ones starting with it, then the ones close to it.
+
+        Args:
+            query (str): The short (or dotted qualified) name of the symbol, or
+            part of it.
+            max_results (int): The maximum number of results.
+
+        Returns:
+            list[Symbol]: The matches, best first.
+        """
+        key = query.strip().lower()
+        if not key:
+            return []
+        # The shortest names first, they are the closest.
+        keys = self._names if _is_qualified(key) else self._keys
+        found = sorted(self.find_prefix(key),
+                       key=lambda i: (len(keys[i]), self._names[i]))
+        if len(found) < max_results:
+            seen = set(found)
+            # A typo a word, up to 2 in long names.
+            fuzzy = self.find_fuzzy(key, 1 if len(key) <= 5 else 2)
+            found.extend(i for i, _ in sorted(fuzzy, key=lambda m: m[1])
+                         if i not in seen)
+        annotate(symbols=len(self._keys), matches=len(found))
+        return [self.get(symbol_id) for symbol_id in found[:max_results]]
+
+
+def _find_fuzzy_keys(keys: list[str], query: str,
+                     max_distance: int) -> list[tuple[int, int]]:
+    """Find the sorted keys close to the (lower case) query, by position."""
+    matches = []
+    # The edit distance rows of each prefix of the current key.
+    rows = [list(range(len(query) + 1))]
+    previous = ""
+    index = 0
+    while index < len(keys):
+        key = keys[index]
+        depth = min(len(rows) - 1, _common_prefix_length(previous, key))
+        del rows[depth + 1:]
+        while depth < len(key):
+            row = _next_row(rows[-1], key[depth], query)
+            rows.append(row)
+            depth += 1
+            if min(row) > max_distance:
+                break
+        previous = key[:depth]
+
+        if min(rows[-1]) > max_distance:
+            # No key starting with this prefix can match.
+            index = bisect.bisect_left(keys,
+                                       previous + _PREFIX_END,
+                                       lo=index + 1)
+            continue
+        if rows[-1][-1] <= max_distance:
+            matches.append((index, rows[-1][-1]))
+        index += 1
+    return matches
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    length = 0
+    for first_char, second_char in zip(first, second):
+        if first_char != second_char:
+            break
+        length += 1
+    return length
+
+
+def _next_row(row: list[int], char: str, query: str) -> list[int]:
+    """Extend the edit distances of a prefix to the query by a character."""
+    next_row = [row[0] + 1]
+    for column, query_char in enumerate(query, start=1):
+        next_row.append(
+            min(next_row[column - 1] + 1, row[column] + 1,
+                row[column - 1] + (query_char != char)))
+    return next_row
+
+
+@traced("symbols.load")
+def load_symbol_index(config_path: pathlib.Path) -> Optional[SymbolIndex]:
+    """Load the symbol index of the project.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+
+    Returns:
+        Optional[SymbolIndex]: The index, or None if there isn't one (or it was
+        written by an incompatible version).
+    """
+    loaded = load_index_generation(
+        pathlib.Path(get_symbol_index_path(config_path)), SYMBOL_INDEX_VERSION)
+    if loaded is None:
+        return None
+    meta, arrays = loaded
+    return SymbolIndex(meta["names"], [path for path, _ in meta["files"]],
+                       arrays)
+
+
+def _parse_file(file_path: pathlib.Path) -> list[ParsedSymbol]:
+    """Parse the symbols of a file, in a worker process."""
+    parser = get_symbol_parser(file_path.name)
+    if parser is None:
+        return []
+    return parser("".join(read_text_lines(file_path)))
+
+
+def _parse_files(project_path: pathlib.Path, paths: list[str],
+                 max_workers: Optional[int]) -> list[list[ParsedSymbol]]:
+    """Parse the files, in worker processes if there are enough of them."""
+    file_paths = [project_path / path for path in paths]
+    if len(paths) < _MIN_FILES_PER_POOL or max_workers == 1:
+        return [_parse_file(file_path) for file_path in file_paths]
+    # Other threads (e.g. model requests) may hold locks, forking them would
+    # deadlock the workers.
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("forkserver")) as executor:
+        return list(executor.map(_parse_file, file_paths, chunksize=16))
+
+
+@traced("symbols.update")
+def update_symbol_index(config_path: pathlib.Path,
+                        update: Optional[IndexUpdate] = None,
+                        max_workers: Optional[int] = None) -> int:
+    """Update the symbol index with the files in the code index.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        update (Optional[IndexUpdate]): The last update of the code index, the
+        index is left as is if no file changed.
+        max_workers (Optional[int]): The number of processes parsing files.
+
+    Returns:
+        int: The number of files that were parsed (again).
+    """
+    index_path = pathlib.Path(get_symbol_index_path(config_path))
+    if (update is not None and not update.changed and not update.removed and
+        (index_path / INDEX_META_FILE_NAME).exists()):
+        return 0
+
+    files = load_code_index(pathlib.Path(get_code_index_path(config_path)))
+    previous = _load_file_symbols(config_path)
+    symbols: dict[str, tuple[str, list[ParsedSymbol]]] = {}
+    to_parse = []
+    for path, entry in sorted(files.items()):
+        if get_symbol_parser(path) is None:
+            continue
+        reused = previous.get(path)
+        if reused is not None and reused[0] == entry.digest:
+            symbols[path] = reused
+        else:
+            to_parse.append(path)
+
+    parsed = _parse_files(config_path.parent, to_parse, max_workers)
+    for path, file_symbols in zip(to_parse, parsed):
+        symbols[path] = (files[path].digest, file_symbols)
+
+    if to_parse or set(previous) != set(symbols) or not previous:
+        _save_symbol_index(index_path, symbols)
+    annotate(files=len(symbols), parsed=len(to_parse))
+    return len(to_parse)
+
+
+def _load_file_symbols(
+        config_path: pathlib.Path) -> dict[str, tuple[str, list[ParsedSymbol]]]:
+    """Load the digest and symbols of each indexed file."""
+    loaded = load_index_generation(
+        pathlib.Path(get_symbol_index_path(config_path)), SYMBOL_INDEX_VERSION)
+    if loaded is None:
+        return {}
+    meta, arrays = loaded
+
+    by_file: list[list[ParsedSymbol]] = [[] for _ in meta["files"]]
+    for name, kind, file_id, (start_line,
+                              end_line) in zip(meta["names"], arrays["kinds"],
+                                               arrays["files"],
+                                               arrays["lines"]):
+        by_file[file_id].append(
+            ParsedSymbol(name, SYMBOL_KINDS[kind], int(start_line),
+                         int(end_line)))
+    return {
+        path: (digest, by_file[file_id])
+        for file_id, (path, digest) in enumerate(meta["files"])
+    }
+
+
+def _save_symbol_index(
+        index_path: pathlib.Path,
+        symbols: dict[str, tuple[str, list[ParsedSymbol]]]) -> None:
+    """Save the symbols as a table sorted by key, with the order of their
+    qualified names."""
+    paths = sorted(symbols)
+    rows = sorted(((_get_key(symbol.name), symbol.name, file_id, symbol)
+                   for file_id, path in enumerate(paths)
+                   for symbol in symbols[path][1]),
+                  key=lambda row: row[:3])
+    kinds = {kind: index for index, kind in enumerate(SYMBOL_KINDS)}
+    qualified = sorted(range(len(rows)), key=lambda i: rows[i][1].lower())
+    save_index_generation(
+        index_path,
+        make_generation(), {
+            "files": [[path, symbols[path][0]] for path in paths],
+            "names": [row[1] for row in rows],
+        }, {
+            "kinds":
+                np.array([kinds[row[3].kind] for row in rows], dtype=np.uint8),
+            "files":
+                np.array([row[2] for row in rows], dtype=np.int32),
+            "lines":
+                np.array([[row[3].start_line, row[3].end_line] for row in rows],
+                         dtype=np.int32).reshape(-1, 2),
+            "qualified":
+                np.array(qualified, dtype=np.int32),
+        },
+        version=SYMBOL_INDEX_VERSION)
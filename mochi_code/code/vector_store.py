@@ -0,0 +1,464 @@
+"""Dense (embedding) search over the code of the project.
+
+The vectors of the chunks of code are stored in the mochi config dir as a
+float32 (or int8 quantized) matrix that is memory mapped when loaded, so memory
+stays flat however large the project is (the chunks and the hashes of the
+files are stored as arrays too, see ChunkTable). Small stores are searched
+exhaustively, larger ones with an inverted file index (IVF): the vectors are
+clustered and a query only scores the clusters closest to it.
+
+Updates are incremental: only the files whose content hash changed since the
+last update are embedded again, the vectors of the other files are copied over.
+"""
+
+import dataclasses
+import math
+import pathlib
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from mochi_code.code.code_index import load_code_index
+from mochi_code.code.code_search import (
+    DEFAULT_CHUNK_LINES, ChunkTable, CodeChunk, SearchResult, StringTable,
+    iter_file_chunks, load_index_generation, make_generation,
+    new_generation_path, pack_chunks, pack_strings, read_text_lines,
+    save_index_generation, top_k_indices)
+from mochi_code.code.embedders import (DEFAULT_EMBEDDER_NAME, Embedder,
+                                       get_embedder)
+from mochi_code.code.mochi_config import (get_code_index_path,
+                                          get_vector_store_path)
+from mochi_code.tracing import annotate, traced
+
+VECTOR_STORE_VERSION = 2
+
+# Stores with at least this many vectors are searched with the IVF index.
+DEFAULT_IVF_THRESHOLD = 20_000
+# The number of clusters scored per query.
+DEFAULT_IVF_PROBES = 8
+
+# Vectors are scored (and copied) in blocks, to bound the memory used.
+_BLOCK_ROWS = 16384
+
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLES_PER_CLUSTER = 64
+
+
+@dataclass(frozen=True)
+class VectorStoreSettings:
+    """How the vectors are embedded, stored and searched."""
+    embedder: str = DEFAULT_EMBEDDER_NAME
+    quantized: bool = False
+    ivf_threshold: int = DEFAULT_IVF_THRESHOLD
+
+
+class VectorStore:
+    """A loaded (memory mapped) vector store."""
+
+    # The number of clusters to score per query.
+    probes = DEFAULT_IVF_PROBES
+
+    def __init__(self, project_path: pathlib.Path, embedder: Embedder,
+                 arrays: dict[str, np.ndarray]) -> None:
+        """Create the store from its (loaded) arrays.
+
+        Args:
+            project_path (pathlib.Path): The root of the indexed project.
+            embedder (Embedder): The embedder the vectors were made with.
+            arrays (dict[str, np.ndarray]): The chunks by row (see ChunkTable),
+            the "vectors" (with their "scales" if quantized) and, for IVF, the
+            "centroids" of the clusters with the "list_rows" of each cluster
+            starting at its "list_offsets".
+        """
+        self.project_path = project_path
+        self.chunks = ChunkTable(arrays)
+        self._embedder = embedder
+        self._arrays = arrays
+
+    @property
+    def uses_ivf(self) -> bool:
+        """Whether queries are answered with the IVF index."""
+        return "centroids" in self._arrays
+
+    @traced("vectors.search")
+    def search(self, query: str, top_k: int = 5) -> list[SearchResult]:
+        """Find the chunks most similar to the query.
+
+        Args:
+            query (str): The query, in code or natural language.
+            top_k (int): The maximum number of results.
+
+        Returns:
+            list[SearchResult]: The best matches (by cosine similarity), best
+            first.
+        """
+        query_vector = self._embedder.embed([query])[0]
+        if not query_vector.any():
+            return []
+
+        if self.uses_ivf:
+            rows = self._probe_rows(query_vector)
+            scores = self._score_rows(rows, query_vector)
+        else:
+            rows = np.arange(len(self.chunks))
+            scores = _score_blocks(self._arrays["vectors"],
+                                   self._arrays.get("scales"), query_vector)
+
+        annotate(scored=len(rows), ivf=self.uses_ivf)
+        return [
+            SearchResult(self.chunks[rows[i]], float(scores[i]))
+            for i in top_k_indices(scores, top_k)
+        ]
+
+    def _probe_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        """Get the rows of the clusters closest to the query."""
+        centroids = self._arrays["centroids"]
+        offsets = self._arrays["list_offsets"]
+        list_rows = self._arrays["list_rows"]
+        probes = min(self.probes, len(centroids))
+        closest = np.argpartition(-(centroids @ query_vector), probes - 1)
+        rows = np.concatenate([
+            list_rows[offsets[cluster]:offsets[cluster + 1]]
+            for cluster in closest[:probes]
+        ])
+        # Reading the mapped rows in order is kinder to the page cache.
+        rows.sort()
+        return rows
+
+    def _score_rows(self, rows: np.ndarray,
+                    query_vector: np.ndarray) -> np.ndarray:
+        scales = self._arrays.get("scales")
+        return _score_blocks(self._arrays["vectors"][rows],
+                             scales[rows] if scales is not None else None,
+                             query_vector)
+
+
+def _score_blocks(vectors: np.ndarray, scales: Optional[np.ndarray],
+                  query_vector: np.ndarray) -> np.ndarray:
+    """Score the (possibly quantized) vectors against the query, by blocks."""
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        scores[block] = vectors[block].astype(np.float32) @ query_vector
+        if scales is not None:
+            scores[block] *= scales[block]
+    return scores
+
+
+@traced("vectors.load")
+def load_vector_store(config_path: pathlib.Path) -> Optional[VectorStore]:
+    """Load the vector store of the project, memory mapping the vectors.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+
+    Returns:
+        Optional[VectorStore]: The store, or None if there isn't one (or it was
+        written by an incompatible version or with an unknown embedder).
+    """
+    loaded = load_index_generation(
+        pathlib.Path(get_vector_store_path(config_path)), VECTOR_STORE_VERSION)
+    if loaded is None:
+        return None
+    meta, arrays = loaded
+
+    embedder = get_embedder(meta["settings"]["embedder"])
+    if embedder is None or embedder.dimensions != meta["dimensions"]:
+        return None
+    return VectorStore(config_path.parent, embedder, arrays)
+
+
+@traced("vectors.update")
+def update_vector_store(config_path: pathlib.Path,
+                        embedder: Optional[str] = None,
+                        quantized: Optional[bool] = None,
+                        ivf_threshold: Optional[int] = None,
+                        chunk_lines: int = DEFAULT_CHUNK_LINES) -> int:
+    """Update the vector store with the files in the code index.
+
+    Settings that aren't given are kept from the previous update.
+
+    Args:
+        config_path (pathlib.Path): The path to the mochi config dir.
+        embedder (Optional[str]): The name of the embedder to use.
+        quantized (Optional[bool]): Whether to store int8 quantized vectors.
+        ivf_threshold (Optional[int]): The number of vectors from which the
+        store is searched with the IVF index.
+        chunk_lines (int): The number of lines per chunk.
+
+    Returns:
+        int: The number of files that were embedded (again).
+    """
+    store_path = pathlib.Path(get_vector_store_path(config_path))
+    previous_meta, previous_arrays = (load_index_generation(
+        store_path, VECTOR_STORE_VERSION) or ({}, {}))
+    settings = _merge_settings(previous_meta,
+                               embedder=embedder,
+                               quantized=quantized,
+                               ivf_threshold=ivf_threshold)
+    embedder_instance = get_embedder(settings.embedder)
+    if embedder_instance is None:
+        raise ValueError(f"Unknown embedder: {settings.embedder}")
+
+    # Vectors can only be copied over if they were made and stored the same
+    # way.
+    reusable = (bool(previous_meta) and
+                previous_meta["dimensions"] == embedder_instance.dimensions and
+                previous_meta["settings"]["embedder"] == settings.embedder and
+                previous_meta["settings"]["quantized"] == settings.quantized)
+    plan = _plan_update(config_path, previous_arrays if reusable else {},
+                        chunk_lines)
+    if (reusable and not plan.embedded_files and
+            plan.files == _read_files(previous_arrays) and
+            previous_meta["settings"] == dataclasses.asdict(settings)):
+        return 0
+
+    generation = make_generation()
+    store_path.mkdir(exist_ok=True)
+    arrays = _create_vectors(store_path, generation, len(plan.chunks),
+                             embedder_instance.dimensions, settings.quantized)
+    if plan.copied_files:
+        _copy_vectors(arrays, plan, previous_arrays)
+    _embed_vectors(arrays, plan, config_path.parent, embedder_instance)
+    ivf_arrays = (_build_ivf(arrays, previous_arrays)
+                  if len(plan.chunks) >= settings.ivf_threshold else {})
+
+    save_index_generation(store_path,
+                          generation, {
+                              "settings": dataclasses.asdict(settings),
+                              "dimensions": embedder_instance.dimensions,
+                          }, {
+                              **_pack_files(plan),
+                              **ivf_arrays
+                          },
+                          version=VECTOR_STORE_VERSION)
+
+    annotate(vectors=len(plan.chunks),
+             embedded_files=len(plan.embedded_files),
+             ivf=bool(ivf_arrays))
+    return len(plan.embedded_files)
+
+
+def _merge_settings(previous_meta: dict[str, Any],
+                    **given: Any) -> VectorStoreSettings:
+    """Merge the given settings (not None) into the previous ones."""
+    return dataclasses.replace(
+        VectorStoreSettings(**previous_meta.get("settings", {})), **{
+            name: value for name, value in given.items() if value is not None
+        })
+
+
+@dataclass
+class _UpdatePlan:
+    """The rows of the updated store, and where their vectors come from."""
+    chunks: list[CodeChunk]
+    # The digest, first row and number of rows of each file.
+    files: dict[str, list[Any]]
+    # The files to embed, with their rows.
+    embedded_files: dict[str, list[int]]
+    # The first row in the previous store of the other files.
+    copied_files: dict[str, int]
+
+
+def _pack_files(plan: _UpdatePlan) -> dict[str, np.ndarray]:
+    """Pack the chunks and files of the updated store as arrays to save.
+
+    The paths of the chunks are the paths of the files, so the files with no
+    chunks (e.g. empty files) are kept as well.
+    """
+    return {
+        **pack_chunks(plan.chunks, paths=list(plan.files)),
+        **pack_strings("file_digests", [
+            digest for digest, _, _ in plan.files.values()
+        ]),
+        "file_rows":
+            np.array([[first_row, row_count]
+                      for _, first_row, row_count in plan.files.values()],
+                     dtype=np.int64).reshape(-1, 2),
+    }
+
+
+def _read_files(arrays: dict[str, np.ndarray]) -> dict[str, list[Any]]:
+    """Read the files of a store back from its arrays, see _pack_files."""
+    if "file_rows" not in arrays:
+        return {}
+    paths = StringTable.from_arrays(arrays, "paths")
+    digests = StringTable.from_arrays(arrays, "file_digests")
+    return {
+        paths[file_id]: [
+            digests[file_id], int(first_row),
+            int(row_count)
+        ] for file_id, (first_row, row_count) in enumerate(arrays["file_rows"])
+    }
+
+
+def _plan_update(config_path: pathlib.Path, previous_arrays: dict[str,
+                                                                  np.ndarray],
+                 chunk_lines: int) -> _UpdatePlan:
+    """Work out the rows of the updated store, reading the changed files."""
+    previous_files = _read_files(previous_arrays)
+    project_path = config_path.parent
+    plan = _UpdatePlan([], {}, {}, {})
+    indexed_files = load_code_index(
+        pathlib.Path(get_code_index_path(config_path)))
+
+    for relative_path, entry in sorted(indexed_files.items()):
+        first_row = len(plan.chunks)
+        previous = previous_files.get(relative_path)
+        if previous is not None and previous[0] == entry.digest:
+            _, previous_first_row, row_count = previous
+            previous_chunks = ChunkTable(previous_arrays)
+            plan.chunks.extend(
+                previous_chunks[row]
+                for row in range(previous_first_row, previous_first_row +
+                                 row_count))
+            plan.copied_files[relative_path] = previous_first_row
+        else:
+            plan.chunks.extend(chunk for chunk, content in iter_file_chunks(
+                project_path, relative_path, chunk_lines) if content.strip())
+            plan.embedded_files[relative_path] = list(
+                range(first_row, len(plan.chunks)))
+        plan.files[relative_path] = [
+            entry.digest, first_row,
+            len(plan.chunks) - first_row
+        ]
+    return plan
+
+
+def _create_vectors(store_path: pathlib.Path, generation: str, rows: int,
+                    dimensions: int, quantized: bool) -> dict[str, np.ndarray]:
+    """Create the (memory mapped) vector arrays of a new generation."""
+    arrays = {
+        "vectors":
+            _create_array(
+                new_generation_path(store_path, generation, "vectors"),
+                (rows, dimensions), np.int8 if quantized else np.float32)
+    }
+    if quantized:
+        arrays["scales"] = _create_array(
+            new_generation_path(store_path, generation, "scales"), (rows,),
+            np.float32)
+    return arrays
+
+
+def _copy_vectors(arrays: dict[str, np.ndarray], plan: _UpdatePlan,
+                  previous_arrays: dict[str, np.ndarray]) -> None:
+    """Copy the vectors of the unchanged files from the previous store."""
+    for relative_path, previous_first_row in plan.copied_files.items():
+        _, first_row, row_count = plan.files[relative_path]
+        source = slice(previous_first_row, previous_first_row + row_count)
+        target = slice(first_row, first_row + row_count)
+        for name, values in arrays.items():
+            values[target] = previous_arrays[name][source]
+
+
+def _embed_vectors(arrays: dict[str, np.ndarray], plan: _UpdatePlan,
+                   project_path: pathlib.Path, embedder: Embedder) -> None:
+    """Embed the chunks of the changed files (a file at a time) and flush."""
+    for relative_path, file_rows in plan.embedded_files.items():
+        if not file_rows:
+            continue
+        lines = read_text_lines(project_path / relative_path)
+        target = slice(file_rows[0], file_rows[-1] + 1)
+        vectors = embedder.embed([
+            "".join(lines[chunk.start_line - 1:chunk.end_line])
+            for chunk in plan.chunks[target]
+        ])
+        if "scales" in arrays:
+            arrays["vectors"][target], arrays["scales"][target] = _quantize(
+                vectors)
+        else:
+            arrays["vectors"][target] = vectors
+
+    for values in arrays.values():
+        if isinstance(values, np.memmap):
+            values.flush()
+
+
+def _create_array(path: pathlib.Path, shape: tuple[int, ...],
+                  dtype: Any) -> np.ndarray:
+    """Create a .npy file mapped in memory (empty arrays can't be mapped)."""
+    if shape[0] == 0:
+        values = np.empty(shape, dtype=dtype)
+        np.save(path, values)
+        return values
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+def _quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Quantize the rows to int8, with a scale per row."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    safe_scales = np.where(scales > 0, scales, 1.0)
+    quantized = np.round(vectors / safe_scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _build_ivf(arrays: dict[str, np.ndarray],
+               previous_arrays: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Cluster the vectors, reusing the previous clusters if still relevant.
+
+    Clusters are trained with (spherical) k-means on a sample of the vectors,
+    and retrained when the number of vectors changed too much for them.
+    """
+    vectors, scales = arrays["vectors"], arrays.get("scales")
+    rows = len(vectors)
+    cluster_count = max(1, round(math.sqrt(rows)))
+
+    centroids = None
+    if "centroids" in previous_arrays:
+        previous_centroids = np.asarray(previous_arrays["centroids"])
+        if (previous_centroids.shape[1] == vectors.shape[1] and
+                0.5 <= len(previous_centroids) / cluster_count <= 2):
+            centroids = previous_centroids
+    if centroids is None:
+        centroids = _train_centroids(vectors, scales, cluster_count)
+
+    assignments = np.empty(rows, dtype=np.int32)
+    for start in range(0, rows, _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        assignments[block] = np.argmax(
+            _dequantize(vectors[block], scales, block) @ centroids.T, axis=1)
+
+    sizes = np.bincount(assignments, minlength=len(centroids))
+    return {
+        "centroids":
+            centroids.astype(np.float32),
+        "list_offsets":
+            np.concatenate(([0], np.cumsum(sizes))).astype(np.int64),
+        "list_rows":
+            np.argsort(assignments, kind="stable").astype(np.int32),
+    }
+
+
+def _dequantize(vectors: np.ndarray, scales: Optional[np.ndarray],
+                rows: slice) -> np.ndarray:
+    values = vectors.astype(np.float32)
+    if scales is not None:
+        values *= scales[rows, None]
+    return values
+
+
+def _train_centroids(vectors: np.ndarray, scales: Optional[np.ndarray],
+                     cluster_count: int) -> np.ndarray:
+    """Train the centroids with spherical k-means on a sample of vectors."""
+    rng = np.random.default_rng(0)
+    rows = len(vectors)
+    sample_rows = np.sort(
+        rng.choice(rows,
+                   min(rows, cluster_count * _KMEANS_SAMPLES_PER_CLUSTER),
+                   replace=False))
+    sample = vectors[sample_rows].astype(np.float32)
+    if scales is not None:
+        sample *= scales[sample_rows, None]
+
+    centroids = sample[rng.choice(len(sample), cluster_count, replace=False)]
+    for _ in range(_KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their previous centroid.
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1),
+                             centroids)
+    return centroids
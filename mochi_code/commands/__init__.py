@@ -1,8 +1,28 @@
-"""Ask command module setup."""
-from mochi_code.commands.init import run_init_command, setup_init_arguments
-from mochi_code.commands.ask import run_ask_command, setup_ask_arguments
+"""Commands module setup.
 
+The command implementations are loaded lazily (see `registry`), so importing
+this package stays cheap.
+"""
+import importlib
+from typing import Any
+
+from mochi_code.commands.arguments import (setup_ask_arguments,
+                                           setup_init_arguments)
+
+_LAZY_ATTRIBUTES = {
+    "run_init_command": "mochi_code.commands.init",
+    "run_ask_command": "mochi_code.commands.ask",
+}
+
+# The runners are resolved lazily by __getattr__ below.
+# pylint: disable=undefined-all-variable
 __all__ = [
     "setup_init_arguments", "run_init_command", "setup_ask_arguments",
     "run_ask_command"
 ]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
@@ -1,6 +1,7 @@
 """Helper functions for argparse argument types."""
 
 import argparse
+import math
 from typing import Optional
 
 
@@ -10,3 +11,27 @@ def valid_prompt(user_prompt: Optional[str]) -> str:
     if not prompt:
         raise argparse.ArgumentTypeError("Prompt cannot be empty.")
     return prompt
+
+
+def positive_int(value: str) -> int:
+    """Validate a strictly positive integer."""
+    try:
+        number = int(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(
+            f"'{value}' is not an integer.") from error
+    if number <= 0:
+        raise argparse.ArgumentTypeError("The value must be positive.")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """Validate a strictly positive number."""
+    try:
+        number = float(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(
+            f"'{value}' is not a number.") from error
+    if number <= 0 or math.isnan(number):
+        raise argparse.ArgumentTypeError("The value must be positive.")
+    return number
@@ -0,0 +1,180 @@
+"""Argument definitions for the mochi subcommands.
+
+These are kept separate from the command implementations so the cli can build
+its parser without importing the (heavy) model backends.
+"""
+
+import argparse
+import pathlib
+
+from mochi_code.commands.argument_types import (positive_float, positive_int,
+                                                valid_prompt)
+from mochi_code.prompts.chat_history import DEFAULT_MAX_TOKENS
+
+# The maximum number of projects initialized at once by init --recursive.
+DEFAULT_INIT_WORKERS = 4
+# The maximum number of symbols listed by find.
+DEFAULT_FIND_RESULTS = 20
+# The number of questions of a batch answered at once.
+DEFAULT_BATCH_CONCURRENCY = 4
+# The ask options that only apply with --batch (left unset by default, so they
+# can be rejected with a single prompt).
+_BATCH_ONLY_OPTIONS = ("concurrency", "rpm", "tpm", "order", "output")
+
+
+def setup_init_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the arguments for the init command.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("-f",
+                        "--force",
+                        action="store_true",
+                        help="Force creating the config, without overriding.")
+    parser.add_argument("-r",
+                        "--recursive",
+                        action="store_true",
+                        help="Initialize every project (found by its " +
+                        "manifest file, e.g. package.json) under this folder.")
+    parser.add_argument("--workers",
+                        type=positive_int,
+                        default=DEFAULT_INIT_WORKERS,
+                        help="The maximum number of projects initialized at " +
+                        "once with --recursive.")
+
+
+def setup_ask_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the parser with the ask command arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    prompt_group = parser.add_mutually_exclusive_group(required=True)
+    prompt_group.add_argument("prompt",
+                              nargs="?",
+                              type=valid_prompt,
+                              help="Your non-empty prompt to run.")
+    prompt_group.add_argument("--batch",
+                              type=pathlib.Path,
+                              metavar="QUESTIONS_JSONL",
+                              help="Answer the questions of a JSONL file "
+                              "instead (a prompt string, or an object with a "
+                              "'prompt' and an optional 'id', per line).")
+    parser.add_argument("--hedge-after",
+                        type=positive_float,
+                        metavar="SECONDS",
+                        help="Send the request again (see MOCHI_HEDGE_BACKEND) "
+                        "if no token arrived after SECONDS, e.g. the usual "
+                        "p95 time to first token, and stream the first "
+                        "answer. Off by default (see MOCHI_HEDGE_AFTER).")
+    batch_group = parser.add_argument_group("batch options")
+    batch_group.add_argument("--concurrency",
+                             type=positive_int,
+                             help="Number of questions answered at once "
+                             f"(defaults to {DEFAULT_BATCH_CONCURRENCY}).")
+    batch_group.add_argument("--rpm",
+                             type=positive_int,
+                             help="Maximum model requests per minute.")
+    batch_group.add_argument("--tpm",
+                             type=positive_int,
+                             help="Maximum model tokens (prompt and "
+                             "completion) per minute.")
+    batch_group.add_argument("--order",
+                             choices=["input", "completion"],
+                             help="Write the results in the order of the "
+                             "questions (the default), or as soon as each "
+                             "completes.")
+    batch_group.add_argument("--output",
+                             type=pathlib.Path,
+                             help="The JSONL file to write the results to "
+                             "(defaults to stdout).")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache",
+                             action="store_true",
+                             help="Don't read or write cached responses.")
+    cache_group.add_argument("--refresh",
+                             action="store_true",
+                             help="Ignore cached responses, but cache the new "
+                             "one.")
+
+
+def validate_ask_arguments(parser: argparse.ArgumentParser,
+                           args: argparse.Namespace) -> None:
+    """Reject the batch options given with a single prompt.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the ask command,
+        reporting the error (and exiting).
+        args (argparse.Namespace): The parsed arguments of the ask command.
+    """
+    if args.batch is not None:
+        return
+    given = [
+        "--" + name
+        for name in _BATCH_ONLY_OPTIONS
+        if getattr(args, name, None) is not None
+    ]
+    if given:
+        parser.error(f"{', '.join(given)} can only be used with --batch.")
+
+
+def setup_index_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the parser with the index command arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("--workers",
+                        type=positive_int,
+                        help="Number of threads hashing files, and of "
+                        "processes parsing them (defaults to a value based on "
+                        "the number of CPUs).")
+    parser.add_argument("--quantize",
+                        action=argparse.BooleanOptionalAction,
+                        help="Store the code vectors as int8, 4x smaller "
+                        "(kept from the previous run by default).")
+    parser.add_argument("--ivf-threshold",
+                        type=positive_int,
+                        help="Number of code vectors from which searches "
+                        "only scan the closest clusters (kept from the "
+                        "previous run by default).")
+
+
+def setup_find_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the parser with the find command arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("name",
+                        help="The name of the function, class or method, "
+                        "or its start (typos are fine).")
+    parser.add_argument("--limit",
+                        type=positive_int,
+                        default=DEFAULT_FIND_RESULTS,
+                        help="Maximum number of symbols listed.")
+
+
+def setup_serve_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the parser with the serve command arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("--socket",
+                        help="Path of the unix socket to listen on (defaults "
+                        "to $MOCHI_SOCKET or a per user path).")
+
+
+def setup_chat_arguments(parser: argparse.ArgumentParser) -> None:
+    """Setup the parser with the chat command arguments.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("--history-tokens",
+                        type=positive_int,
+                        default=DEFAULT_MAX_TOKENS,
+                        help="Token budget for the conversation history "
+                        "included in each prompt.")
@@ -1,62 +1,452 @@
 """The ask command. This command is used to ask mochi a single question."""
 
 import argparse
+import functools
 import pathlib
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 
-from dotenv import dotenv_values
-from langchain import LLMChain, OpenAI, PromptTemplate
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from mochi_code.backends import (BackendConfig, TokenCallback, get_backend,
+                                 load_backend_config)
+from mochi_code.code.code_search import INDEX_META_FILE_NAME, CodeSearchIndex
+from mochi_code.code.dependency_index import (DependencyIndex,
+                                              load_dependency_index)
+from mochi_code.code.git_history import GitHistory, load_git_history
+from mochi_code.code.lexical_index import LexicalIndex, load_lexical_index
+from mochi_code.code.mochi_config import (
+    get_backend_config_path, get_dependency_apis_path, get_git_history_path,
+    get_lexical_index_path, get_project_details_path, get_response_cache_path,
+    get_vector_store_path, search_mochi_config)
+from mochi_code.code.response_cache import ResponseCache, make_cache_key
+from mochi_code.code.vector_store import VectorStore, load_vector_store
+from mochi_code.commands.arguments import setup_ask_arguments
+from mochi_code.hedging import HedgePolicy, hedged_complete, load_hedge_policy
+from mochi_code.prompts.project_prompts import (get_code_snippets_section,
+                                                get_dependency_apis_section,
+                                                get_git_history_section,
+                                                get_project_sections)
+from mochi_code.prompts.prompt_assembly import (SECTION_SEPARATOR,
+                                                AssembledPrompt, PromptSection,
+                                                assemble_prompt)
+from mochi_code.prompts.tokens import get_token_counter
+from mochi_code.rendering import StreamRenderer
+from mochi_code.resilience import call_with_retries, is_retryable_error
+from mochi_code.tracing import annotate, get_tracer, mark, span, traced
 
-from mochi_code.commands.argument_types import valid_prompt
-from mochi_code.prompts.project_prompts import get_project_prompt
+__all__ = [
+    "setup_ask_arguments", "run_ask_command", "ask", "load_project_context",
+    "ProjectContext", "ProjectContexts", "TokenCallback", "write_to_stdout",
+    "build_prompt", "request_completion"
+]
 
-# Load keys for the different model backends. This needs to be setup separately.
-keys = dotenv_values(".keys")
+# The prompt and the completion share the context window of the model.
+MODEL_CONTEXT_TOKENS = 4097
+COMPLETION_MAX_TOKENS = 256
+PROMPT_MAX_TOKENS = MODEL_CONTEXT_TOKENS - COMPLETION_MAX_TOKENS
+# The temperature of the answers, unless the backend config overrides it.
+TEMPERATURE = 0.9
 
+# The instructions shared by all the assistant prompts.
+ASSISTANT_INSTRUCTIONS = (
+    "You are an great software engineer helping other " +
+    "engineers. Whenever possible provide code examples, prioritise " +
+    "copying code from the following prompt (if available). If you're " +
+    "creating a function or command, please show how to call it.\nIt's " +
+    "very important you keep answers related to code, if you think the " +
+    "query is not related to code, please ask to clarify, to provide " +
+    "more context or rephrase the query.\nKeep answers concise and if " +
+    "you don't know the answer, please say so.\nALWAYS address the user " +
+    "directly, as an interactive assistant, but no need to greet, go " +
+    "straight to the point, politely and very light humour when " +
+    "appropriate. Do not ask follow-up questions!")
 
-def setup_ask_arguments(parser: argparse.ArgumentParser) -> None:
-    """Setup the parser with the ask command arguments.
-
-    Args:
-        parser (argparse.ArgumentParser): The parser to add the arguments to.
-    """
-    parser.add_argument("prompt",
-                        type=valid_prompt,
-                        help="Your non-empty prompt to run.")
+_INSTRUCTIONS_SECTION = PromptSection("instructions", (ASSISTANT_INSTRUCTIONS,),
+                                      required=True)
 
 
 def run_ask_command(args: argparse.Namespace) -> None:
     """Run the 'ask' command with the provided arguments."""
     # Arguments should be validated by the parser.
-    ask(args.prompt)
+    renderer = StreamRenderer()
+    try:
+        ask(args.prompt,
+            use_cache=not args.no_cache,
+            refresh_cache=args.refresh,
+            on_token=renderer,
+            hedge=load_hedge_policy(args.hedge_after))
+    finally:
+        stats = renderer.finish()
+        annotate(time_to_first_token=stats.time_to_first_token,
+                 tokens_per_second=stats.tokens_per_second,
+                 writes=stats.writes)
+
+
+@dataclass(frozen=True)
+class ProjectContext:
+    """The project specific state used to answer a question."""
+    project_sections: tuple[PromptSection, ...]
+    response_cache: Optional[ResponseCache]
+    lexical_index: Optional[LexicalIndex] = None
+    vector_store: Optional[VectorStore] = None
+    git_history: Optional[GitHistory] = None
+    dependency_index: Optional[DependencyIndex] = None
+    # The model answering, from the env if None.
+    backend_config: Optional[BackendConfig] = None
+
+    @property
+    def project_prompt(self) -> Optional[str]:
+        """The project sections, in full (None if there are none)."""
+        if not self.project_sections:
+            return None
+        return SECTION_SEPARATOR.join(section.render()
+                                      for section in self.project_sections
+                                      if section.items)
+
+    def get_backend_config(self) -> BackendConfig:
+        """Get the config of the model answering (from the env if unset)."""
+        return self.backend_config or load_backend_config()
+
+    @property
+    def code_indexes(self) -> list[CodeSearchIndex]:
+        """The loaded indexes of the project code."""
+        return [
+            index for index in (self.lexical_index, self.vector_store)
+            if index is not None
+        ]
+
+
+def write_to_stdout(token: str) -> None:
+    """Write a streamed token to stdout straight away."""
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+@traced("ask.load_project_context")
+def load_project_context(start_path: pathlib.Path,
+                         use_cache: bool = True) -> ProjectContext:
+    """Load the project context for questions asked from the path.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+        use_cache (bool): Whether to load the response cache.
+
+    Returns:
+        ProjectContext: The context (empty if mochi isn't initialized).
+    """
+    return ProjectContext(
+        project_sections=tuple(get_project_sections(start_path)),
+        response_cache=_get_response_cache(start_path) if use_cache else None,
+        lexical_index=_get_lexical_index(start_path),
+        vector_store=_get_vector_store(start_path),
+        git_history=_get_git_history(start_path),
+        dependency_index=_get_dependency_index(start_path),
+        backend_config=load_backend_config(search_mochi_config(start_path)))
+
+
+class ProjectContexts:  # pylint: disable=too-few-public-methods
+    """The loaded project contexts, keyed by config root.
+
+    Contexts are reloaded when the project details, the code indexes, the git
+    history, the indexed dependencies or the backend config change.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._contexts: dict[pathlib.Path, tuple[Any, ProjectContext]] = {}
+
+    def get(self, start_path: pathlib.Path) -> ProjectContext:
+        """Get the context for questions asked from the path.
 
+        Args:
+            start_path (pathlib.Path): The path the question was asked from.
 
-def ask(prompt: str) -> None:
-    """Run the ask command."""
+        Returns:
+            ProjectContext: The (possibly cached) project context.
+        """
+        config_path = search_mochi_config(start_path)
+        if config_path is None:
+            return load_project_context(start_path)
+
+        config_path = pathlib.Path(config_path)
+        signature = (
+            _stat_signature(get_project_details_path(config_path)),
+            _stat_signature(
+                get_lexical_index_path(config_path) / INDEX_META_FILE_NAME),
+            _stat_signature(
+                get_vector_store_path(config_path) / INDEX_META_FILE_NAME),
+            _stat_signature(get_git_history_path(config_path)),
+            _stat_signature(
+                get_dependency_apis_path(config_path) / INDEX_META_FILE_NAME),
+            _stat_signature(get_backend_config_path(config_path)),
+        )
+
+        with self._lock:
+            cached = self._contexts.get(config_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        context = load_project_context(config_path.parent)
+        with self._lock:
+            self._contexts[config_path] = (signature, context)
+        return context
+
+
+def _stat_signature(path: pathlib.Path) -> Optional[tuple[int, int]]:
+    """Get a cheap signature of the file content (or None if missing)."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# pylint: disable-next=too-many-arguments
+def ask(prompt: str,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        project_context: Optional[ProjectContext] = None,
+        on_token: Optional[TokenCallback] = None,
+        before_request: Optional[Callable[[AssembledPrompt], None]] = None,
+        hedge: Optional[HedgePolicy] = None) -> str:
+    """Run the ask command.
+
+    Args:
+        prompt (str): The user prompt.
+        use_cache (bool): Whether to read and write cached responses.
+        refresh_cache (bool): Skip reading cached responses, but still cache
+        the new response (only used if use_cache is set).
+        project_context (Optional[ProjectContext]): A preloaded context, by
+        default it is loaded from the current directory.
+        on_token (Optional[TokenCallback]): Receives the streamed response, by
+        default it is written to stdout.
+        before_request (Optional[Callable[[AssembledPrompt], None]]): Called
+        with the prompt before requesting the model (not for cached responses),
+        e.g. to wait for a rate limit.
+        hedge (Optional[HedgePolicy]): Hedges the request if it is slow to
+        start streaming, not hedged if None.
+
+    Returns:
+        str: The response.
+    """
     assert prompt and prompt.strip()
 
-    llm = OpenAI(streaming=True,
-                 callbacks=[StreamingStdOutCallbackHandler()],
-                 temperature=0.9,
-                 openai_api_key=keys["OPENAI_API_KEY"])  # type: ignore
-
-    template = PromptTemplate(
-        input_variables=["project_prompt", "user_prompt"],
-        template="You are an great software engineer helping other " +
-        "engineers. Whenever possible provide code examples, prioritise " +
-        "copying code from the following prompt (if available). If you're " +
-        "creating a function or command, please show how to call it.\nIt's " +
-        "very important you keep answers related to code, if you think the " +
-        "query is not related to code, please ask to clarify, to provide " +
-        "more context or rephrase the query.\nKeep answers concise and if " +
-        "you don't know the answer, please say so.\nALWAYS address the user " +
-        "directly, as an interactive assistant, but no need to greet, go " +
-        "straight to the point, politely and very light humour when " +
-        "appropriate. Do not ask follow-up questions!\n{project_prompt}\n\n" +
-        "User query: '{user_prompt}'",
-    )
-    chain = LLMChain(llm=llm, prompt=template)
-
-    current_path = pathlib.Path.cwd()
-    project_prompt = get_project_prompt(current_path)
-    chain.run(user_prompt=prompt, project_prompt=project_prompt)
+    if project_context is None:
+        project_context = load_project_context(pathlib.Path.cwd(), use_cache)
+    full_prompt = build_prompt(project_context, prompt)
+    on_token = on_token or write_to_stdout
+    if get_tracer() is not None:
+        on_token = _FirstTokenMarker(on_token)
+
+    backend_config = project_context.get_backend_config()
+    temperature = backend_config.get_temperature(TEMPERATURE)
+    cache = project_context.response_cache if use_cache else None
+    cache_key = make_cache_key(prompt=full_prompt.text,
+                               model_name=backend_config.cache_name,
+                               model_params={
+                                   "temperature": temperature,
+                                   "max_tokens": COMPLETION_MAX_TOKENS
+                               })
+
+    if cache is not None and not refresh_cache:
+        with span("ask.cache_lookup"):
+            cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            # Replay through the same output path as a streamed response.
+            on_token(cached_response)
+            return cached_response
+
+    if before_request is not None:
+        before_request(full_prompt)
+
+    with span("ask.llm_request",
+              model=backend_config.model,
+              prompt_tokens=full_prompt.tokens):
+        response = request_completion(backend_config, full_prompt, temperature,
+                                      on_token, hedge)
+        annotate(response_chars=len(response))
+
+    if cache is not None:
+        cache.put(cache_key, response)
+    return response
+
+
+def request_completion(backend_config: BackendConfig,
+                       full_prompt: AssembledPrompt,
+                       temperature: float,
+                       on_token: TokenCallback,
+                       hedge: Optional[HedgePolicy] = None) -> str:
+    """Stream the completion of the prompt, retrying the transient failures.
+
+    Args:
+        backend_config (BackendConfig): The config of the model answering.
+        full_prompt (AssembledPrompt): The prompt.
+        temperature (float): The sampling temperature.
+        on_token (TokenCallback): Receives the streamed completion.
+        hedge (Optional[HedgePolicy]): Hedges the request if it is slow to
+        start streaming, not hedged if None.
+
+    Returns:
+        str: The completion.
+    """
+    backend = get_backend(backend_config)
+    streamed = False
+
+    def stream_token(token: str) -> None:
+        nonlocal streamed
+        streamed = True
+        on_token(token)
+
+    complete: Callable[[], str] = functools.partial(backend.complete,
+                                                    full_prompt.text,
+                                                    temperature,
+                                                    COMPLETION_MAX_TOKENS,
+                                                    on_token=stream_token)
+    if hedge is not None:
+        complete = functools.partial(
+            hedged_complete, backend,
+            get_backend(hedge.get_hedge_config(backend_config)),
+            full_prompt.text, temperature, stream_token, hedge,
+            COMPLETION_MAX_TOKENS)
+
+    return call_with_retries(
+        complete,
+        tokens=full_prompt.tokens + COMPLETION_MAX_TOKENS,
+        # A partly streamed completion can't be taken back.
+        retryable=lambda error: not streamed and is_retryable_error(error))
+
+
+def build_prompt(
+    project_context: ProjectContext,
+    prompt: str,
+    extra_sections: tuple[PromptSection, ...] = ()) -> AssembledPrompt:
+    """Build the prompt for the model, within its token budget.
+
+    Args:
+        project_context (ProjectContext): The context of the project.
+        prompt (str): The user prompt.
+        extra_sections (tuple[PromptSection, ...]): Sections added before the
+        user query (e.g. the conversation history).
+
+    Returns:
+        AssembledPrompt: The prompt, with the lowest priority sections shrunk
+        if needed.
+    """
+    sections = [_INSTRUCTIONS_SECTION, *project_context.project_sections]
+    if project_context.code_indexes:
+        snippets_section = get_code_snippets_section(
+            project_context.code_indexes, prompt)
+        if snippets_section is not None:
+            sections.append(snippets_section)
+    if project_context.git_history is not None:
+        history_section = get_git_history_section(project_context.git_history,
+                                                  prompt)
+        if history_section is not None:
+            sections.append(history_section)
+    if project_context.dependency_index is not None:
+        apis_section = get_dependency_apis_section(
+            project_context.dependency_index, prompt)
+        if apis_section is not None:
+            sections.append(apis_section)
+    sections.extend(extra_sections)
+    sections.append(
+        PromptSection("query", (f"User query: '{prompt}'",), required=True))
+
+    return assemble_prompt(
+        sections, PROMPT_MAX_TOKENS,
+        get_token_counter(project_context.get_backend_config().model))
+
+
+class _FirstTokenMarker:  # pylint: disable=too-few-public-methods
+    """Marks the first streamed token in the trace (time to first token)."""
+
+    def __init__(self, on_token: TokenCallback) -> None:
+        self._on_token = on_token
+        self._marked = False
+
+    def __call__(self, token: str) -> None:
+        if not self._marked:
+            self._marked = True
+            mark("ask.first_token")
+        self._on_token(token)
+
+
+def _get_response_cache(start_path: pathlib.Path) -> Optional[ResponseCache]:
+    """Get the response cache for the project, if mochi is initialized.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+
+    Returns:
+        Optional[ResponseCache]: The cache or None if there is no config.
+    """
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        return None
+    return ResponseCache(pathlib.Path(get_response_cache_path(config_path)))
+
+
+def _get_lexical_index(start_path: pathlib.Path) -> Optional[LexicalIndex]:
+    """Get the lexical index of the project, if mochi is initialized.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+
+    Returns:
+        Optional[LexicalIndex]: The index or None if there is no config (or the
+        project wasn't indexed yet).
+    """
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        return None
+    return load_lexical_index(pathlib.Path(config_path))
+
+
+def _get_vector_store(start_path: pathlib.Path) -> Optional[VectorStore]:
+    """Get the vector store of the project, if mochi is initialized.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+
+    Returns:
+        Optional[VectorStore]: The store or None if there is no config (or the
+        project wasn't indexed yet).
+    """
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        return None
+    return load_vector_store(pathlib.Path(config_path))
+
+
+def _get_git_history(start_path: pathlib.Path) -> Optional[GitHistory]:
+    """Get the git history of the project, if mochi is initialized.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+
+    Returns:
+        Optional[GitHistory]: The history or None if there is no config (or the
+        history wasn't ingested yet).
+    """
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        return None
+    return load_git_history(pathlib.Path(config_path))
+
+
+def _get_dependency_index(
+        start_path: pathlib.Path) -> Optional[DependencyIndex]:
+    """Get the API index of the project dependencies, if mochi is initialized.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the mochi config.
+
+    Returns:
+        Optional[DependencyIndex]: The index or None if there is no config (or
+        no dependency was indexed).
+    """
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        return None
+    return load_dependency_index(pathlib.Path(config_path))
@@ -0,0 +1,253 @@
+"""The batch mode of the ask command, answering a file of questions.
+
+The questions are answered concurrently: asyncio schedules them, a semaphore
+bounds how many are in flight and the blocking model requests run in a thread
+pool of the same size. A rate limiter keeps the requests (and their tokens)
+per minute under the provider limits, so throughput grows with the concurrency
+until it reaches the rate limit. The project context is loaded once and shared.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import json
+import pathlib
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional, TextIO
+
+from mochi_code.commands.ask import (COMPLETION_MAX_TOKENS, ProjectContext, ask,
+                                     load_project_context)
+from mochi_code.commands.arguments import DEFAULT_BATCH_CONCURRENCY
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.hedging import HedgePolicy, load_hedge_policy
+from mochi_code.prompts.prompt_assembly import AssembledPrompt
+from mochi_code.rate_limits import RateLimiter
+from mochi_code.tracing import span
+
+__all__ = [
+    "BatchItem", "BatchOptions", "BatchResult", "read_batch", "ask_batch",
+    "run_batch_command"
+]
+
+DEFAULT_CONCURRENCY = DEFAULT_BATCH_CONCURRENCY
+
+WriteResult = Callable[["BatchResult"], None]
+
+
+@dataclass(frozen=True)
+class BatchOptions:
+    """How to run a batch."""
+    # The maximum number of questions answered at once.
+    concurrency: int = DEFAULT_CONCURRENCY
+    # Write the results in the order of the questions, rather than as soon as
+    # each completes.
+    ordered: bool = True
+    # Whether to read and write cached responses.
+    use_cache: bool = True
+    # Skip reading cached responses, but still cache the new responses.
+    refresh_cache: bool = False
+    # Hedges the requests slow to start streaming, not hedged if None.
+    hedge: Optional[HedgePolicy] = None
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """A question of the batch."""
+    index: int
+    prompt: str
+    # An optional id from the input, copied to the result.
+    id: Optional[Any] = None  # pylint: disable=invalid-name
+
+
+@dataclass(frozen=True)
+class BatchResult:  # pylint: disable=too-many-instance-attributes
+    """The answer to a question of the batch, or why it failed."""
+    index: int
+    id: Optional[Any]  # pylint: disable=invalid-name
+    prompt: str
+    response: Optional[str]
+    # Seconds from the start of the question to its answer (or failure).
+    latency: float
+    # Seconds spent waiting for the rate limit, included in the latency.
+    rate_limit_wait: float
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+
+
+def run_batch_command(args: argparse.Namespace) -> None:
+    """Run the batch mode of the ask command with the provided arguments."""
+    items = read_batch(args.batch)
+    if args.output is None:
+        _run_batch(items, args, sys.stdout)
+        return
+    with open(args.output, "w", encoding="utf-8") as output:
+        _run_batch(items, args, output)
+
+
+def _run_batch(items: list[BatchItem], args: argparse.Namespace,
+               output: TextIO) -> None:
+
+    def write_result(result: BatchResult) -> None:
+        output.write(json.dumps(asdict(result)) + "\n")
+        output.flush()
+
+    limiter = RateLimiter(requests_per_minute=args.rpm,
+                          tokens_per_minute=args.tpm)
+    asyncio.run(
+        ask_batch(items,
+                  write_result,
+                  BatchOptions(concurrency=args.concurrency or
+                               DEFAULT_CONCURRENCY,
+                               ordered=args.order != "completion",
+                               use_cache=not args.no_cache,
+                               refresh_cache=args.refresh,
+                               hedge=load_hedge_policy(args.hedge_after)),
+                  limiter=limiter))
+
+
+def read_batch(batch_path: pathlib.Path) -> list[BatchItem]:
+    """Read the questions of a batch.
+
+    Args:
+        batch_path (pathlib.Path): The JSONL file, each (non-empty) line is a
+        prompt string or an object with a "prompt" and an optional "id".
+
+    Returns:
+        list[BatchItem]: The questions, in order.
+    """
+    try:
+        with open(batch_path, encoding="utf-8") as batch_file:
+            lines = batch_file.readlines()
+    except OSError as error:
+        raise MochiCannotContinue(
+            f"🚫 Cannot read the questions in '{batch_path}': {error}"
+        ) from error
+
+    items: list[BatchItem] = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = _parse_item(len(items), json.loads(line))
+        except ValueError as error:
+            raise MochiCannotContinue(
+                f"🚫 Invalid question on line {line_number} of " +
+                f"'{batch_path}': {error}") from error
+        items.append(item)
+    return items
+
+
+def _parse_item(index: int, value: Any) -> BatchItem:
+    """Parse a question of the batch, raising a ValueError if invalid."""
+    item_id = None
+    if isinstance(value, dict):
+        item_id = value.get("id")
+        value = value.get("prompt")
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("expected a non-empty prompt.")
+    return BatchItem(index, value.strip(), item_id)
+
+
+async def ask_batch(
+        items: list[BatchItem],
+        write_result: WriteResult,
+        options: BatchOptions = BatchOptions(),
+        limiter: Optional[RateLimiter] = None,
+        project_context: Optional[ProjectContext] = None) -> list[BatchResult]:
+    """Answer the questions concurrently.
+
+    A failing question is reported in its result, the others still run.
+
+    Args:
+        items (list[BatchItem]): The questions.
+        write_result (WriteResult): Receives the results as they are ready.
+        options (BatchOptions): How to run the batch.
+        limiter (Optional[RateLimiter]): Limits the model requests, unlimited
+        if None.
+        project_context (Optional[ProjectContext]): The context shared by the
+        questions, by default it is loaded from the current directory.
+
+    Returns:
+        list[BatchResult]: The results, in the order of the questions.
+    """
+    if project_context is None:
+        project_context = load_project_context(pathlib.Path.cwd(),
+                                               options.use_cache)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(options.concurrency)
+    rate_limiter = limiter or RateLimiter()
+
+    with concurrent.futures.ThreadPoolExecutor(options.concurrency) as executor:
+
+        async def answer(item: BatchItem) -> BatchResult:
+            async with semaphore:
+                start = time.perf_counter()
+                waits: list[float] = []
+
+                def wait_for_limit(prompt: AssembledPrompt) -> None:
+                    # Called from the worker thread, the limiter runs on the
+                    # event loop.
+                    tokens = prompt.tokens + COMPLETION_MAX_TOKENS
+                    waits.append(
+                        asyncio.run_coroutine_threadsafe(
+                            rate_limiter.acquire(tokens), loop).result())
+
+                request = functools.partial(ask,
+                                            item.prompt,
+                                            use_cache=options.use_cache,
+                                            refresh_cache=options.refresh_cache,
+                                            project_context=project_context,
+                                            on_token=_ignore_token,
+                                            before_request=wait_for_limit,
+                                            hedge=options.hedge)
+                response, error = None, None
+                try:
+                    # Runs in the context of the batch (e.g. its deadline).
+                    response = await loop.run_in_executor(
+                        executor,
+                        contextvars.copy_context().run, request)
+                # One failing question shouldn't stop the batch.
+                except Exception as caught:  # pylint: disable=broad-except
+                    error = caught
+                return BatchResult(
+                    index=item.index,
+                    id=item.id,
+                    prompt=item.prompt,
+                    response=response,
+                    latency=time.perf_counter() - start,
+                    rate_limit_wait=sum(waits),
+                    error=None if error is None else str(error),
+                    error_type=None if error is None else type(error).__name__)
+
+        with span("ask.batch",
+                  questions=len(items),
+                  concurrency=options.concurrency):
+            return await _collect(items, [answer(item) for item in items],
+                                  write_result, options.ordered)
+
+
+async def _collect(items: list[BatchItem], answers: list[Any],
+                   write_result: WriteResult,
+                   ordered: bool) -> list[BatchResult]:
+    """Write the results as they complete, in order if asked to."""
+    results: dict[int, BatchResult] = {}
+    written = 0
+    for completed in asyncio.as_completed(answers):
+        result = await completed
+        results[result.index] = result
+        if not ordered:
+            write_result(result)
+            continue
+        # Write the results that no longer wait on an earlier question.
+        while written < len(items) and items[written].index in results:
+            write_result(results[items[written].index])
+            written += 1
+    return [results[item.index] for item in items]
+
+
+def _ignore_token(_token: str) -> None:
+    """The responses are written whole, with the results."""
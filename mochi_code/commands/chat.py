@@ -0,0 +1,166 @@
+"""The chat command. This command starts an interactive chat with mochi.
+
+A chat session is set up once: the model backend is shared by every turn (and
+so is the HTTP connection), and the project prompt is only reloaded when the
+project details change. The history is the first thing shrunk after the
+dependencies and code snippets when the prompt gets too long.
+"""
+
+import argparse
+import pathlib
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from mochi_code.backends import load_backend_config
+from mochi_code.code.mochi_config import search_mochi_config
+from mochi_code.commands.arguments import setup_chat_arguments
+from mochi_code.commands.ask import (TEMPERATURE, ProjectContexts,
+                                     TokenCallback, build_prompt,
+                                     request_completion, write_to_stdout)
+from mochi_code.prompts.chat_history import ChatHistory
+from mochi_code.prompts.project_prompts import HISTORY_PRIORITY
+from mochi_code.prompts.prompt_assembly import PromptSection
+from mochi_code.prompts.tokens import get_token_counter
+from mochi_code.rendering import StreamRenderer, StreamStats
+from mochi_code.tracing import span
+
+__all__ = ["setup_chat_arguments", "run_chat_command", "chat", "ChatSession"]
+
+_EXIT_COMMANDS = {"exit", "quit", "bye"}
+
+
+@dataclass(frozen=True)
+class TurnStats:
+    """Timings (in seconds) of a chat turn."""
+    time_to_first_token: Optional[float]
+    total_latency: float
+
+
+class ChatSession:
+    """A conversation with mochi, reusing the model client across turns."""
+
+    def __init__(self,
+                 start_path: pathlib.Path,
+                 history: ChatHistory,
+                 on_token: TokenCallback = write_to_stdout) -> None:
+        """Create the session.
+
+        Args:
+            start_path (pathlib.Path): The path to search the project from.
+            history (ChatHistory): The (token budgeted) conversation history.
+            on_token (TokenCallback): Receives the streamed responses.
+        """
+        self._start_path = start_path
+        self._history = history
+        self._on_token = on_token
+        self._project_contexts = ProjectContexts()
+        self._first_token_time: Optional[float] = None
+
+    @property
+    def history(self) -> ChatHistory:
+        """The conversation history of the session."""
+        return self._history
+
+    def send(self, prompt: str) -> TurnStats:
+        """Send a message, streaming the response.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            TurnStats: The timings of the turn.
+        """
+        context = self._project_contexts.get(self._start_path)
+        history_section = PromptSection(
+            "history",
+            self._history.turns,
+            priority=HISTORY_PRIORITY,
+            template="Conversation so far:\n{items}",
+            omitted="[{count} earlier turns left out]",
+            keep_last=True)
+        full_prompt = build_prompt(context, prompt, (history_section,))
+        backend_config = context.get_backend_config()
+
+        self._first_token_time = None
+        start_time = time.perf_counter()
+        with span("chat.llm_request",
+                  model=backend_config.model,
+                  prompt_tokens=full_prompt.tokens):
+            # The backend is created once per process, and reused by the turns.
+            response = request_completion(
+                backend_config, full_prompt,
+                backend_config.get_temperature(TEMPERATURE), self._handle_token)
+        end_time = time.perf_counter()
+
+        self._history.add(prompt, response)
+
+        time_to_first_token = (None if self._first_token_time is None else
+                               self._first_token_time - start_time)
+        return TurnStats(time_to_first_token, end_time - start_time)
+
+    def _handle_token(self, token: str) -> None:
+        if self._first_token_time is None:
+            self._first_token_time = time.perf_counter()
+        self._on_token(token)
+
+
+def run_chat_command(args: argparse.Namespace) -> None:
+    """Run the chat command with the provided arguments."""
+    start_path = pathlib.Path.cwd()
+    backend_config = load_backend_config(search_mochi_config(start_path))
+    chat(
+        start_path,
+        ChatHistory(max_tokens=args.history_tokens,
+                    count_tokens=get_token_counter(backend_config.model)))
+
+
+def chat(start_path: pathlib.Path, history: ChatHistory) -> None:
+    """Run the chat loop until the user leaves.
+
+    Args:
+        start_path (pathlib.Path): The path to search the project from.
+        history (ChatHistory): The (token budgeted) conversation history.
+    """
+    renderer = StreamRenderer()
+    session = ChatSession(start_path, history, renderer)
+    print("💬 Chat with mochi, type 'exit' (or Ctrl + D) to leave.")
+
+    while True:
+        try:
+            prompt = input("\n🧑 > ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+
+        if not prompt:
+            continue
+        if prompt.lower() in _EXIT_COMMANDS:
+            break
+
+        print("🤖 ", end="", flush=True)
+        renderer.start()
+        try:
+            stats = session.send(prompt)
+        except KeyboardInterrupt:
+            renderer.finish()
+            print("\n✋ Stopped, the answer isn't kept in the conversation.")
+            continue
+        # A failed turn (e.g. the model is down) shouldn't end the chat.
+        except Exception as error:  # pylint: disable=broad-except
+            renderer.finish()
+            print(f"\n😭 an issue occurred answering: {error}")
+            continue
+        stream_stats = renderer.finish()
+        print("\n" + _format_stats(stats, stream_stats))
+
+    print("👋 See you soon!")
+
+
+def _format_stats(stats: TurnStats, stream_stats: StreamStats) -> str:
+    first_token = ("n/a" if stats.time_to_first_token is None else
+                   f"{stats.time_to_first_token:.2f}s")
+    rate = ("" if stream_stats.tokens_per_second is None else
+            f", {stream_stats.tokens_per_second:.0f} tokens/s")
+    return (f"⏱️  first token {first_token}{rate}, " +
+            f"total {stats.total_latency:.2f}s")
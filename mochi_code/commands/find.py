@@ -0,0 +1,51 @@
+"""The find command. This command finds where symbols are defined."""
+
+import argparse
+import os
+import pathlib
+
+from mochi_code.code.mochi_config import search_mochi_config
+from mochi_code.code.symbol_index import Symbol, load_symbol_index
+from mochi_code.commands.arguments import setup_find_arguments
+from mochi_code.commands.exceptions import MochiCannotContinue
+
+__all__ = ["setup_find_arguments", "run_find_command", "format_symbol"]
+
+
+def run_find_command(args: argparse.Namespace) -> None:
+    """Run the find command with the provided arguments."""
+    start_path = pathlib.Path.cwd()
+    config_path = search_mochi_config(start_path)
+    if config_path is None:
+        raise MochiCannotContinue(
+            "🚫 Mochi isn't initialized for this project, try > mochi init")
+
+    index = load_symbol_index(pathlib.Path(config_path))
+    if index is None:
+        raise MochiCannotContinue(
+            "🚫 The project symbols aren't indexed yet, try > mochi index")
+
+    symbols = index.search(args.name, args.limit)
+    if not symbols:
+        print(f"🤷 No function, class or method matches '{args.name}'.")
+        return
+    project_path = pathlib.Path(config_path).parent
+    for symbol in symbols:
+        print(format_symbol(symbol, project_path, start_path))
+
+
+def format_symbol(symbol: Symbol, project_path: pathlib.Path,
+                  start_path: pathlib.Path) -> str:
+    """Describe where a symbol is defined, as a path the terminal can open.
+
+    Args:
+        symbol (Symbol): The symbol.
+        project_path (pathlib.Path): The root of the project.
+        start_path (pathlib.Path): The directory the paths are relative to.
+
+    Returns:
+        str: The location, kind, name and lines of the symbol.
+    """
+    path = os.path.relpath(project_path / symbol.path, start_path)
+    return (f"{path}:{symbol.start_line}  {symbol.kind} {symbol.name} " +
+            f"(lines {symbol.start_line}-{symbol.end_line})")
@@ -0,0 +1,60 @@
+"""The index command. This command updates the index of the project files."""
+
+import argparse
+import pathlib
+
+from mochi_code.code.code_index import IndexUpdate, update_code_index
+from mochi_code.code.dependency_index import update_dependency_index
+from mochi_code.code.git_history import update_git_history
+from mochi_code.code.lexical_index import update_lexical_index
+from mochi_code.code.mochi_config import (get_project_details_path,
+                                          load_project_details,
+                                          search_mochi_config)
+from mochi_code.code.symbol_index import update_symbol_index
+from mochi_code.code.vector_store import update_vector_store
+from mochi_code.commands.arguments import setup_index_arguments
+from mochi_code.commands.exceptions import MochiCannotContinue
+
+__all__ = ["setup_index_arguments", "run_index_command", "format_index_update"]
+
+
+def run_index_command(args: argparse.Namespace) -> None:
+    """Run the index command with the provided arguments."""
+    config_path = search_mochi_config(pathlib.Path.cwd())
+    if config_path is None:
+        raise MochiCannotContinue(
+            "🚫 Mochi isn't initialized for this project, try > mochi init")
+
+    update = update_code_index(pathlib.Path(config_path),
+                               max_workers=args.workers)
+    update_lexical_index(pathlib.Path(config_path), update)
+    update_symbol_index(pathlib.Path(config_path),
+                        update,
+                        max_workers=args.workers)
+    update_vector_store(pathlib.Path(config_path),
+                        quantized=args.quantize,
+                        ivf_threshold=args.ivf_threshold)
+    commits = update_git_history(pathlib.Path(config_path))
+    # E.g. the dependencies installed (or upgraded) since the last run.
+    project_details = load_project_details(
+        get_project_details_path(config_path))
+    update_dependency_index(pathlib.Path(config_path),
+                            project_details.dependencies,
+                            max_workers=args.workers)
+    print(format_index_update(update))
+    if commits:
+        print(f"📜 Indexed {commits} new commits.")
+
+
+def format_index_update(update: IndexUpdate) -> str:
+    """Describe the index update for the user.
+
+    Args:
+        update (IndexUpdate): The changes found while updating the index.
+
+    Returns:
+        str: The description of the update.
+    """
+    total = update.unchanged + len(update.changed)
+    return (f"🗂️  Indexed {total} files ({len(update.added)} added, " +
+            f"{len(update.modified)} modified, {len(update.removed)} removed).")
@@ -2,38 +2,61 @@
 project."""
 
 import argparse
+import asyncio
+import functools
 import pathlib
+import shutil
+import sys
+from dataclasses import dataclass
+from typing import Callable, Optional
 
-from dotenv import dotenv_values
-from langchain import LLMChain, OpenAI, PromptTemplate
-from langchain.output_parsers import (CommaSeparatedListOutputParser,
-                                      PydanticOutputParser)
-from retry import retry
-
+from mochi_code.backends import get_backend, load_backend_config
 from mochi_code.code import ProjectDetails, ProjectDetailsWithDependencies
-from mochi_code.code.mochi_config import create_config, search_mochi_config
+from mochi_code.code.code_index import IndexUpdate, update_code_index
+from mochi_code.code.dependency_index import update_dependency_index
+from mochi_code.code.dependency_parsers import (get_dependency_parser,
+                                                parse_dependencies)
+from mochi_code.code.git_history import update_git_history
+from mochi_code.code.lexical_index import update_lexical_index
+from mochi_code.code.output_repair import (normalise_project_details,
+                                           repair_project_details)
+from mochi_code.code.mochi_config import (create_staging_config,
+                                          get_config_path, publish_config,
+                                          search_mochi_config)
+from mochi_code.code.project_detection import detect_project
+from mochi_code.code.project_discovery import discover_projects
+from mochi_code.code.symbol_index import update_symbol_index
+from mochi_code.code.vector_store import update_vector_store
+from mochi_code.commands.arguments import setup_init_arguments
 from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.resilience import (RetryPolicy, call_with_retries,
+                                   is_retryable_error)
+from mochi_code.tracing import annotate, span, traced
 
-# Load keys for the different model backends. This needs to be setup separately.
-keys = dotenv_values(".keys")
+__all__ = [
+    "setup_init_arguments", "run_init_command", "init", "init_recursive",
+    "ProjectDetails", "ProjectDetailsWithDependencies"
+]
 
+# The temperature of the requests, unless the backend config overrides it.
+TEMPERATURE = 0.5
 
-def setup_init_arguments(parser: argparse.ArgumentParser) -> None:
-    """Setup the arguments for the init command.
+# The model replies are sometimes invalid, asking again usually fixes it.
+_RETRY_POLICY = RetryPolicy(max_attempts=3)
 
-    Args:
-        parser (argparse.ArgumentParser): The parser to add the arguments to.
-    """
-    parser.add_argument("-f",
-                        "--force",
-                        action="store_true",
-                        help="Force creating the config, without overriding.")
+# Prints a progress message.
+Log = Callable[[str], None]
 
 
 def run_init_command(args: argparse.Namespace) -> None:
     """Run the init command with the provided arguments."""
     # Arguments should be validated by the parser.
     project_path = pathlib.Path.cwd()
+    if args.recursive:
+        # The projects already initialized are skipped, the others are added.
+        init_recursive(project_path, args.workers)
+        return
+
     existing_root = search_mochi_config(project_path)
 
     if not args.force and existing_root is not None:
@@ -49,7 +72,12 @@ def run_init_command(args: argparse.Namespace) -> None:
 
 def init(project_path: pathlib.Path) -> None:
     """Run the init command.
-    
+
+    The independent steps overlap: the project files are indexed and the
+    dependency config files are read and parsed while the project details are
+    detected (or asked to the model). The config is filled in a staging dir,
+    and only appears once everything succeeded.
+
     Args:
         project_path (pathlib.Path): The path to the project to initialize (the
         config folder will be created here).
@@ -57,29 +85,227 @@ def init(project_path: pathlib.Path) -> None:
     print(f"⚙️  Initializing mochi for project '{project_path}'.")
     print("🤖 Gathering information about your project...")
 
-    project_files = [p.name for p in project_path.glob("*")]
-    project_details = _get_project_details(project_files)
+    with span("init.pipeline"):
+        config_path, update = asyncio.run(_run_init_pipeline(project_path))
+
+    config_display_uri = config_path.relative_to(project_path).as_posix()
+    print(f"🤖 Created the config at {config_display_uri}")
+    print(f"🤖 Indexed {len(update.added)} files.")
+
+
+def init_recursive(root_path: pathlib.Path, workers: int) -> None:
+    """Initialize every project under the root (included), e.g. of a monorepo.
+
+    The projects are found by their manifest files, and initialized
+    concurrently (each one as init does). A project failing doesn't stop the
+    others, the failures are reported at the end.
+
+    Args:
+        root_path (pathlib.Path): The root of the repository.
+        workers (int): The maximum number of projects initialized at once.
+    """
+    print(f"⚙️  Looking for projects under '{root_path}'.")
+    projects = discover_projects(root_path)
+    if not projects:
+        raise MochiCannotContinue(
+            f"🚫 Couldn't find any project under '{root_path}'.")
+
+    pending = [p for p in projects if not get_config_path(p).exists()]
+    print(f"🤖 Found {len(projects)} projects, " +
+          f"{len(projects) - len(pending)} already initialized.")
+    with span("init.recursive", projects=len(pending), workers=workers):
+        failures = asyncio.run(_init_projects(root_path, pending, workers))
+
+    if failures:
+        raise MochiCannotContinue(
+            f"🚫 Couldn't initialize {len(failures)} of {len(pending)} " +
+            "projects:\n" + "\n".join(failures))
+
+
+async def _init_projects(root_path: pathlib.Path, projects: list[pathlib.Path],
+                         workers: int) -> list[str]:
+    """Initialize the projects, at most workers at once.
+
+    Returns:
+        list[str]: A description of each failure.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def init_project(project_path: pathlib.Path) -> Optional[str]:
+        name = project_path.relative_to(root_path).as_posix()
+
+        def log(message: str) -> None:
+            # A single write, print from several threads can mix the lines.
+            sys.stdout.write(f"[{name}] {message}\n")
+
+        async with semaphore:
+            try:
+                _, update = await _run_init_pipeline(project_path, log)
+            # One failing project shouldn't stop the others.
+            except Exception as error:  # pylint: disable=broad-except
+                log(f"🚫 Failed: {error}")
+                return f"  {name}: {error}"
+        log(f"🤖 Created the config, indexed {len(update.added)} files.")
+        return None
+
+    results = await asyncio.gather(*(init_project(p) for p in projects))
+    return [failure for failure in results if failure is not None]
+
+
+async def _run_init_pipeline(
+        project_path: pathlib.Path,
+        log: Log = print) -> tuple[pathlib.PurePath, IndexUpdate]:
+    """Gather the project details and index the project, concurrently.
+
+    Args:
+        project_path (pathlib.Path): The root of the project.
+        log (Log): Prints the progress messages.
+
+    Returns:
+        tuple[pathlib.PurePath, IndexUpdate]: The path to the config and the
+        files indexed.
+    """
+    with span("init.list_files"):
+        project_files = [p.name for p in project_path.glob("*")]
+
+    staging_path = create_staging_config(project_path)
+    log("🤖 Indexing the project files...")
+    indexing = asyncio.create_task(
+        asyncio.to_thread(_index_project, staging_path))
+    try:
+        # Read (and parse) the config files before knowing which one is used.
+        config_files = asyncio.create_task(
+            _read_config_files(project_path, project_files))
+        project_details = await asyncio.to_thread(_detect_project_details,
+                                                  project_files, log)
+
+        log("🤖 Gathering list of dependencies...")
+        dependencies = await asyncio.to_thread(_get_dependencies_list,
+                                               project_details, project_path,
+                                               await config_files)
+        log("🤖 Indexing the APIs of the dependencies...")
+        await asyncio.to_thread(update_dependency_index, staging_path,
+                                dependencies)
+        update = await indexing
+    except BaseException:
+        # The indexing thread can't be interrupted, let it finish first.
+        await asyncio.gather(indexing, return_exceptions=True)
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
 
-    print("🤖 Gathering list of dependencies...")
-    dependencies = _get_dependencies_list(project_details)
     complete_project_details = ProjectDetailsWithDependencies(
         **project_details.dict(), dependencies=dependencies)
+    with span("init.create_config"):
+        try:
+            config_path = publish_config(staging_path, complete_project_details)
+        except BaseException:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+    return config_path, update
 
-    config_path = create_config(project_path, complete_project_details)
 
-    config_display_uri = config_path.relative_to(project_path).as_posix()
-    print(f"🤖 Created the config at {config_display_uri}")
+@traced("init.index")
+def _index_project(config_path: pathlib.Path) -> IndexUpdate:
+    """Index the project files and git history, for the code search.
+
+    Args:
+        config_path (pathlib.Path): The (staging) config dir to index into.
+
+    Returns:
+        IndexUpdate: The files indexed.
+    """
+    update = update_code_index(config_path)
+    update_lexical_index(config_path, update)
+    update_symbol_index(config_path, update)
+    update_vector_store(config_path)
+    update_git_history(config_path)
+    return update
+
+
+@traced("init.detect_project")
+def _detect_project_details(project_files: list[str],
+                            log: Log = print) -> ProjectDetails:
+    """Detect the project details from its files, or ask the model.
+
+    Args:
+        project_files (list[str]): The names of the files in the project root.
+        log (Log): Prints the progress messages.
+
+    Returns:
+        ProjectDetails: The details of the project.
+    """
+    detection = detect_project(project_files)
+    if detection is not None:
+        log("🤖 Recognised the project from its files (confidence " +
+            f"{detection.confidence:.0%}), no need to ask the model.")
+        return detection.project_details
+
+    log("🤖 Couldn't recognise the project from its files, asking the " +
+        "model...")
+    return _get_project_details(project_files)
+
+
+@dataclass(frozen=True)
+class _ConfigFile:
+    """A dependencies config file, read ahead."""
+    content: str
+    # None if the format can't be parsed locally.
+    dependencies: Optional[list[str]]
+
+
+async def _read_config_files(
+        project_path: pathlib.Path,
+        project_files: list[str]) -> dict[str, _ConfigFile]:
+    """Read and parse the files that may define the dependencies, concurrently.
+
+    Args:
+        project_path (pathlib.Path): The root of the project.
+        project_files (list[str]): The names of the files in the project root.
+
+    Returns:
+        dict[str, _ConfigFile]: The config files that could be read, by name.
+    """
+    names = [name for name in project_files if get_dependency_parser(name)]
+    config_files = await asyncio.gather(
+        *(asyncio.to_thread(_read_config_file, project_path / name)
+          for name in names))
+    return {
+        name: config_file
+        for name, config_file in zip(names, config_files)
+        if config_file is not None
+    }
+
+
+def _read_config_file(config_path: pathlib.Path) -> Optional[_ConfigFile]:
+    """Read and parse a config file, or return None if it can't be read."""
+    try:
+        content = _load_dependencies_config_content(config_path)
+    except (OSError, UnicodeDecodeError):
+        return None
+    return _ConfigFile(content, parse_dependencies(config_path.name, content))
 
 
-@retry(tries=3)
 def _get_project_details(project_files: list[str]) -> ProjectDetails:
-    """Get the details of a project from the user.
+    """Get the details of a project from the model.
 
     Returns:
         ProjectDetails: The details of the project.
     """
-    llm = OpenAI(temperature=0.5,
-                 openai_api_key=keys["OPENAI_API_KEY"])  # type: ignore
+    return call_with_retries(functools.partial(_request_project_details,
+                                               project_files),
+                             policy=_RETRY_POLICY,
+                             retryable=_is_retryable_error)
+
+
+# Each retried attempt is recorded as its own span.
+@traced("init.project_details_attempt")
+def _request_project_details(project_files: list[str]) -> ProjectDetails:
+    """Ask the model for the details of a project (a single attempt)."""
+    # langchain is slow to import, only pay for it when the model is needed.
+    # pylint: disable-next=import-outside-toplevel
+    from langchain import PromptTemplate
+    # pylint: disable-next=import-outside-toplevel
+    from langchain.output_parsers import PydanticOutputParser
 
     parser = PydanticOutputParser(pydantic_object=ProjectDetails,)
     template = PromptTemplate(
@@ -94,20 +320,51 @@ def _get_project_details(project_files: list[str]) -> ProjectDetails:
         "format with lower case values.\n{format_instructions}\nOutput must " +
         "be a valid json!\nHere's the list of files:\n{files}",
     )
-    chain = LLMChain(llm=llm, prompt=template)
+    with span("init.llm_request"):
+        response = _complete(template.format(files=",".join(project_files)))
 
-    response = chain.run(files=",".join(project_files))
+    with span("init.parse_output"):
+        return _parse_project_details(parser.parse, response)
 
-    return parser.parse(response)
 
+def _parse_project_details(parse: Callable[[str], ProjectDetails],
+                           response: str) -> ProjectDetails:
+    """Parse the reply of the model, repairing it locally if malformed.
+
+    Args:
+        parse (Callable[[str], ProjectDetails]): The strict output parser.
+        response (str): The reply of the model.
 
-def _get_dependencies_list(project_details: ProjectDetails) -> list[str]:
+    Returns:
+        ProjectDetails: The (normalised) details, a ValueError is raised if the
+        reply can't be repaired (so the model is asked again).
+    """
+    try:
+        return normalise_project_details(parse(response))
+    except ValueError:
+        # Each repair is a span, annotated with its outcome.
+        with span("init.repair_output"):
+            repaired = repair_project_details(response)
+            annotate(repaired=repaired is not None,
+                     fix=None if repaired is None else repaired[1])
+        if repaired is None:
+            raise
+        return repaired[0]
+
+
+def _get_dependencies_list(
+        project_details: ProjectDetails,
+        project_path: pathlib.Path,
+        config_files: Optional[dict[str, _ConfigFile]] = None) -> list[str]:
     """Get the list of dependencies from the dependencies file.
 
     Args:
         project_details (ProjectDetails): The details of the project we're
         extracting the dependencies from.
-    
+        project_path (pathlib.Path): The root of the project.
+        config_files (Optional[dict[str, _ConfigFile]]): The config files
+        already read, by path relative to the root.
+
     Returns:
         list[str]: The list of dependencies or empty if none could be found.
     """
@@ -115,15 +372,22 @@ def _get_dependencies_list(project_details: ProjectDetails) -> list[str]:
         # Avoids the case where it is treated as the "." file.
         return []
 
-    dependencies_config_path = pathlib.Path(project_details.config_file)
-    if not dependencies_config_path.exists():
-        return []
+    config_file = (config_files or {}).get(project_details.config_file)
+    if config_file is None:
+        dependencies_config_path = project_path / project_details.config_file
+        if not dependencies_config_path.is_file():
+            return []
+        config_file = _read_config_file(dependencies_config_path)
+        if config_file is None:
+            return []
+
+    # Known formats are parsed locally, the model is only a fallback.
+    if config_file.dependencies is not None:
+        return config_file.dependencies
 
-    dependencies_config_content = _load_dependencies_config_content(
-        dependencies_config_path)
     return _fetch_list_of_dependencies(project_details.language,
                                        project_details.package_manager,
-                                       dependencies_config_content)
+                                       config_file.content)
 
 
 def _load_dependencies_config_content(
@@ -141,7 +405,6 @@ def _load_dependencies_config_content(
         return config_file.read()
 
 
-@retry(tries=3)
 def _fetch_list_of_dependencies(language: str, package_manager: str,
                                 dependencies_config_content: str) -> list[str]:
     """Fetch the list of dependencies from the modal.
@@ -149,8 +412,22 @@ def _fetch_list_of_dependencies(language: str, package_manager: str,
     Returns:
         list[str]: The list of dependencies or empty if none could be found.
     """
-    llm = OpenAI(temperature=0.5,
-                 openai_api_key=keys["OPENAI_API_KEY"])  # type: ignore
+    return call_with_retries(functools.partial(_request_list_of_dependencies,
+                                               language, package_manager,
+                                               dependencies_config_content),
+                             policy=_RETRY_POLICY,
+                             retryable=_is_retryable_error)
+
+
+@traced("init.dependencies_attempt")
+def _request_list_of_dependencies(
+        language: str, package_manager: str,
+        dependencies_config_content: str) -> list[str]:
+    """Ask the model for the list of dependencies (a single attempt)."""
+    # pylint: disable-next=import-outside-toplevel
+    from langchain import PromptTemplate
+    # pylint: disable-next=import-outside-toplevel
+    from langchain.output_parsers import CommaSeparatedListOutputParser
 
     parser = CommaSeparatedListOutputParser()
     template = PromptTemplate(
@@ -164,10 +441,24 @@ def _fetch_list_of_dependencies(language: str, package_manager: str,
         "the project.\n{format_instructions}\nThe config file:\n```\n" +
         "{config_content}\n```",
     )
-    chain = LLMChain(llm=llm, prompt=template)
+    with span("init.llm_request"):
+        response = _complete(
+            template.format(language=language,
+                            package_manager=package_manager,
+                            config_content=dependencies_config_content))
+
+    with span("init.parse_output"):
+        return parser.parse(response)
+
+
+def _complete(prompt: str) -> str:
+    """Complete the prompt with the backend configured where init runs."""
+    config = load_backend_config(search_mochi_config(pathlib.Path.cwd()))
+    return get_backend(config).complete(prompt,
+                                        config.get_temperature(TEMPERATURE))
 
-    response = chain.run(language=language,
-                         package_manager=package_manager,
-                         config_content=dependencies_config_content)
 
-    return parser.parse(response)
+def _is_retryable_error(error: BaseException) -> bool:
+    """Check if a request is worth retrying, invalid outputs included."""
+    # The output parsers raise ValueErrors, a new reply is usually valid.
+    return is_retryable_error(error) or isinstance(error, ValueError)
@@ -0,0 +1,128 @@
+"""Registry of the mochi subcommands.
+
+Each command declares its arguments up front, but the module implementing it is
+only imported when the command actually runs. This keeps `mochi` startup fast,
+since most commands pull in langchain and the model backends.
+"""
+
+import argparse
+import importlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from mochi_code.commands.arguments import (
+    setup_ask_arguments, setup_chat_arguments, setup_find_arguments,
+    setup_index_arguments, setup_init_arguments, setup_serve_arguments,
+    validate_ask_arguments)
+from mochi_code.tracing import span
+
+CommandType = Callable[[argparse.Namespace], None]
+# Checks the parsed arguments, reporting the invalid ones with parser.error.
+ValidatorType = Callable[[argparse.ArgumentParser, argparse.Namespace], None]
+
+# The command to run when mochi is called without a subcommand, from a terminal.
+DEFAULT_COMMAND_NAME = "chat"
+
+
+@dataclass(frozen=True)
+class LazyCommand:  # pylint: disable=too-many-instance-attributes
+    """A subcommand whose implementation is imported on demand."""
+    name: str
+    help: str
+    setup_arguments: Callable[[argparse.ArgumentParser], None]
+    module_name: str
+    runner_name: str
+    show_waiting_message: bool = False
+    # Whether the command can be forwarded to a running daemon.
+    daemon_forwardable: bool = False
+    # Runners replacing the default one when their argument is set, as
+    # (argument, module name, runner name). They always run in process.
+    argument_runners: tuple[tuple[str, str, str], ...] = ()
+    # Checks the combinations of arguments argparse can't express.
+    validate_arguments: Optional[ValidatorType] = None
+
+    def load_runner(self,
+                    args: Optional[argparse.Namespace] = None) -> CommandType:
+        """Import the command module and return its runner.
+
+        Args:
+            args (Optional[argparse.Namespace]): The parsed arguments, selecting
+            the runner if the command has several.
+
+        Returns:
+            CommandType: The function running the command.
+        """
+        module_name, runner_name = self._select_runner(args)
+        with span("cli.import_command", module=module_name):
+            module = importlib.import_module(module_name)
+        return getattr(module, runner_name)
+
+    def forwards_to_daemon(self, args: argparse.Namespace) -> bool:
+        """Check if the command should be forwarded to a running daemon.
+
+        Args:
+            args (argparse.Namespace): The parsed arguments of the command.
+
+        Returns:
+            bool: True if the daemon can run the command with these arguments.
+        """
+        return self.daemon_forwardable and self._select_runner(args) == (
+            self.module_name, self.runner_name)
+
+    def _select_runner(self,
+                       args: Optional[argparse.Namespace]) -> tuple[str, str]:
+        for argument, module_name, runner_name in self.argument_runners:
+            if getattr(args, argument, None) is not None:
+                return module_name, runner_name
+        return self.module_name, self.runner_name
+
+
+COMMANDS: tuple[LazyCommand, ...] = (
+    LazyCommand(name="init",
+                help="Initialize mochi for a project.",
+                setup_arguments=setup_init_arguments,
+                module_name="mochi_code.commands.init",
+                runner_name="run_init_command"),
+    LazyCommand(name="ask",
+                help="Ask a question to mochi.",
+                setup_arguments=setup_ask_arguments,
+                module_name="mochi_code.commands.ask",
+                runner_name="run_ask_command",
+                show_waiting_message=True,
+                daemon_forwardable=True,
+                argument_runners=(("batch", "mochi_code.commands.ask_batch",
+                                   "run_batch_command"),),
+                validate_arguments=validate_ask_arguments),
+    LazyCommand(name="find",
+                help="Find where a function, class or method is defined.",
+                setup_arguments=setup_find_arguments,
+                module_name="mochi_code.commands.find",
+                runner_name="run_find_command"),
+    LazyCommand(name="index",
+                help="Update the index of the project files.",
+                setup_arguments=setup_index_arguments,
+                module_name="mochi_code.commands.index",
+                runner_name="run_index_command"),
+    LazyCommand(name="chat",
+                help="Chat with mochi (the default without a subcommand).",
+                setup_arguments=setup_chat_arguments,
+                module_name="mochi_code.commands.chat",
+                runner_name="run_chat_command"),
+    LazyCommand(name="serve",
+                help="Run the mochi daemon, keeping the backends warm.",
+                setup_arguments=setup_serve_arguments,
+                module_name="mochi_code.commands.serve",
+                runner_name="run_serve_command"),
+)
+
+
+def get_command(name: Optional[str]) -> Optional[LazyCommand]:
+    """Get a registered command by name.
+
+    Args:
+        name (Optional[str]): The name of the command.
+
+    Returns:
+        Optional[LazyCommand]: The command or None if it isn't registered.
+    """
+    return next((c for c in COMMANDS if c.name == name), None)
@@ -0,0 +1,17 @@
+"""The serve command. This command runs the mochi daemon, which keeps the
+backends warm so other commands (e.g. ask) can be forwarded to it."""
+
+import argparse
+import pathlib
+
+from mochi_code.commands.arguments import setup_serve_arguments
+from mochi_code.daemon.protocol import get_socket_path
+from mochi_code.daemon.server import serve
+
+__all__ = ["setup_serve_arguments", "run_serve_command"]
+
+
+def run_serve_command(args: argparse.Namespace) -> None:
+    """Run the serve command with the provided arguments."""
+    socket_path = pathlib.Path(args.socket) if args.socket else None
+    serve(socket_path or get_socket_path())
@@ -0,0 +1,5 @@
+"""The mochi daemon keeps the backends warm between commands.
+
+The client side (`protocol` and `client`) only uses the standard library, so the
+cli can forward commands without importing any of the heavy backends.
+"""
@@ -0,0 +1,96 @@
+"""Thin client forwarding commands to a running daemon."""
+
+import argparse
+import os
+import pathlib
+import socket
+import sys
+from typing import Optional, TextIO
+
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.daemon.protocol import (DISABLE_DAEMON_ENV_VAR, FORWARDED_ARGS,
+                                        Message, decode_message, encode_message,
+                                        get_env_fingerprint, get_socket_path)
+from mochi_code.rendering import StreamRenderer
+from mochi_code.tracing import get_tracer
+
+
+def forward_command(args: argparse.Namespace,
+                    socket_path: Optional[pathlib.Path] = None,
+                    output: Optional[TextIO] = None) -> bool:
+    """Forward a command to the daemon and stream its output.
+
+    Args:
+        args (argparse.Namespace): The parsed cli arguments, including the
+        subcommand.
+        socket_path (Optional[pathlib.Path]): The daemon socket, defaults to
+        get_socket_path().
+        output (Optional[TextIO]): Where to write the output, defaults to
+        stdout.
+
+    Returns:
+        bool: True if the daemon ran the command, False if the daemon isn't
+        available (or can't honour the root options, e.g. a deadline, or runs
+        with another env, e.g. another backend or keys) and the command should
+        run in process instead.
+    """
+    if os.environ.get(DISABLE_DAEMON_ENV_VAR) or _has_local_options(args):
+        return False
+
+    connection = _connect(socket_path or get_socket_path())
+    if connection is None:
+        return False
+
+    command_args = {
+        name: getattr(args, name, None)
+        for name in FORWARDED_ARGS.get(args.subcommand, ())
+    }
+    request: Message = {
+        "command": args.subcommand,
+        "args": command_args,
+        "cwd": os.getcwd(),
+        "env": get_env_fingerprint(),
+    }
+    renderer = StreamRenderer(output or sys.stdout)
+
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(encode_message(request))
+        stream.flush()
+
+        try:
+            for line in stream:
+                message = decode_message(line)
+                if "token" in message:
+                    renderer(message["token"])
+                elif "error" in message:
+                    raise MochiCannotContinue(message["error"])
+                elif message.get("declined"):
+                    return False
+                elif message.get("done"):
+                    return True
+        finally:
+            renderer.finish()
+
+    raise MochiCannotContinue("The mochi daemon closed the connection.")
+
+
+def _has_local_options(args: argparse.Namespace) -> bool:
+    """Check if the command uses options only the cli process can apply."""
+    # The daemon would trace (and time out) its own work, not the command's.
+    if get_tracer() is not None:
+        return True
+    return getattr(args, "deadline", None) is not None
+
+
+def _connect(socket_path: pathlib.Path) -> Optional[socket.socket]:
+    """Connect to the daemon, returning None if it isn't running."""
+    if not hasattr(socket, "AF_UNIX") or not socket_path.exists():
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(socket_path))
+    except OSError:
+        connection.close()
+        return None
+    return connection
@@ -0,0 +1,100 @@
+"""The messages exchanged between the daemon and its clients.
+
+Each message is a single line of JSON. A client sends one request and the daemon
+replies with any number of `token` messages followed by either a `done` or an
+`error` message, or with a single `declined` message if the client's env differs
+from the daemon's (the client then runs the command itself).
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+from typing import Any
+
+from mochi_code.tracing import TRACE_ENV_VAR
+
+# Overrides the path to the daemon socket.
+SOCKET_ENV_VAR = "MOCHI_SOCKET"
+# When set, the cli never forwards commands to the daemon.
+DISABLE_DAEMON_ENV_VAR = "MOCHI_NO_DAEMON"
+
+# The prefixes of the env vars configuring the commands (the root, backend,
+# model, keys, hedging...). The daemon only runs the commands of clients with
+# the same env as its own.
+_COMMAND_ENV_PREFIXES = ("MOCHI_", "OPENAI_")
+# The keys file of the backends (see backends.KEYS_FILE_NAME), importing them
+# would slow down every forwarded command.
+_KEYS_FILE_NAME = ".keys"
+# Only read by the client process.
+_CLIENT_ENV_VARS = {SOCKET_ENV_VAR, DISABLE_DAEMON_ENV_VAR, TRACE_ENV_VAR}
+
+Message = dict[str, Any]
+
+# The arguments of each command the daemon runs, the others aren't forwarded.
+FORWARDED_ARGS: dict[str, tuple[str, ...]] = {
+    "ping": (),
+    "ask": ("prompt", "no_cache", "refresh", "hedge_after"),
+}
+
+
+def get_socket_path() -> pathlib.Path:
+    """Get the path to the daemon socket.
+
+    Returns:
+        pathlib.Path: The path from the env or a per user default.
+    """
+    if os.environ.get(SOCKET_ENV_VAR):
+        return pathlib.Path(os.environ[SOCKET_ENV_VAR])
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    user_id = os.getuid() if hasattr(os, "getuid") else 0
+    return pathlib.Path(runtime_dir) / f"mochi-{user_id}.sock"
+
+
+def get_env_fingerprint() -> str:
+    """Fingerprint the env the commands of this process run with.
+
+    It covers the command env vars and the keys file found from the working
+    directory, but not their values in clear, as it is sent to the daemon.
+
+    Returns:
+        str: The fingerprint, equal for processes with the same env.
+    """
+    command_env = {
+        name: value for name, value in os.environ.items() if
+        name.startswith(_COMMAND_ENV_PREFIXES) and name not in _CLIENT_ENV_VARS
+    }
+    keys_path = pathlib.Path(_KEYS_FILE_NAME).resolve()
+    if keys_path.is_file():
+        command_env[_KEYS_FILE_NAME] = str(keys_path)
+    encoded = json.dumps(command_env, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def encode_message(message: Message) -> bytes:
+    """Encode a message to be sent over the socket.
+
+    Args:
+        message (Message): The JSON serializable message.
+
+    Returns:
+        bytes: The encoded message, including the line terminator.
+    """
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+def decode_message(line: bytes) -> Message:
+    """Decode a message received from the socket.
+
+    Args:
+        line (bytes): A single line received from the socket.
+
+    Returns:
+        Message: The decoded message.
+    """
+    message = json.loads(line.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("Daemon messages must be JSON objects.")
+    return message
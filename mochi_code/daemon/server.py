@@ -0,0 +1,129 @@
+"""The mochi daemon, answering forwarded commands with warm backends.
+
+Importing this module imports the backends, the daemon keeps them (together
+with the pooled HTTP session and the loaded project contexts) alive between
+commands.
+"""
+
+import os
+import pathlib
+import socket
+import socketserver
+from typing import Any, Callable
+
+from mochi_code.backends import install_pooled_session
+from mochi_code.commands.ask import ProjectContexts, ask
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.daemon.protocol import (Message, decode_message, encode_message,
+                                        get_env_fingerprint)
+from mochi_code.hedging import load_hedge_policy
+
+SendMessage = Callable[[Message], None]
+_CommandHandler = Callable[[dict[str, Any], pathlib.Path, SendMessage], None]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles a single forwarded command."""
+    server: "MochiServer"
+
+    def handle(self) -> None:
+        try:
+            request = decode_message(self.rfile.readline())
+            if request.get("env") != self.server.env_fingerprint:
+                # The backend, model or keys of the client could differ.
+                self._send({"declined": True})
+                return
+            self.server.dispatch(request, self._send)
+            self._send({"done": True})
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, there is nobody to report to.
+            pass
+        except Exception as error:  # pylint: disable=broad-except
+            self._send({"error": str(error)})
+
+    def _send(self, message: Message) -> None:
+        self.wfile.write(encode_message(message))
+        self.wfile.flush()
+
+
+class MochiServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves forwarded commands over a unix socket."""
+    daemon_threads = True
+
+    def __init__(self, socket_path: pathlib.Path) -> None:
+        self.socket_path = socket_path
+        self.project_contexts = ProjectContexts()
+        # The commands run with the env the daemon was started with.
+        self.env_fingerprint = get_env_fingerprint()
+        self._handlers: dict[str, _CommandHandler] = {
+            "ping": self._handle_ping,
+            "ask": self._handle_ask,
+        }
+        # Only the user can connect, from the moment the socket exists.
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(str(socket_path), _RequestHandler)
+        finally:
+            os.umask(previous_umask)
+
+    def dispatch(self, request: Message, send: SendMessage) -> None:
+        """Run the requested command.
+
+        Args:
+            request (Message): The request sent by the client.
+            send (SendMessage): Sends messages back to the client.
+        """
+        handler = self._handlers.get(request.get("command", ""))
+        if handler is None:
+            raise MochiCannotContinue(
+                f"The daemon can't run '{request.get('command')}'.")
+        handler(request.get("args", {}), pathlib.Path(request["cwd"]), send)
+
+    def _handle_ping(self, _args: dict[str, Any], _cwd: pathlib.Path,
+                     _send: SendMessage) -> None:
+        pass
+
+    def _handle_ask(self, args: dict[str, Any], cwd: pathlib.Path,
+                    send: SendMessage) -> None:
+        ask(args["prompt"],
+            use_cache=not args.get("no_cache", False),
+            refresh_cache=args.get("refresh", False),
+            project_context=self.project_contexts.get(cwd),
+            on_token=lambda token: send({"token": token}),
+            hedge=load_hedge_policy(args.get("hedge_after")))
+
+
+def _is_daemon_running(socket_path: pathlib.Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def serve(socket_path: pathlib.Path) -> None:
+    """Serve commands until interrupted.
+
+    Args:
+        socket_path (pathlib.Path): The path of the unix socket to listen on.
+    """
+    if socket_path.exists():
+        if _is_daemon_running(socket_path):
+            raise MochiCannotContinue(
+                f"🚫 Mochi is already serving at '{socket_path}'.")
+        # Left behind by a daemon that didn't shut down cleanly.
+        socket_path.unlink()
+
+    # Reuse connections across requests (openai defaults to a session per
+    # thread, and the server uses a thread per request).
+    install_pooled_session()
+
+    with MochiServer(socket_path) as server:
+        print(f"🤖 Mochi is serving at '{socket_path}' (Ctrl + C to stop).")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Mochi is going to sleep.")
+        finally:
+            socket_path.unlink(missing_ok=True)
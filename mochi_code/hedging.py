@@ -0,0 +1,309 @@
+"""Hedged model requests, cutting the tail latency of interactive answers.
+
+A slow response of the provider dominates how long ask feels. With hedging on
+(see load_hedge_policy), a request that hasn't streamed a token after the hedge
+delay (e.g. the usual p95 time to first token) is sent again, to the same or an
+alternate backend. The answer streams from whichever request produces a token
+first, and the other one is cancelled.
+
+Hedges cost a request each, so a budget caps the share of hedged requests: each
+request adds max_rate to the budget, each hedge spends 1. The budget starts
+empty and is shared by the processes (in the user cache dir), so one-off asks
+earn their hedges like the requests of a batch or of the daemon do.
+"""
+
+import contextvars
+import dataclasses
+import fcntl
+import functools
+import math
+import os
+import pathlib
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from mochi_code.backends import (DEFAULT_MAX_TOKENS, BackendConfig,
+                                 ModelBackend, TokenCallback)
+from mochi_code.code.mochi_config import get_user_cache_path
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.tracing import annotate, mark
+
+# Hedging is off unless the delay is set.
+HEDGE_AFTER_ENV_VAR = "MOCHI_HEDGE_AFTER"
+HEDGE_RATE_ENV_VAR = "MOCHI_HEDGE_RATE"
+# The alternate backend (and model) hedges are sent to, the same by default.
+HEDGE_BACKEND_ENV_VAR = "MOCHI_HEDGE_BACKEND"
+HEDGE_MODEL_ENV_VAR = "MOCHI_HEDGE_MODEL"
+
+# At most 1 in 10 requests is hedged (in the long run).
+DEFAULT_MAX_HEDGE_RATE = 0.1
+# The budget shared by the processes, in the user cache dir.
+HEDGE_BUDGET_FILE_NAME = "hedge_budget"
+# E.g. 10 requests at a rate of 0.1 add up to 0.999...
+_ROUNDING = 1e-9
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """When, and where to, requests are hedged."""
+    # Seconds without a token before sending the hedge.
+    after: float
+    # The maximum share of the requests that are hedged.
+    max_rate: float = DEFAULT_MAX_HEDGE_RATE
+    # The alternate backend and model, the ones of the request if None.
+    backend: Optional[str] = None
+    model: Optional[str] = None
+
+    def get_hedge_config(self, config: BackendConfig) -> BackendConfig:
+        """Get the config of the backend the hedges are sent to.
+
+        Args:
+            config (BackendConfig): The config of the hedged request.
+
+        Returns:
+            BackendConfig: The config of the alternate backend, if any.
+        """
+        backend, api_base = config.backend, config.api_base
+        if self.backend is not None and self.backend != config.backend:
+            # The url of the request is the one of its backend.
+            backend, api_base = self.backend, None
+        return dataclasses.replace(config,
+                                   backend=backend,
+                                   model=self.model or config.model,
+                                   api_base=api_base)
+
+
+def load_hedge_policy(after: Optional[float] = None) -> Optional[HedgePolicy]:
+    """Load the hedge policy from the MOCHI_HEDGE_* env vars.
+
+    Args:
+        after (Optional[float]): The hedge delay, overriding MOCHI_HEDGE_AFTER.
+
+    Returns:
+        Optional[HedgePolicy]: The policy, or None if hedging is off.
+    """
+    try:
+        if after is None and os.environ.get(HEDGE_AFTER_ENV_VAR):
+            after = float(os.environ[HEDGE_AFTER_ENV_VAR])
+        max_rate = float(
+            os.environ.get(HEDGE_RATE_ENV_VAR) or DEFAULT_MAX_HEDGE_RATE)
+    except ValueError as error:
+        raise MochiCannotContinue(
+            f"🚫 Invalid hedging config: {error}") from error
+    if after is None:
+        return None
+    if after < 0 or math.isnan(after) or not 0 <= max_rate <= 1:
+        raise MochiCannotContinue(
+            f"🚫 Invalid hedging config, {HEDGE_AFTER_ENV_VAR} must be " +
+            f"positive and {HEDGE_RATE_ENV_VAR} between 0 and 1.")
+    return HedgePolicy(after=after,
+                       max_rate=max_rate,
+                       backend=os.environ.get(HEDGE_BACKEND_ENV_VAR) or None,
+                       model=os.environ.get(HEDGE_MODEL_ENV_VAR) or None)
+
+
+class HedgeBudget:
+    """Caps the share of hedged requests, like a token bucket."""
+
+    def __init__(self,
+                 burst: float = 1.0,
+                 path: Optional[pathlib.Path] = None,
+                 balance: float = 0.0) -> None:
+        """Create a budget, empty by default.
+
+        Args:
+            burst (float): The most hedges the budget can save up.
+            path (Optional[pathlib.Path]): The file keeping the budget, shared
+            by the processes using it. Only kept in memory if None.
+            balance (float): The hedges in a new budget.
+        """
+        self._burst = burst
+        self._path = path
+        self._balance = balance
+        self._lock = threading.Lock()
+
+    def record_request(self, max_rate: float) -> None:
+        """Record a request, adding its share of a hedge to the budget.
+
+        Args:
+            max_rate (float): The maximum share of the requests hedged.
+        """
+        self._update(lambda balance:
+                     (min(self._burst, balance + max_rate), True))
+
+    def try_spend(self) -> bool:
+        """Spend a hedge, returning False if the budget is out of hedges."""
+        return self._update(lambda balance: (balance - 1, True)
+                            if balance >= 1 - _ROUNDING else (balance, False))
+
+    def _update(self, change: Callable[[float], tuple[float, bool]]) -> bool:
+        """Change the balance, returning the result of the change."""
+        with self._lock:
+            if self._path is not None:
+                try:
+                    return _update_balance_file(self._path, change)
+                except OSError:
+                    # E.g. a read-only cache dir, the process keeps its own.
+                    pass
+            self._balance, result = change(self._balance)
+            return result
+
+
+def _update_balance_file(path: pathlib.Path,
+                         change: Callable[[float], tuple[float, bool]]) -> bool:
+    """Change the balance kept in the file, one process at a time."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+", encoding="utf-8") as budget_file:
+        # Closing the file releases the lock.
+        fcntl.flock(budget_file, fcntl.LOCK_EX)
+        budget_file.seek(0)
+        try:
+            balance = float(budget_file.read() or 0)
+        except ValueError:
+            balance = 0
+        if not math.isfinite(balance):
+            balance = 0
+        balance, result = change(balance)
+        budget_file.truncate(0)
+        budget_file.write(repr(balance))
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _get_shared_budget() -> HedgeBudget:
+    return HedgeBudget(path=get_user_cache_path() / HEDGE_BUDGET_FILE_NAME)
+
+
+class _Cancelled(Exception):
+    """Raised in the stream of the request that lost the race."""
+
+
+# What the racing requests report: a token, their response or their error.
+_Event = tuple[str, str, Union[str, BaseException]]
+
+
+class _Racer:
+    """Runs a request in a thread, reporting its progress to a queue."""
+
+    def __init__(self, name: str, events: "queue.Queue[_Event]") -> None:
+        self.name = name
+        self._events = events
+        self._cancelled = threading.Event()
+
+    def start(self, backend: ModelBackend, prompt: str, temperature: float,
+              max_tokens: int) -> None:
+        """Start the request, in the context of the caller (e.g. its
+        deadline)."""
+        context = contextvars.copy_context()
+        # Not joined, a cancelled request may still wait for its connection.
+        threading.Thread(target=context.run,
+                         args=(self._run, backend, prompt, temperature,
+                               max_tokens),
+                         daemon=True).start()
+
+    def cancel(self) -> None:
+        """Stop streaming, closing the connection at the next token."""
+        self._cancelled.set()
+
+    def _run(self, backend: ModelBackend, prompt: str, temperature: float,
+             max_tokens: int) -> None:
+        try:
+            response = backend.complete(prompt,
+                                        temperature,
+                                        max_tokens,
+                                        on_token=self._on_token)
+        except _Cancelled:
+            return
+        except Exception as error:  # pylint: disable=broad-except
+            self._events.put(("error", self.name, error))
+            return
+        self._events.put(("done", self.name, response))
+
+    def _on_token(self, token: str) -> None:
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        self._events.put(("token", self.name, token))
+
+
+# pylint: disable-next=too-many-arguments,too-many-locals
+def hedged_complete(backend: ModelBackend,
+                    hedge_backend: ModelBackend,
+                    prompt: str,
+                    temperature: float,
+                    on_token: TokenCallback,
+                    policy: HedgePolicy,
+                    max_tokens: int = DEFAULT_MAX_TOKENS,
+                    budget: Optional[HedgeBudget] = None) -> str:
+    """Complete the prompt, hedging the request if it is slow to start.
+
+    The tokens are passed to on_token from the calling thread, only from the
+    request that streamed first.
+
+    Args:
+        backend (ModelBackend): The backend of the request.
+        hedge_backend (ModelBackend): The backend of the hedge.
+        prompt (str): The prompt.
+        temperature (float): The sampling temperature.
+        on_token (TokenCallback): Receives the streamed completion.
+        policy (HedgePolicy): When to hedge.
+        max_tokens (int): The maximum tokens of the completion.
+        budget (Optional[HedgeBudget]): Caps the hedges, the budget shared by
+        the processes by default.
+
+    Returns:
+        str: The completion of the first request to stream.
+    """
+    budget = budget or _get_shared_budget()
+    budget.record_request(policy.max_rate)
+    events: "queue.Queue[_Event]" = queue.Queue()
+    racers = {name: _Racer(name, events) for name in (PRIMARY, HEDGE)}
+    racers[PRIMARY].start(backend, prompt, temperature, max_tokens)
+    running = {PRIMARY}
+    hedged = False
+    hedge_at: Optional[float] = time.monotonic() + policy.after
+    winner: Optional[str] = None
+    errors: dict[str, BaseException] = {}
+
+    while True:
+        timeout = None
+        if hedge_at is not None:
+            timeout = max(hedge_at - time.monotonic(), 0)
+        try:
+            kind, name, value = events.get(timeout=timeout)
+        except queue.Empty:
+            hedge_at = None
+            if budget.try_spend():
+                mark("hedge_sent")
+                racers[HEDGE].start(hedge_backend, prompt, temperature,
+                                    max_tokens)
+                running.add(HEDGE)
+                hedged = True
+            continue
+
+        if winner is None and kind != "error":
+            # The first to stream wins, the others are cancelled.
+            winner = name
+            hedge_at = None
+            for racer in racers.values():
+                if racer.name != winner:
+                    racer.cancel()
+            annotate(hedged=hedged, hedge_winner=winner)
+        if kind == "error":
+            assert isinstance(value, BaseException)
+            running.discard(name)
+            errors[name] = value
+            if name == winner or (winner is None and not running):
+                # Nothing else can answer (a failed primary isn't hedged, it
+                # is up to the retries).
+                raise errors.get(PRIMARY, value)
+        elif name == winner:
+            assert isinstance(value, str)
+            if kind == "done":
+                return value
+            on_token(value)
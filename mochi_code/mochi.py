@@ -1,55 +1,125 @@
 """This file sets up the mochi subcommands, validates cli user input and calls
 out to the subcommands.
 It serves as a router to the different subcommands.
+
+Subcommand implementations are imported lazily through the command registry,
+so only the selected subcommand pays for its imports. Commands supporting it are
+forwarded to the daemon (see `mochi serve`) when it is running.
 """
 
 import argparse
-from typing import Callable
+import contextlib
+import sys
+from typing import Any, Optional
 
-from mochi_code.commands import (run_ask_command, run_init_command,
-                                 setup_ask_arguments, setup_init_arguments)
+from mochi_code.commands.argument_types import positive_float
+from mochi_code.commands.registry import (COMMANDS, DEFAULT_COMMAND_NAME,
+                                          CommandType, LazyCommand, get_command)
+from mochi_code.daemon.client import forward_command
 from mochi_code.greeting import get_greeting, get_waiting_message
-
-CommandType = Callable[[argparse.Namespace], None]
+from mochi_code.tracing import (disable_tracing, enable_tracing,
+                                get_trace_output_path, span, write_trace)
 
 
 def cli():
     """Setup the cli environment and run the selected subcommand."""
     root_parser = argparse.ArgumentParser(prog="mochi")
+    root_parser.add_argument("--trace",
+                             action="store_true",
+                             help="Trace where the time goes, printing a "
+                             "summary and writing a Chrome trace file (also "
+                             "enabled by $MOCHI_TRACE).")
+    root_parser.add_argument("--deadline",
+                             type=positive_float,
+                             metavar="SECONDS",
+                             help="Give up on the model requests (retries "
+                             "included) after this long.")
     subparsers = root_parser.add_subparsers(title="subcommands",
                                             dest="subcommand")
 
-    init_name = "init"
-    init_parser = subparsers.add_parser(init_name,
-                                        help="Initialize mochi for a project.")
-    setup_init_arguments(init_parser)
-
-    ask_name = "ask"
-    ask_parser = subparsers.add_parser(ask_name,
-                                       help="Ask a question to mochi.")
-    setup_ask_arguments(ask_parser)
+    command_parsers = {}
+    for registered in COMMANDS:
+        command_parser = subparsers.add_parser(registered.name,
+                                               help=registered.help)
+        registered.setup_arguments(command_parser)
+        command_parsers[registered.name] = command_parser
 
     args = root_parser.parse_args()
 
-    if args.subcommand == init_name:
-        _run_command(run_init_command, args, init_parser)
-    elif args.subcommand == ask_name:
-        print(get_waiting_message())
-        _run_command(run_ask_command, args, ask_parser)
-    else:
+    trace_output_path = get_trace_output_path(args.trace)
+    if trace_output_path is not None:
+        enable_tracing()
+
+    try:
+        with _deadline_scope(args.deadline):
+            _run_selected_command(args, root_parser, command_parsers)
+    finally:
+        tracer = disable_tracing()
+        if tracer is not None and trace_output_path is not None:
+            write_trace(tracer, trace_output_path)
+
+
+def _deadline_scope(
+        seconds: Optional[float]) -> contextlib.AbstractContextManager[Any]:
+    """Set the deadline of the command, if any."""
+    if seconds is None:
+        return contextlib.nullcontext()
+    # Only paid for when a deadline is set, it isn't needed to start the cli.
+    # pylint: disable-next=import-outside-toplevel
+    from mochi_code.resilience import deadline_scope
+    return deadline_scope(seconds)
+
+
+def _run_selected_command(
+        args: argparse.Namespace, root_parser: argparse.ArgumentParser,
+        command_parsers: dict[str, argparse.ArgumentParser]) -> None:
+    """Run the selected subcommand. Without one, run the default one if a user
+    is at the terminal, or print the help (e.g. to scripts and editor hooks).
+    """
+    command = get_command(args.subcommand)
+    if command is None:
         print(get_greeting())
-        print("🕰️ Here will live the chat mode, but not yet... try > mochi ask")
-        root_parser.print_help()
+        if not sys.stdin.isatty():
+            # The default command is interactive, and slow to load.
+            root_parser.print_help()
+            return
+        print("💡 Try > mochi --help for the other commands.")
+        command = get_command(DEFAULT_COMMAND_NAME)
+        assert command is not None
+        args = command_parsers[command.name].parse_args([])
+        args.subcommand = command.name
+
+    command_parser = command_parsers[command.name]
+    if command.validate_arguments is not None:
+        command.validate_arguments(command_parser, args)
+    if command.show_waiting_message:
+        print(get_waiting_message())
+    _run_command(_get_runner(command, args), args, command_parser)
+
+
+def _get_runner(command: LazyCommand, args: argparse.Namespace) -> CommandType:
+    """Get the runner for the command, preferring the daemon if available."""
+    if not command.forwards_to_daemon(args):
+        return command.load_runner(args)
+
+    def run(args: argparse.Namespace) -> None:
+        with span("cli.forward_to_daemon"):
+            forwarded = forward_command(args)
+        if not forwarded:
+            command.load_runner(args)(args)
+
+    return run
 
 
 def _run_command(
-        command: CommandType,
-        args: argparse.Namespace,
-        command_parser: argparse.ArgumentParser,
+    command: CommandType,
+    args: argparse.Namespace,
+    command_parser: argparse.ArgumentParser,
 ):
     """Run the command and exit if an error occurred."""
     try:
-        command(args)
+        with span("cli.run_command"):
+            command(args)
     except Exception as error:  # pylint: disable=broad-except
         print(f"😭 an issue occurred running your command: {error}")
         command_parser.exit(1)
@@ -0,0 +1,77 @@
+"""The conversation history used by the chat prompts.
+
+The history is a sliding window of the most recent turns that fit in a token
+budget, so the prompt size stays bounded however long the conversation gets.
+"""
+
+from collections import deque
+from typing import Callable
+
+# Not imported from prompts.tokens, the cli imports this module at startup.
+TokenCounter = Callable[[str], int]
+
+DEFAULT_MAX_TOKENS = 1500
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in the text (~4 chars/token).
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return (len(text) + 3) // 4
+
+
+class ChatHistory:
+    """A token budgeted window of the most recent conversation turns."""
+
+    def __init__(self,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 count_tokens: TokenCounter = estimate_tokens) -> None:
+        """Create an empty history.
+
+        Args:
+            max_tokens (int): The maximum number of tokens to keep.
+            count_tokens (TokenCounter): Counts the tokens of a turn.
+        """
+        self._max_tokens = max_tokens
+        self._count_tokens = count_tokens
+        self._turns: deque[tuple[str, int]] = deque()
+        self._total_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """The number of tokens of the turns in the window."""
+        return self._total_tokens
+
+    @property
+    def turns(self) -> tuple[str, ...]:
+        """The turns in the window, oldest first."""
+        return tuple(turn for turn, _ in self._turns)
+
+    def add(self, user_prompt: str, response: str) -> None:
+        """Add a turn, dropping the oldest turns if over the budget.
+
+        Args:
+            user_prompt (str): What the user asked.
+            response (str): What mochi answered.
+        """
+        turn = f"User: {user_prompt}\nMochi: {response.strip()}"
+        tokens = self._count_tokens(turn)
+        self._turns.append((turn, tokens))
+        self._total_tokens += tokens
+
+        while self._turns and self._total_tokens > self._max_tokens:
+            _, dropped_tokens = self._turns.popleft()
+            self._total_tokens -= dropped_tokens
+
+    def render(self) -> str:
+        """Render the turns in the window, oldest first.
+
+        Returns:
+            str: The conversation, or an empty string if there is none.
+        """
+        return "\n".join(turn for turn, _ in self._turns)
@@ -1,20 +1,84 @@
 """Utilities to create project specific prompts."""
 import pathlib
-from typing import Optional
-
-from langchain import PromptTemplate
+from typing import Optional, Sequence
 
+from mochi_code.code import ProjectDetailsWithDependencies
+from mochi_code.code.code_search import (CodeSearchIndex, read_chunk,
+                                         search_all)
+from mochi_code.code.dependency_index import DependencyIndex
+from mochi_code.code.git_history import GitHistory
 from mochi_code.code.mochi_config import (get_project_details_path,
                                           load_project_details,
                                           search_mochi_config)
+from mochi_code.prompts.prompt_assembly import (SECTION_SEPARATOR,
+                                                PromptSection)
+from mochi_code.tracing import annotate, traced
+
+# The priorities of the sections, the lowest are shrunk first when the prompt
+# is too long.
+PROJECT_PRIORITY = 40
+HISTORY_PRIORITY = 30
+CODE_SNIPPETS_PRIORITY = 20
+GIT_HISTORY_PRIORITY = 15
+DEPENDENCY_APIS_PRIORITY = 12
+DEPENDENCIES_PRIORITY = 10
+
+DEFAULT_SNIPPETS_TOP_K = 5
+DEFAULT_SNIPPETS_MAX_TOKENS = 1000
+DEFAULT_DEPENDENCIES_MAX_TOKENS = 300
+DEFAULT_COMMITS_TOP_K = 5
+DEFAULT_COMMITS_MAX_TOKENS = 300
+DEFAULT_APIS_TOP_K = 5
+DEFAULT_APIS_MAX_TOKENS = 300
+
 
-_ProjectTemplate = PromptTemplate(
-    input_variables=["language", "package_manager", "dependencies"],
-    template=
-    "The user is working on a {language} project using {package_manager} as " +
-    "a package manager. Here's a list of dependencies used by the project: " +
-    "({dependencies})",
-)
+@traced("prompt.project")
+def get_project_sections(start_path: pathlib.Path) -> list[PromptSection]:
+    """Get the project prompt sections if available.
+
+    Args:
+        start_path (pathlib.Path): The path to search for the project details
+        (uses search_mochi_config to find the project details).
+
+    Returns:
+        list[PromptSection]: The project details and dependencies sections, or
+        no sections if there are no project details available.
+    """
+    existing_root = search_mochi_config(start_path)
+    if not existing_root:
+        return []
+
+    project_details_path = get_project_details_path(existing_root)
+    return make_project_sections(load_project_details(project_details_path))
+
+
+def make_project_sections(
+        project_details: ProjectDetailsWithDependencies) -> list[PromptSection]:
+    """Make the prompt sections describing the project.
+
+    Args:
+        project_details (ProjectDetailsWithDependencies): The project details.
+
+    Returns:
+        list[PromptSection]: The project details and dependencies sections (the
+        dependencies are summarised if there are too many).
+    """
+    return [
+        PromptSection(
+            "project",
+            (f"The user is working on a {project_details.language} project " +
+             f"using {project_details.package_manager} as a package manager.",),
+            priority=PROJECT_PRIORITY),
+        PromptSection(
+            "dependencies",
+            tuple(project_details.dependencies),
+            priority=DEPENDENCIES_PRIORITY,
+            template="Here's a list of dependencies used by the project: " +
+            "({items})",
+            separator=", ",
+            omitted=" and {count} more",
+            max_tokens=DEFAULT_DEPENDENCIES_MAX_TOKENS),
+    ]
 
 
 def get_project_prompt(start_path: pathlib.Path) -> Optional[str]:
@@ -28,14 +92,120 @@ def get_project_prompt(start_path: pathlib.Path) -> Optional[str]:
         str: The project prompt or None if there are no project details
         available.
     """
-    existing_root = search_mochi_config(start_path)
-    if not existing_root:
+    sections = get_project_sections(start_path)
+    if not sections:
         return None
+    return SECTION_SEPARATOR.join(
+        section.render() for section in sections if section.items)
 
-    project_details_path = get_project_details_path(existing_root)
-    project_details = load_project_details(project_details_path)
 
-    return _ProjectTemplate.format(
-        language=project_details.language,
-        package_manager=project_details.package_manager,
-        dependencies=project_details.dependencies)
+@traced("prompt.code_snippets")
+def get_code_snippets_section(
+        indexes: Sequence[CodeSearchIndex],
+        query: str,
+        top_k: int = DEFAULT_SNIPPETS_TOP_K,
+        max_tokens: int = DEFAULT_SNIPPETS_MAX_TOKENS
+) -> Optional[PromptSection]:
+    """Get a prompt section with the project code most relevant to the query.
+
+    Args:
+        indexes (Sequence[CodeSearchIndex]): The indexes of the project code
+        (their rankings are fused).
+        query (str): The user query.
+        top_k (int): The maximum number of snippets.
+        max_tokens (int): The token budget of the snippets, the least relevant
+        snippets are left out if they don't fit.
+
+    Returns:
+        Optional[PromptSection]: The section or None if no code matches the
+        query.
+    """
+    if not indexes:
+        return None
+    # All the indexes are of the same project.
+    project_path = indexes[0].project_path
+
+    snippets = []
+    for result in search_all(indexes, query, top_k):
+        chunk = result.chunk
+        content = read_chunk(project_path, chunk)
+        if content:
+            snippets.append(f"{chunk.path} (lines {chunk.start_line}-" +
+                            f"{chunk.end_line}):\n```\n{content.rstrip()}\n```")
+
+    annotate(snippets=len(snippets))
+    if not snippets:
+        return None
+    return PromptSection(
+        "code_snippets",
+        tuple(snippets),
+        priority=CODE_SNIPPETS_PRIORITY,
+        template="Here is some of the project's code that may be relevant " +
+        "to the query:\n\n{items}",
+        separator="\n\n",
+        max_tokens=max_tokens)
+
+
+@traced("prompt.git_history")
+def get_git_history_section(
+        history: GitHistory,
+        query: str,
+        top_k: int = DEFAULT_COMMITS_TOP_K,
+        max_tokens: int = DEFAULT_COMMITS_MAX_TOKENS
+) -> Optional[PromptSection]:
+    """Get a prompt section with the commits most relevant to the query.
+
+    Args:
+        history (GitHistory): The git history of the project.
+        query (str): The user query.
+        top_k (int): The maximum number of commits.
+        max_tokens (int): The token budget of the commits, the least relevant
+        commits are left out if they don't fit.
+
+    Returns:
+        Optional[PromptSection]: The section or None if no commit matches the
+        query.
+    """
+    commits = history.search(query, top_k)
+    annotate(commits=len(commits))
+    if not commits:
+        return None
+    return PromptSection(
+        "git_history",
+        tuple(commit.describe() for commit in commits),
+        priority=GIT_HISTORY_PRIORITY,
+        template="Here are some of the project's commits that may be " +
+        "relevant to the query:\n{items}",
+        max_tokens=max_tokens)
+
+
+@traced("prompt.dependency_apis")
+def get_dependency_apis_section(
+        index: DependencyIndex,
+        query: str,
+        top_k: int = DEFAULT_APIS_TOP_K,
+        max_tokens: int = DEFAULT_APIS_MAX_TOKENS) -> Optional[PromptSection]:
+    """Get a prompt section with the dependency APIs named in the query.
+
+    Args:
+        index (DependencyIndex): The API index of the project dependencies.
+        query (str): The user query.
+        top_k (int): The maximum number of APIs.
+        max_tokens (int): The token budget of the APIs, the least relevant
+        APIs are left out if they don't fit.
+
+    Returns:
+        Optional[PromptSection]: The section or None if no API matches the
+        query.
+    """
+    symbols = index.search(query, top_k)
+    annotate(apis=len(symbols))
+    if not symbols:
+        return None
+    return PromptSection(
+        "dependency_apis",
+        tuple(symbol.describe() for symbol in symbols),
+        priority=DEPENDENCY_APIS_PRIORITY,
+        template="Here are some of the APIs of the project's dependencies " +
+        "that may be relevant to the query:\n{items}",
+        max_tokens=max_tokens)
@@ -0,0 +1,175 @@
+"""Assemble prompts from sections, within a token budget.
+
+A prompt is made of sections (instructions, project details, dependencies,
+retrieved code, history...) with a priority. When the prompt doesn't fit in the
+budget, the lowest priority sections are shrunk first: a section is a list of
+items (lines, dependencies, snippets, turns) and shrinking keeps as many items
+as fit, replacing the others with a short summary. Required sections are never
+shrunk. The result only depends on the sections and the budget.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from mochi_code.prompts.tokens import TokenCounter, get_token_counter
+from mochi_code.tracing import annotate, traced
+
+# Sections are separated by an empty line.
+SECTION_SEPARATOR = "\n\n"
+
+
+@dataclass(frozen=True)
+class PromptSection:  # pylint: disable=too-many-instance-attributes
+    """A part of a prompt, made of items that can be left out if too long."""
+    name: str
+    items: tuple[str, ...]
+    # Higher priority sections are shrunk last.
+    priority: int = 0
+    # Formats the kept items (joined by the separator) as {items}.
+    template: str = "{items}"
+    separator: str = "\n"
+    # Replaces the items left out, formatted with their {count}.
+    omitted: str = ""
+    # Keep the last items rather than the first ones (e.g. for history).
+    keep_last: bool = False
+    max_tokens: Optional[int] = None
+    required: bool = False
+
+    def render(self, count: Optional[int] = None) -> str:
+        """Render the section with (at most) the first or last count items.
+
+        Args:
+            count (Optional[int]): The number of items to keep (all if None).
+
+        Returns:
+            str: The rendered section, empty if no items are kept.
+        """
+        count = len(self.items) if count is None else count
+        if count <= 0:
+            return ""
+        kept = (self.items[len(self.items) -
+                           count:] if self.keep_last else self.items[:count])
+        text = self.separator.join(kept)
+        dropped = len(self.items) - count
+        if dropped and self.omitted:
+            summary = self.omitted.format(count=dropped)
+            text = (summary + self.separator +
+                    text if self.keep_last else text + summary)
+        return self.template.format(items=text)
+
+
+def text_section(name: str, text: str, **options) -> PromptSection:
+    """Make a section of the lines of a text.
+
+    Args:
+        name (str): The name of the section.
+        text (str): The text of the section.
+        options: The other PromptSection fields.
+
+    Returns:
+        PromptSection: The section, shrunk a line at a time.
+    """
+    options.setdefault("omitted", "\n[... {count} more lines]")
+    return PromptSection(name, tuple(text.splitlines()), **options)
+
+
+@dataclass(frozen=True)
+class AssembledPrompt:
+    """A prompt that fits in its budget."""
+    text: str
+    tokens: int
+    # The tokens of each included section, by name.
+    section_tokens: dict[str, int] = field(default_factory=dict)
+    # The sections that were shrunk (or left out), by name.
+    shrunk: tuple[str, ...] = ()
+
+
+@traced("prompt.assemble")
+def assemble_prompt(
+        sections: Sequence[PromptSection],
+        max_tokens: int,
+        count_tokens: Optional[TokenCounter] = None) -> AssembledPrompt:
+    """Assemble the sections in a prompt, shrinking them to fit the budget.
+
+    Args:
+        sections (Sequence[PromptSection]): The sections, in prompt order.
+        max_tokens (int): The token budget of the whole prompt.
+        count_tokens (Optional[TokenCounter]): Counts the tokens of a text,
+        defaults to the approximate counter.
+
+    Returns:
+        AssembledPrompt: The prompt (it may still be over budget if the required
+        sections alone are).
+    """
+    count_tokens = count_tokens or get_token_counter()
+    separator_tokens = count_tokens(SECTION_SEPARATOR)
+    counts = [len(section.items) for section in sections]
+    tokens = [
+        count_tokens(section.render()) if section.items else 0
+        for section in sections
+    ]
+    shrunk: set[str] = set()
+
+    # Sections over their own budget are shrunk first.
+    for i, section in enumerate(sections):
+        if section.max_tokens is not None and tokens[i] > section.max_tokens:
+            counts[i], tokens[i] = _shrink(section, section.max_tokens,
+                                           count_tokens)
+            shrunk.add(section.name)
+
+    def total() -> int:
+        included = [t for t in tokens if t]
+        return sum(included) + separator_tokens * max(0, len(included) - 1)
+
+    by_priority = sorted(
+        (i for i, section in enumerate(sections) if not section.required),
+        key=lambda i: sections[i].priority)
+    for i in by_priority:
+        excess = total() - max_tokens
+        if excess <= 0:
+            break
+        counts[i], tokens[i] = _shrink(sections[i], max(0, tokens[i] - excess),
+                                       count_tokens)
+        shrunk.add(sections[i].name)
+
+    rendered = [
+        (section.name, section.render(count), section_tokens)
+        for section, count, section_tokens in zip(sections, counts, tokens)
+        if section_tokens
+    ]
+    prompt = AssembledPrompt(text=SECTION_SEPARATOR.join(
+        text for _, text, _ in rendered),
+                             tokens=total(),
+                             section_tokens={
+                                 name: count for name, _, count in rendered
+                             },
+                             shrunk=tuple(sorted(shrunk)))
+
+    annotate(prompt_tokens=prompt.tokens,
+             budget=max_tokens,
+             shrunk=",".join(prompt.shrunk),
+             **{
+                 f"tokens.{name}": count
+                 for name, count in prompt.section_tokens.items()
+             })
+    return prompt
+
+
+def _shrink(section: PromptSection, max_tokens: int,
+            count_tokens: TokenCounter) -> tuple[int, int]:
+    """Find the most items of the section that fit in the budget.
+
+    Returns:
+        tuple[int, int]: The number of items kept and their tokens.
+    """
+    # Binary search, the tokens grow with the number of items.
+    low, high = 0, len(section.items)
+    best_tokens = 0
+    while low < high:
+        middle = (low + high + 1) // 2
+        middle_tokens = count_tokens(section.render(middle))
+        if middle_tokens <= max_tokens:
+            low, best_tokens = middle, middle_tokens
+        else:
+            high = middle - 1
+    return low, best_tokens
@@ -0,0 +1,77 @@
+"""Local token counting for the prompts.
+
+Tokens are counted with the model's own tokenizer when tiktoken is installed
+(and its encodings are available), otherwise with a fast approximation of the
+GPT tokenizers. Counts are cached, as the same sections (instructions, project
+details...) are counted again for every prompt.
+"""
+
+import functools
+import re
+from typing import Any, Callable, Optional
+
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # Optional, fallback to the approximation.
+    tiktoken = None  # type: ignore # pylint: disable=invalid-name
+
+TokenCounter = Callable[[str], int]
+
+# Roughly how GPT tokenizers split text before merging: words (with their
+# leading space), numbers of up to 3 digits, punctuation runs and whitespace.
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[A-Za-z]+| ?[0-9]{1,3}|" +
+                       r" ?[^\sA-Za-z0-9]+|\s+")
+
+# Common words are a single token, longer ones are split every few letters.
+_LETTERS_PER_TOKEN = 6
+
+_CACHE_SIZE = 4096
+
+
+def approximate_tokens(text: str) -> int:
+    """Approximate the number of GPT tokens of the text, without a tokenizer.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: The approximate number of tokens.
+    """
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        length = len(piece.strip()) or 1
+        tokens += -(-length // _LETTERS_PER_TOKEN)
+    return tokens
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model_name: str) -> Optional[Any]:
+    """Get the model's encoding, or None if tiktoken can't provide it."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    # Unknown models, or the encoding couldn't be downloaded.
+    except Exception:  # pylint: disable=broad-exception-caught
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model_name: Optional[str] = None) -> TokenCounter:
+    """Get a (cached) token counter for the model.
+
+    Args:
+        model_name (Optional[str]): The model whose tokenizer to use, the
+        approximation is used if None (or the tokenizer isn't available).
+
+    Returns:
+        TokenCounter: Counts the tokens of a text.
+    """
+    encoding = _get_encoding(model_name) if model_name else None
+    if encoding is None:
+        return functools.lru_cache(maxsize=_CACHE_SIZE)(approximate_tokens)
+
+    def count_tokens(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return functools.lru_cache(maxsize=_CACHE_SIZE)(count_tokens)
@@ -0,0 +1,179 @@
+"""Client side rate limits for the requests sent to the model backends.
+
+Providers limit both the requests and the tokens per minute, going over either
+gets the requests throttled. They usually enforce the limits over shorter
+periods too (60 requests per minute as 1 per second), so each limit is a token
+bucket refilled continuously and holding about a second worth of budget: short
+bursts go through at once and longer runs settle at the configured rate.
+
+RateLimiter is shared by asyncio tasks, BlockingRateLimiter by threads.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Optional
+
+Clock = Callable[[], float]
+
+# The budget available at once, in seconds of the rate.
+DEFAULT_BURST_SECONDS = 1.0
+
+
+class TokenBucket:
+    """A budget refilled continuously, up to its capacity."""
+
+    def __init__(self,
+                 per_minute: float,
+                 burst_seconds: float = DEFAULT_BURST_SECONDS,
+                 clock: Clock = time.monotonic) -> None:
+        """Create a full bucket.
+
+        Args:
+            per_minute (float): The budget refilled every minute.
+            burst_seconds (float): The capacity of the bucket, in seconds of
+            refill.
+            clock (Clock): Returns the current time in seconds.
+        """
+        if per_minute <= 0:
+            raise ValueError("The rate limit must be positive.")
+        self._rate = per_minute / 60
+        self.capacity = self._rate * burst_seconds
+        self._clock = clock
+        self._available = self.capacity
+        self._updated = clock()
+
+    def wait_time(self, amount: float) -> float:
+        """Get how long until the amount is available.
+
+        Args:
+            amount (float): The budget needed (capped to the capacity, so a
+            large request waits for a full bucket rather than forever).
+
+        Returns:
+            float: The time to wait in seconds, 0 if available now.
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self._available
+        return max(0.0, missing / self._rate)
+
+    def take(self, amount: float) -> None:
+        """Use the amount, the budget can go negative to pay for it later.
+
+        Args:
+            amount (float): The budget used.
+        """
+        self._refill()
+        self._available -= amount
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._available = min(
+            self.capacity, self._available + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class _Limits:
+    """The request and token budgets, either may be unlimited."""
+
+    def __init__(self, requests_per_minute: Optional[float],
+                 tokens_per_minute: Optional[float], clock: Clock) -> None:
+        self._requests = (None if requests_per_minute is None else TokenBucket(
+            requests_per_minute, clock=clock))
+        self._tokens = (None if tokens_per_minute is None else TokenBucket(
+            tokens_per_minute, clock=clock))
+
+    def wait_time(self, tokens: int) -> float:
+        """Get how long until a request of that many tokens is within limits."""
+        return max(self._wait_time(self._requests, 1),
+                   self._wait_time(self._tokens, tokens))
+
+    def take(self, tokens: int) -> None:
+        """Use the budget of a request of that many tokens."""
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(tokens)
+
+    @staticmethod
+    def _wait_time(bucket: Optional[TokenBucket], amount: float) -> float:
+        return 0.0 if bucket is None else bucket.wait_time(amount)
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    """Limits the requests and tokens per minute of concurrent tasks."""
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 clock: Clock = time.monotonic) -> None:
+        """Create the limiter.
+
+        Args:
+            requests_per_minute (Optional[float]): The maximum requests per
+            minute, unlimited if None.
+            tokens_per_minute (Optional[float]): The maximum tokens (prompt and
+            completion) per minute, unlimited if None.
+            clock (Clock): Returns the current time in seconds.
+        """
+        self._limits = _Limits(requests_per_minute, tokens_per_minute, clock)
+        # Tasks are served in order, so large requests aren't starved.
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until a request of that many tokens is within the limits.
+
+        Args:
+            tokens (int): The (estimated) tokens of the request.
+
+        Returns:
+            float: The time waited in seconds.
+        """
+        waited = 0.0
+        async with self._lock:
+            while (wait := self._limits.wait_time(tokens)) > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+            self._limits.take(tokens)
+        return waited
+
+
+class BlockingRateLimiter:  # pylint: disable=too-few-public-methods
+    """Limits the requests and tokens per minute of concurrent threads."""
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 clock: Clock = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        """Create the limiter.
+
+        Args:
+            requests_per_minute (Optional[float]): The maximum requests per
+            minute, unlimited if None.
+            tokens_per_minute (Optional[float]): The maximum tokens (prompt and
+            completion) per minute, unlimited if None.
+            clock (Clock): Returns the current time in seconds.
+            sleep (Callable[[float], None]): Blocks for the given seconds.
+        """
+        self._limits = _Limits(requests_per_minute, tokens_per_minute, clock)
+        self._sleep = sleep
+        # One thread waits for the budget at a time, the others queue.
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of that many tokens is within the limits.
+
+        Args:
+            tokens (int): The (estimated) tokens of the request.
+
+        Returns:
+            float: The time waited in seconds.
+        """
+        waited = 0.0
+        with self._lock:
+            while (wait := self._limits.wait_time(tokens)) > 0:
+                self._sleep(wait)
+                waited += wait
+            self._limits.take(tokens)
+        return waited
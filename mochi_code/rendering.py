@@ -0,0 +1,295 @@
+"""Rendering of the streamed answers to the terminal.
+
+Writing (and flushing) every token is slow over SSH or tmux, so on a terminal
+the tokens are coalesced and written at most once per frame: the first token
+straight away, the next ones by a flusher thread, so the stream stays
+responsive even when the model pauses. The markdown code blocks (and inline
+code) are styled as the answer streams, one line at a time, without going back
+over what was already written.
+
+Pipes and files get the plain tokens, written straight away.
+"""
+
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, TextIO
+
+# Honoured by most command line tools, https://no-color.org.
+NO_COLOR_ENV_VAR = "NO_COLOR"
+
+# Writes per second on a terminal.
+DEFAULT_FRAME_RATE = 30.0
+
+_FENCE = "```"
+# Markdown allows up to 3 spaces before a fence.
+_MAX_FENCE_INDENT = 3
+
+_DIM = "\x1b[2m"
+_CODE = "\x1b[36m"
+_RESET = "\x1b[0m"
+
+
+class MarkdownStyler:
+    """Styles streamed markdown with terminal colours, as it arrives.
+
+    Only the start of a line that could be a code fence is held back, the rest
+    is styled and passed on straight away. A styler styles a single answer.
+    """
+
+    def __init__(self) -> None:
+        self._in_code_block = False
+        self._in_inline_code = False
+        self._at_line_start = True
+        # The start of the current line, while it could be a fence.
+        self._held = ""
+
+    def feed(self, text: str) -> str:
+        """Style the next part of the answer.
+
+        Args:
+            text (str): The streamed text.
+
+        Returns:
+            str: The styled text, ready to be written.
+        """
+        parts: list[str] = []
+        start = 0
+        for index, char in enumerate(text):
+            if not self._at_line_start:
+                if char == "\n":
+                    parts.append(self._style_text(text[start:index + 1]))
+                    self._at_line_start = True
+                    start = index + 1
+                continue
+
+            self._held += char
+            start = index + 1
+            if char == "\n":
+                parts.append(self._end_held_line())
+            elif not self._could_be_fence():
+                # A regular line, styled as it streams from here on.
+                parts.append(self._style_text(self._held))
+                self._held = ""
+                self._at_line_start = False
+        if not self._at_line_start:
+            parts.append(self._style_text(text[start:]))
+        return "".join(parts)
+
+    def finish(self) -> str:
+        """End the answer, closing the open styles.
+
+        Returns:
+            str: The rest of the styled answer.
+        """
+        held = self._held.lstrip(" ")
+        if held.startswith(_FENCE):
+            rest = self._style_fence(self._held)
+        else:
+            rest = self._style_text(self._held)
+        if self._in_code_block or self._in_inline_code:
+            rest += _RESET
+        return rest
+
+    def _could_be_fence(self) -> bool:
+        stripped = self._held.lstrip(" ")
+        if len(self._held) - len(stripped) > _MAX_FENCE_INDENT:
+            return False
+        return stripped.startswith(_FENCE) or _FENCE.startswith(stripped)
+
+    def _end_held_line(self) -> str:
+        line, self._held = self._held, ""
+        if line.lstrip(" ").startswith(_FENCE):
+            return self._style_fence(line)
+        return self._style_text(line)
+
+    def _style_fence(self, line: str) -> str:
+        """Style a fence line, opening or closing a code block."""
+        fence = line.rstrip("\n")
+        newline = line[len(fence):]
+        if self._in_code_block:
+            self._in_code_block = False
+            return _RESET + _DIM + fence + _RESET + newline
+        self._in_code_block = True
+        # The code starts styled, after the newline.
+        return _DIM + fence + _RESET + newline + _CODE
+
+    def _style_text(self, text: str) -> str:
+        """Style text outside the fences, e.g. its inline code."""
+        if self._in_code_block or ("`" not in text and
+                                   not self._in_inline_code):
+            return text
+        parts = []
+        for char in text:
+            if char == "`":
+                self._in_inline_code = not self._in_inline_code
+                parts.append(char + _CODE if self._in_inline_code else _RESET +
+                             char)
+            elif char == "\n" and self._in_inline_code:
+                # Unclosed inline code doesn't leak to the next line.
+                self._in_inline_code = False
+                parts.append(_RESET + char)
+            else:
+                parts.append(char)
+        return "".join(parts)
+
+
+@dataclass(frozen=True)
+class StreamStats:
+    """How an answer streamed."""
+    # Seconds from the start to the first token, None if there wasn't any.
+    time_to_first_token: Optional[float]
+    tokens: int
+    # Seconds from the first token to the last.
+    stream_duration: float
+    # The writes to the output.
+    writes: int
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """The streaming rate, None if it can't be measured."""
+        if self.tokens < 2 or self.stream_duration <= 0:
+            return None
+        # The first token starts the clock.
+        return (self.tokens - 1) / self.stream_duration
+
+
+class StreamRenderer:  # pylint: disable=too-many-instance-attributes
+    """Renders a streamed answer, a token callback (see TokenCallback).
+
+    Call start before each answer and finish after it.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self,
+                 output: Optional[TextIO] = None,
+                 frame_rate: float = DEFAULT_FRAME_RATE,
+                 interactive: Optional[bool] = None,
+                 styled: Optional[bool] = None,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        """Create the renderer, and start the first answer.
+
+        Args:
+            output (Optional[TextIO]): Where to write, stdout by default.
+            frame_rate (float): The maximum writes per second on a terminal.
+            interactive (Optional[bool]): Coalesce the writes, by default if
+            the output is a terminal.
+            styled (Optional[bool]): Style the markdown, by default if the
+            output is interactive and NO_COLOR isn't set.
+            clock (Callable[[], float]): Returns the current time in seconds.
+        """
+        self._output = output or sys.stdout
+        self._frame_interval = 1 / frame_rate
+        if interactive is None:
+            interactive = self._output.isatty()
+        self._interactive = interactive
+        if styled is None:
+            styled = interactive and not os.environ.get(NO_COLOR_ENV_VAR)
+        self._styler = MarkdownStyler() if styled else None
+        self._clock = clock
+
+        self._condition = threading.Condition()
+        self._pending: list[str] = []
+        self._last_write = -float("inf")
+        self._writes = 0
+        self._flusher: Optional[threading.Thread] = None
+        self._finished = False
+
+        self._start = clock()
+        self._first_token: Optional[float] = None
+        self._last_token: Optional[float] = None
+        self._tokens = 0
+
+    def start(self) -> None:
+        """Start the next answer, from now on for the time to first token."""
+        self._start = self._clock()
+        self._first_token = self._last_token = None
+        self._tokens = 0
+        self._writes = 0
+
+    def __call__(self, token: str) -> None:
+        """Render a streamed token.
+
+        Args:
+            token (str): The token.
+        """
+        now = self._clock()
+        if self._first_token is None:
+            self._first_token = now
+        self._last_token = now
+        self._tokens += 1
+
+        if self._styler is not None:
+            token = self._styler.feed(token)
+        if not self._interactive:
+            self._write(token)
+            return
+
+        with self._condition:
+            self._pending.append(token)
+            if not self._pending[:-1] and (now - self._last_write
+                                           >= self._frame_interval):
+                # On time, written straight away (e.g. the first token).
+                self._write_pending()
+                return
+            if self._flusher is None:
+                self._finished = False
+                self._flusher = threading.Thread(target=self._flush_frames,
+                                                 daemon=True)
+                self._flusher.start()
+            self._condition.notify()
+
+    def finish(self) -> StreamStats:
+        """Write the rest of the answer, and stop the flusher.
+
+        Returns:
+            StreamStats: How the answer streamed.
+        """
+        with self._condition:
+            self._finished = True
+            self._condition.notify()
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.join()
+
+        with self._condition:
+            if self._styler is not None:
+                self._pending.append(self._styler.finish())
+                self._styler = MarkdownStyler()
+            self._write_pending()
+
+        return StreamStats(
+            time_to_first_token=(None if self._first_token is None else
+                                 self._first_token - self._start),
+            tokens=self._tokens,
+            stream_duration=((self._last_token or 0) -
+                             (self._first_token or 0)),
+            writes=self._writes)
+
+    def _flush_frames(self) -> None:
+        """Write the pending tokens once per frame, until finished."""
+        with self._condition:
+            while not self._finished:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                wait = self._last_write + self._frame_interval - self._clock()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                self._write_pending()
+
+    def _write_pending(self) -> None:
+        """Write the pending tokens, with the condition held."""
+        text = "".join(self._pending)
+        self._pending.clear()
+        if text:
+            self._write(text)
+
+    def _write(self, text: str) -> None:
+        self._output.write(text)
+        self._output.flush()
+        self._last_write = self._clock()
+        self._writes += 1
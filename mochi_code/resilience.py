@@ -0,0 +1,379 @@
+"""Resilient requests to the model backends.
+
+Backend requests fail transiently (rate limits, overloaded servers, dropped
+connections), so every request goes through call_with_retries:
+- Transient errors are retried after an exponential backoff with full jitter
+  (so concurrent requests don't retry in lockstep), or after the Retry-After
+  the server asked for. Other errors (e.g. a bad API key) fail straight away.
+- The retries stop at the deadline of the command (see deadline_scope).
+- A circuit breaker fails fast once the backend keeps failing, rather than
+  piling more requests on it, and lets a trial request through after a while.
+- A rate limiter shared by the whole process keeps the requests (and tokens)
+  per minute under the provider limits (see MOCHI_RPM and MOCHI_TPM).
+"""
+
+import contextlib
+import contextvars
+import email.utils
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, TypeVar
+
+from mochi_code.rate_limits import BlockingRateLimiter, Clock
+from mochi_code.tracing import annotate, span
+
+# The limits of the process rate limiter, unlimited if unset.
+REQUESTS_PER_MINUTE_ENV_VAR = "MOCHI_RPM"
+TOKENS_PER_MINUTE_ENV_VAR = "MOCHI_TPM"
+
+# The timeout of a single request, shortened to fit the deadline.
+DEFAULT_REQUEST_TIMEOUT = 60.0
+
+# The HTTP statuses worth retrying (timeouts, conflicts, throttling and
+# server errors).
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+_T = TypeVar("_T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The command ran out of time."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The backend kept failing, requests fail fast for a while."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times, and how long apart, requests are retried."""
+    # The attempts in total, the first one included.
+    max_attempts: int = 4
+    # The maximum delay before the first retry, doubled for each retry after.
+    base_delay: float = 1.0
+    max_delay: float = 20.0
+
+    def backoff(self, retry: int, rng: random.Random) -> float:
+        """Get the delay before a retry, with full jitter.
+
+        Args:
+            retry (int): The retry number, starting from 1.
+            rng (random.Random): The source of the jitter.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        return rng.uniform(
+            0, min(self.max_delay, self.base_delay * 2**(retry - 1)))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class Deadline:  # pylint: disable=too-few-public-methods
+    """The time a command must finish by."""
+
+    def __init__(self, seconds: float, clock: Clock = time.monotonic) -> None:
+        """Start the deadline.
+
+        Args:
+            seconds (float): The time from now to the deadline.
+            clock (Clock): Returns the current time in seconds.
+        """
+        self._clock = clock
+        self._end = clock() + seconds
+
+    def remaining(self) -> float:
+        """Get the time left in seconds (negative once expired)."""
+        return self._end - self._clock()
+
+
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "mochi_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Set the deadline of the requests made in the block.
+
+    The deadline follows the context, so it also applies in the tasks and
+    threads started with asyncio.to_thread (or contextvars.copy_context).
+
+    Args:
+        seconds (Optional[float]): The time from now to the deadline, no
+        deadline if None.
+    """
+    deadline = None if seconds is None else Deadline(seconds)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def get_deadline() -> Optional[Deadline]:
+    """Get the deadline of the current command, if any."""
+    return _deadline.get()
+
+
+def get_request_timeout(
+        default: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Optional[float]:
+    """Get the timeout of a request, so it doesn't outlive the deadline.
+
+    Args:
+        default (Optional[float]): The timeout without a deadline (None for no
+        timeout).
+
+    Returns:
+        Optional[float]: The timeout in seconds, or the default.
+    """
+    deadline = get_deadline()
+    if deadline is None:
+        return default
+    remaining = max(deadline.remaining(), 0.001)
+    return remaining if default is None else min(default, remaining)
+
+
+class CircuitBreaker:
+    """Fails requests fast after repeated failures of the backend.
+
+    Closed (requests go through) until failure_threshold failures in a row,
+    then open (requests fail) for reset_timeout seconds, then half open: one
+    trial request goes through, closing the breaker if it succeeds.
+    """
+
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 clock: Clock = time.monotonic) -> None:
+        """Create a closed breaker.
+
+        Args:
+            failure_threshold (int): The failures in a row opening the breaker.
+            reset_timeout (float): The seconds before a trial request.
+            clock (Clock): Returns the current time in seconds.
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests currently fail fast."""
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_request(self) -> None:
+        """Check a request can go through, raising CircuitOpenError if not."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            wait = self._opened_at + self._reset_timeout - self._clock()
+            if wait > 0 or self._trial_running:
+                raise CircuitOpenError(
+                    "🚫 The model backend keeps failing, not sending more " +
+                    f"requests for {max(wait, 0):.0f}s.")
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the breaker."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Record a failed request, opening the breaker if too many failed."""
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self._failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def release(self) -> None:
+        """End a request that says nothing about the backend (e.g. an invalid
+        or interrupted one), so another trial request can go through."""
+        with self._lock:
+            self._trial_running = False
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Check if an error is transient, and the request worth retrying.
+
+    Args:
+        error (BaseException): The error raised by the request.
+
+    Returns:
+        bool: True for throttling, timeouts, connection and server errors.
+    """
+    # openai is slow to import, and only raises once it was imported.
+    # pylint: disable-next=import-outside-toplevel
+    from openai import error as openai_error
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return not isinstance(error, DeadlineExceeded)
+    if isinstance(error, openai_error.RateLimitError):
+        # Out of credits, waiting won't help.
+        return _get_error_code(error) != "insufficient_quota"
+    if isinstance(
+            error,
+        (openai_error.Timeout, openai_error.APIConnectionError,
+         openai_error.ServiceUnavailableError, openai_error.TryAgain)):
+        return True
+    if isinstance(error, openai_error.APIError):
+        return (error.http_status is None or
+                error.http_status in RETRYABLE_STATUSES)
+    return False
+
+
+def _get_error_code(error: BaseException) -> Optional[str]:
+    """Get the code of an OpenAI error, from its response body."""
+    body = getattr(error, "json_body", None)
+    if not isinstance(body, dict) or not isinstance(body.get("error"), dict):
+        return None
+    return body["error"].get("code")
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Get the delay the server asked for before retrying, if any.
+
+    Args:
+        error (BaseException): The error raised by the request (its headers
+        are read if it has any).
+
+    Returns:
+        Optional[float]: The delay in seconds, None if the server didn't say.
+    """
+    headers = getattr(error, "headers", None) or {}
+    headers = {str(key).lower(): value for key, value in headers.items()}
+    try:
+        if "retry-after-ms" in headers:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        if "retry-after" in headers:
+            return max(float(headers["retry-after"]), 0.0)
+    except ValueError:
+        pass
+    if "retry-after" not in headers:
+        return None
+    # Otherwise the header is an HTTP date.
+    try:
+        retry_at = email.utils.parsedate_to_datetime(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+_breaker = CircuitBreaker()
+_rng = random.Random()
+_limiter_lock = threading.Lock()
+_limiter: Optional[BlockingRateLimiter] = None
+
+
+def get_rate_limiter() -> BlockingRateLimiter:
+    """Get the rate limiter shared by the requests of the process.
+
+    Returns:
+        BlockingRateLimiter: The limiter, configured from the MOCHI_RPM and
+        MOCHI_TPM env vars (unlimited if unset).
+    """
+    global _limiter  # pylint: disable=global-statement
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = BlockingRateLimiter(
+                requests_per_minute=_get_env_rate(REQUESTS_PER_MINUTE_ENV_VAR),
+                tokens_per_minute=_get_env_rate(TOKENS_PER_MINUTE_ENV_VAR))
+        return _limiter
+
+
+def _get_env_rate(env_var: str) -> Optional[float]:
+    """Get a per minute rate from an env var, None if unset or invalid."""
+    try:
+        rate = float(os.environ.get(env_var, ""))
+    except ValueError:
+        return None
+    return rate if rate > 0 else None
+
+
+# pylint: disable-next=too-many-arguments
+def call_with_retries(request: Callable[[], _T],
+                      tokens: int = 0,
+                      policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+                      retryable: Callable[[BaseException],
+                                          bool] = is_retryable_error,
+                      breaker: Optional[CircuitBreaker] = None,
+                      limiter: Optional[BlockingRateLimiter] = None,
+                      sleep: Callable[[float], None] = time.sleep,
+                      rng: random.Random = _rng) -> _T:
+    """Make a backend request, retrying the transient failures.
+
+    Args:
+        request (Callable[[], _T]): Makes the request.
+        tokens (int): The (estimated) tokens of the request, for the limiter.
+        policy (RetryPolicy): How many times, and how long apart, to retry.
+        retryable (Callable[[BaseException], bool]): Whether an error is worth
+        retrying (e.g. to also retry invalid outputs, or to stop once a
+        response started streaming).
+        breaker (Optional[CircuitBreaker]): The breaker of the backend, the one
+        of the process by default.
+        limiter (Optional[BlockingRateLimiter]): The rate limiter, the one of
+        the process by default.
+        sleep (Callable[[float], None]): Blocks for the given seconds.
+        rng (random.Random): The source of the jitter.
+
+    Returns:
+        _T: The result of the request.
+    """
+    breaker = breaker or _breaker
+    limiter = limiter or get_rate_limiter()
+    deadline = get_deadline()
+
+    attempt = 0
+    while True:
+        attempt += 1
+        if deadline is not None and deadline.remaining() <= 0:
+            raise DeadlineExceeded("🚫 Ran out of time waiting for the model.")
+        # Waiting for the limiter doesn't hold the breaker's trial request.
+        limiter.acquire(tokens)
+        breaker.before_request()
+        try:
+            result = _make_attempt(request, breaker)
+        except Exception as error:  # pylint: disable=broad-except
+            if attempt == policy.max_attempts or not retryable(error):
+                raise
+            delay = get_retry_after(error)
+            if delay is None:
+                delay = policy.backoff(attempt, rng)
+            if deadline is not None and delay >= deadline.remaining():
+                raise DeadlineExceeded(
+                    "🚫 Ran out of time retrying the model request.") from error
+            with span("backend.backoff", seconds=delay):
+                sleep(delay)
+            continue
+
+        annotate(attempts=attempt)
+        return result
+
+
+def _make_attempt(request: Callable[[], _T], breaker: CircuitBreaker) -> _T:
+    """Make a request, recording in the breaker how the backend did."""
+    try:
+        result = request()
+    except Exception as error:
+        # Only the backend failures count, not e.g. invalid requests or
+        # outputs.
+        if is_retryable_error(error):
+            breaker.record_failure()
+        raise
+    finally:
+        # Whatever ended the request (even an interrupt), the breaker mustn't
+        # wait for its trial forever.
+        breaker.release()
+    breaker.record_success()
+    return result
@@ -0,0 +1,282 @@
+"""Lightweight span based tracing, to find out where mochi spends its time.
+
+Tracing is disabled by default and then every span is a no-op. When enabled
+(`mochi --trace` or the MOCHI_TRACE env var) the spans are recorded and, at the
+end of the command, summarised for humans and written as a Chrome trace (open
+it with chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional, TextIO, TypeVar
+
+# Set to "1" to enable tracing, or to the path to write the trace to.
+TRACE_ENV_VAR = "MOCHI_TRACE"
+
+_FuncT = TypeVar("_FuncT", bound=Callable[..., Any])
+
+
+@dataclass
+class TraceEvent:
+    """A recorded span (or an instant event when it has no duration)."""
+    name: str
+    start: float
+    duration: Optional[float]
+    depth: int
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """Records the spans of the current process."""
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._events: list[TraceEvent] = []
+
+    @property
+    def events(self) -> list[TraceEvent]:
+        """The recorded events, in the order they finished."""
+        with self._lock:
+            return list(self._events)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """Record the duration of the block as a span.
+
+        Args:
+            name (str): The name of the span.
+            **args (Any): Extra details to record with the span.
+        """
+        stack = self._stack()
+        event_args = dict(args)
+        stack.append(event_args)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as error:
+            event_args["error"] = type(error).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            self._record(
+                TraceEvent(name, start - self._origin, end - start, len(stack),
+                           threading.get_ident(), event_args))
+
+    def mark(self, name: str, **args: Any) -> None:
+        """Record an instant event (e.g. the first streamed token).
+
+        Args:
+            name (str): The name of the event.
+            **args (Any): Extra details to record with the event.
+        """
+        self._record(
+            TraceEvent(name,
+                       time.perf_counter() - self._origin, None,
+                       len(self._stack()), threading.get_ident(), args))
+
+    def annotate(self, **args: Any) -> None:
+        """Add details to the innermost open span of the current thread.
+
+        Args:
+            **args (Any): The details to add.
+        """
+        stack = self._stack()
+        if stack:
+            stack[-1].update(args)
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        """Export the events in the Chrome trace event format.
+
+        Returns:
+            dict[str, Any]: The JSON serializable trace.
+        """
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            trace_event = {
+                "name": event.name,
+                "ts": event.start * 1e6,
+                "pid": pid,
+                "tid": event.thread_id,
+                "args": event.args,
+            }
+            if event.duration is None:
+                trace_event.update(ph="i", s="t")
+            else:
+                trace_event.update(ph="X", dur=event.duration * 1e6)
+            trace_events.append(trace_event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> str:
+        """Summarise the events as an indented tree, in start order.
+
+        Returns:
+            str: The human readable summary.
+        """
+        lines = []
+        for event in sorted(self.events, key=lambda e: (e.start, e.depth)):
+            label = "  " * event.depth + event.name
+            timing = ("@ " + _format_ms(event.start)
+                      if event.duration is None else _format_ms(event.duration))
+            details = ", ".join(f"{k}={v}" for k, v in event.args.items())
+            lines.append(f"{label:<48} {timing:>12}  {details}".rstrip())
+        return "\n".join(lines)
+
+    def _stack(self) -> list[dict[str, Any]]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, event: TraceEvent) -> None:
+        with self._lock:
+            self._events.append(event)
+
+
+def _format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f} ms"
+
+
+_NULL_SPAN = contextlib.nullcontext()
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Get the active tracer.
+
+    Returns:
+        Optional[Tracer]: The tracer or None if tracing is disabled.
+    """
+    return _tracer
+
+
+def enable_tracing() -> Tracer:
+    """Start recording spans, keeping the existing tracer if enabled.
+
+    Returns:
+        Tracer: The active tracer.
+    """
+    global _tracer  # pylint: disable=global-statement
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def disable_tracing() -> Optional[Tracer]:
+    """Stop recording spans.
+
+    Returns:
+        Optional[Tracer]: The tracer that was active, if any.
+    """
+    global _tracer  # pylint: disable=global-statement
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, **args: Any) -> contextlib.AbstractContextManager[None]:
+    """Record the duration of a block, a no-op when tracing is disabled.
+
+    Args:
+        name (str): The name of the span.
+        **args (Any): Extra details to record with the span.
+
+    Returns:
+        contextlib.AbstractContextManager[None]: The span context manager.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, **args)
+
+
+def mark(name: str, **args: Any) -> None:
+    """Record an instant event, a no-op when tracing is disabled.
+
+    Args:
+        name (str): The name of the event.
+        **args (Any): Extra details to record with the event.
+    """
+    if _tracer is not None:
+        _tracer.mark(name, **args)
+
+
+def annotate(**args: Any) -> None:
+    """Add details to the current span, a no-op when tracing is disabled.
+
+    Args:
+        **args (Any): The details to add.
+    """
+    if _tracer is not None:
+        _tracer.annotate(**args)
+
+
+def traced(name: str) -> Callable[[_FuncT], _FuncT]:
+    """Decorate a function to record each call as a span.
+
+    Args:
+        name (str): The name of the span.
+
+    Returns:
+        Callable[[_FuncT], _FuncT]: The decorator.
+    """
+
+    def decorator(func: _FuncT) -> _FuncT:
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def get_trace_output_path(trace_flag: bool) -> Optional[pathlib.Path]:
+    """Get where to write the trace, if tracing was requested.
+
+    Args:
+        trace_flag (bool): Whether the --trace flag was used.
+
+    Returns:
+        Optional[pathlib.Path]: The path of the trace file, or None if tracing
+        wasn't requested by the flag or the env.
+    """
+    env_value = os.environ.get(TRACE_ENV_VAR, "")
+    if env_value not in ("", "0", "1"):
+        return pathlib.Path(env_value)
+    if trace_flag or env_value == "1":
+        return (pathlib.Path(tempfile.gettempdir()) /
+                f"mochi-trace-{os.getpid()}.json")
+    return None
+
+
+def write_trace(tracer: Tracer,
+                output_path: pathlib.Path,
+                summary_output: Optional[TextIO] = None) -> None:
+    """Write the Chrome trace file and print the summary.
+
+    Args:
+        tracer (Tracer): The tracer with the recorded events.
+        output_path (pathlib.Path): Where to write the Chrome trace.
+        summary_output (Optional[TextIO]): Where to print the summary, defaults
+        to stderr.
+    """
+    with open(output_path, "w", encoding="utf-8") as trace_file:
+        json.dump(tracer.to_chrome_trace(), trace_file)
+
+    summary_output = summary_output or sys.stderr
+    summary_output.write(f"\n🔍 Trace (full trace at '{output_path}'):\n")
+    summary_output.write(tracer.summary() + "\n")
@@ -0,0 +1,101 @@
+"""Test the code_index module."""
+
+import os
+import pathlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.code.code_index import (hash_file, load_code_index,
+                                        update_code_index)
+from mochi_code.code.mochi_config import get_code_index_path, get_config_path
+
+
+class TestUpdateCodeIndex(TestCase):
+    """Test the update_code_index function."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._config_path = get_config_path(self._root_path)
+        self._config_path.mkdir()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _write(self, relative_path: str, content: str) -> None:
+        path = self._root_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def test_indexes_all_files(self) -> None:
+        """Test the first update indexes every file (but the config)."""
+        self._write("main.py", "print('hi')")
+        self._write("pkg/util.py", "VALUE = 1")
+
+        update = update_code_index(self._config_path)
+
+        self.assertEqual(sorted(update.added), ["main.py", "pkg/util.py"])
+        index = load_code_index(get_code_index_path(self._config_path))
+        self.assertEqual(set(index), {"main.py", "pkg/util.py"})
+        self.assertEqual(index["main.py"].digest,
+                         hash_file(self._root_path / "main.py"))
+
+    def test_detects_changes(self) -> None:
+        """Test that updates report added, modified and removed files."""
+        self._write("keep.py", "1")
+        self._write("change.py", "1")
+        self._write("remove.py", "1")
+        update_code_index(self._config_path)
+
+        self._write("change.py", "22")
+        (self._root_path / "remove.py").unlink()
+        self._write("add.py", "1")
+        update = update_code_index(self._config_path)
+
+        self.assertEqual(update.added, ["add.py"])
+        self.assertEqual(update.modified, ["change.py"])
+        self.assertEqual(update.removed, ["remove.py"])
+        self.assertEqual(update.unchanged, 1)
+
+    @patch("mochi_code.code.code_index.hash_file", side_effect=hash_file)
+    def test_only_hashes_changed_files(self, mock_hash: MagicMock) -> None:
+        """Test that unchanged files (same size and mtime) aren't hashed."""
+        for i in range(10):
+            self._write(f"file{i}.py", str(i))
+        update_code_index(self._config_path)
+        self.assertEqual(mock_hash.call_count, 10)
+
+        mock_hash.reset_mock()
+        update = update_code_index(self._config_path)
+        mock_hash.assert_not_called()
+        self.assertEqual(update.unchanged, 10)
+
+        # Same content but touched, it's hashed but not modified.
+        file_path = self._root_path / "file0.py"
+        stat = file_path.stat()
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        update = update_code_index(self._config_path)
+        mock_hash.assert_called_once_with(file_path)
+        self.assertEqual(update.modified, [])
+        self.assertEqual(update.unchanged, 10)
+
+    def test_skips_large_files(self) -> None:
+        """Test that files over the size limit are not indexed."""
+        self._write("small.py", "1")
+        self._write("large.bin", "x" * 100)
+
+        update = update_code_index(self._config_path, max_file_size=10)
+
+        self.assertEqual(update.added, ["small.py"])
+
+    def test_ignores_incompatible_index(self) -> None:
+        """Test that an index from another version is rebuilt."""
+        self._write("main.py", "1")
+        get_code_index_path(self._config_path).write_text(
+            '{"version": -1, "files": {}}', encoding="utf-8")
+
+        update = update_code_index(self._config_path)
+
+        self.assertEqual(update.added, ["main.py"])
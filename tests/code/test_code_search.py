@@ -0,0 +1,163 @@
+"""Test the code_search module."""
+
+import pathlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from mochi_code.code.code_search import (ChunkTable, CodeChunk, SearchResult,
+                                         StringTable, iter_file_chunks,
+                                         load_index_generation, make_generation,
+                                         pack_chunks, pack_strings,
+                                         save_index_generation, search_all,
+                                         tokenize, top_k_indices)
+
+
+class TestTokenize(TestCase):
+    """Test the tokenize function."""
+
+    def test_splits_identifiers(self) -> None:
+        """Test identifiers are kept whole and split in their parts."""
+        self.assertEqual(tokenize("get_project_prompt"),
+                         ["get_project_prompt", "get", "project", "prompt"])
+        self.assertEqual(tokenize("HTTPServer"),
+                         ["httpserver", "http", "server"])
+
+    def test_skips_single_characters(self) -> None:
+        """Test single character terms aren't kept."""
+        self.assertEqual(tokenize("x = a + b1"), ["b1"])
+
+
+class TestIterFileChunks(TestCase):
+    """Test the iter_file_chunks function."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def test_splits_in_chunks(self) -> None:
+        """Test the file is split in chunks of lines."""
+        (self._root_path / "a.py").write_text("1\n2\n3\n", encoding="utf-8")
+
+        chunks = list(iter_file_chunks(self._root_path, "a.py", 2))
+
+        self.assertEqual(chunks, [(CodeChunk("a.py", 1, 2), "1\n2\n"),
+                                  (CodeChunk("a.py", 3, 3), "3\n")])
+
+    def test_skips_generated_and_binary_files(self) -> None:
+        """Test lock files and binaries aren't chunked."""
+        (self._root_path / "poetry.lock").write_text("a", encoding="utf-8")
+        (self._root_path / "data.bin").write_bytes(b"a\0b")
+
+        self.assertEqual(list(iter_file_chunks(self._root_path, "poetry.lock")),
+                         [])
+        self.assertEqual(list(iter_file_chunks(self._root_path, "data.bin")),
+                         [])
+
+
+class TestRanking(TestCase):
+    """Test ranking and fusing results."""
+
+    def test_top_k_indices(self) -> None:
+        """Test only the best positive scores are kept, best first."""
+        scores = np.array([0.5, 0.0, 2.0, 1.0, -1.0])
+
+        self.assertEqual(top_k_indices(scores, 2).tolist(), [2, 3])
+        self.assertEqual(top_k_indices(scores, 10).tolist(), [2, 3, 0])
+
+    def test_search_all_fuses_rankings(self) -> None:
+        """Test chunks found by several indexes rank first."""
+        first, second, both = (
+            CodeChunk(name, 1, 1) for name in ("first", "second", "both"))
+        lexical_index, vector_store = MagicMock(), MagicMock()
+        lexical_index.search.return_value = [
+            SearchResult(first, 10.0),
+            SearchResult(both, 5.0)
+        ]
+        vector_store.search.return_value = [
+            SearchResult(second, 0.9),
+            SearchResult(both, 0.8)
+        ]
+
+        results = search_all([lexical_index, vector_store], "query", 2)
+
+        self.assertEqual([r.chunk for r in results], [both, first])
+
+
+class TestTables(TestCase):
+    """Test the string and chunk tables stored as arrays."""
+
+    def test_finds_strings(self) -> None:
+        """Test strings are read and found in a sorted table."""
+        strings = ["", "cache", "caché", "evict", "zone", "évincer"]
+        table = StringTable.from_arrays(pack_strings("terms", strings), "terms")
+
+        self.assertEqual(len(table), 6)
+        self.assertEqual([table[i] for i in range(len(table))], strings)
+        self.assertEqual(table[-1], "évincer")
+        for index, string in enumerate(strings):
+            self.assertEqual(table.find(string), index)
+        for missing in ("a", "cach", "caches", "zones"):
+            self.assertIsNone(table.find(missing))
+        with self.assertRaises(IndexError):
+            _ = table[6]
+
+    def test_empty_table(self) -> None:
+        """Test an empty table finds nothing."""
+        table = StringTable.from_arrays(pack_strings("terms", []), "terms")
+
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.find("cache"))
+
+    def test_packs_chunks(self) -> None:
+        """Test chunks are read back from their arrays."""
+        chunks = [CodeChunk("b.py", 1, 40), CodeChunk("a.py", 41, 42)]
+        table = ChunkTable(pack_chunks(chunks))
+
+        self.assertEqual(len(table), 2)
+        self.assertEqual([table[i] for i in range(len(table))], chunks)
+        self.assertEqual([table.paths[i] for i in range(2)], ["a.py", "b.py"])
+        self.assertEqual(len(ChunkTable(pack_chunks([]))), 0)
+
+
+class TestIndexGenerations(TestCase):
+    """Test saving and loading index generations."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._index_path = pathlib.Path(self._root_dir.name) / "index"
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def test_loads_the_latest_generation(self) -> None:
+        """Test the arrays of the latest generation are mapped."""
+        save_index_generation(self._index_path, make_generation(), {"n": 1},
+                              {"values": np.arange(3)})
+        save_index_generation(self._index_path, make_generation(), {"n": 2},
+                              {"values": np.arange(5)})
+
+        loaded = load_index_generation(self._index_path, 1)
+
+        assert loaded is not None
+        meta, arrays = loaded
+        self.assertEqual(meta["n"], 2)
+        self.assertEqual(arrays["values"].tolist(), list(range(5)))
+        self.assertIsInstance(arrays["values"], np.memmap)
+        self.assertEqual(len(list(self._index_path.glob("*.npy"))), 1)
+
+    def test_ignores_other_versions(self) -> None:
+        """Test indexes of other versions aren't loaded."""
+        save_index_generation(self._index_path, make_generation(), {},
+                              {"values": np.arange(3)})
+
+        self.assertIsNone(load_index_generation(self._index_path, 2))
+        self.assertIsNone(load_index_generation(self._index_path / "missing",
+                                                1))
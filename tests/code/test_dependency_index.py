@@ -0,0 +1,250 @@
+"""Test the dependency_index module."""
+
+import concurrent.futures
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from mochi_code.code.dependency_index import (ApiSymbol, DependencyIndex,
+                                              load_dependency_index,
+                                              pack_api_symbols,
+                                              parse_module_api,
+                                              update_dependency_index)
+from mochi_code.code.mochi_config import USER_CACHE_ENV_VAR, get_config_path
+
+_MODULE = '''
+"""Readers.
+
+More details.
+"""
+
+__all__ = ["read_table", "Reader"]
+
+
+def read_table(path: str, sep=",", *, header: bool = True) -> list:
+    """Read a table from a file.
+
+    The file is read in full.
+    """
+
+
+def not_exported():
+    pass
+
+
+class Reader:
+    """Reads tables."""
+
+    def __init__(self, path, chunk_size=100):
+        pass
+
+    def read_chunk(self, size=None):
+        pass
+
+    def _skip(self):
+        pass
+'''
+
+_IO_MODULE = '''
+"""Input and output.
+===================
+"""
+
+def load_table(path):
+    """Load a table."""
+
+
+def _private():
+    pass
+'''
+
+
+class TestParseModuleApi(TestCase):
+    """Test the parse_module_api function."""
+
+    def test_finds_the_public_api(self) -> None:
+        """Test that the exported classes, functions and methods are found,
+        with their signatures and docs."""
+        self.assertEqual(parse_module_api("tables.readers", _MODULE), [
+            ("tables.readers", "readers", "module", "tables.readers",
+             "Readers."),
+            ("tables.readers", "read_table", "function",
+             "read_table(path: str, sep=',', *, header: bool=True) -> list",
+             "Read a table from a file."),
+            ("tables.readers", "Reader", "class",
+             "Reader(path, chunk_size=100)", "Reads tables."),
+            ("tables.readers", "Reader.read_chunk", "method",
+             "Reader.read_chunk(size=None)", ""),
+        ])
+
+    def test_without_all(self) -> None:
+        """Test that the names not starting with _ are public by default."""
+        self.assertEqual(
+            [symbol[1] for symbol in parse_module_api("tables", _IO_MODULE)],
+            ["load_table"])
+
+    def test_invalid_source(self) -> None:
+        """Test that a module that can't be parsed has no API."""
+        self.assertEqual(parse_module_api("broken", "def broken(:\n"), [])
+
+
+class TestDependencyIndex(TestCase):
+    """Test the search of the DependencyIndex class."""
+
+    def setUp(self) -> None:
+        self._index = DependencyIndex(
+            pack_api_symbols([
+                ApiSymbol("tables", "tables.io", "read_table", "function",
+                          "read_table(path)", "Read a table."),
+                ApiSymbol("tables", "tables.io", "write_table", "function",
+                          "write_table(path)", ""),
+                ApiSymbol("charts", "charts", "read_chart", "function",
+                          "read_chart(path)", ""),
+                ApiSymbol("charts", "charts", "Table", "class", "Table()", ""),
+            ]))
+
+    def test_named_symbols(self) -> None:
+        """Test that the symbols named in the query match."""
+        self.assertEqual(
+            [s.name for s in self._index.search("what does read_table do?")],
+            ["read_table"])
+        self.assertEqual([s.name for s in self._index.search("a Table")],
+                         ["Table"])
+
+    def test_words_of_the_name(self) -> None:
+        """Test that at least two words of the names must match, and the
+        packages in the query come first."""
+        self.assertEqual(
+            [s.name for s in self._index.search("how do I read a table?")],
+            ["read_table"])
+        self.assertEqual(
+            [s.name for s in self._index.search("how do I read with charts")],
+            [])
+        self.assertEqual(self._index.search("read"), [])
+
+    def test_empty_index(self) -> None:
+        """Test that an index without symbols finds nothing."""
+        index = DependencyIndex(pack_api_symbols([]))
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search("read_table"), [])
+
+    def test_describe(self) -> None:
+        """Test that the symbols are described in a line."""
+        self.assertEqual(
+            self._index.search("read_table")[0].describe(),
+            "tables: tables.io.read_table(path) - Read a table.")
+
+
+class TestUpdateDependencyIndex(TestCase):
+    """Test indexing the installed dependencies."""
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        temp_path = pathlib.Path(self._temp_dir.name)
+        self._site_path = temp_path / "site-packages"
+        self._cache_path = temp_path / "cache"
+        self._config_path = get_config_path(temp_path / "project")
+        self._config_path.mkdir(parents=True)
+        for name in ["tables", "charts", "plots", "maps"]:
+            self._install(name, "1.0")
+
+        self._path_patcher = patch.object(sys, "path",
+                                          [str(self._site_path), *sys.path])
+        self._path_patcher.start()
+        self._env_patcher = patch.dict(
+            os.environ, {USER_CACHE_ENV_VAR: str(self._cache_path)})
+        self._env_patcher.start()
+
+    def tearDown(self) -> None:
+        self._env_patcher.stop()
+        self._path_patcher.stop()
+        self._temp_dir.cleanup()
+
+    def _install(self, name: str, version: str) -> None:
+        """Install a fake distribution with a few modules."""
+        files = {
+            f"{name}/__init__.py": f"def open_{name}(path):\n    pass\n",
+            f"{name}/io.py": _IO_MODULE,
+            f"{name}/_internal.py": "def load_secret():\n    pass\n",
+            f"{name}/tests/test_io.py": "def test_load_table():\n    pass\n",
+        }
+        for path, content in files.items():
+            (self._site_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (self._site_path / path).write_text(content, encoding="utf-8")
+        dist_info = self._site_path / f"{name}-{version}.dist-info"
+        dist_info.mkdir(exist_ok=True)
+        (dist_info / "METADATA").write_text(
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+            encoding="utf-8")
+        (dist_info / "RECORD").write_text("".join(
+            f"{path},,\n" for path in files),
+                                          encoding="utf-8")
+
+    def test_indexes_the_installed_dependencies(self) -> None:
+        """Test that the public API of the installed dependencies is found."""
+        self.assertEqual(
+            update_dependency_index(self._config_path,
+                                    ["tables", "not-installed"]), 1)
+
+        index = load_dependency_index(self._config_path)
+        assert index is not None
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search("open_tables"), [
+            ApiSymbol("tables", "tables", "open_tables", "function",
+                      "open_tables(path)", "")
+        ])
+        self.assertEqual(index.search("load_secret"), [])
+        self.assertEqual([s.module for s in index.search("test_load_table")],
+                         ["tables.io"])
+
+    def test_packages_are_indexed_once(self) -> None:
+        """Test that the indexed packages are reused by every project."""
+        update_dependency_index(self._config_path, ["tables"])
+        other_config_path = self._config_path.parent.parent / ".other"
+        other_config_path.mkdir()
+
+        self.assertEqual(
+            update_dependency_index(other_config_path, ["tables", "charts"]), 1)
+        self.assertEqual(sorted(p.name for p in self._cache_path.glob("*/*")),
+                         ["charts==1.0.json", "tables==1.0.json"])
+        self.assertIsNotNone(load_dependency_index(other_config_path))
+
+    def test_loads_without_the_cache(self) -> None:
+        """Test that the project index is loaded on its own, without reading
+        the indexed packages again."""
+        update_dependency_index(self._config_path, ["tables", "charts"])
+        shutil.rmtree(self._cache_path)
+
+        index = load_dependency_index(self._config_path)
+        assert index is not None
+        self.assertEqual(len(index), 6)
+        self.assertEqual([s.package for s in index.search("open_charts")],
+                         ["charts"])
+
+    @patch("mochi_code.code.dependency_index._MIN_PACKAGES_PER_POOL", 2)
+    def test_indexes_in_processes(self) -> None:
+        """Test that many packages are indexed by the process pool."""
+        with patch("concurrent.futures.ProcessPoolExecutor",
+                   wraps=concurrent.futures.ProcessPoolExecutor) as mock_pool:
+            self.assertEqual(
+                update_dependency_index(self._config_path,
+                                        ["tables", "charts", "plots", "maps"],
+                                        max_workers=2), 4)
+        self.assertEqual(
+            mock_pool.call_args.kwargs["mp_context"].get_start_method(),
+            "forkserver")
+
+        index = load_dependency_index(self._config_path)
+        assert index is not None
+        self.assertEqual(len(index), 12)
+
+    def test_missing_index(self) -> None:
+        """Test that there is no index before the dependencies are indexed."""
+        self.assertIsNone(load_dependency_index(self._config_path))
+        update_dependency_index(self._config_path, ["not-installed"])
+        self.assertIsNone(load_dependency_index(self._config_path))
@@ -0,0 +1,155 @@
+"""Test the dependency_parsers module."""
+
+from unittest import TestCase
+
+from mochi_code.code.dependency_parsers import (get_dependency_parser,
+                                                parse_dependencies)
+
+
+class TestGetDependencyParser(TestCase):
+    """Test the get_dependency_parser function."""
+
+    def test_known_formats(self) -> None:
+        """Test that the known config files have a parser."""
+        for name in [
+                "pyproject.toml", "requirements.txt", "requirements-dev.txt",
+                "package.json", "Cargo.toml", "go.mod", "Gemfile", "pom.xml"
+        ]:
+            self.assertIsNotNone(get_dependency_parser(name), name)
+
+    def test_unknown_formats(self) -> None:
+        """Test that unknown config files don't have a parser."""
+        for name in ["build.gradle", "setup.py", "package-lock.json"]:
+            self.assertIsNone(get_dependency_parser(name), name)
+
+
+class TestParseDependencies(TestCase):
+    """Test the parse_dependencies function."""
+
+    def test_unknown_format_returns_none(self) -> None:
+        """Test that unknown formats can't be parsed locally."""
+        self.assertIsNone(parse_dependencies("build.gradle", "anything"))
+
+    def test_invalid_content_returns_none(self) -> None:
+        """Test that invalid content falls back (returns None)."""
+        self.assertIsNone(parse_dependencies("package.json", "{not json"))
+        self.assertIsNone(parse_dependencies("pom.xml", "<project>"))
+
+    def test_poetry_pyproject(self) -> None:
+        """Test poetry dependencies, including groups, excluding python."""
+        content = """
+[tool.poetry.dependencies]
+python = "^3.10"
+langchain = "^0.0.181"
+
+[tool.poetry.dev-dependencies]
+black = "*"
+
+[tool.poetry.group.test.dependencies]
+pytest = "^7.3.1"
+langchain = "^0.0.181"
+"""
+        self.assertEqual(parse_dependencies("pyproject.toml", content),
+                         ["langchain", "black", "pytest"])
+
+    def test_pep621_pyproject(self) -> None:
+        """Test PEP 621 dependencies, including optional ones."""
+        content = """
+[project]
+dependencies = ["requests>=2", "pydantic[email]==1.10.8; python_version>'3'"]
+
+[project.optional-dependencies]
+test = ["pytest"]
+"""
+        self.assertEqual(parse_dependencies("pyproject.toml", content),
+                         ["requests", "pydantic", "pytest"])
+
+    def test_requirements(self) -> None:
+        """Test requirements files skip comments, options and includes."""
+        content = """
+# a comment
+-r base.txt
+--index-url https://example.com
+numpy==1.24.3  # pinned
+pandas>=2
+Django
+"""
+        self.assertEqual(parse_dependencies("requirements-dev.txt", content),
+                         ["numpy", "pandas", "Django"])
+
+    def test_package_json(self) -> None:
+        """Test all the npm dependency sections."""
+        content = """{
+            "name": "app",
+            "dependencies": {"react": "^18", "redux": "^4"},
+            "devDependencies": {"jest": "^29"},
+            "peerDependencies": {"react": "^18"}
+        }"""
+        self.assertEqual(parse_dependencies("package.json", content),
+                         ["react", "redux", "jest"])
+
+    def test_cargo(self) -> None:
+        """Test the cargo dependency sections."""
+        content = """
+[package]
+name = "app"
+
+[dependencies]
+serde = { version = "1", features = ["derive"] }
+tokio = "1"
+
+[dev-dependencies]
+criterion = "0.5"
+
+[target.'cfg(unix)'.dependencies]
+nix = "0.27"
+"""
+        self.assertEqual(parse_dependencies("Cargo.toml", content),
+                         ["serde", "tokio", "criterion", "nix"])
+
+    def test_go_mod(self) -> None:
+        """Test single line and block requires."""
+        content = """module example.com/app
+
+go 1.21
+
+require github.com/pkg/errors v0.9.1
+
+require (
+    github.com/stretchr/testify v1.8.4 // indirect
+    golang.org/x/sync v0.5.0
+)
+"""
+        self.assertEqual(parse_dependencies("go.mod", content), [
+            "github.com/pkg/errors", "github.com/stretchr/testify",
+            "golang.org/x/sync"
+        ])
+
+    def test_gemfile(self) -> None:
+        """Test gem declarations."""
+        content = """source "https://rubygems.org"
+
+gem "rails", "~> 7.0"
+gem 'puma'
+  gem "rspec", group: :test
+"""
+        self.assertEqual(parse_dependencies("Gemfile", content),
+                         ["rails", "puma", "rspec"])
+
+    def test_pom(self) -> None:
+        """Test namespaced maven dependencies."""
+        content = """<?xml version="1.0"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <dependencies>
+    <dependency>
+      <groupId>junit</groupId>
+      <artifactId>junit</artifactId>
+    </dependency>
+    <dependency>
+      <groupId>com.google.guava</groupId>
+      <artifactId>guava</artifactId>
+    </dependency>
+  </dependencies>
+</project>"""
+        self.assertEqual(parse_dependencies("pom.xml", content),
+                         ["junit:junit", "com.google.guava:guava"])
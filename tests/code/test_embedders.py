@@ -0,0 +1,61 @@
+"""Test the embedders module."""
+
+from unittest import TestCase
+
+import numpy as np
+
+from mochi_code.code.embedders import (DEFAULT_EMBEDDER_NAME, HashingEmbedder,
+                                       get_embedder, register_embedder)
+
+
+class TestHashingEmbedder(TestCase):
+    """Test the HashingEmbedder class."""
+
+    def test_vectors_are_normalised(self) -> None:
+        """Test that the rows have unit length (or are empty)."""
+        vectors = HashingEmbedder(dimensions=64).embed(
+            ["def load_config(path):", "", "a"])
+
+        self.assertEqual(vectors.shape, (3, 64))
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, 5)
+        self.assertFalse(vectors[1].any())
+        self.assertFalse(vectors[2].any())
+
+    def test_similar_texts_are_closer(self) -> None:
+        """Test that texts sharing terms are more similar."""
+        query, related, unrelated = HashingEmbedder().embed([
+            "load the config file", "def load_config_file(path):",
+            "class HttpServer: pass"
+        ])
+
+        self.assertGreater(query @ related, query @ unrelated)
+
+    def test_is_deterministic(self) -> None:
+        """Test that the same text always has the same vector."""
+        first = HashingEmbedder().embed(["some text"])
+        second = HashingEmbedder().embed(["some text"])
+
+        np.testing.assert_array_equal(first, second)
+
+
+class TestRegistry(TestCase):
+    """Test registering embedders."""
+
+    def test_default_embedder(self) -> None:
+        """Test the default embedder is registered."""
+        self.assertIsInstance(get_embedder(DEFAULT_EMBEDDER_NAME),
+                              HashingEmbedder)
+        self.assertIsNone(get_embedder("missing"))
+
+    def test_register_embedder(self) -> None:
+        """Test embedders can be registered by name."""
+
+        @register_embedder("small-hashing")
+        def small_hashing() -> HashingEmbedder:
+            return HashingEmbedder(dimensions=8)
+
+        embedder = get_embedder("small-hashing")
+
+        self.assertIsNotNone(embedder)
+        self.assertEqual(small_hashing().dimensions, 8)
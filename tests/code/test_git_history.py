@@ -0,0 +1,133 @@
+"""Test the git_history module."""
+
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase, skipUnless
+
+from mochi_code.code.git_history import (Commit, load_git_history,
+                                         update_git_history)
+from mochi_code.code.mochi_config import get_config_path
+
+
+@skipUnless(shutil.which("git"), "git isn't installed")
+class TestGitHistory(TestCase):
+    """Test ingesting and searching the git history."""
+
+    def setUp(self) -> None:
+        # Create a temporary git repo as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._config_path = get_config_path(self._root_path)
+        self._config_path.mkdir()
+        self._git("init", "-q")
+        self._commits = 0
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _git(self, *args: str) -> str:
+        env = {
+            **os.environ, "GIT_AUTHOR_NAME": "Mochi",
+            "GIT_AUTHOR_EMAIL": "mochi@example.com",
+            "GIT_COMMITTER_NAME": "Mochi",
+            "GIT_COMMITTER_EMAIL": "mochi@example.com"
+        }
+        return subprocess.run(
+            ["git", "-C", str(self._root_path), *args],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True).stdout.strip()
+
+    def _commit(self, message: str, *paths: str) -> str:
+        self._commits += 1
+        for relative_path in paths:
+            path = self._root_path / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"{self._commits}\n", encoding="utf-8")
+        self._git("add", *paths)
+        self._git("commit", "-q", "-m", message)
+        return self._git("rev-parse", "HEAD")
+
+    def test_missing_history(self) -> None:
+        """Test that there is no history before it's ingested."""
+        self.assertIsNone(load_git_history(self._config_path))
+        self.assertEqual(update_git_history(self._config_path), 0)
+
+    def test_search(self) -> None:
+        """Test that the commits are found by message and touched files."""
+        first = self._commit(
+            "Evict the least recently used entries\n\n" +
+            "The cache was growing forever.", "cache.py")
+        second = self._commit("Start the server", "server/app.py", "README.md")
+        self.assertEqual(update_git_history(self._config_path), 2)
+
+        history = load_git_history(self._config_path)
+        assert history is not None
+        results = history.search("why is the cache growing?")
+        self.assertEqual(results[0].hash, first)
+        self.assertEqual(results[0].subject,
+                         "Evict the least recently used entries")
+        self.assertEqual(results[0].files, ("cache.py",))
+        self.assertEqual([c.hash for c in history.search("app")], [second])
+        self.assertEqual(history.search("unknown"), [])
+        self.assertEqual(history.search("cache", top_k=0), [])
+
+    def test_incremental_updates(self) -> None:
+        """Test that only the new commits are ingested."""
+        self._commit("First", "a.py")
+        self._commit("Second", "b.py")
+        update_git_history(self._config_path)
+        self.assertEqual(update_git_history(self._config_path), 0)
+
+        third = self._commit("Third", "c.py")
+        self.assertEqual(update_git_history(self._config_path, batch_size=1), 1)
+
+        history = load_git_history(self._config_path)
+        assert history is not None
+        self.assertEqual([c.hash for c in history.search("third")], [third])
+
+    def test_rewritten_history(self) -> None:
+        """Test that a rewritten history is ingested again."""
+        self._commit("First", "a.py")
+        self._commit("Second", "b.py")
+        update_git_history(self._config_path)
+
+        self._git("reset", "-q", "--hard", "HEAD~1")
+        amended = self._commit("Amended", "b.py")
+        self.assertEqual(update_git_history(self._config_path, batch_size=1), 2)
+
+        history = load_git_history(self._config_path)
+        assert history is not None
+        self.assertEqual(history.search("second"), [])
+        self.assertEqual([c.hash for c in history.search("amended")], [amended])
+
+    def test_project_in_a_monorepo(self) -> None:
+        """Test that only the commits of the project dir are ingested."""
+        self._commit("Add the api", "api/main.py")
+        self._commit("Add the web app", "web/index.js")
+        config_path = get_config_path(self._root_path / "api")
+        config_path.mkdir()
+
+        self.assertEqual(update_git_history(config_path), 1)
+
+        history = load_git_history(config_path)
+        assert history is not None
+        self.assertEqual([c.files for c in history.search("add")],
+                         [("main.py",)])
+
+
+class TestCommit(TestCase):
+    """Test the Commit class."""
+
+    def test_describe(self) -> None:
+        """Test that the commit is described in a line."""
+        commit = Commit("0123456789abcdef", 1_689_000_000, "Mochi", "Fix it",
+                        ("a.py", "b.py", "c.py", "d.py", "e.py", "f.py"), 7)
+
+        self.assertEqual(
+            commit.describe(), "0123456789 2023-07-10 Fix it " +
+            "(a.py, b.py, c.py, d.py, e.py and 2 more)")
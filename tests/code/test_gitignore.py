@@ -0,0 +1,133 @@
+"""Test the gitignore module."""
+
+import pathlib
+import tempfile
+from unittest import TestCase
+
+from mochi_code.code.gitignore import is_ignored, parse_gitignore, walk_files
+
+
+class TestIsIgnored(TestCase):
+    """Test parsing and matching gitignore rules."""
+
+    def _ignored(self, content: str, path: str, is_dir: bool = False) -> bool:
+        return is_ignored(parse_gitignore(content), path, is_dir)
+
+    def test_comments_and_blank_lines(self) -> None:
+        """Test that comments and blank lines are not rules."""
+        self.assertEqual(parse_gitignore("# comment\n\n   \n"), [])
+
+    def test_unanchored_patterns_match_any_depth(self) -> None:
+        """Test that patterns without a slash match at any depth."""
+        self.assertTrue(self._ignored("*.pyc", "a.pyc"))
+        self.assertTrue(self._ignored("*.pyc", "pkg/sub/a.pyc"))
+        self.assertFalse(self._ignored("*.pyc", "a.py"))
+        self.assertTrue(self._ignored("__pycache__/", "pkg/__pycache__", True))
+
+    def test_anchored_patterns(self) -> None:
+        """Test that patterns with a slash are relative to the root."""
+        self.assertTrue(self._ignored("/build", "build", True))
+        self.assertFalse(self._ignored("/build", "src/build", True))
+        self.assertTrue(self._ignored("docs/*.md", "docs/a.md"))
+        self.assertFalse(self._ignored("docs/*.md", "docs/sub/a.md"))
+
+    def test_double_star(self) -> None:
+        """Test the ** wildcard."""
+        self.assertTrue(self._ignored("**/logs", "a/b/logs", True))
+        self.assertTrue(self._ignored("logs/**", "logs/a/b.txt"))
+        self.assertTrue(self._ignored("a/**/b", "a/x/y/b"))
+        self.assertTrue(self._ignored("a/**/b", "a/b"))
+
+    def test_dir_only_patterns(self) -> None:
+        """Test that patterns ending with a slash only match directories."""
+        self.assertTrue(self._ignored("out/", "out", True))
+        self.assertFalse(self._ignored("out/", "out", False))
+
+    def test_negation(self) -> None:
+        """Test that the last matching rule wins."""
+        content = "*.log\n!important.log\n"
+        self.assertTrue(self._ignored(content, "debug.log"))
+        self.assertFalse(self._ignored(content, "important.log"))
+
+    def test_character_classes(self) -> None:
+        """Test the [...] wildcard."""
+        self.assertTrue(self._ignored("file[0-9].txt", "file1.txt"))
+        self.assertFalse(self._ignored("file[!0-9].txt", "file1.txt"))
+
+    def test_nested_base(self) -> None:
+        """Test rules from a nested ignore file only apply below it."""
+        rules = parse_gitignore("/generated", "pkg")
+        self.assertTrue(is_ignored(rules, "pkg/generated", True))
+        self.assertFalse(is_ignored(rules, "generated", True))
+        self.assertFalse(is_ignored(rules, "other/generated", True))
+
+
+class TestWalkFiles(TestCase):
+    """Test the walk_files function."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _touch(self, *relative_paths: str) -> None:
+        for relative_path in relative_paths:
+            path = self._root_path / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+
+    def test_skips_ignored_files(self) -> None:
+        """Test that ignored files and directories are skipped."""
+        self._touch("main.py", "main.pyc", "build/out.txt", "src/app.py",
+                    "src/gen/code.py", ".git/HEAD", ".mochi/index.json",
+                    ".mochi.staging-1234/index.json")
+        (self._root_path / ".gitignore").write_text("*.pyc\nbuild/\n",
+                                                    encoding="utf-8")
+        (self._root_path / "src/.gitignore").write_text("gen/\n",
+                                                        encoding="utf-8")
+
+        files = sorted(path for path, _ in walk_files(self._root_path))
+
+        self.assertEqual(
+            files, [".gitignore", "main.py", "src/.gitignore", "src/app.py"])
+
+    def test_skips_vendored_dirs(self) -> None:
+        """Test that installed dependencies are skipped, even if not ignored."""
+        self._touch("index.js", "node_modules/lib/index.js", "vendor/lib.go",
+                    "src/.venv/bin/python")
+
+        files = sorted(path for path, _ in walk_files(self._root_path))
+
+        self.assertEqual(files, ["index.js"])
+
+    def test_applies_the_parent_ignore_files(self) -> None:
+        """Test that the ignore files above the walked dir apply, up to the
+        root of the repository."""
+        (self._root_path / ".git").mkdir()
+        (self._root_path / ".gitignore").write_text("build/\n/pkgs/web/dist/\n",
+                                                    encoding="utf-8")
+        self._touch("pkgs/web/app.js", "pkgs/web/build/out.js",
+                    "pkgs/web/dist/app.js", "pkgs/web/src/dist/app.js",
+                    "pkgs/web/debug.log", "pkgs/web/keep.log")
+        (self._root_path / "pkgs/.gitignore").write_text("*.log\n",
+                                                         encoding="utf-8")
+        (self._root_path / "pkgs/web/.gitignore").write_text("!keep.log\n",
+                                                             encoding="utf-8")
+
+        files = sorted(
+            path for path, _ in walk_files(self._root_path / "pkgs/web"))
+
+        self.assertEqual(
+            files, [".gitignore", "app.js", "keep.log", "src/dist/app.js"])
+
+    def test_ignores_the_parents_outside_the_repository(self) -> None:
+        """Test that the ignore files above the repository root don't apply."""
+        (self._root_path / ".gitignore").write_text("*.js\n", encoding="utf-8")
+        self._touch("repo/.git/HEAD", "repo/app.js")
+
+        files = sorted(path for path, _ in walk_files(self._root_path / "repo"))
+
+        self.assertEqual(files, ["app.js"])
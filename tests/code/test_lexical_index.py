@@ -0,0 +1,134 @@
+"""Test the lexical_index module."""
+
+import json
+import pathlib
+import tempfile
+from unittest import TestCase
+
+from mochi_code.code.code_index import IndexUpdate, update_code_index
+from mochi_code.code.code_search import (INDEX_META_FILE_NAME, CodeChunk,
+                                         read_chunk)
+from mochi_code.code.lexical_index import (build_lexical_index,
+                                           load_lexical_index,
+                                           update_lexical_index)
+from mochi_code.code.mochi_config import (get_config_path,
+                                          get_lexical_index_path)
+
+
+class TestLexicalIndex(TestCase):
+    """Test building, loading and searching the lexical index."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._config_path = get_config_path(self._root_path)
+        self._config_path.mkdir()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _write(self, relative_path: str, content: str) -> None:
+        path = self._root_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def _index(self, chunk_lines: int = 40) -> None:
+        update_code_index(self._config_path)
+        build_lexical_index(self._config_path, chunk_lines=chunk_lines)
+
+    def test_missing_index(self) -> None:
+        """Test that there is no index before it's built."""
+        self.assertIsNone(load_lexical_index(self._config_path))
+
+    def test_finds_the_most_relevant_chunk(self) -> None:
+        """Test that the best matching chunk comes first."""
+        self._write("cache.py",
+                    "def evict_cache_entries(cache):\n" + "    cache.evict()\n")
+        self._write("server.py",
+                    "def start_server(socket):\n" + "    socket.listen()\n")
+        self._write("util.py", "def cache_size():\n    return 1\n")
+        self._index()
+
+        index = load_lexical_index(self._config_path)
+        assert index is not None
+        results = index.search("how are cache entries evicted?")
+
+        self.assertEqual([r.chunk.path for r in results],
+                         ["cache.py", "util.py"])
+        self.assertGreater(results[0].score, results[1].score)
+        self.assertEqual(index.search("unknown words only"), [])
+
+    def test_top_k(self) -> None:
+        """Test that at most top_k results are returned."""
+        for i in range(10):
+            self._write(f"file{i}.py", f"value = {i}\n")
+        self._index()
+
+        index = load_lexical_index(self._config_path)
+        assert index is not None
+
+        self.assertEqual(len(index.search("value", top_k=3)), 3)
+
+    def test_chunks_and_reads_lines(self) -> None:
+        """Test that files are split in chunks and chunks can be read."""
+        self._write("main.py", "".join(f"line_{i}\n" for i in range(1, 6)))
+        self._index(chunk_lines=2)
+
+        index = load_lexical_index(self._config_path)
+        assert index is not None
+        results = index.search("line_3")
+
+        self.assertEqual(results[0].chunk, CodeChunk("main.py", 3, 4))
+        self.assertEqual(read_chunk(self._root_path, results[0].chunk),
+                         "line_3\nline_4\n")
+        self.assertEqual(index.chunks[-1], CodeChunk("main.py", 5, 5))
+
+    def test_skips_binary_files(self) -> None:
+        """Test that binary files aren't indexed."""
+        (self._root_path / "data.bin").write_bytes(b"binary\0content")
+        self._index()
+
+        index = load_lexical_index(self._config_path)
+        assert index is not None
+
+        self.assertEqual(index.search("binary content"), [])
+
+    def test_update_only_rebuilds_on_changes(self) -> None:
+        """Test the index is only rebuilt when the files changed."""
+        self._write("main.py", "print('hi')\n")
+        update = update_code_index(self._config_path)
+
+        self.assertTrue(update_lexical_index(self._config_path, update))
+        self.assertFalse(update_lexical_index(self._config_path, IndexUpdate()))
+        self.assertTrue(
+            update_lexical_index(self._config_path,
+                                 IndexUpdate(removed=["main.py"])))
+
+    def test_rebuild_removes_previous_generation(self) -> None:
+        """Test that only the arrays of the latest build are kept."""
+        self._write("main.py", "print('hi')\n")
+        self._index()
+        self._index()
+
+        index_path = get_lexical_index_path(self._config_path)
+        generations = {
+            path.name.split(".")[0] for path in index_path.glob("*.npy")
+        }
+        self.assertEqual(len(generations), 1)
+        self.assertIsNotNone(load_lexical_index(self._config_path))
+
+    def test_metadata_stays_small(self) -> None:
+        """Test the terms and chunks are stored in arrays, not the metadata."""
+        for i in range(50):
+            self._write(f"module_{i}.py", f"value_{i} = {i}\n")
+        self._index()
+
+        index_path = get_lexical_index_path(self._config_path)
+        meta = json.loads((index_path / INDEX_META_FILE_NAME).read_text())
+        index = load_lexical_index(self._config_path)
+        assert index is not None
+
+        self.assertEqual(set(meta), {"version", "generation", "arrays"})
+        self.assertEqual(
+            index.search("value_7")[0].chunk, CodeChunk("module_7.py", 1, 1))
@@ -3,13 +3,18 @@
 import pathlib
 import tempfile
 import json
+import os
+import threading
 from unittest import TestCase
+from unittest.mock import patch
 from mochi_code.code import ProjectDetailsWithDependencies
 
-from mochi_code.code.mochi_config import (PROJECT_DETAILS_FILE_NAME,
-                                          create_config, load_project_details,
-                                          search_mochi_config, MOCHI_DIR_NAME,
-                                          save_project_details)
+from mochi_code.code.mochi_config import (
+    CEILING_DIRS_ENV_VAR, CHECKSUM_KEY, MOCHI_ROOT_ENV_VAR,
+    PROJECT_DETAILS_FILE_NAME, PROJECT_DETAILS_SCHEMA_VERSION,
+    SCHEMA_VERSION_KEY, ConfigResolver, create_config, create_staging_config,
+    load_config_file, load_project_details, publish_config, search_mochi_config,
+    MOCHI_DIR_NAME, save_project_details, write_file_atomically)
 
 
 class TestSearchMochiConfig(TestCase):
@@ -97,6 +102,94 @@ class TestSearchMochiConfig(TestCase):
             search_mochi_config(pathlib.Path(self._root_path.root)))
 
 
+class TestConfigResolver(TestCase):
+    """Test the ConfigResolver class."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._resolver = ConfigResolver()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def test_remembers_the_dirs(self) -> None:
+        """Test that resolving again only stats the unchanged dirs."""
+        (self._root_path / MOCHI_DIR_NAME).mkdir()
+        children_path = self._root_path / "child1/child2/child3"
+        children_path.mkdir(parents=True)
+        self._resolver.resolve(children_path)
+
+        with patch("os.stat", wraps=os.stat) as mock_stat:
+            self.assertEqual(self._resolver.resolve(children_path),
+                             self._root_path / MOCHI_DIR_NAME)
+            # The mtimes didn't change, one stat per dir (and no look inside).
+            self.assertEqual(mock_stat.call_count, 4)
+
+    def test_sees_new_and_removed_configs(self) -> None:
+        """Test that the configs created or removed by another process are
+        seen straight away."""
+        child_path = self._root_path / "child"
+        child_path.mkdir()
+        self.assertIsNone(self._resolver.resolve(child_path, self._root_path))
+
+        (child_path / MOCHI_DIR_NAME).mkdir()
+        self.assertEqual(self._resolver.resolve(child_path, self._root_path),
+                         child_path / MOCHI_DIR_NAME)
+
+        (child_path / MOCHI_DIR_NAME).rmdir()
+        self.assertIsNone(self._resolver.resolve(child_path, self._root_path))
+
+    def test_stops_at_repository_roots(self) -> None:
+        """Test that the configs outside the repository aren't used."""
+        (self._root_path / MOCHI_DIR_NAME).mkdir()
+        repo_path = self._root_path / "repo"
+        (repo_path / ".git").mkdir(parents=True)
+        (repo_path / "src").mkdir()
+
+        self.assertIsNone(self._resolver.resolve(repo_path / "src"))
+
+        (repo_path / MOCHI_DIR_NAME).mkdir()
+        self._resolver.forget(repo_path)
+        self.assertEqual(self._resolver.resolve(repo_path / "src"),
+                         repo_path / MOCHI_DIR_NAME)
+
+    def test_stops_at_ceiling_dirs(self) -> None:
+        """Test that the search stops at the MOCHI_CEILING_DIRS dirs."""
+        (self._root_path / MOCHI_DIR_NAME).mkdir()
+        child_path = self._root_path / "child"
+        (child_path / "grandchild").mkdir(parents=True)
+
+        with patch.dict(os.environ, {CEILING_DIRS_ENV_VAR: str(child_path)}):
+            self.assertIsNone(self._resolver.resolve(child_path / "grandchild"))
+
+    def test_mochi_root_overrides_the_search(self) -> None:
+        """Test that MOCHI_ROOT picks the config, wherever mochi runs."""
+        project_path = self._root_path / "project"
+        (project_path / MOCHI_DIR_NAME).mkdir(parents=True)
+
+        with patch.dict(os.environ, {MOCHI_ROOT_ENV_VAR: str(project_path)}):
+            self.assertEqual(self._resolver.resolve(self._root_path),
+                             project_path / MOCHI_DIR_NAME)
+        with patch.dict(os.environ, {MOCHI_ROOT_ENV_VAR: str(self._root_path)}):
+            self.assertIsNone(self._resolver.resolve(project_path))
+
+    def test_sees_the_configs_it_creates(self) -> None:
+        """Test that the configs created by mochi are found straight away."""
+        self.assertIsNone(search_mochi_config(self._root_path))
+
+        create_config(
+            self._root_path,
+            ProjectDetailsWithDependencies(language="python",
+                                           config_file="testing.yml",
+                                           package_manager="pip",
+                                           dependencies=[]))
+
+        self.assertEqual(search_mochi_config(self._root_path),
+                         self._root_path / MOCHI_DIR_NAME)
+
+
 class TestCreateConfig(TestCase):
     """Test the create_config function."""
 
@@ -163,9 +256,66 @@ class TestCreateConfig(TestCase):
                   encoding="utf-8") as config_file:
             project_details = json.load(config_file)
 
+        self.assertEqual(project_details.pop(SCHEMA_VERSION_KEY),
+                         PROJECT_DETAILS_SCHEMA_VERSION)
+        self.assertIn(CHECKSUM_KEY, project_details)
+        project_details.pop(CHECKSUM_KEY)
         self.assertEqual(project_details, self._project_details)
 
 
+class TestStagingConfig(TestCase):
+    """Test the create_staging_config and publish_config functions."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._project_details = ProjectDetailsWithDependencies(
+            language="python",
+            config_file="testing.yml",
+            package_manager="pip",
+            dependencies=["numpy"])
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def test_publishes_the_staging_config(self) -> None:
+        """Test that the staged files end up in the config."""
+        staging_path = create_staging_config(self._root_path)
+        (staging_path / "index.json").touch()
+
+        self.assertIsNone(search_mochi_config(self._root_path))
+
+        config_path = publish_config(staging_path, self._project_details)
+
+        self.assertEqual(config_path, self._root_path / MOCHI_DIR_NAME)
+        self.assertFalse(staging_path.exists())
+        self.assertTrue(
+            (self._root_path / MOCHI_DIR_NAME / "index.json").exists())
+        self.assertEqual(
+            load_project_details(config_path / PROJECT_DETAILS_FILE_NAME),
+            self._project_details)
+
+    def test_the_config_follows_the_umask(self) -> None:
+        """Test that the published config gets the default dir permissions."""
+        previous_umask = os.umask(0o002)
+        self.addCleanup(os.umask, previous_umask)
+
+        config_path = publish_config(create_staging_config(self._root_path),
+                                     self._project_details)
+
+        self.assertEqual(
+            pathlib.Path(config_path).stat().st_mode & 0o777, 0o775)
+
+    def test_does_not_override_existing(self) -> None:
+        """Test that an existing config is left intact."""
+        (self._root_path / MOCHI_DIR_NAME).mkdir()
+        staging_path = create_staging_config(self._root_path)
+
+        with self.assertRaises(FileExistsError):
+            publish_config(staging_path, self._project_details)
+
+
 class TestSaveAndLoadProjectDetails(TestCase):
     """Test the save_project_details and load_project_details functions."""
 
@@ -226,3 +376,127 @@ class TestSaveAndLoadProjectDetails(TestCase):
         with self.assertRaises(FileNotFoundError):
             load_project_details(self._root_path /
                                  "invalid/project_details.json")
+
+    def _write_json(self, path: pathlib.Path, content: dict) -> None:
+        with open(path, "w", encoding="utf-8") as config_file:
+            json.dump(content, config_file)
+
+    def test_loads_legacy_project_details(self) -> None:
+        """Test that the files written before the schema versions load."""
+        project_details_path = self._root_path / PROJECT_DETAILS_FILE_NAME
+        self._write_json(project_details_path, self._project_details.dict())
+
+        self.assertEqual(load_project_details(project_details_path),
+                         self._project_details)
+
+    def test_validates_edited_project_details(self) -> None:
+        """Test that the details not written by mochi are validated."""
+        project_details_path = self._root_path / PROJECT_DETAILS_FILE_NAME
+        save_project_details(project_details_path, self._project_details)
+        with open(project_details_path, encoding="utf-8") as config_file:
+            content = json.load(config_file)
+
+        self._write_json(project_details_path, {**content, "language": None})
+        with self.assertRaises(ValueError):
+            load_project_details(project_details_path)
+
+        self._write_json(project_details_path, {
+            **content, SCHEMA_VERSION_KEY: PROJECT_DETAILS_SCHEMA_VERSION + 1
+        })
+        with self.assertRaisesRegex(ValueError, "newer version"):
+            load_project_details(project_details_path)
+
+    def test_caches_until_saved_again(self) -> None:
+        """Test that the details are only parsed again once they change."""
+        project_details_path = self._root_path / PROJECT_DETAILS_FILE_NAME
+        save_project_details(project_details_path, self._project_details)
+
+        with patch("mochi_code.code.mochi_config.load_config_file",
+                   wraps=load_config_file) as mock_load:
+            load_project_details(project_details_path)
+            loaded = load_project_details(project_details_path)
+            loaded.dependencies = ["changed"]
+            self.assertEqual(load_project_details(project_details_path),
+                             self._project_details)
+            self.assertEqual(mock_load.call_count, 1)
+
+            updated = self._project_details.copy(update={"language": "go"})
+            save_project_details(project_details_path, updated)
+            self.assertEqual(load_project_details(project_details_path),
+                             updated)
+            self.assertEqual(mock_load.call_count, 2)
+
+    def test_loads_independent_copies(self) -> None:
+        """Test that changing loaded details doesn't change the next loads."""
+        project_details_path = self._root_path / PROJECT_DETAILS_FILE_NAME
+        save_project_details(project_details_path, self._project_details)
+
+        load_project_details(project_details_path).dependencies.append("vue")
+
+        self.assertEqual(
+            load_project_details(project_details_path).dependencies,
+            ["react", "redux"])
+
+    def test_concurrent_saves(self) -> None:
+        """Test that concurrent saves never leave a partial file behind."""
+        project_details_path = self._root_path / PROJECT_DETAILS_FILE_NAME
+        details = [
+            self._project_details.copy(update={"dependencies": [str(i)] * 100})
+            for i in range(8)
+        ]
+
+        threads = [
+            threading.Thread(target=save_project_details,
+                             args=(project_details_path, project_details))
+            for project_details in details
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn(load_project_details(project_details_path), details)
+        self.assertEqual([p.name for p in self._root_path.iterdir()],
+                         [PROJECT_DETAILS_FILE_NAME])
+
+
+class TestWriteFileAtomically(TestCase):
+    """Test the write_file_atomically function."""
+
+    def setUp(self) -> None:
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._path = pathlib.Path(self._root_dir.name) / "config.json"
+        self._umask = os.umask(0o022)
+
+    def tearDown(self) -> None:
+        os.umask(self._umask)
+        self._root_dir.cleanup()
+
+    def test_uses_the_default_permissions(self) -> None:
+        """Test that new files get the permissions allowed by the umask."""
+        write_file_atomically(self._path, "{}")
+
+        self.assertEqual(self._path.read_text(encoding="utf-8"), "{}")
+        self.assertEqual(self._path.stat().st_mode & 0o777, 0o644)
+
+    def test_keeps_the_permissions(self) -> None:
+        """Test that replaced files keep their permissions."""
+        self._path.write_text("old", encoding="utf-8")
+        self._path.chmod(0o600)
+
+        write_file_atomically(self._path, "new")
+
+        self.assertEqual(self._path.read_text(encoding="utf-8"), "new")
+        self.assertEqual(self._path.stat().st_mode & 0o777, 0o600)
+
+    def test_leaves_no_temporary_file(self) -> None:
+        """Test that a failed write leaves the previous file alone."""
+        self._path.write_text("old", encoding="utf-8")
+
+        with patch("os.replace", side_effect=OSError("full")):
+            with self.assertRaises(OSError):
+                write_file_atomically(self._path, "new")
+
+        self.assertEqual(self._path.read_text(encoding="utf-8"), "old")
+        self.assertEqual([p.name for p in self._path.parent.iterdir()],
+                         [self._path.name])
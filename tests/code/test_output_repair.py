@@ -0,0 +1,84 @@
+"""Test the local repair of the model outputs."""
+
+from unittest import TestCase
+
+from mochi_code.code import ProjectDetails
+from mochi_code.code.output_repair import (extract_json_object,
+                                           repair_json_object,
+                                           repair_project_details)
+
+_DETAILS = ProjectDetails(language="python",
+                          config_file="pyproject.toml",
+                          package_manager="poetry")
+
+
+class TestExtractJsonObject(TestCase):
+    """Test the extract_json_object function."""
+
+    def test_it_skips_the_prose(self) -> None:
+        """Test that the first object is extracted, up to its matching brace.
+        """
+        text = 'Sure! {"a": {"b": "}"}} and {"c": 1}. Hope it helps {'
+        self.assertEqual(extract_json_object(text), '{"a": {"b": "}"}}')
+
+    def test_it_closes_cut_objects(self) -> None:
+        """Test that the missing quote and brackets are added."""
+        self.assertEqual(extract_json_object('{"a": ["b", "c'),
+                         '{"a": ["b", "c"]}')
+
+    def test_it_returns_none_without_object(self) -> None:
+        """Test that a text without an object has nothing to extract."""
+        self.assertIsNone(extract_json_object("I don't know."))
+
+
+class TestRepairJsonObject(TestCase):
+    """Test the repair_json_object function."""
+
+    def test_it_fixes_common_issues(self) -> None:
+        """Test the fixes, from the strictest."""
+        for text, fix in [
+            ('{"a": "b"}', "json"),
+            ('{"a": "b",}', "trailing_commas"),
+            ('{a: "b"}', "unquoted_keys"),
+            ("{'a': 'b'}", "python_literal"),
+        ]:
+            self.assertEqual(repair_json_object(text), ({"a": "b"}, fix), text)
+
+    def test_it_gives_up_on_invalid_objects(self) -> None:
+        """Test that an object that can't be fixed isn't parsed."""
+        self.assertIsNone(repair_json_object('{"a": b c}'))
+
+
+class TestRepairProjectDetails(TestCase):
+    """Test the repair_project_details function."""
+
+    def test_it_repairs_malformed_replies(self) -> None:
+        """Test typical malformed replies of the model."""
+        for text in [
+                "Here are the details:\n```json\n{'language': 'Python', " +
+                "'config_file': 'pyproject.toml', 'package_manager': " +
+                "'Poetry'}\n```\nLet me know if you need anything else.",
+                '{"Language": "PYTHON", "Config File": "pyproject.toml", ' +
+                '"package-manager": "poetry",}',
+                '{"language": "python", "config_file": "pyproject.toml", ' +
+                '"package_manager": "poetry"',
+                '{"properties": {"language": "python", "config_file": ' +
+                '"pyproject.toml", "package_manager": "poetry"}}',
+        ]:
+            repaired = repair_project_details(text)
+            assert repaired is not None, text
+            self.assertEqual(repaired[0], _DETAILS)
+
+    def test_it_keeps_the_config_file_case(self) -> None:
+        """Test that the file name isn't lower cased."""
+        repaired = repair_project_details(
+            "{'language': 'Rust', 'config_file': 'Cargo.toml', " +
+            "'package_manager': 'Cargo'}")
+        assert repaired is not None
+        self.assertEqual(repaired[0].config_file, "Cargo.toml")
+        self.assertEqual(repaired[0].package_manager, "cargo")
+
+    def test_it_rejects_incomplete_details(self) -> None:
+        """Test that missing fields can't be repaired."""
+        self.assertIsNone(repair_project_details('{"language": "python"}'))
+        self.assertIsNone(repair_project_details("No idea, sorry."))
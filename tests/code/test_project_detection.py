@@ -0,0 +1,77 @@
+"""Test the project_detection module."""
+
+from unittest import TestCase
+
+from mochi_code.code import ProjectDetails
+from mochi_code.code.project_detection import detect_project
+
+
+class TestDetectProject(TestCase):
+    """Test the detect_project function."""
+
+    def test_no_markers(self) -> None:
+        """Test that projects without marker files aren't detected."""
+        self.assertIsNone(detect_project([]))
+        self.assertIsNone(detect_project(["README.md", "src"]))
+
+    def test_lock_file_picks_package_manager(self) -> None:
+        """Test that lock files pick the package manager."""
+        expected = {
+            "poetry.lock": "poetry",
+            "pdm.lock": "pdm",
+        }
+        for lock_file, package_manager in expected.items():
+            detection = detect_project(["pyproject.toml", lock_file, "src"])
+            assert detection is not None
+            self.assertEqual(
+                detection.project_details,
+                ProjectDetails(language="python",
+                               config_file="pyproject.toml",
+                               package_manager=package_manager))
+            self.assertEqual(detection.confidence, 1.0)
+
+        expected = {
+            "package-lock.json": "npm",
+            "yarn.lock": "yarn",
+            "pnpm-lock.yaml": "pnpm",
+        }
+        for lock_file, package_manager in expected.items():
+            detection = detect_project(["package.json", lock_file])
+            assert detection is not None
+            self.assertEqual(detection.project_details.package_manager,
+                             package_manager)
+
+    def test_single_config_file(self) -> None:
+        """Test that a single unambiguous config file is enough."""
+        detection = detect_project(["Cargo.toml", "src"])
+        assert detection is not None
+        self.assertEqual(
+            detection.project_details,
+            ProjectDetails(language="rust",
+                           config_file="Cargo.toml",
+                           package_manager="cargo"))
+
+    def test_typescript(self) -> None:
+        """Test that javascript projects with a tsconfig are typescript."""
+        detection = detect_project(["package.json", "tsconfig.json"])
+        assert detection is not None
+        self.assertEqual(detection.project_details.language, "typescript")
+
+    def test_ambiguous_projects(self) -> None:
+        """Test that ambiguous projects are left for the model."""
+        # Multiple languages.
+        self.assertIsNone(detect_project(["package.json", "pyproject.toml"]))
+        # Conflicting lock files.
+        self.assertIsNone(
+            detect_project(["package.json", "yarn.lock", "package-lock.json"]))
+
+    def test_confidence_threshold(self) -> None:
+        """Test that lower thresholds accept less certain detections."""
+        files = ["pyproject.toml", "requirements.txt"]
+        self.assertIsNone(detect_project(files))
+
+        detection = detect_project(files, confidence_threshold=0.5)
+        assert detection is not None
+        self.assertEqual(detection.project_details.config_file,
+                         "requirements.txt")
+        self.assertLess(detection.confidence, 1.0)
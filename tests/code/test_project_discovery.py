@@ -0,0 +1,57 @@
+"""Test the project discovery."""
+
+import pathlib
+import tempfile
+from unittest import TestCase
+
+from mochi_code.code.project_discovery import discover_projects
+
+
+class TestDiscoverProjects(TestCase):
+    """Test the discover_projects function."""
+
+    def setUp(self) -> None:
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _write(self, relative_path: str, content: str = "") -> None:
+        path = self._root_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def test_it_finds_nested_projects(self) -> None:
+        """Test that the projects are found at any depth, root included."""
+        self._write("pyproject.toml")
+        self._write("packages/web/package.json")
+        self._write("packages/web/src/index.js")
+        self._write("services/api/go.mod")
+        self._write("docs/index.md")
+
+        self.assertEqual(discover_projects(self._root_path, max_workers=2), [
+            self._root_path,
+            self._root_path / "packages/web",
+            self._root_path / "services/api",
+        ])
+
+    def test_it_skips_ignored_dirs(self) -> None:
+        """Test that ignored, vendored and config dirs are not searched."""
+        self._write(".gitignore", "/build\n")
+        self._write("build/package.json")
+        self._write("web/package.json")
+        self._write("web/.gitignore", "generated/\n")
+        self._write("web/generated/package.json")
+        self._write("web/node_modules/left-pad/package.json")
+        self._write(".mochi/package.json")
+        self._write(".mochi.staging-1234/package.json")
+
+        self.assertEqual(discover_projects(self._root_path),
+                         [self._root_path / "web"])
+
+    def test_it_finds_nothing_without_manifests(self) -> None:
+        """Test that directories without a manifest are not projects."""
+        self._write("notes/todo.txt")
+
+        self.assertEqual(discover_projects(self._root_path), [])
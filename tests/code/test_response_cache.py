@@ -0,0 +1,130 @@
+"""Test the response_cache module."""
+
+import os
+import pathlib
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from mochi_code.code.response_cache import ResponseCache, make_cache_key
+
+
+class TestMakeCacheKey(TestCase):
+    """Test the make_cache_key function."""
+
+    def test_same_parts_same_key(self) -> None:
+        """Test that the key doesn't depend on the order of the parts."""
+        parts = {"x": 1, "y": 2}
+        reversed_parts = {"y": 2, "x": 1}
+        self.assertEqual(make_cache_key(a="1", b=parts),
+                         make_cache_key(b=reversed_parts, a="1"))
+
+    def test_different_parts_different_key(self) -> None:
+        """Test that any change to the parts changes the key."""
+        key = make_cache_key(user_prompt="hi", project_prompt=None)
+        self.assertNotEqual(key,
+                            make_cache_key(user_prompt="hi", project_prompt=""))
+        self.assertNotEqual(
+            key, make_cache_key(user_prompt="hi!", project_prompt=None))
+
+
+class TestResponseCache(TestCase):
+    """Test the ResponseCache class."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._cache_path = pathlib.Path(self._root_dir.name) / "cache"
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _age_entry(self, key: str, seconds: float) -> None:
+        """Move the last access time of an entry into the past."""
+        entry_path = self._cache_path / f"{key}.json"
+        past = time.time() - seconds
+        os.utime(entry_path, (past, past))
+
+    def test_missing_key_returns_none(self) -> None:
+        """Test that missing entries (and missing cache dir) return None."""
+        cache = ResponseCache(self._cache_path)
+        self.assertIsNone(cache.get("missing"))
+
+    def test_put_and_get(self) -> None:
+        """Test that stored responses can be read back."""
+        cache = ResponseCache(self._cache_path)
+        cache.put("key", "response")
+        cache.put("other", "other response")
+
+        self.assertEqual(cache.get("key"), "response")
+        self.assertEqual(cache.get("other"), "other response")
+
+        cache.put("key", "updated")
+        self.assertEqual(cache.get("key"), "updated")
+
+    def test_expired_entries_are_discarded(self) -> None:
+        """Test that entries older than the max age are not returned."""
+        cache = ResponseCache(self._cache_path, max_age_seconds=5)
+        cache.put("key", "response")
+        self._age_entry("key", 10)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertFalse((self._cache_path / "key.json").exists())
+
+    def test_reading_renews_entries(self) -> None:
+        """Test that the age of an entry is the time since its last use."""
+        cache = ResponseCache(self._cache_path, max_age_seconds=15)
+        cache.put("key", "response")
+        self._age_entry("key", 10)
+        self.assertEqual(cache.get("key"), "response")
+
+        cache.put("other", "other response")
+
+        self.assertEqual(cache.get("key"), "response")
+
+    def test_entries_evicted_while_reading_are_missing(self) -> None:
+        """Test that an entry removed by another process isn't an error."""
+        cache = ResponseCache(self._cache_path)
+        cache.put("key", "response")
+
+        with patch("os.utime", side_effect=FileNotFoundError):
+            self.assertIsNone(cache.get("key"))
+
+    def test_failed_writes_leave_no_files(self) -> None:
+        """Test that a failed write doesn't leak its temporary file."""
+        cache = ResponseCache(self._cache_path)
+        cache.put("key", "response")
+
+        with patch("os.fsync", side_effect=OSError("Disk full")):
+            with self.assertRaises(OSError):
+                cache.put("other", "other response")
+
+        self.assertEqual([path.name for path in self._cache_path.iterdir()],
+                         ["key.json"])
+
+    def test_evicts_least_recently_used_by_count(self) -> None:
+        """Test that the least recently used entry is evicted first."""
+        cache = ResponseCache(self._cache_path, max_entries=2)
+        cache.put("first", "1")
+        self._age_entry("first", 20)
+        cache.put("second", "2")
+        self._age_entry("second", 10)
+
+        # Reading marks "first" as the most recently used.
+        self.assertEqual(cache.get("first"), "1")
+        cache.put("third", "3")
+
+        self.assertEqual(cache.get("first"), "1")
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), "3")
+
+    def test_evicts_by_size(self) -> None:
+        """Test that entries are evicted when the size limit is exceeded."""
+        cache = ResponseCache(self._cache_path, max_bytes=100)
+        cache.put("first", "a" * 50)
+        self._age_entry("first", 10)
+        cache.put("second", "b" * 50)
+
+        self.assertIsNone(cache.get("first"))
+        self.assertEqual(cache.get("second"), "b" * 50)
@@ -0,0 +1,184 @@
+"""Test the symbol_index module."""
+
+import concurrent.futures
+import pathlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from mochi_code.code.code_index import update_code_index
+from mochi_code.code.mochi_config import get_config_path
+from mochi_code.code.symbol_index import (ParsedSymbol, Symbol,
+                                          get_symbol_parser, load_symbol_index,
+                                          parse_python_symbols,
+                                          update_symbol_index)
+
+_MODULE = """
+import os
+
+
+class Cache:
+    def get(self, key):
+        return key
+
+    async def evict(self):
+        def keep(entry):
+            return entry
+        return keep
+
+
+def start_server():
+    pass
+"""
+
+
+class TestParsePythonSymbols(TestCase):
+    """Test the parse_python_symbols function."""
+
+    def test_finds_the_symbols(self) -> None:
+        """Test that the classes, methods and nested functions are found."""
+        self.assertEqual(parse_python_symbols(_MODULE), [
+            ParsedSymbol("Cache", "class", 5, 12),
+            ParsedSymbol("Cache.get", "method", 6, 7),
+            ParsedSymbol("Cache.evict", "method", 9, 12),
+            ParsedSymbol("Cache.evict.keep", "function", 10, 11),
+            ParsedSymbol("start_server", "function", 15, 16),
+        ])
+
+    def test_invalid_source(self) -> None:
+        """Test that a module that can't be parsed has no symbols."""
+        self.assertEqual(parse_python_symbols("def broken(:\n"), [])
+
+    def test_parsers_by_suffix(self) -> None:
+        """Test that the parser is picked by the file suffix."""
+        self.assertIs(get_symbol_parser("a/b.py"), parse_python_symbols)
+        self.assertIsNone(get_symbol_parser("a/b.md"))
+
+
+class TestSymbolIndex(TestCase):
+    """Test updating, loading and searching the symbol index."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._config_path = get_config_path(self._root_path)
+        self._config_path.mkdir()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _write(self, relative_path: str, content: str) -> None:
+        path = self._root_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def _index(self, max_workers: int = 1) -> int:
+        update = update_code_index(self._config_path)
+        return update_symbol_index(self._config_path,
+                                   update,
+                                   max_workers=max_workers)
+
+    def test_missing_index(self) -> None:
+        """Test that there is no index before it's built."""
+        self.assertIsNone(load_symbol_index(self._config_path))
+
+    def test_search(self) -> None:
+        """Test the prefix matches come first, then the fuzzy ones."""
+        self._write("cache.py", _MODULE)
+        self._write("docs.md", "def not_code():\n")
+        self._write("server/app.py", "def start():\n    pass\n")
+        self.assertEqual(self._index(), 2)
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.search("start"), [
+            Symbol("start", "function", "server/app.py", 1, 2),
+            Symbol("start_server", "function", "cache.py", 15, 16),
+        ])
+        self.assertEqual([s.name for s in index.search("CACHE")], ["Cache"])
+        self.assertEqual([s.name for s in index.search("evit")],
+                         ["Cache.evict"])
+        self.assertEqual([s.name for s in index.search("start", 1)], ["start"])
+        self.assertEqual(index.search("nothing_like_it"), [])
+
+    def test_search_qualified_names(self) -> None:
+        """Test that a dotted query matches the qualified names."""
+        self._write("cache.py", _MODULE)
+        self._write("loader.py",
+                    "class Loader:\n    def load(self):\n        pass\n")
+        self._index()
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        self.assertEqual(index.search("Loader.load"),
+                         [Symbol("Loader.load", "method", "loader.py", 2, 3)])
+        self.assertEqual([s.name for s in index.search("cache.ev", 2)],
+                         ["Cache.evict", "Cache.evict.keep"])
+        self.assertEqual([s.name for s in index.search("Cache.gte")],
+                         ["Cache.get"])
+        self.assertEqual(index.search("Loader.missing"), [])
+
+    def test_fuzzy_distance(self) -> None:
+        """Test that the fuzzy matches are within the distance."""
+        self._write(
+            "a.py", "def load():\n    pass\ndef loader():\n    pass\n" +
+            "def lead():\n    pass\ndef read():\n    pass\n")
+        self._index()
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        names = {
+            index.get(i).name: distance
+            for i, distance in index.find_fuzzy("load", 1)
+        }
+        self.assertEqual(names, {"load": 0, "lead": 1})
+
+    def test_only_changed_files_are_parsed(self) -> None:
+        """Test that the files that didn't change keep their symbols."""
+        self._write("a.py", "def first():\n    pass\n")
+        self._write("b.py", "def second():\n    pass\n")
+        self._index()
+
+        self._write("b.py", "def renamed():\n    pass\n")
+        self.assertEqual(self._index(), 1)
+        self.assertEqual(self._index(), 0)
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        self.assertEqual([index.get(i).name for i in range(len(index))],
+                         ["first", "renamed"])
+
+    def test_removed_files(self) -> None:
+        """Test that the symbols of removed files are dropped."""
+        self._write("a.py", "def first():\n    pass\n")
+        self._write("b.py", "def second():\n    pass\n")
+        self._index()
+
+        (self._root_path / "b.py").unlink()
+        self.assertEqual(self._index(), 0)
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        self.assertEqual(index.search("second"), [])
+        self.assertEqual(len(index), 1)
+
+    @patch("mochi_code.code.symbol_index._MIN_FILES_PER_POOL", 2)
+    def test_parses_in_processes(self) -> None:
+        """Test that many files are parsed by the process pool."""
+        for number in range(4):
+            self._write(f"m{number}.py", f"class Model{number}:\n    pass\n")
+
+        with patch("concurrent.futures.ProcessPoolExecutor",
+                   wraps=concurrent.futures.ProcessPoolExecutor) as mock_pool:
+            self.assertEqual(self._index(max_workers=2), 4)
+        # Forking the threads of the cli could deadlock the workers.
+        self.assertEqual(
+            mock_pool.call_args.kwargs["mp_context"].get_start_method(),
+            "forkserver")
+
+        index = load_symbol_index(self._config_path)
+        assert index is not None
+        self.assertEqual([s.path for s in index.search("model")],
+                         ["m0.py", "m1.py", "m2.py", "m3.py"])
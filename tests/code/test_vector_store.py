@@ -0,0 +1,144 @@
+"""Test the vector_store module."""
+
+import json
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from mochi_code.code.code_index import update_code_index
+from mochi_code.code.code_search import INDEX_META_FILE_NAME, CodeChunk
+from mochi_code.code.mochi_config import (get_config_path,
+                                          get_vector_store_path)
+from mochi_code.code.vector_store import (load_vector_store,
+                                          update_vector_store)
+
+
+class TestVectorStore(TestCase):
+    """Test updating, loading and searching the vector store."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._config_path = get_config_path(self._root_path)
+        self._config_path.mkdir()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _write(self, relative_path: str, content: str) -> None:
+        path = self._root_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def _update(self, **settings) -> int:
+        update_code_index(self._config_path)
+        return update_vector_store(self._config_path, **settings)
+
+    def _write_project(self) -> None:
+        self._write(
+            "cache.py",
+            "def evict_cache_entries(cache):\n" + "    cache.evict_entries()\n")
+        self._write(
+            "server.py",
+            "def start_http_server(socket):\n" + "    socket.listen()\n")
+
+    def test_missing_store(self) -> None:
+        """Test that there is no store before it's updated."""
+        self.assertIsNone(load_vector_store(self._config_path))
+
+    def test_finds_similar_chunks(self) -> None:
+        """Test that the most similar chunk comes first."""
+        self._write_project()
+        self._update()
+
+        store = load_vector_store(self._config_path)
+        assert store is not None
+        results = store.search("evict the cache entries")
+
+        self.assertFalse(store.uses_ivf)
+        self.assertEqual(results[0].chunk.path, "cache.py")
+        self.assertEqual(store.search("!!"), [])
+
+    def test_quantized_search(self) -> None:
+        """Test that int8 vectors score (almost) like float32 vectors."""
+        self._write_project()
+        self._update()
+        store = load_vector_store(self._config_path)
+        assert store is not None
+        expected = store.search("start the http server")
+
+        self._update(quantized=True)
+        store = load_vector_store(self._config_path)
+        assert store is not None
+        results = store.search("start the http server")
+
+        self.assertEqual(results[0].chunk, expected[0].chunk)
+        self.assertAlmostEqual(results[0].score, expected[0].score, delta=0.02)
+
+    def test_updates_are_incremental(self) -> None:
+        """Test that only the changed files are embedded again."""
+        self._write_project()
+        self.assertEqual(self._update(), 2)
+        self.assertEqual(self._update(), 0)
+
+        self._write("server.py", "def stop_http_server(): pass\n")
+        self._write("new.py", "def new_feature(): pass\n")
+        self.assertEqual(self._update(), 2)
+
+        store = load_vector_store(self._config_path)
+        assert store is not None
+        self.assertEqual(
+            store.search("evict cache entries")[0].chunk.path, "cache.py")
+        self.assertEqual(
+            store.search("stop the server")[0].chunk.path, "server.py")
+
+    def test_metadata_stays_small(self) -> None:
+        """Test the chunks and files are stored in arrays, not the metadata."""
+        self._write_project()
+        self._write("empty.py", "")
+        self._update()
+        self._write("server.py", "def stop_http_server(): pass\n")
+        self.assertEqual(self._update(), 1)
+
+        meta = json.loads((get_vector_store_path(self._config_path) /
+                           INDEX_META_FILE_NAME).read_text())
+        store = load_vector_store(self._config_path)
+        assert store is not None
+
+        self.assertEqual(
+            set(meta),
+            {"version", "generation", "arrays", "settings", "dimensions"})
+        self.assertEqual([store.chunks[i] for i in range(len(store.chunks))], [
+            CodeChunk("cache.py", 1, 2),
+            CodeChunk("server.py", 1, 1),
+        ])
+        self.assertEqual(self._update(), 0)
+
+    def test_settings_are_kept(self) -> None:
+        """Test that settings are kept until changed, re-embedding if needed."""
+        self._write_project()
+        self._update(quantized=True)
+        self.assertEqual(self._update(), 0)
+
+        self.assertEqual(self._update(quantized=False), 2)
+
+    def test_ivf_search(self) -> None:
+        """Test that large stores are clustered, and still find the chunks."""
+        rng = np.random.default_rng(0)
+        words = [f"word{i}" for i in range(200)]
+        for i in range(100):
+            self._write(f"file{i}.py",
+                        " ".join(rng.choice(words, 10)) + f" unique{i}\n")
+        self._update(ivf_threshold=50)
+
+        store = load_vector_store(self._config_path)
+        assert store is not None
+        # Probe all the clusters, so the result doesn't depend on clustering.
+        store.probes = len(store.chunks)
+        results = store.search("unique42 unique42")
+
+        self.assertTrue(store.uses_ivf)
+        self.assertEqual(results[0].chunk.path, "file42.py")
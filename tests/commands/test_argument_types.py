@@ -3,7 +3,8 @@
 import argparse
 from unittest import TestCase
 
-from mochi_code.commands.argument_types import valid_prompt
+from mochi_code.commands.argument_types import (positive_float, positive_int,
+                                                valid_prompt)
 
 
 class TestValidPrompt(TestCase):
@@ -33,3 +34,31 @@ class TestValidPrompt(TestCase):
         """Test that a prompt with leading and trailing whitespace is stripped."""
         prompt = "    test    "
         self.assertEqual(valid_prompt(prompt), prompt.strip())
+
+
+class TestPositiveInt(TestCase):
+    """Test the positive_int function."""
+
+    def test_positive_int_succeeds(self):
+        """Test that a positive integer is converted."""
+        self.assertEqual(positive_int("4"), 4)
+
+    def test_invalid_values_fail(self):
+        """Test that zero, negative and non integer values fail."""
+        for value in ["0", "-1", "1.5", "four"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                positive_int(value)
+
+
+class TestPositiveFloat(TestCase):
+    """Test the positive_float function."""
+
+    def test_positive_float_succeeds(self):
+        """Test that a positive number is converted."""
+        self.assertEqual(positive_float("2.5"), 2.5)
+
+    def test_invalid_values_fail(self):
+        """Test that zero, negative and non numeric values fail."""
+        for value in ["0", "-1", "nan", "soon"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                positive_float(value)
@@ -1,12 +1,32 @@
 """Test the command function in ask.py"""
 
 import argparse
+import io
+import os
+import pathlib
+import tempfile
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import ANY, MagicMock, patch
 
 from pytest import raises
 
-from mochi_code.commands.ask import run_ask_command, setup_ask_arguments
+from mochi_code.code import ProjectDetailsWithDependencies
+from mochi_code.code.code_index import update_code_index
+from mochi_code.code.lexical_index import update_lexical_index
+from mochi_code.code.mochi_config import (create_config,
+                                          get_project_details_path,
+                                          save_project_details)
+from mochi_code.code.response_cache import ResponseCache
+from mochi_code.code.vector_store import update_vector_store
+from mochi_code.commands.ask import (ASSISTANT_INSTRUCTIONS, ProjectContext,
+                                     ProjectContexts, ask, build_prompt,
+                                     run_ask_command, setup_ask_arguments)
+from mochi_code.commands.arguments import validate_ask_arguments
+from mochi_code.hedging import HedgePolicy
+from mochi_code.prompts.project_prompts import make_project_sections
+from mochi_code.prompts.prompt_assembly import PromptSection
+
+_PROJECT_SECTION = PromptSection("project", ("project prompt",))
 
 
 class TestSetupAskCommand(TestCase):
@@ -26,6 +46,30 @@ class TestSetupAskCommand(TestCase):
         with raises(SystemExit):
             parser.parse_args(["         "])
 
+    def test_cache_flags_are_exclusive(self):
+        """Test that --no-cache and --refresh can't be used together."""
+        parser = argparse.ArgumentParser()
+        setup_ask_arguments(parser)
+
+        args = parser.parse_args(["test"])
+        self.assertFalse(args.no_cache)
+        self.assertFalse(args.refresh)
+
+        with raises(SystemExit):
+            parser.parse_args(["test", "--no-cache", "--refresh"])
+
+    def test_batch_options_need_a_batch(self):
+        """Test that the batch options are rejected with a single prompt."""
+        parser = argparse.ArgumentParser()
+        setup_ask_arguments(parser)
+
+        validate_ask_arguments(
+            parser, parser.parse_args(["--batch", "q.jsonl", "--rpm", "60"]))
+        validate_ask_arguments(parser, parser.parse_args(["test"]))
+        with raises(SystemExit):
+            validate_ask_arguments(
+                parser, parser.parse_args(["test", "--concurrency", "8"]))
+
 
 class TestRunAskCommand(TestCase):
     """Test the command function in ask.py"""
@@ -36,7 +80,230 @@ class TestRunAskCommand(TestCase):
         mock_ask.return_value = None
 
         prompt = "test"
-        args = argparse.Namespace(prompt=prompt)
+        args = argparse.Namespace(prompt=prompt,
+                                  no_cache=False,
+                                  refresh=False,
+                                  hedge_after=None)
         run_ask_command(args)
 
-        mock_ask.assert_called_once_with(prompt)
+        mock_ask.assert_called_once_with(prompt,
+                                         use_cache=True,
+                                         refresh_cache=False,
+                                         on_token=ANY,
+                                         hedge=None)
+
+    @patch("mochi_code.commands.ask.ask")
+    def test_cache_flags_are_forwarded(self, mock_ask):
+        """Test that the cache flags are forwarded to ask."""
+        mock_ask.return_value = None
+
+        prompt = "test"
+        run_ask_command(
+            argparse.Namespace(prompt=prompt,
+                               no_cache=True,
+                               refresh=False,
+                               hedge_after=None))
+        mock_ask.assert_called_with(prompt,
+                                    use_cache=False,
+                                    refresh_cache=False,
+                                    on_token=ANY,
+                                    hedge=None)
+
+        run_ask_command(
+            argparse.Namespace(prompt=prompt,
+                               no_cache=False,
+                               refresh=True,
+                               hedge_after=None))
+        mock_ask.assert_called_with(prompt,
+                                    use_cache=True,
+                                    refresh_cache=True,
+                                    on_token=ANY,
+                                    hedge=None)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch("mochi_code.commands.ask.ask")
+    def test_hedging_is_forwarded(self, mock_ask):
+        """Test that the hedge delay turns hedging on."""
+        run_ask_command(
+            argparse.Namespace(prompt="test",
+                               no_cache=False,
+                               refresh=False,
+                               hedge_after=1.5))
+
+        self.assertEqual(mock_ask.call_args.kwargs["hedge"],
+                         HedgePolicy(after=1.5))
+
+
+class TestAskCache(TestCase):
+    """Test the response cache used by the ask function."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder for the cache
+        self._cache_dir = tempfile.TemporaryDirectory()
+        self._cache = ResponseCache(pathlib.Path(self._cache_dir.name))
+
+    def tearDown(self) -> None:
+        self._cache_dir.cleanup()
+
+    @patch("mochi_code.commands.ask.get_backend")
+    @patch("mochi_code.commands.ask.get_project_sections")
+    @patch("mochi_code.commands.ask._get_response_cache")
+    def test_replays_cached_response(self, mock_get_cache: MagicMock,
+                                     mock_project_sections: MagicMock,
+                                     mock_llm: MagicMock) -> None:
+        """Test that a cached response is replayed without calling the model.
+        """
+        mock_get_cache.return_value = self._cache
+        mock_project_sections.return_value = [_PROJECT_SECTION]
+        mock_llm.return_value.complete.return_value = "fresh answer"
+
+        with patch("sys.stdout", new_callable=io.StringIO):
+            ask("test")
+        mock_llm.return_value.complete.assert_called_once()
+
+        mock_llm.reset_mock()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            ask("test")
+
+        mock_llm.assert_not_called()
+        mock_llm.return_value.complete.assert_not_called()
+        self.assertEqual(mock_stdout.getvalue(), "fresh answer")
+
+    @patch("mochi_code.commands.ask.get_backend")
+    @patch("mochi_code.commands.ask.get_project_sections")
+    @patch("mochi_code.commands.ask._get_response_cache")
+    def test_refresh_skips_cached_response(self, mock_get_cache: MagicMock,
+                                           mock_project_sections: MagicMock,
+                                           mock_llm: MagicMock) -> None:
+        """Test that refreshing calls the model and updates the cache."""
+        mock_get_cache.return_value = self._cache
+        mock_project_sections.return_value = [_PROJECT_SECTION]
+
+        mock_llm.return_value.complete.return_value = "first answer"
+        ask("test")
+        mock_llm.return_value.complete.return_value = "second answer"
+        ask("test", refresh_cache=True)
+
+        self.assertEqual(mock_llm.return_value.complete.call_count, 2)
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            ask("test")
+        self.assertEqual(mock_stdout.getvalue(), "second answer")
+
+    @patch("mochi_code.commands.ask.get_backend")
+    @patch("mochi_code.commands.ask.get_project_sections")
+    @patch("mochi_code.commands.ask._get_response_cache")
+    def test_no_cache_skips_cache(self, mock_get_cache: MagicMock,
+                                  mock_project_sections: MagicMock,
+                                  mock_llm: MagicMock) -> None:
+        """Test that the cache isn't used at all when disabled."""
+        mock_get_cache.return_value = self._cache
+        mock_project_sections.return_value = [_PROJECT_SECTION]
+        mock_llm.return_value.complete.return_value = "answer"
+
+        ask("test", use_cache=False)
+        ask("test", use_cache=False)
+
+        mock_get_cache.assert_not_called()
+        self.assertEqual(mock_llm.return_value.complete.call_count, 2)
+
+
+class TestBuildPrompt(TestCase):
+    """Test the prompt built by the ask function."""
+
+    @patch("mochi_code.commands.ask.get_backend")
+    @patch("mochi_code.commands.ask.get_code_snippets_section")
+    def test_snippets_follow_the_project_prompt(self, mock_snippets: MagicMock,
+                                                mock_llm: MagicMock) -> None:
+        """Test that the relevant snippets follow the project prompt."""
+        lexical_index = MagicMock()
+        mock_snippets.return_value = PromptSection("code_snippets",
+                                                   ("snippets prompt",))
+        mock_llm.return_value.complete.return_value = "answer"
+
+        ask("test",
+            project_context=ProjectContext((_PROJECT_SECTION,), None,
+                                           lexical_index))
+
+        mock_snippets.assert_called_once_with([lexical_index], "test")
+        mock_llm.return_value.complete.assert_called_once()
+        self.assertEqual(
+            mock_llm.return_value.complete.call_args.args[0],
+            ASSISTANT_INSTRUCTIONS + "\n\nproject prompt\n\n" +
+            "snippets prompt\n\nUser query: 'test'")
+
+    @patch("mochi_code.commands.ask.PROMPT_MAX_TOKENS", 300)
+    def test_it_keeps_to_the_budget(self) -> None:
+        """Test that the dependencies are summarised to fit the budget."""
+        details = ProjectDetailsWithDependencies(
+            language="python",
+            config_file="pyproject.toml",
+            package_manager="poetry",
+            dependencies=[f"package-{i}" for i in range(500)])
+        context = ProjectContext(tuple(make_project_sections(details)), None)
+
+        prompt = build_prompt(context, "test")
+
+        self.assertLessEqual(prompt.tokens, 300)
+        self.assertIn("poetry", prompt.text)
+        self.assertIn("more)", prompt.text)
+        self.assertEqual(prompt.shrunk, ("dependencies",))
+
+
+class TestProjectContexts(TestCase):
+    """Test the ProjectContexts class."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as root
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        self._project_details = ProjectDetailsWithDependencies(
+            language="python",
+            config_file="pyproject.toml",
+            package_manager="poetry",
+            dependencies=["numpy"])
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def test_without_config(self) -> None:
+        """Test that an empty context is returned without a mochi config."""
+        context = ProjectContexts().get(self._root_path)
+
+        self.assertIsNone(context.project_prompt)
+        self.assertIsNone(context.response_cache)
+
+    def test_caches_until_details_change(self) -> None:
+        """Test that the context is reused until the details change."""
+        config_path = create_config(self._root_path, self._project_details)
+        child_path = self._root_path / "child"
+        child_path.mkdir()
+        contexts = ProjectContexts()
+
+        context = contexts.get(self._root_path)
+        self.assertIn("numpy", context.project_prompt or "")
+        self.assertIs(contexts.get(child_path), context)
+
+        save_project_details(
+            get_project_details_path(config_path),
+            self._project_details.copy(update={"dependencies": ["pandas"]}))
+        updated_context = contexts.get(child_path)
+
+        self.assertIsNot(updated_context, context)
+        self.assertIn("pandas", updated_context.project_prompt or "")
+
+    def test_reloads_when_the_code_is_reindexed(self) -> None:
+        """Test that the context is reloaded with the new lexical index."""
+        config_path = create_config(self._root_path, self._project_details)
+        contexts = ProjectContexts()
+
+        context = contexts.get(self._root_path)
+        self.assertIsNone(context.lexical_index)
+
+        update = update_code_index(pathlib.Path(config_path))
+        update_lexical_index(pathlib.Path(config_path), update)
+        updated_context = contexts.get(self._root_path)
+
+        self.assertIsNotNone(updated_context.lexical_index)
+
+        update_vector_store(pathlib.Path(config_path))
+        self.assertIsNotNone(contexts.get(self._root_path).vector_store)
@@ -0,0 +1,205 @@
+"""Test the batch mode of the ask command."""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import tempfile
+import threading
+from typing import Any
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.commands.ask import ProjectContext
+from mochi_code.commands.ask_batch import (BatchItem, BatchOptions, BatchResult,
+                                           ask_batch, read_batch,
+                                           run_batch_command)
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.rate_limits import RateLimiter
+
+_CONTEXT = ProjectContext((), None)
+
+
+class TestReadBatch(TestCase):
+    """Test the read_batch function."""
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._batch_path = pathlib.Path(self._temp_dir.name) / "batch.jsonl"
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_it_reads_prompts_and_objects(self) -> None:
+        """Test that both prompt strings and objects are read."""
+        self._batch_path.write_text(
+            '"first?"\n\n{"prompt": " second? ", "id": "q2"}\n',
+            encoding="utf-8")
+
+        items = read_batch(self._batch_path)
+
+        self.assertEqual(
+            items, [BatchItem(0, "first?"),
+                    BatchItem(1, "second?", "q2")])
+
+    def test_it_rejects_invalid_lines(self) -> None:
+        """Test that invalid lines are reported with their line number."""
+        for content in ['"ok"\n{"id": 1}\n', '"ok"\nnot json\n', '"ok"\n" "\n']:
+            self._batch_path.write_text(content, encoding="utf-8")
+            with self.assertRaisesRegex(MochiCannotContinue, "line 2"):
+                read_batch(self._batch_path)
+
+    def test_it_reports_missing_files(self) -> None:
+        """Test that a missing file can't be read."""
+        with self.assertRaises(MochiCannotContinue):
+            read_batch(self._batch_path)
+
+
+class TestAskBatch(TestCase):
+    """Test the ask_batch function."""
+
+    def _run(self, items: list[BatchItem],
+             **options: Any) -> tuple[list[BatchResult], list[BatchResult]]:
+        written: list[BatchResult] = []
+        results = asyncio.run(
+            ask_batch(items,
+                      written.append,
+                      BatchOptions(**options),
+                      project_context=_CONTEXT))
+        return results, written
+
+    @patch("mochi_code.commands.ask_batch.ask")
+    def test_it_runs_concurrently(self, mock_ask: MagicMock) -> None:
+        """Test that the questions are in flight at the same time."""
+        barrier = threading.Barrier(4, timeout=5)
+
+        def answer(prompt: str, **_kwargs: Any) -> str:
+            barrier.wait()
+            return prompt.upper()
+
+        mock_ask.side_effect = answer
+        items = [BatchItem(i, f"q{i}") for i in range(8)]
+
+        results, written = self._run(items, concurrency=4)
+
+        self.assertEqual([r.response for r in results],
+                         [f"Q{i}" for i in range(8)])
+        self.assertEqual(written, results)
+        self.assertTrue(all(r.error is None for r in results))
+
+    @patch("mochi_code.commands.ask_batch.ask")
+    def test_it_writes_in_completion_order(self, mock_ask: MagicMock) -> None:
+        """Test that results can be written as soon as they complete."""
+        first_written = threading.Event()
+        written: list[BatchResult] = []
+
+        def write_result(result: BatchResult) -> None:
+            written.append(result)
+            first_written.set()
+
+        def answer(prompt: str, **_kwargs: Any) -> str:
+            if prompt == "slow":
+                first_written.wait(timeout=5)
+            return prompt
+
+        mock_ask.side_effect = answer
+        items = [BatchItem(0, "slow"), BatchItem(1, "fast")]
+
+        results = asyncio.run(
+            ask_batch(items,
+                      write_result,
+                      BatchOptions(concurrency=2, ordered=False),
+                      project_context=_CONTEXT))
+
+        self.assertEqual([r.prompt for r in written], ["fast", "slow"])
+        self.assertEqual([r.prompt for r in results], ["slow", "fast"])
+
+    @patch("mochi_code.commands.ask_batch.ask")
+    def test_it_reports_errors(self, mock_ask: MagicMock) -> None:
+        """Test that a failing question doesn't stop the others."""
+
+        def answer(prompt: str, **_kwargs: Any) -> str:
+            if prompt == "bad":
+                raise RuntimeError("boom")
+            return "fine"
+
+        mock_ask.side_effect = answer
+        items = [BatchItem(0, "bad", "a"), BatchItem(1, "good", "b")]
+
+        results, _ = self._run(items)
+
+        self.assertEqual(results[0].error, "boom")
+        self.assertEqual(results[0].error_type, "RuntimeError")
+        self.assertIsNone(results[0].response)
+        self.assertEqual(results[0].id, "a")
+        self.assertEqual(results[1].response, "fine")
+        self.assertGreaterEqual(results[1].latency, 0)
+
+    @patch("mochi_code.commands.ask_batch.ask")
+    def test_it_waits_for_the_rate_limit(self, mock_ask: MagicMock) -> None:
+        """Test that the model requests wait for the rate limiter."""
+
+        def answer(prompt: str, **kwargs: Any) -> str:
+            kwargs["before_request"](MagicMock(tokens=10))
+            return prompt
+
+        mock_ask.side_effect = answer
+        acquired: list[int] = []
+
+        async def acquire(tokens: int) -> float:
+            acquired.append(tokens)
+            return 0.25
+
+        limiter = MagicMock(spec=RateLimiter, acquire=acquire)
+        results = asyncio.run(
+            ask_batch([BatchItem(0, "q")],
+                      lambda _: None,
+                      limiter=limiter,
+                      project_context=_CONTEXT))
+
+        self.assertEqual(results[0].rate_limit_wait, 0.25)
+        # The prompt and the completion tokens.
+        self.assertEqual(len(acquired), 1)
+        self.assertGreater(acquired[0], 10)
+
+
+class TestRunBatchCommand(TestCase):
+    """Test the run_batch_command function."""
+
+    @patch("mochi_code.commands.ask_batch.load_project_context")
+    @patch("mochi_code.commands.ask_batch.ask")
+    def test_it_writes_jsonl(self, mock_ask: MagicMock,
+                             mock_context: MagicMock) -> None:
+        """Test that the results are written as JSONL, in input order."""
+        mock_ask.side_effect = lambda prompt, **_: f"answer to {prompt}"
+        mock_context.return_value = _CONTEXT
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            batch_path = pathlib.Path(temp_dir) / "batch.jsonl"
+            batch_path.write_text('"one"\n"two"\n', encoding="utf-8")
+            output_path = pathlib.Path(temp_dir) / "results.jsonl"
+
+            run_batch_command(
+                argparse.Namespace(batch=batch_path,
+                                   output=output_path,
+                                   concurrency=2,
+                                   rpm=None,
+                                   tpm=None,
+                                   order=None,
+                                   no_cache=True,
+                                   refresh=False,
+                                   hedge_after=1.5))
+
+            lines = output_path.read_text(encoding="utf-8").splitlines()
+
+        results = [json.loads(line) for line in lines]
+        self.assertEqual([r["response"] for r in results],
+                         ["answer to one", "answer to two"])
+        self.assertEqual(
+            set(results[0]), {
+                "index", "id", "prompt", "response", "latency",
+                "rate_limit_wait", "error", "error_type"
+            })
+        self.assertFalse(mock_ask.call_args.kwargs["use_cache"])
+        # The questions are hedged like single prompts.
+        self.assertEqual(mock_ask.call_args.kwargs["hedge"].after, 1.5)
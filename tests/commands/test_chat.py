@@ -0,0 +1,141 @@
+"""Test the chat command."""
+
+import argparse
+import pathlib
+from typing import Callable
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.commands.ask import ProjectContext
+from mochi_code.commands.chat import (ChatSession, TurnStats, chat,
+                                      run_chat_command)
+from mochi_code.prompts.chat_history import ChatHistory
+from mochi_code.prompts.prompt_assembly import PromptSection
+
+
+class TestChatSession(TestCase):
+    """Test the ChatSession class."""
+
+    @patch("mochi_code.commands.chat.ProjectContexts")
+    @patch("mochi_code.commands.ask.get_backend")
+    def test_sends_the_history(self, mock_llm: MagicMock,
+                               mock_contexts: MagicMock) -> None:
+        """Test that the history is sent along with the prompt."""
+        mock_contexts.return_value.get.return_value = ProjectContext(
+            (PromptSection("project", ("project",)),), None)
+        mock_llm.return_value.complete.side_effect = ["one", "two"]
+        session = ChatSession(pathlib.Path("/some/path"), ChatHistory())
+
+        session.send("first?")
+        session.send("second?")
+
+        prompt = mock_llm.return_value.complete.call_args.args[0]
+        self.assertIn("project", prompt)
+        self.assertIn("Conversation so far:\nUser: first?\nMochi: one", prompt)
+        self.assertTrue(prompt.endswith("User query: 'second?'"))
+        self.assertIn("second?", session.history.render())
+
+    @patch("mochi_code.commands.ask.PROMPT_MAX_TOKENS", 400)
+    @patch("mochi_code.commands.chat.ProjectContexts")
+    @patch("mochi_code.commands.ask.get_backend")
+    def test_shrinks_the_oldest_turns(self, mock_llm: MagicMock,
+                                      mock_contexts: MagicMock) -> None:
+        """Test that the oldest turns are left out when the prompt is full."""
+        mock_contexts.return_value.get.return_value = ProjectContext((), None)
+        mock_llm.return_value.complete.return_value = "answer"
+        session = ChatSession(pathlib.Path("/some/path"),
+                              ChatHistory(max_tokens=10_000))
+
+        for i in range(20):
+            session.send(f"question {i} " + "word " * 10)
+
+        prompt = mock_llm.return_value.complete.call_args.args[0]
+        self.assertNotIn("question 0 ", prompt)
+        self.assertIn("question 18 ", prompt)
+        self.assertIn("earlier turns left out", prompt)
+
+    @patch("mochi_code.commands.chat.ProjectContexts")
+    @patch("mochi_code.commands.ask.get_backend")
+    def test_measures_time_to_first_token(self, mock_llm: MagicMock,
+                                          mock_contexts: MagicMock) -> None:
+        """Test that the turn timings are reported."""
+        mock_contexts.return_value.get.return_value = ProjectContext((), None)
+        tokens: list[str] = []
+        session = ChatSession(pathlib.Path("/some/path"), ChatHistory(),
+                              tokens.append)
+
+        def stream(*_args, on_token: Callable[[str], None]) -> str:
+            on_token("hi")
+            return "hi"
+
+        mock_llm.return_value.complete.side_effect = stream
+        stats = session.send("hello?")
+
+        self.assertEqual(tokens, ["hi"])
+        assert stats.time_to_first_token is not None
+        self.assertLessEqual(stats.time_to_first_token, stats.total_latency)
+
+        mock_llm.return_value.complete.side_effect = None
+        mock_llm.return_value.complete.return_value = "cached"
+        stats = session.send("hello again?")
+        self.assertIsNone(stats.time_to_first_token)
+
+
+class TestChat(TestCase):
+    """Test the chat loop."""
+
+    @patch("builtins.print")
+    @patch("builtins.input")
+    @patch("mochi_code.commands.chat.ChatSession")
+    def test_loops_until_exit(self, mock_session: MagicMock,
+                              mock_input: MagicMock, _print: MagicMock) -> None:
+        """Test that empty prompts are skipped and exit leaves the chat."""
+        mock_input.side_effect = ["hello", "   ", "and you?", "exit", "never"]
+        mock_session.return_value.send.return_value = TurnStats(0.1, 0.5)
+
+        chat(pathlib.Path("/some/path"), ChatHistory())
+
+        sent = [c.args[0] for c in mock_session.return_value.send.mock_calls]
+        self.assertEqual(sent, ["hello", "and you?"])
+
+    @patch("builtins.print")
+    @patch("builtins.input")
+    @patch("mochi_code.commands.chat.ChatSession")
+    def test_leaves_on_eof(self, mock_session: MagicMock, mock_input: MagicMock,
+                           _print: MagicMock) -> None:
+        """Test that the chat ends with the input."""
+        mock_input.side_effect = EOFError()
+
+        chat(pathlib.Path("/some/path"), ChatHistory())
+
+        mock_session.return_value.send.assert_not_called()
+
+    @patch("builtins.print")
+    @patch("builtins.input")
+    @patch("mochi_code.commands.chat.ChatSession")
+    def test_keeps_going_after_failed_turns(self, mock_session: MagicMock,
+                                            mock_input: MagicMock,
+                                            mock_print: MagicMock) -> None:
+        """Test that errors and interrupted answers don't end the chat."""
+        mock_input.side_effect = ["down?", "stop!", "fine?", "exit"]
+        mock_session.return_value.send.side_effect = [
+            RuntimeError("model down"),
+            KeyboardInterrupt(),
+            TurnStats(0.1, 0.5)
+        ]
+
+        chat(pathlib.Path("/some/path"), ChatHistory())
+
+        self.assertEqual(mock_session.return_value.send.call_count, 3)
+        printed = "".join(str(c.args) for c in mock_print.mock_calls)
+        self.assertIn("model down", printed)
+        self.assertIn("See you soon", printed)
+
+    @patch("mochi_code.commands.chat.chat")
+    def test_uses_history_budget(self, mock_chat: MagicMock) -> None:
+        """Test that the history budget argument is used."""
+        run_chat_command(argparse.Namespace(history_tokens=42))
+
+        history = mock_chat.call_args.args[1]
+        history.add("question", "word " * 100)
+        self.assertEqual(history.render(), "")
@@ -0,0 +1,81 @@
+"""Test the find command."""
+
+import argparse
+import pathlib
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from mochi_code.code.mochi_config import get_config_path
+from mochi_code.code.symbol_index import Symbol
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.commands.find import format_symbol, run_find_command
+
+_PROJECT_PATH = pathlib.Path("/some/path")
+
+
+class TestRunFindCommand(TestCase):
+    """Test the run_find_command function."""
+
+    @patch("mochi_code.commands.find.search_mochi_config")
+    def test_raises_if_not_initialized(self, mock_search: MagicMock) -> None:
+        """Test that the project must be initialized first."""
+        mock_search.return_value = None
+
+        with self.assertRaises(MochiCannotContinue):
+            run_find_command(argparse.Namespace(name="run", limit=20))
+
+    @patch("mochi_code.commands.find.load_symbol_index")
+    @patch("mochi_code.commands.find.search_mochi_config")
+    def test_raises_if_not_indexed(self, mock_search: MagicMock,
+                                   mock_load: MagicMock) -> None:
+        """Test that the symbols must be indexed first."""
+        mock_search.return_value = get_config_path(_PROJECT_PATH)
+        mock_load.return_value = None
+
+        with self.assertRaises(MochiCannotContinue):
+            run_find_command(argparse.Namespace(name="run", limit=20))
+
+    @patch("pathlib.Path.cwd")
+    @patch("builtins.print")
+    @patch("mochi_code.commands.find.load_symbol_index")
+    @patch("mochi_code.commands.find.search_mochi_config")
+    def test_prints_the_matches(self, mock_search: MagicMock,
+                                mock_load: MagicMock, mock_print: MagicMock,
+                                mock_cwd: MagicMock) -> None:
+        """Test that the matches are printed, relative to the cwd."""
+        mock_cwd.return_value = _PROJECT_PATH
+        mock_search.return_value = get_config_path(_PROJECT_PATH)
+        mock_load.return_value.search.return_value = [
+            Symbol("Runner.run", "method", "src/runner.py", 12, 20)
+        ]
+
+        run_find_command(argparse.Namespace(name="run", limit=5))
+
+        mock_load.return_value.search.assert_called_once_with("run", 5)
+        mock_print.assert_has_calls(
+            [call("src/runner.py:12  method Runner.run (lines 12-20)")])
+
+    @patch("builtins.print")
+    @patch("mochi_code.commands.find.load_symbol_index")
+    @patch("mochi_code.commands.find.search_mochi_config")
+    def test_no_matches(self, mock_search: MagicMock, mock_load: MagicMock,
+                        mock_print: MagicMock) -> None:
+        """Test that the user is told when nothing matches."""
+        mock_search.return_value = get_config_path(_PROJECT_PATH)
+        mock_load.return_value.search.return_value = []
+
+        run_find_command(argparse.Namespace(name="run", limit=5))
+
+        self.assertIn("No function", mock_print.call_args[0][0])
+
+
+class TestFormatSymbol(TestCase):
+    """Test the format_symbol function."""
+
+    def test_relative_to_the_start_path(self) -> None:
+        """Test that the path is relative to where mochi was started."""
+        symbol = Symbol("start", "function", "server/app.py", 3, 9)
+
+        self.assertEqual(
+            format_symbol(symbol, _PROJECT_PATH, _PROJECT_PATH / "docs"),
+            "../server/app.py:3  function start (lines 3-9)")
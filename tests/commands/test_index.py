@@ -0,0 +1,93 @@
+"""Test the index command."""
+
+import argparse
+import pathlib
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.code.code_index import IndexUpdate
+from mochi_code.code.mochi_config import get_config_path
+from mochi_code.commands.arguments import setup_index_arguments
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.commands.index import format_index_update, run_index_command
+
+
+class TestRunIndexCommand(TestCase):
+    """Test the run_index_command function."""
+
+    @patch("mochi_code.commands.index.search_mochi_config")
+    def test_raises_if_not_initialized(self, mock_search: MagicMock) -> None:
+        """Test that the project must be initialized first."""
+        mock_search.return_value = None
+
+        with self.assertRaises(MochiCannotContinue):
+            run_index_command(argparse.Namespace(workers=None))
+
+    @patch("builtins.print")
+    @patch("mochi_code.commands.index.update_dependency_index")
+    @patch("mochi_code.commands.index.load_project_details")
+    @patch("mochi_code.commands.index.update_git_history")
+    @patch("mochi_code.commands.index.update_vector_store")
+    @patch("mochi_code.commands.index.update_symbol_index")
+    @patch("mochi_code.commands.index.update_lexical_index")
+    @patch("mochi_code.commands.index.update_code_index")
+    @patch("mochi_code.commands.index.search_mochi_config")
+    def test_updates_index(self, mock_search: MagicMock, mock_update: MagicMock,
+                           mock_lexical: MagicMock, mock_symbols: MagicMock,
+                           mock_vectors: MagicMock, mock_history: MagicMock,
+                           mock_details: MagicMock, mock_apis: MagicMock,
+                           _print: MagicMock) -> None:
+        """Test that the indexes of the found config are updated."""
+        config_path = get_config_path(pathlib.Path("/some/path"))
+        mock_search.return_value = config_path
+        mock_update.return_value = IndexUpdate()
+        mock_history.return_value = 0
+        mock_details.return_value.dependencies = ["numpy"]
+
+        run_index_command(
+            argparse.Namespace(workers=2, quantize=True, ivf_threshold=None))
+
+        mock_update.assert_called_once_with(config_path, max_workers=2)
+        mock_lexical.assert_called_once_with(config_path,
+                                             mock_update.return_value)
+        mock_symbols.assert_called_once_with(config_path,
+                                             mock_update.return_value,
+                                             max_workers=2)
+        mock_vectors.assert_called_once_with(config_path,
+                                             quantized=True,
+                                             ivf_threshold=None)
+        mock_history.assert_called_once_with(config_path)
+        mock_apis.assert_called_once_with(config_path, ["numpy"], max_workers=2)
+
+
+class TestIndexArguments(TestCase):
+    """Test the setup_index_arguments function."""
+
+    @patch("sys.stderr")
+    def test_rejects_non_positive_counts(self, _stderr: MagicMock) -> None:
+        """Test that the worker and vector counts must be positive."""
+        parser = argparse.ArgumentParser()
+        setup_index_arguments(parser)
+
+        for args in (["--workers", "0"], ["--ivf-threshold", "-1"]):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(args)
+        self.assertEqual(parser.parse_args(["--workers", "2"]).workers, 2)
+
+
+class TestFormatIndexUpdate(TestCase):
+    """Test the format_index_update function."""
+
+    def test_counts(self) -> None:
+        """Test the summary counts every kind of change."""
+        update = IndexUpdate(added=["a"],
+                             modified=["b", "c"],
+                             removed=["d"],
+                             unchanged=4)
+
+        summary = format_index_update(update)
+
+        self.assertIn("7 files", summary)
+        self.assertIn("1 added", summary)
+        self.assertIn("2 modified", summary)
+        self.assertIn("1 removed", summary)
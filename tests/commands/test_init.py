@@ -3,17 +3,23 @@
 import argparse
 import pathlib
 import tempfile
+import threading
+from typing import Callable
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
+from mochi_code.code.code_index import IndexUpdate
 from mochi_code.code.mochi_config import (get_config_path,
                                           get_project_details_path,
                                           load_project_details)
 from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.resilience import RetryPolicy
 from mochi_code.commands.init import (ProjectDetails,
                                       ProjectDetailsWithDependencies,
-                                      _get_dependencies_list, init,
-                                      run_init_command)
+                                      _ConfigFile, _get_dependencies_list,
+                                      _get_project_details,
+                                      _parse_project_details, init,
+                                      init_recursive, run_init_command)
 
 
 class TestRunInitCommand(TestCase):
@@ -38,7 +44,7 @@ class TestRunInitCommand(TestCase):
 
         error_pattern = rf".*'{start_path}'."
         with self.assertRaisesRegex(MochiCannotContinue, error_pattern):
-            run_init_command(argparse.Namespace(force=False))
+            run_init_command(argparse.Namespace(force=False, recursive=False))
         mock_search.assert_called_once()
         mock_init.assert_not_called()
 
@@ -59,7 +65,7 @@ class TestRunInitCommand(TestCase):
         mock_init.return_value = None
         mock_search.return_value = get_config_path(start_path.parent)
 
-        run_init_command(argparse.Namespace(force=True))
+        run_init_command(argparse.Namespace(force=True, recursive=False))
         mock_init.assert_called_once()
 
     @patch("mochi_code.commands.init.search_mochi_config")
@@ -79,7 +85,7 @@ class TestRunInitCommand(TestCase):
         mock_init.return_value = None
         mock_search.return_value = get_config_path(start_path)
 
-        run_init_command(argparse.Namespace(force=True))
+        run_init_command(argparse.Namespace(force=True, recursive=False))
         mock_init.assert_not_called()
 
     @patch("mochi_code.commands.init.search_mochi_config")
@@ -94,11 +100,28 @@ class TestRunInitCommand(TestCase):
         mock_init.return_value = None
         mock_cwd.return_value = start_path
 
-        run_init_command(argparse.Namespace(force=False))
+        run_init_command(argparse.Namespace(force=False, recursive=False))
 
         assert mock_init.call_count == 1
         mock_init.assert_called_once_with(start_path)
 
+    @patch("mochi_code.commands.init.search_mochi_config")
+    @patch("mochi_code.commands.init.init_recursive")
+    @patch("mochi_code.commands.init.pathlib.Path.cwd")
+    def test_it_calls_init_recursive(self, mock_cwd: MagicMock,
+                                     mock_init_recursive: MagicMock,
+                                     mock_search: MagicMock) -> None:
+        """Test that the function initializes every project if recursive, even
+        inside an initialized project."""
+        start_path = pathlib.Path("/some/path")
+        mock_cwd.return_value = start_path
+        mock_search.return_value = get_config_path(start_path.parent)
+
+        run_init_command(
+            argparse.Namespace(force=False, recursive=True, workers=3))
+
+        mock_init_recursive.assert_called_once_with(start_path, 3)
+
 
 class TestInit(TestCase):
     """Test the init function."""
@@ -108,8 +131,13 @@ class TestInit(TestCase):
         self._root_dir = tempfile.TemporaryDirectory()
         self._root_path = pathlib.Path(self._root_dir.name)
         self._mochi_path = get_config_path(self._root_path)
+        # The dependencies are indexed in a cache shared by all projects.
+        self._apis_patcher = patch(
+            "mochi_code.commands.init.update_dependency_index")
+        self._mock_apis = self._apis_patcher.start()
 
     def tearDown(self) -> None:
+        self._apis_patcher.stop()
         self._root_dir.cleanup()
 
     @patch("mochi_code.commands.init._get_dependencies_list")
@@ -130,7 +158,7 @@ class TestInit(TestCase):
 
         self.assertTrue(self._mochi_path.exists())
         mock_dependencies_list.assert_called_once_with(
-            mock_project_details.return_value)
+            mock_project_details.return_value, self._root_path, {})
 
         project_details_path = get_project_details_path(self._mochi_path)
         loaded_project_details = load_project_details(project_details_path)
@@ -141,6 +169,26 @@ class TestInit(TestCase):
         )
         self.assertEqual(loaded_project_details, expected_project_details)
 
+    @patch("mochi_code.commands.init._get_dependencies_list")
+    @patch("mochi_code.commands.init._get_project_details")
+    def test_it_detects_known_projects_locally(
+            self, mock_project_details: MagicMock,
+            mock_dependencies_list: MagicMock) -> None:
+        """Test that the function doesn't ask the model for the details when
+        the project can be recognised from its files."""
+        (self._root_path / "pyproject.toml").touch()
+        (self._root_path / "poetry.lock").touch()
+        mock_dependencies_list.return_value = ["mypy"]
+
+        init(self._root_path)
+
+        mock_project_details.assert_not_called()
+        mock_dependencies_list.assert_called_once_with(
+            ProjectDetails(language="python",
+                           config_file="pyproject.toml",
+                           package_manager="poetry"), self._root_path,
+            {"pyproject.toml": _ConfigFile("", [])})
+
     @patch("mochi_code.commands.init._get_dependencies_list")
     @patch("mochi_code.commands.init._get_project_details")
     def test_does_not_create_config_if_failed(
@@ -156,8 +204,162 @@ class TestInit(TestCase):
             init(self._root_path)
 
         self.assertFalse(self._mochi_path.exists())
+        self.assertEqual(list(self._root_path.iterdir()), [])
         mock_dependencies_list.assert_not_called()
 
+    @patch("mochi_code.commands.init._fetch_list_of_dependencies")
+    @patch("mochi_code.commands.init._index_project")
+    @patch("mochi_code.commands.init._get_project_details")
+    def test_it_overlaps_the_model_and_indexing(
+            self, mock_project_details: MagicMock, mock_index: MagicMock,
+            mock_fetch_dependencies: MagicMock) -> None:
+        """Test that the project is indexed while the model is asked, and the
+        config files are parsed ahead."""
+        (self._root_path / "requirements.txt").write_text("numpy\n",
+                                                          encoding="utf-8")
+        (self._root_path / "odd.cfg").touch()
+        # Both steps wait for each other, they must run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def get_details(_files: list[str]) -> ProjectDetails:
+            barrier.wait()
+            return ProjectDetails(language="python",
+                                  config_file="requirements.txt",
+                                  package_manager="pip")
+
+        def index(_config_path: pathlib.Path) -> IndexUpdate:
+            barrier.wait()
+            return IndexUpdate(added=["requirements.txt"])
+
+        mock_project_details.side_effect = get_details
+        mock_index.side_effect = index
+
+        with patch("mochi_code.commands.init.detect_project",
+                   return_value=None):
+            init(self._root_path)
+
+        details = load_project_details(
+            get_project_details_path(self._mochi_path))
+        self.assertEqual(details.dependencies, ["numpy"])
+        self.assertEqual(self._mock_apis.call_args.args[1], ["numpy"])
+        mock_fetch_dependencies.assert_not_called()
+        # The index was built in the staging config, now the config.
+        self.assertEqual(mock_index.call_args.args[0].parent, self._root_path)
+        self.assertEqual(sorted(p.name for p in self._root_path.iterdir()),
+                         [".mochi", "odd.cfg", "requirements.txt"])
+
+
+class TestInitRecursive(TestCase):
+    """Test the init_recursive function."""
+
+    def setUp(self) -> None:
+        self._root_dir = tempfile.TemporaryDirectory()
+        self._root_path = pathlib.Path(self._root_dir.name)
+        for project in ["web", "api", "done"]:
+            (self._root_path / project).mkdir()
+            (self._root_path / project / "requirements.txt").touch()
+        get_config_path(self._root_path / "done").mkdir()
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    @patch("mochi_code.commands.init._index_project")
+    def test_it_initializes_the_projects_concurrently(
+            self, mock_index: MagicMock) -> None:
+        """Test that each project gets its config, at the same time, and the
+        projects already initialized are skipped."""
+        # Both projects wait for each other, they must run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def index(_config_path: pathlib.Path) -> IndexUpdate:
+            barrier.wait()
+            return IndexUpdate(added=["requirements.txt"])
+
+        mock_index.side_effect = index
+
+        init_recursive(self._root_path, workers=2)
+
+        for project in ["web", "api"]:
+            details = load_project_details(
+                get_project_details_path(
+                    get_config_path(self._root_path / project)))
+            self.assertEqual(details.config_file, "requirements.txt")
+        self.assertEqual(mock_index.call_count, 2)
+        self.assertEqual(
+            list(get_config_path(self._root_path / "done").iterdir()), [])
+
+    @patch("mochi_code.commands.init._index_project")
+    @patch("mochi_code.commands.init._detect_project_details")
+    def test_it_reports_failures_after_the_others(
+            self, mock_detect: MagicMock, mock_index: MagicMock) -> None:
+        """Test that a failing project doesn't stop the others."""
+
+        def detect(project_files: list[str],
+                   _log: Callable[[str], None]) -> ProjectDetails:
+            if "broken.txt" in project_files:
+                raise ValueError("Some error")
+            return ProjectDetails(language="python",
+                                  config_file="requirements.txt",
+                                  package_manager="pip")
+
+        (self._root_path / "api" / "broken.txt").touch()
+        mock_detect.side_effect = detect
+        mock_index.return_value = IndexUpdate()
+
+        with self.assertRaisesRegex(MochiCannotContinue, "api: Some error"):
+            init_recursive(self._root_path, workers=1)
+
+        self.assertTrue(get_config_path(self._root_path / "web").exists())
+        self.assertEqual(
+            sorted(p.name for p in (self._root_path / "api").iterdir()),
+            ["broken.txt", "requirements.txt"])
+
+    def test_it_raises_without_projects(self) -> None:
+        """Test that the function raises if there is no project."""
+        with tempfile.TemporaryDirectory() as empty_dir:
+            with self.assertRaises(MochiCannotContinue):
+                init_recursive(pathlib.Path(empty_dir), workers=1)
+
+
+class TestGetProjectDetails(TestCase):
+    """Test the _get_project_details function."""
+
+    @patch("mochi_code.commands.init._RETRY_POLICY",
+           RetryPolicy(max_attempts=3, base_delay=0))
+    @patch("mochi_code.commands.init._request_project_details")
+    def test_it_asks_again_for_invalid_outputs(self,
+                                               mock_request: MagicMock) -> None:
+        """Test that an invalid output is retried, but a fatal error isn't."""
+        details = ProjectDetails(language="go",
+                                 config_file="go.mod",
+                                 package_manager="go")
+        mock_request.side_effect = [ValueError("Invalid json"), details]
+
+        self.assertEqual(_get_project_details(["go.mod"]), details)
+
+        mock_request.reset_mock()
+        mock_request.side_effect = KeyError("OPENAI_API_KEY")
+        with self.assertRaises(KeyError):
+            _get_project_details(["go.mod"])
+        mock_request.assert_called_once()
+
+    def test_it_repairs_malformed_outputs_locally(self) -> None:
+        """Test that a malformed output is repaired instead of asking again,
+        and only given up on if it can't be repaired."""
+        strict_parse = MagicMock(side_effect=ValueError("Invalid json"))
+
+        details = _parse_project_details(
+            strict_parse, "Sure! {'language': 'Go', 'config_file': " +
+            "'go.mod', 'package_manager': 'Go',}")
+
+        self.assertEqual(
+            details,
+            ProjectDetails(language="go",
+                           config_file="go.mod",
+                           package_manager="go"))
+        with self.assertRaisesRegex(ValueError, "Invalid json"):
+            _parse_project_details(strict_parse, "I'm not sure.")
+
 
 class TestGetDependenciesList(TestCase):
     """Test the _get_dependencies_list function."""
@@ -184,14 +386,57 @@ class TestGetDependenciesList(TestCase):
             config_file="pyproject.toml",
             package_manager="poetry",
         )
-        config_path = pathlib.Path(project_details.config_file)
-        (self._root_path / config_path).touch()
+        config_path = self._root_path / project_details.config_file
+        config_path.touch()
 
-        dependencies = _get_dependencies_list(project_details)
+        dependencies = _get_dependencies_list(project_details, self._root_path)
 
         self.assertEqual(dependencies, mock_fetch_dependencies.return_value)
         mock_load_content.assert_called_once_with(config_path)
 
+    @patch("mochi_code.commands.init._fetch_list_of_dependencies")
+    @patch("mochi_code.commands.init._load_dependencies_config_content")
+    def test_it_parses_known_configs_locally(
+            self, mock_load_content: MagicMock,
+            mock_fetch_dependencies: MagicMock) -> None:
+        """Test the function doesn't call the model for known config files."""
+        mock_load_content.return_value = '{"dependencies": {"react": "^18"}}'
+
+        project_details = ProjectDetails(
+            language="javascript",
+            config_file="package.json",
+            package_manager="npm",
+        )
+        with patch("mochi_code.commands.init.pathlib.Path.is_file",
+                   return_value=True):
+            dependencies = _get_dependencies_list(project_details,
+                                                  self._root_path)
+
+        self.assertEqual(dependencies, ["react"])
+        mock_fetch_dependencies.assert_not_called()
+
+    @patch("mochi_code.commands.init._fetch_list_of_dependencies")
+    @patch("mochi_code.commands.init._load_dependencies_config_content")
+    def test_it_uses_the_config_files_read_ahead(
+            self, mock_load_content: MagicMock,
+            mock_fetch_dependencies: MagicMock) -> None:
+        """Test the function doesn't read the config files again."""
+        project_details = ProjectDetails(
+            language="python",
+            config_file="setup.cfg",
+            package_manager="pip",
+        )
+        mock_fetch_dependencies.return_value = ["requests"]
+
+        dependencies = _get_dependencies_list(
+            project_details, self._root_path,
+            {"setup.cfg": _ConfigFile("install_requires = requests", None)})
+
+        self.assertEqual(dependencies, ["requests"])
+        mock_load_content.assert_not_called()
+        mock_fetch_dependencies.assert_called_once_with(
+            "python", "pip", "install_requires = requests")
+
     @patch("mochi_code.commands.init._fetch_list_of_dependencies")
     @patch("mochi_code.commands.init._load_dependencies_config_content")
     def test_it_returns_empty_if_config_does_not_exist(
@@ -205,7 +450,7 @@ class TestGetDependenciesList(TestCase):
             package_manager="poetry",
         )
 
-        dependencies = _get_dependencies_list(project_details)
+        dependencies = _get_dependencies_list(project_details, self._root_path)
 
         self.assertEqual(dependencies, [])
         mock_load_content.assert_not_called()
@@ -224,7 +469,7 @@ class TestGetDependenciesList(TestCase):
             package_manager="poetry",
         )
 
-        dependencies = _get_dependencies_list(project_details)
+        dependencies = _get_dependencies_list(project_details, self._root_path)
 
         self.assertEqual(dependencies, [])
         mock_load_content.assert_not_called()
@@ -0,0 +1,50 @@
+"""Test the lazy command registry."""
+
+import argparse
+from unittest import TestCase
+
+from mochi_code.commands.registry import COMMANDS, get_command
+
+
+class TestGetCommand(TestCase):
+    """Test the get_command function."""
+
+    def test_finds_registered_commands(self) -> None:
+        """Test that every registered command can be found by name."""
+        for command in COMMANDS:
+            self.assertEqual(get_command(command.name), command)
+
+    def test_returns_none_for_unknown_command(self) -> None:
+        """Test that unknown (or missing) commands return None."""
+        self.assertIsNone(get_command("unknown"))
+        self.assertIsNone(get_command(None))
+
+
+class TestLazyCommand(TestCase):
+    """Test the LazyCommand class."""
+
+    def test_loads_runners(self) -> None:
+        """Test that every registered command resolves to a callable runner."""
+        for command in COMMANDS:
+            self.assertTrue(callable(command.load_runner()))
+
+    def test_sets_up_arguments(self) -> None:
+        """Test that every registered command can setup its arguments."""
+        for command in COMMANDS:
+            parser = argparse.ArgumentParser()
+            command.setup_arguments(parser)
+
+    def test_selects_runner_by_argument(self) -> None:
+        """Test that argument runners replace the default one, in process."""
+        ask_command = get_command("ask")
+        assert ask_command is not None
+
+        batch_args = argparse.Namespace(prompt=None, batch="questions.jsonl")
+        prompt_args = argparse.Namespace(prompt="test", batch=None)
+
+        self.assertEqual(
+            ask_command.load_runner(batch_args).__name__, "run_batch_command")
+        self.assertEqual(
+            ask_command.load_runner(prompt_args).__name__, "run_ask_command")
+        self.assertFalse(ask_command.forwards_to_daemon(batch_args))
+        self.assertTrue(ask_command.forwards_to_daemon(prompt_args))
@@ -0,0 +1,168 @@
+"""Test the daemon server and its client."""
+
+import argparse
+import io
+import os
+import pathlib
+import tempfile
+import threading
+from typing import Any
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.daemon.client import forward_command
+from mochi_code.daemon.protocol import DISABLE_DAEMON_ENV_VAR
+from mochi_code.daemon.server import MochiServer
+from mochi_code.tracing import disable_tracing, enable_tracing
+
+
+def _fake_ask(prompt: str, **kwargs: Any) -> None:
+    """Streams the prompt back, one word at a time."""
+    if prompt == "fail":
+        raise ValueError("Some error")
+    for word in prompt.split():
+        kwargs["on_token"](word + " ")
+
+
+class TestDaemon(TestCase):
+    """Test forwarding commands to a running daemon."""
+
+    def setUp(self) -> None:
+        # Unix socket paths are short, so use a short temporary folder.
+        self._root_dir = tempfile.TemporaryDirectory(dir="/tmp")
+        self._socket_path = pathlib.Path(self._root_dir.name) / "mochi.sock"
+
+    def tearDown(self) -> None:
+        self._root_dir.cleanup()
+
+    def _start_server(self) -> MochiServer:
+        server = MochiServer(self._socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _ask_args(self, prompt: str, **options: Any) -> argparse.Namespace:
+        return argparse.Namespace(subcommand="ask",
+                                  prompt=prompt,
+                                  no_cache=False,
+                                  refresh=False,
+                                  **options)
+
+    def test_falls_back_if_not_running(self) -> None:
+        """Test that the client reports the daemon isn't available."""
+        output = io.StringIO()
+
+        self.assertFalse(
+            forward_command(self._ask_args("hi"), self._socket_path, output))
+        self.assertEqual(output.getvalue(), "")
+
+    def test_falls_back_if_disabled(self) -> None:
+        """Test that the client doesn't forward if disabled in the env."""
+        self._start_server()
+
+        with patch.dict(os.environ, {DISABLE_DAEMON_ENV_VAR: "1"}):
+            self.assertFalse(
+                forward_command(self._ask_args("hi"), self._socket_path,
+                                io.StringIO()))
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_streams_ask_output(self, mock_ask: MagicMock) -> None:
+        """Test that the ask output is streamed back to the client."""
+        self._start_server()
+        output = io.StringIO()
+
+        self.assertTrue(
+            forward_command(self._ask_args("hello there mochi"),
+                            self._socket_path, output))
+
+        self.assertEqual(output.getvalue(), "hello there mochi ")
+        mock_ask.assert_called_once()
+        self.assertEqual(mock_ask.call_args.kwargs["use_cache"], True)
+        self.assertEqual(mock_ask.call_args.kwargs["refresh_cache"], False)
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_reports_errors(self, _mock_ask: MagicMock) -> None:
+        """Test that errors in the daemon are raised by the client."""
+        self._start_server()
+
+        with self.assertRaisesRegex(MochiCannotContinue, "Some error"):
+            forward_command(self._ask_args("fail"), self._socket_path,
+                            io.StringIO())
+
+    def test_rejects_unknown_commands(self) -> None:
+        """Test that the daemon only runs the commands it knows."""
+        self._start_server()
+        args = argparse.Namespace(subcommand="init", force=False)
+
+        with self.assertRaisesRegex(MochiCannotContinue, "init"):
+            forward_command(args, self._socket_path, io.StringIO())
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_forwards_the_ask_arguments(self, mock_ask: MagicMock) -> None:
+        """Test that only the arguments the daemon honours are sent."""
+        self._start_server()
+        args = self._ask_args("hi",
+                              hedge_after=2.0,
+                              output=pathlib.Path("answers.jsonl"),
+                              trace=False,
+                              deadline=None)
+
+        self.assertTrue(forward_command(args, self._socket_path, io.StringIO()))
+        self.assertEqual(mock_ask.call_args.kwargs["hedge"].after, 2.0)
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_runs_local_options_in_process(self, mock_ask: MagicMock) -> None:
+        """Test that a deadline or a trace keeps the command in process."""
+        self._start_server()
+
+        self.assertFalse(
+            forward_command(self._ask_args("hi", deadline=5.0),
+                            self._socket_path, io.StringIO()))
+        enable_tracing()
+        try:
+            self.assertFalse(
+                forward_command(self._ask_args("hi"), self._socket_path,
+                                io.StringIO()))
+        finally:
+            disable_tracing()
+        mock_ask.assert_not_called()
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_runs_other_envs_in_process(self, mock_ask: MagicMock) -> None:
+        """Test that a client with another backend or keys isn't forwarded."""
+        self._start_server()
+
+        with patch.dict(os.environ, {"MOCHI_MODEL": "other-model"}):
+            self.assertFalse(
+                forward_command(self._ask_args("hi"), self._socket_path,
+                                io.StringIO()))
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "other-key"}):
+            self.assertFalse(
+                forward_command(self._ask_args("hi"), self._socket_path,
+                                io.StringIO()))
+        mock_ask.assert_not_called()
+
+    @patch("mochi_code.daemon.server.ask", side_effect=_fake_ask)
+    def test_runs_other_keys_files_in_process(self,
+                                              mock_ask: MagicMock) -> None:
+        """Test that a client with its own .keys file isn't forwarded."""
+        self._start_server()
+        working_dir = os.getcwd()
+        os.chdir(self._root_dir.name)
+        self.addCleanup(os.chdir, working_dir)
+        pathlib.Path(".keys").write_text("OPENAI_API_KEY=other-key\n",
+                                         encoding="utf-8")
+
+        self.assertFalse(
+            forward_command(self._ask_args("hi"), self._socket_path,
+                            io.StringIO()))
+        mock_ask.assert_not_called()
+
+    def test_only_the_user_can_connect(self) -> None:
+        """Test that the socket is private from the moment it exists."""
+        self._start_server()
+
+        self.assertEqual(self._socket_path.stat().st_mode & 0o777, 0o600)
@@ -0,0 +1,65 @@
+"""Test the chat history."""
+
+from unittest import TestCase
+
+from mochi_code.prompts.chat_history import ChatHistory, estimate_tokens
+
+
+class TestEstimateTokens(TestCase):
+    """Test the estimate_tokens function."""
+
+    def test_estimates(self) -> None:
+        """Test the estimate rounds up to ~4 characters per token."""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("a"), 1)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+
+class TestChatHistory(TestCase):
+    """Test the ChatHistory class."""
+
+    def test_empty(self) -> None:
+        """Test that an empty history renders as an empty string."""
+        history = ChatHistory()
+
+        self.assertEqual(history.render(), "")
+        self.assertEqual(history.total_tokens, 0)
+
+    def test_renders_turns_in_order(self) -> None:
+        """Test that the turns are rendered oldest first."""
+        history = ChatHistory()
+        history.add("first?", "one\n")
+        history.add("second?", "two")
+
+        self.assertEqual(history.render(),
+                         "User: first?\nMochi: one\nUser: second?\nMochi: two")
+
+    def test_drops_oldest_turns_over_budget(self) -> None:
+        """Test that the history stays within the token budget."""
+        history = ChatHistory(max_tokens=2, count_tokens=lambda _: 1)
+        history.add("first?", "one")
+        history.add("second?", "two")
+        history.add("third?", "three")
+
+        self.assertEqual(history.total_tokens, 2)
+        self.assertNotIn("first?", history.render())
+        self.assertIn("second?", history.render())
+        self.assertIn("third?", history.render())
+
+    def test_drops_turns_larger_than_budget(self) -> None:
+        """Test that a single turn over the budget isn't kept."""
+        history = ChatHistory(max_tokens=10)
+        history.add("question?", "a very long answer" * 10)
+
+        self.assertEqual(history.render(), "")
+        self.assertEqual(history.total_tokens, 0)
+
+    def test_keeps_nothing_without_budget(self) -> None:
+        """Test that a budget of no tokens doesn't fail, nothing is kept."""
+        for max_tokens in (0, -5):
+            history = ChatHistory(max_tokens=max_tokens)
+            history.add("question?", "answer")
+            history.add("again?", "answer")
+
+            self.assertEqual(history.render(), "")
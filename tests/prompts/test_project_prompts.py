@@ -5,7 +5,15 @@ from unittest.mock import MagicMock, patch
 
 from mochi_code.code.mochi_config import get_config_path
 from mochi_code.code import ProjectDetailsWithDependencies
-from mochi_code.prompts.project_prompts import get_project_prompt
+from mochi_code.code.code_search import CodeChunk, SearchResult
+from mochi_code.code.dependency_index import ApiSymbol
+from mochi_code.code.git_history import Commit
+from mochi_code.prompts.project_prompts import (get_code_snippets_section,
+                                                get_dependency_apis_section,
+                                                get_git_history_section,
+                                                get_project_prompt,
+                                                make_project_sections)
+from mochi_code.prompts.prompt_assembly import assemble_prompt
 
 
 class TestGetProjectPrompt(TestCase):
@@ -57,3 +65,138 @@ class TestGetProjectPrompt(TestCase):
         prompt = get_project_prompt(pathlib.Path("/some/path"))
 
         self.assertIsNone(prompt)
+
+
+class TestMakeProjectSections(TestCase):
+    """Test the make_project_sections function."""
+
+    def test_it_summarises_the_dependencies(self) -> None:
+        """Test that the dependencies that don't fit are counted."""
+        details = ProjectDetailsWithDependencies(
+            language="python",
+            config_file="pyproject.toml",
+            package_manager="poetry",
+            dependencies=[f"package-{i}" for i in range(1000)])
+
+        prompt = assemble_prompt(make_project_sections(details), 10_000)
+
+        self.assertEqual(prompt.shrunk, ("dependencies",))
+        self.assertIn("package-0, package-1", prompt.text)
+        self.assertRegex(prompt.text, r" and \d+ more\)$")
+
+
+class TestGetCodeSnippetsSection(TestCase):
+    """Test the get_code_snippets_section function."""
+
+    def setUp(self) -> None:
+        self._snippets: dict[str, str] = {}
+        self._read_patcher = patch(
+            "mochi_code.prompts.project_prompts.read_chunk",
+            side_effect=lambda _, chunk: self._snippets[chunk.path])
+        self._read_patcher.start()
+
+    def tearDown(self) -> None:
+        self._read_patcher.stop()
+
+    def _mock_index(self, snippets: dict[str, str]) -> MagicMock:
+        self._snippets.update(snippets)
+        index = MagicMock()
+        index.search.return_value = [
+            SearchResult(CodeChunk(path, 1, 2), 1.0) for path in snippets
+        ]
+        return index
+
+    def test_it_includes_the_snippets(self) -> None:
+        """Test that the matching snippets are included, best first."""
+        index = self._mock_index({"a.py": "def a(): pass", "b.py": "b = 1"})
+
+        section = get_code_snippets_section([index], "query")
+
+        assert section is not None
+        prompt = section.render()
+        self.assertIn("a.py (lines 1-2)", prompt)
+        self.assertIn("def a(): pass", prompt)
+        self.assertLess(prompt.index("a.py"), prompt.index("b.py"))
+
+    def test_it_fuses_the_indexes(self) -> None:
+        """Test that the snippets of all the indexes are included."""
+        lexical_index = self._mock_index({"a.py": "a = 1"})
+        vector_store = self._mock_index({"b.py": "b = 1"})
+
+        section = get_code_snippets_section([lexical_index, vector_store],
+                                            "query")
+
+        assert section is not None
+        self.assertIn("a.py", section.render())
+        self.assertIn("b.py", section.render())
+
+    def test_it_keeps_to_the_token_budget(self) -> None:
+        """Test that the least relevant snippets are left out."""
+        index = self._mock_index({"a.py": "a = 1", "b.py": "b" * 400})
+
+        section = get_code_snippets_section([index], "query", max_tokens=50)
+
+        assert section is not None
+        prompt = assemble_prompt([section], 10_000)
+        self.assertIn("a.py", prompt.text)
+        self.assertNotIn("b.py", prompt.text)
+        self.assertLessEqual(prompt.tokens, 50)
+
+    def test_it_returns_none_without_matches(self) -> None:
+        """Test that there's no section if nothing matches."""
+        self.assertIsNone(get_code_snippets_section([self._mock_index({})],
+                                                    "q"))
+        self.assertIsNone(get_code_snippets_section([], "q"))
+
+
+class TestGetGitHistorySection(TestCase):
+    """Test the get_git_history_section function."""
+
+    def test_it_includes_the_commits(self) -> None:
+        """Test that the matching commits are included, best first."""
+        history = MagicMock()
+        history.search.return_value = [
+            Commit("a" * 40, 0, "Mochi", "Fix the cache", ("cache.py",), 1),
+            Commit("b" * 40, 0, "Mochi", "Add the cache", ("cache.py",), 1),
+        ]
+
+        section = get_git_history_section(history, "cache", top_k=2)
+
+        assert section is not None
+        history.search.assert_called_once_with("cache", 2)
+        prompt = section.render()
+        self.assertIn("aaaaaaaaaa 1970-01-01 Fix the cache (cache.py)", prompt)
+        self.assertLess(prompt.index("Fix"), prompt.index("Add"))
+
+    def test_it_returns_none_without_matches(self) -> None:
+        """Test that there's no section if no commit matches."""
+        history = MagicMock()
+        history.search.return_value = []
+
+        self.assertIsNone(get_git_history_section(history, "q"))
+
+
+class TestGetDependencyApisSection(TestCase):
+    """Test the get_dependency_apis_section function."""
+
+    def test_it_includes_the_apis(self) -> None:
+        """Test that the matching APIs are included."""
+        index = MagicMock()
+        index.search.return_value = [
+            ApiSymbol("numpy", "numpy.linalg", "norm", "function", "norm(x)",
+                      "Matrix or vector norm.")
+        ]
+
+        section = get_dependency_apis_section(index, "norm", top_k=3)
+
+        assert section is not None
+        index.search.assert_called_once_with("norm", 3)
+        self.assertIn("numpy: numpy.linalg.norm(x) - Matrix or vector norm.",
+                      section.render())
+
+    def test_it_returns_none_without_matches(self) -> None:
+        """Test that there's no section if no API matches."""
+        index = MagicMock()
+        index.search.return_value = []
+
+        self.assertIsNone(get_dependency_apis_section(index, "q"))
@@ -0,0 +1,96 @@
+"""Test the prompt assembly."""
+
+from unittest import TestCase
+
+from mochi_code.prompts.prompt_assembly import (PromptSection, assemble_prompt,
+                                                text_section)
+
+
+def _count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TestPromptSection(TestCase):
+    """Test the PromptSection class."""
+
+    def test_it_renders_the_kept_items(self) -> None:
+        """Test that the left out items are summarised."""
+        section = PromptSection("deps", ("a", "b", "c"),
+                                template="Dependencies: {items}.",
+                                separator=", ",
+                                omitted=" and {count} more")
+
+        self.assertEqual(section.render(), "Dependencies: a, b, c.")
+        self.assertEqual(section.render(1), "Dependencies: a and 2 more.")
+        self.assertEqual(section.render(0), "")
+
+    def test_it_keeps_the_last_items(self) -> None:
+        """Test that the first items are left out with keep_last."""
+        section = PromptSection("history", ("1", "2", "3"),
+                                omitted="[{count} left out]",
+                                keep_last=True)
+
+        self.assertEqual(section.render(2), "[1 left out]\n2\n3")
+
+
+class TestAssemblePrompt(TestCase):
+    """Test the assemble_prompt function."""
+
+    def test_it_keeps_everything_within_budget(self) -> None:
+        """Test that the sections are joined when they fit."""
+        prompt = assemble_prompt([
+            PromptSection("a", ("one two",)),
+            PromptSection("empty", ()),
+            PromptSection("b", ("three",))
+        ], 100, _count_words)
+
+        self.assertEqual(prompt.text, "one two\n\nthree")
+        self.assertEqual(prompt.tokens, 3)
+        self.assertEqual(prompt.section_tokens, {"a": 2, "b": 1})
+        self.assertEqual(prompt.shrunk, ())
+
+    def test_it_shrinks_the_lowest_priority_first(self) -> None:
+        """Test that the required and higher priority sections are kept."""
+        words = tuple(f"w{i}" for i in range(10))
+        prompt = assemble_prompt([
+            PromptSection("instructions", words, required=True),
+            PromptSection("high", words, priority=2),
+            PromptSection("low", words, priority=1),
+        ], 25, _count_words)
+
+        self.assertEqual(prompt.section_tokens, {
+            "instructions": 10,
+            "high": 10,
+            "low": 5
+        })
+        self.assertEqual(prompt.shrunk, ("low",))
+        self.assertLessEqual(prompt.tokens, 25)
+
+    def test_it_leaves_out_sections(self) -> None:
+        """Test that sections are left out entirely if needed."""
+        prompt = assemble_prompt([
+            PromptSection("low", ("a b c",), priority=1),
+            PromptSection("query", ("d e",), required=True),
+        ], 2, _count_words)
+
+        self.assertEqual(prompt.text, "d e")
+        self.assertEqual(prompt.shrunk, ("low",))
+
+    def test_it_applies_the_section_budgets(self) -> None:
+        """Test that a section is capped at its own budget."""
+        section = text_section("code", "\n".join(["x y"] * 10), max_tokens=7)
+
+        prompt = assemble_prompt([section], 100, _count_words)
+
+        self.assertEqual(prompt.text, "x y\n[... 9 more lines]")
+        self.assertEqual(prompt.shrunk, ("code",))
+
+    def test_it_is_deterministic(self) -> None:
+        """Test that the same sections give the same prompt."""
+        sections = [
+            text_section("a", "\n".join(str(i) for i in range(100))),
+            PromptSection("b", tuple("xyz"), priority=1)
+        ]
+
+        self.assertEqual(assemble_prompt(sections, 50),
+                         assemble_prompt(sections, 50))
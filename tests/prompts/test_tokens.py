@@ -0,0 +1,35 @@
+"""Test the token counting."""
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from mochi_code.prompts.tokens import approximate_tokens, get_token_counter
+
+
+class TestApproximateTokens(TestCase):
+    """Test the approximate_tokens function."""
+
+    def test_it_counts_words_and_punctuation(self) -> None:
+        """Test that common words and punctuation are a token each."""
+        self.assertEqual(approximate_tokens(""), 0)
+        self.assertEqual(approximate_tokens("Hello world!"), 3)
+        self.assertEqual(approximate_tokens("don't"), 2)
+
+    def test_it_splits_long_words(self) -> None:
+        """Test that long identifiers count as several tokens."""
+        self.assertEqual(approximate_tokens("supercalifragilistic"), 4)
+        self.assertEqual(approximate_tokens("1234567"), 3)
+
+
+class TestGetTokenCounter(TestCase):
+    """Test the get_token_counter function."""
+
+    @patch("mochi_code.prompts.tokens.tiktoken", None)
+    def test_it_falls_back_to_the_approximation(self) -> None:
+        """Test that the approximation is used without tiktoken."""
+        get_token_counter.cache_clear()
+        try:
+            counter = get_token_counter("text-davinci-003")
+            self.assertEqual(counter("Hello world!"), 3)
+        finally:
+            get_token_counter.cache_clear()
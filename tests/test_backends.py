@@ -0,0 +1,124 @@
+"""Test the model backends."""
+
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.backends import (BackendConfig, FakeBackend, LocalBackend,
+                                 get_api_key, get_backend, load_backend_config)
+from mochi_code.commands.exceptions import MochiCannotContinue
+
+
+class TestLoadBackendConfig(TestCase):
+    """Test the load_backend_config function."""
+
+    def setUp(self) -> None:
+        # Create a temporary folder as the mochi config
+        self._config_path = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self._config_path)
+        self._env_patcher = patch.dict(os.environ, {}, clear=True)
+        self._env_patcher.start()
+
+    def tearDown(self) -> None:
+        self._env_patcher.stop()
+
+    def _write_config(self, content: str) -> None:
+        (self._config_path / "backend.json").write_text(content,
+                                                        encoding="utf-8")
+
+    def test_it_defaults_without_config(self) -> None:
+        """Test that a project without config uses the default backend."""
+        self.assertEqual(load_backend_config(self._config_path),
+                         BackendConfig())
+
+    def test_the_env_overrides_the_file(self) -> None:
+        """Test that the env vars take precedence over the project config."""
+        self._write_config(
+            json.dumps({
+                "backend": "local",
+                "model": "llama",
+                "temperature": 0.2
+            }))
+        os.environ["MOCHI_MODEL"] = "mistral"
+
+        config = load_backend_config(self._config_path)
+
+        self.assertEqual(
+            config,
+            BackendConfig(backend="local", model="mistral", temperature=0.2))
+        self.assertEqual(config.cache_name, "local/mistral")
+        self.assertEqual(config.get_temperature(0.9), 0.2)
+
+    def test_it_rejects_invalid_configs(self) -> None:
+        """Test that unknown keys, invalid values and JSON are reported."""
+        for content in [
+                '{"model": "llama", "colour": "blue"}', '{"timeout": "soon"}',
+                "not json", "[]"
+        ]:
+            self._write_config(content)
+            with self.assertRaises(MochiCannotContinue, msg=content):
+                load_backend_config(self._config_path)
+
+
+class TestGetBackend(TestCase):
+    """Test the get_backend function."""
+
+    def test_it_reuses_the_backends(self) -> None:
+        """Test that a backend is created once per config."""
+        backend = get_backend(BackendConfig(backend="fake", model="a"))
+
+        self.assertIs(get_backend(BackendConfig(backend="fake", model="a")),
+                      backend)
+        self.assertIsNot(get_backend(BackendConfig(backend="fake", model="b")),
+                         backend)
+
+    def test_it_rejects_unknown_backends(self) -> None:
+        """Test that the known backends are listed."""
+        with self.assertRaisesRegex(MochiCannotContinue, "fake, local"):
+            get_backend(BackendConfig(backend="unknown"))
+
+
+class TestFakeBackend(TestCase):
+    """Test the FakeBackend class."""
+
+    def test_it_streams_the_answer(self) -> None:
+        """Test that the tokens add up to the answer."""
+        backend = FakeBackend(BackendConfig(backend="fake"),
+                              lambda prompt: f"You said {prompt}")
+        tokens: list[str] = []
+
+        response = backend.complete("hi there", 0.5, on_token=tokens.append)
+
+        self.assertEqual(response, "You said hi there")
+        self.assertEqual(tokens, ["You", " said", " hi", " there"])
+
+
+class TestApiKey(TestCase):
+    """Test how the backends get the API key."""
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch("mochi_code.backends._read_keys_file")
+    def test_missing_key(self, mock_keys_file: MagicMock) -> None:
+        """Test that the key is only required by the OpenAI backend."""
+        mock_keys_file.return_value = {}
+
+        with self.assertRaises(MochiCannotContinue):
+            get_api_key()
+        self.assertIsNone(get_api_key(required=False))
+        LocalBackend(BackendConfig(backend="local"))
+
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "sk-env"}, clear=True)
+    @patch("mochi_code.backends._read_keys_file")
+    def test_key_precedence(self, mock_keys_file: MagicMock) -> None:
+        """Test that MOCHI_API_KEY comes first, the keys file last."""
+        mock_keys_file.return_value = {"OPENAI_API_KEY": "sk-file"}
+
+        self.assertEqual(get_api_key(), "sk-env")
+        os.environ["MOCHI_API_KEY"] = "sk-mochi"
+        self.assertEqual(get_api_key(), "sk-mochi")
+        del os.environ["MOCHI_API_KEY"], os.environ["OPENAI_API_KEY"]
+        self.assertEqual(get_api_key(), "sk-file")
@@ -0,0 +1,62 @@
+"""Smoke test the offline benchmarks, and ask end to end against the fake
+backend."""
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.fake_openai_server import FakeBackendConfig, FakeOpenAIServer
+from benchmarks.run_benchmarks import BENCHMARKS, run_benchmarks
+from mochi_code.commands.ask import ProjectContext, ask
+from mochi_code.prompts.prompt_assembly import text_section
+
+
+class TestFakeBackend(TestCase):
+    """Test running ask against the fake backend."""
+
+    def test_streams_answer(self) -> None:
+        """Test that ask streams the whole fake answer."""
+        config = FakeBackendConfig(responder=lambda _: "one two three")
+        tokens: list[str] = []
+
+        with FakeOpenAIServer(config) as server, \
+                patch.dict(os.environ, {"OPENAI_API_BASE": server.api_base,
+                                        "OPENAI_API_KEY": "sk-fake"}):
+            response = ask("How do I run the tests?",
+                           use_cache=False,
+                           project_context=ProjectContext(
+                               (text_section("project", "A python project."),),
+                               None),
+                           on_token=tokens.append)
+
+        self.assertEqual(server.stats.requests, 1)
+        self.assertEqual(server.stats.tokens, 3)
+        self.assertIn("A python project.", server.stats.prompts[0])
+        self.assertEqual(response.split(), ["one", "two", "three"])
+        self.assertEqual("".join(tokens), response)
+
+
+class TestRunBenchmarks(TestCase):
+    """Test the benchmark report."""
+
+    def test_report_is_machine_readable(self) -> None:
+        """Test that every result has the summary stats."""
+        report = run_benchmarks(["load_project_details", "search_mochi_config"],
+                                repeat=2,
+                                quick=True)
+
+        self.assertTrue(report["results"])
+        for result in report["results"]:
+            for key in ("name", "unit", "params", "runs", "mean", "median",
+                        "p95", "min", "max"):
+                self.assertIn(key, result)
+            self.assertEqual(result["runs"], 2)
+
+    def test_registered_benchmarks(self) -> None:
+        """Test that all the documented benchmarks are registered."""
+        self.assertEqual(
+            set(BENCHMARKS), {
+                "cli_cold_start", "search_mochi_config", "load_project_details",
+                "init", "ask_streaming", "ask_batch", "lexical_search",
+                "vector_search"
+            })
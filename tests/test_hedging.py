@@ -0,0 +1,215 @@
+"""Test the hedged model requests."""
+
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+from typing import Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from mochi_code.backends import BackendConfig, FakeBackend, TokenCallback
+from mochi_code.commands.exceptions import MochiCannotContinue
+from mochi_code.hedging import (HedgeBudget, HedgePolicy, hedged_complete,
+                                load_hedge_policy)
+
+_CONFIG = BackendConfig(backend="fake")
+_HEDGE_ENV = {
+    "MOCHI_HEDGE_AFTER": "1.5",
+    "MOCHI_HEDGE_RATE": "0.05",
+    "MOCHI_HEDGE_BACKEND": "local",
+}
+
+
+class _SlowBackend:  # pylint: disable=too-few-public-methods
+    """Starts streaming once released, or fails."""
+
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.config = _CONFIG
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+        self._error = error
+
+    def complete(self,
+                 prompt: str,
+                 temperature: float,
+                 max_tokens: int = 256,
+                 on_token: Optional[TokenCallback] = None) -> str:
+        """Wait to be released, then stream the prompt back."""
+        del temperature, max_tokens
+        self.release.wait(5)
+        if self._error is not None:
+            raise self._error
+        assert on_token is not None
+        try:
+            on_token("slow")
+            on_token(" answer")
+        except Exception:
+            self.cancelled.set()
+            raise
+        return prompt
+
+
+def _fast_backend() -> FakeBackend:
+    return FakeBackend(_CONFIG, lambda prompt: "fast answer")
+
+
+class TestHedgedComplete(TestCase):
+    """Test the hedged_complete function."""
+
+    def test_fast_requests_are_not_hedged(self) -> None:
+        """Test that no hedge is sent if the first token is on time."""
+        hedge_backend = MagicMock()
+        budget = HedgeBudget(balance=1)
+        tokens: list[str] = []
+
+        response = hedged_complete(_fast_backend(),
+                                   hedge_backend,
+                                   "prompt",
+                                   0.5,
+                                   tokens.append,
+                                   HedgePolicy(after=10),
+                                   budget=budget)
+
+        self.assertEqual(response, "fast answer")
+        self.assertEqual("".join(tokens), "fast answer")
+        hedge_backend.complete.assert_not_called()
+        self.assertTrue(budget.try_spend())
+
+    def test_the_first_to_stream_wins(self) -> None:
+        """Test that a slow request is hedged, and cancelled once it loses."""
+        slow_backend = _SlowBackend()
+        tokens: list[str] = []
+
+        response = hedged_complete(slow_backend,
+                                   _fast_backend(),
+                                   "prompt",
+                                   0.5,
+                                   tokens.append,
+                                   HedgePolicy(after=0.01),
+                                   budget=HedgeBudget(balance=1))
+        slow_backend.release.set()
+
+        self.assertEqual(response, "fast answer")
+        self.assertEqual("".join(tokens), "fast answer")
+        self.assertTrue(slow_backend.cancelled.wait(5))
+
+    def test_the_budget_caps_the_hedges(self) -> None:
+        """Test that slow requests aren't hedged once out of budget."""
+        budget = HedgeBudget(balance=1)
+        self.assertTrue(budget.try_spend())
+        slow_backend = _SlowBackend()
+        hedge_backend = MagicMock()
+        threading.Timer(0.1, slow_backend.release.set).start()
+
+        response = hedged_complete(slow_backend,
+                                   hedge_backend,
+                                   "prompt",
+                                   0.5,
+                                   lambda _: None,
+                                   HedgePolicy(after=0.01, max_rate=0.5),
+                                   budget=budget)
+
+        self.assertEqual(response, "prompt")
+        hedge_backend.complete.assert_not_called()
+        # Each request saves up half a hedge.
+        budget.record_request(0.5)
+        self.assertTrue(budget.try_spend())
+
+    def test_a_failed_request_is_not_hedged(self) -> None:
+        """Test that a request failing before the hedge delay is raised."""
+        failing_backend = _SlowBackend(ConnectionResetError())
+        failing_backend.release.set()
+        hedge_backend = MagicMock()
+
+        with self.assertRaises(ConnectionResetError):
+            hedged_complete(failing_backend,
+                            hedge_backend,
+                            "prompt",
+                            0.5,
+                            lambda _: None,
+                            HedgePolicy(after=10),
+                            budget=HedgeBudget(balance=1))
+        hedge_backend.complete.assert_not_called()
+
+    def test_the_hedge_answers_a_failed_request(self) -> None:
+        """Test that the hedge still answers if the slow request fails."""
+        failing_backend = _SlowBackend(ConnectionResetError())
+        hedge_backend = _SlowBackend()
+        threading.Timer(0.05, failing_backend.release.set).start()
+        threading.Timer(0.1, hedge_backend.release.set).start()
+
+        response = hedged_complete(failing_backend,
+                                   hedge_backend,
+                                   "prompt",
+                                   0.5,
+                                   lambda _: None,
+                                   HedgePolicy(after=0.01),
+                                   budget=HedgeBudget(balance=1))
+
+        self.assertEqual(response, "prompt")
+
+
+class TestHedgeBudget(TestCase):
+    """Test the HedgeBudget class."""
+
+    def setUp(self) -> None:
+        temp_path = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp_path)
+        self._path = temp_path / "cache/budget"
+
+    def test_hedges_are_earned(self) -> None:
+        """Test that a new budget has to earn its hedges."""
+        budget = HedgeBudget()
+        self.assertFalse(budget.try_spend())
+
+        for _ in range(10):
+            budget.record_request(0.1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+    def test_the_budget_is_shared(self) -> None:
+        """Test that the processes (e.g. one-off asks) share the budget."""
+        for _ in range(4):
+            # Each one-off ask has its own budget, with the same file.
+            HedgeBudget(path=self._path).record_request(0.25)
+
+        self.assertTrue(HedgeBudget(path=self._path).try_spend())
+        self.assertFalse(HedgeBudget(path=self._path).try_spend())
+
+    def test_invalid_budgets_are_empty(self) -> None:
+        """Test that an unreadable budget file has no hedges."""
+        self._path.parent.mkdir()
+        for content in ("not a number", "nan", "inf"):
+            self._path.write_text(content, encoding="utf-8")
+            self.assertFalse(HedgeBudget(path=self._path).try_spend())
+
+
+class TestHedgePolicy(TestCase):
+    """Test the hedge policy."""
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_it_is_off_by_default(self) -> None:
+        """Test that hedging is only on with a delay."""
+        self.assertIsNone(load_hedge_policy())
+        self.assertEqual(load_hedge_policy(2.0), HedgePolicy(after=2.0))
+
+    @patch.dict(os.environ, _HEDGE_ENV, clear=True)
+    def test_it_reads_the_env(self) -> None:
+        """Test the env vars, and the config of the alternate backend."""
+        policy = load_hedge_policy()
+
+        self.assertEqual(policy,
+                         HedgePolicy(after=1.5, max_rate=0.05, backend="local"))
+        assert policy is not None
+        self.assertEqual(
+            policy.get_hedge_config(
+                BackendConfig(model="gpt", api_base="https://api")),
+            BackendConfig(backend="local", model="gpt"))
+
+    @patch.dict(os.environ, {"MOCHI_HEDGE_RATE": "2"}, clear=True)
+    def test_it_rejects_invalid_rates(self) -> None:
+        """Test that the rate must be a share of the requests."""
+        with self.assertRaises(MochiCannotContinue):
+            load_hedge_policy(1.0)
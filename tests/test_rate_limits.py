@@ -0,0 +1,115 @@
+"""Test the rate limits of the backend requests."""
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from mochi_code.rate_limits import (BlockingRateLimiter, RateLimiter,
+                                    TokenBucket)
+
+
+class _FakeClock:
+    """A clock only moving forward when asked to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        """Move the clock forward, without waiting."""
+        self.now += seconds
+
+    def sleep_blocking(self, seconds: float) -> None:
+        """Move the clock forward, without blocking."""
+        self.now += seconds
+
+
+class TestTokenBucket(TestCase):
+    """Test the TokenBucket class."""
+
+    def test_it_refills_at_the_rate(self) -> None:
+        """Test that the budget comes back at the per minute rate."""
+        clock = _FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+
+        self.assertEqual(bucket.wait_time(1), 0)
+        bucket.take(1)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0)
+
+        clock.now += 0.5
+        self.assertAlmostEqual(bucket.wait_time(1), 0.5)
+
+    def test_it_caps_large_amounts(self) -> None:
+        """Test that amounts over the capacity wait for a full bucket, and are
+        paid for after."""
+        clock = _FakeClock()
+        bucket = TokenBucket(600, clock=clock)
+
+        self.assertEqual(bucket.wait_time(50), 0)
+        bucket.take(50)
+        # 40 tokens short of a full bucket, then 40 more tokens to pay for.
+        self.assertAlmostEqual(bucket.wait_time(1), 4.1)
+
+    def test_rate_must_be_positive(self) -> None:
+        """Test that a zero rate is rejected."""
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+
+
+class TestRateLimiter(TestCase):
+    """Test the RateLimiter class."""
+
+    def test_unlimited_by_default(self) -> None:
+        """Test that no limits never wait."""
+        limiter = RateLimiter()
+
+        waits = asyncio.run(_acquire_all(limiter, [1000] * 100))
+
+        self.assertEqual(waits, [0.0] * 100)
+
+    def test_it_spaces_requests(self) -> None:
+        """Test that requests settle at the requests per minute."""
+        clock = _FakeClock()
+        limiter = RateLimiter(requests_per_minute=120, clock=clock)
+
+        with patch("asyncio.sleep", clock.sleep):
+            asyncio.run(_acquire_all(limiter, [0] * 10))
+
+        # A burst of 2, then one every half second.
+        self.assertAlmostEqual(clock.now, 4.0)
+
+    def test_it_limits_tokens(self) -> None:
+        """Test that the tokens per minute are limited as well."""
+        clock = _FakeClock()
+        limiter = RateLimiter(requests_per_minute=6000,
+                              tokens_per_minute=6000,
+                              clock=clock)
+
+        with patch("asyncio.sleep", clock.sleep):
+            waits = asyncio.run(_acquire_all(limiter, [100, 100, 100]))
+
+        self.assertEqual(waits[0], 0.0)
+        self.assertAlmostEqual(sum(waits), 2.0)
+
+
+class TestBlockingRateLimiter(TestCase):
+    """Test the BlockingRateLimiter class."""
+
+    def test_it_spaces_requests(self) -> None:
+        """Test that requests settle at the requests per minute."""
+        clock = _FakeClock()
+        limiter = BlockingRateLimiter(requests_per_minute=120,
+                                      clock=clock,
+                                      sleep=clock.sleep_blocking)
+
+        waits = [limiter.acquire() for _ in range(10)]
+
+        # A burst of 2, then one every half second.
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(clock.now, 4.0)
+
+
+async def _acquire_all(limiter: RateLimiter, tokens: list[int]) -> list[float]:
+    return await asyncio.gather(*(limiter.acquire(t) for t in tokens))
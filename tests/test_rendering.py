@@ -0,0 +1,132 @@
+"""Test the rendering of the streamed answers."""
+
+import io
+import re
+import time
+from unittest import TestCase
+
+from mochi_code.rendering import MarkdownStyler, StreamRenderer, StreamStats
+
+_ANSWER = ("Run `pip install mochi`:\n```bash\npip install mochi\n```\n" +
+           "Then run it.")
+
+
+def _strip_styles(text: str) -> str:
+    return re.sub(r"\x1b\[\d+m", "", text)
+
+
+class _Terminal(io.StringIO):
+    """A terminal counting the writes."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes = 0
+
+    def isatty(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        return super().write(text)
+
+
+class TestMarkdownStyler(TestCase):
+    """Test the MarkdownStyler class."""
+
+    def test_it_styles_code(self) -> None:
+        """Test that the code blocks and inline code are styled."""
+        styler = MarkdownStyler()
+
+        styled = styler.feed(_ANSWER) + styler.finish()
+
+        self.assertEqual(_strip_styles(styled), _ANSWER)
+        self.assertIn("`\x1b[36mpip install mochi\x1b[0m`", styled)
+        self.assertIn("\x1b[2m```bash\x1b[0m\n\x1b[36mpip install mochi\n",
+                      styled)
+        self.assertTrue(styled.endswith("\x1b[0m\nThen run it."))
+
+    def test_streaming_doesnt_change_the_output(self) -> None:
+        """Test that the answer is styled the same, however it is split."""
+        styler = MarkdownStyler()
+        whole = styler.feed(_ANSWER) + styler.finish()
+
+        for size in [1, 2, 5]:
+            styler = MarkdownStyler()
+            chunks = [_ANSWER[i:i + size] for i in range(0, len(_ANSWER), size)]
+            streamed = "".join(styler.feed(chunk) for chunk in chunks)
+            self.assertEqual(streamed + styler.finish(), whole, size)
+
+    def test_it_closes_cut_blocks(self) -> None:
+        """Test that the styles are reset at the end of a cut answer."""
+        styler = MarkdownStyler()
+
+        styled = styler.feed("```python\nprint(") + styler.finish()
+
+        self.assertTrue(styled.endswith("print(\x1b[0m"))
+
+
+class TestStreamRenderer(TestCase):
+    """Test the StreamRenderer class."""
+
+    def test_pipes_get_the_plain_tokens(self) -> None:
+        """Test that a pipe gets every token, unstyled, straight away."""
+        output = io.StringIO()
+        renderer = StreamRenderer(output)
+
+        renderer("`a`")
+        self.assertEqual(output.getvalue(), "`a`")
+        renderer(" b")
+        stats = renderer.finish()
+
+        self.assertEqual(output.getvalue(), "`a` b")
+        self.assertEqual(stats.writes, 2)
+
+    def test_terminals_get_coalesced_writes(self) -> None:
+        """Test that the first token is written straight away, and the next
+        ones once per frame."""
+        terminal = _Terminal()
+        renderer = StreamRenderer(terminal, frame_rate=0.01, styled=False)
+
+        for token in ["one", " two", " three", " four"]:
+            renderer(token)
+        self.assertEqual(terminal.getvalue(), "one")
+        stats = renderer.finish()
+
+        self.assertEqual(terminal.getvalue(), "one two three four")
+        self.assertEqual((terminal.writes, stats.writes), (2, 2))
+        self.assertEqual(stats.tokens, 4)
+
+    def test_pauses_are_flushed(self) -> None:
+        """Test that the pending tokens are written even if the model
+        pauses."""
+        terminal = _Terminal()
+        renderer = StreamRenderer(terminal, frame_rate=100, styled=False)
+
+        renderer("one")
+        renderer(" two")
+        for _ in range(100):
+            if terminal.getvalue() == "one two":
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(terminal.getvalue(), "one two")
+        renderer.finish()
+
+    def test_it_measures_the_stream(self) -> None:
+        """Test the time to first token and the tokens per second."""
+        now = [0.0]
+        renderer = StreamRenderer(io.StringIO(), clock=lambda: now[0])
+
+        now[0] = 0.5
+        renderer("a")
+        now[0] = 1.5
+        renderer("b")
+        renderer("c")
+
+        self.assertEqual(
+            renderer.finish(),
+            StreamStats(time_to_first_token=0.5,
+                        tokens=3,
+                        stream_duration=1.0,
+                        writes=3))
+        self.assertEqual(renderer.finish().tokens_per_second, 2.0)
@@ -0,0 +1,257 @@
+"""Test the resilient requests to the model backends."""
+
+import random
+from typing import Callable
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from openai import error as openai_error
+
+from mochi_code.rate_limits import BlockingRateLimiter
+from mochi_code.resilience import (CircuitBreaker, CircuitOpenError,
+                                   DeadlineExceeded, RetryPolicy,
+                                   call_with_retries, deadline_scope,
+                                   get_request_timeout, get_retry_after,
+                                   is_retryable_error)
+
+
+class _FakeClock:
+    """A clock only moving forward when asked to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Move the clock forward, without waiting."""
+        self.now += seconds
+
+
+def _rate_limit_error(headers: dict[str, str]) -> openai_error.RateLimitError:
+    return openai_error.RateLimitError("Slow down",
+                                       http_status=429,
+                                       headers=headers)
+
+
+def _failing(errors: list[Exception]) -> Callable[[], str]:
+    """Make a request raising the errors in turn, then succeeding."""
+
+    def request() -> str:
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return request
+
+
+class TestIsRetryableError(TestCase):
+    """Test the is_retryable_error function."""
+
+    def test_transient_errors_are_retryable(self) -> None:
+        """Test that throttling, timeouts and server errors are retried."""
+        for error in [
+                _rate_limit_error({}),
+                openai_error.Timeout("Timed out"),
+                openai_error.APIConnectionError("Reset"),
+                openai_error.ServiceUnavailableError("Overloaded"),
+                openai_error.APIError("Bad gateway", http_status=502),
+                ConnectionResetError(),
+        ]:
+            self.assertTrue(is_retryable_error(error), error)
+
+    def test_other_errors_are_fatal(self) -> None:
+        """Test that errors a retry wouldn't fix are not retried."""
+        out_of_credits = openai_error.RateLimitError(
+            "No credits",
+            http_status=429,
+            json_body={"error": {
+                "code": "insufficient_quota"
+            }})
+        for error in [
+                out_of_credits,
+                openai_error.AuthenticationError("Bad key", http_status=401),
+                openai_error.InvalidRequestError("Too long", None),
+                openai_error.APIError("Bad request", http_status=400),
+                DeadlineExceeded(),
+                KeyError("OPENAI_API_KEY"),
+        ]:
+            self.assertFalse(is_retryable_error(error), error)
+
+
+class TestGetRetryAfter(TestCase):
+    """Test the get_retry_after function."""
+
+    def test_it_reads_the_headers(self) -> None:
+        """Test the seconds, milliseconds and missing headers."""
+        self.assertEqual(
+            get_retry_after(_rate_limit_error({"Retry-After": "3"})), 3.0)
+        self.assertEqual(
+            get_retry_after(_rate_limit_error({"retry-after-ms": "1500"})), 1.5)
+        self.assertIsNone(get_retry_after(_rate_limit_error({})))
+        self.assertIsNone(get_retry_after(ValueError()))
+
+    def test_it_reads_dates(self) -> None:
+        """Test that a date in the past means retrying now."""
+        error = _rate_limit_error(
+            {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(get_retry_after(error), 0.0)
+
+
+class TestCallWithRetries(TestCase):
+    """Test the call_with_retries function."""
+
+    def setUp(self) -> None:
+        self._clock = _FakeClock()
+        self._breaker = CircuitBreaker(clock=self._clock)
+        self._limiter = BlockingRateLimiter(clock=self._clock,
+                                            sleep=self._clock.sleep)
+
+    def _call(self, request: Callable[[], str], **kwargs) -> str:
+        kwargs.setdefault("breaker", self._breaker)
+        return call_with_retries(request,
+                                 limiter=self._limiter,
+                                 sleep=self._clock.sleep,
+                                 rng=random.Random(0),
+                                 **kwargs)
+
+    def test_it_retries_transient_errors(self) -> None:
+        """Test that transient errors are retried with a growing backoff."""
+        sleep = MagicMock(side_effect=self._clock.sleep)
+        request = _failing([openai_error.Timeout(), openai_error.Timeout()])
+
+        self.assertEqual(
+            call_with_retries(request,
+                              policy=RetryPolicy(base_delay=1.0),
+                              breaker=self._breaker,
+                              limiter=self._limiter,
+                              sleep=sleep,
+                              rng=random.Random(0)), "ok")
+
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertLessEqual(delays[0], 1.0)
+        self.assertLessEqual(delays[1], 2.0)
+
+    def test_it_stops_after_the_attempts(self) -> None:
+        """Test that the last error is raised once out of attempts."""
+        request = _failing(
+            [openai_error.Timeout("1"),
+             openai_error.Timeout("2")])
+
+        with self.assertRaisesRegex(openai_error.Timeout, "2"):
+            self._call(request, policy=RetryPolicy(max_attempts=2))
+
+    def test_it_does_not_retry_fatal_errors(self) -> None:
+        """Test that fatal errors are raised straight away."""
+        request = MagicMock(
+            side_effect=openai_error.AuthenticationError("Bad key"))
+
+        with self.assertRaises(openai_error.AuthenticationError):
+            self._call(request)
+        request.assert_called_once()
+
+    def test_it_honours_retry_after(self) -> None:
+        """Test that the delay asked by the server is used."""
+        request = _failing([_rate_limit_error({"Retry-After": "7"})])
+
+        self.assertEqual(self._call(request), "ok")
+        self.assertEqual(self._clock.now, 7.0)
+
+    def test_it_stops_at_the_deadline(self) -> None:
+        """Test that a retry is not attempted if it can't finish in time."""
+        request = _failing([_rate_limit_error({"Retry-After": "30"})])
+
+        with deadline_scope(10):
+            with self.assertRaises(DeadlineExceeded):
+                self._call(request)
+
+    def test_the_breaker_fails_fast(self) -> None:
+        """Test that the breaker opens after repeated failures, and closes
+        after a successful trial request."""
+        breaker = CircuitBreaker(failure_threshold=2,
+                                 reset_timeout=30,
+                                 clock=self._clock)
+        failing = MagicMock(side_effect=openai_error.Timeout())
+        policy = RetryPolicy(max_attempts=1)
+
+        for _ in range(2):
+            with self.assertRaises(openai_error.Timeout):
+                call_with_retries(failing, policy=policy, breaker=breaker)
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            call_with_retries(failing, policy=policy, breaker=breaker)
+        self.assertEqual(failing.call_count, 2)
+
+        self._clock.now += 30
+        self.assertEqual(
+            call_with_retries(_failing([]), policy=policy, breaker=breaker),
+            "ok")
+        self.assertFalse(breaker.is_open)
+
+    def _open_breaker(self) -> CircuitBreaker:
+        """Get a breaker that opened and is ready for a trial request."""
+        breaker = CircuitBreaker(failure_threshold=1,
+                                 reset_timeout=30,
+                                 clock=self._clock)
+        breaker.record_failure()
+        self._clock.now += 30
+        return breaker
+
+    def test_interrupted_trials_are_released(self) -> None:
+        """Test that an interrupted trial request doesn't block the next."""
+        breaker = self._open_breaker()
+
+        with self.assertRaises(KeyboardInterrupt):
+            self._call(MagicMock(side_effect=KeyboardInterrupt()),
+                       breaker=breaker)
+        with self.assertRaises(openai_error.AuthenticationError):
+            self._call(
+                MagicMock(side_effect=openai_error.AuthenticationError("Bad")),
+                breaker=breaker)
+
+        self.assertEqual(self._call(_failing([]), breaker=breaker), "ok")
+        self.assertFalse(breaker.is_open)
+
+    def test_the_limiter_does_not_hold_the_trial(self) -> None:
+        """Test that a failure waiting for the limiter doesn't start a trial."""
+        breaker = self._open_breaker()
+        limiter = MagicMock(spec=BlockingRateLimiter)
+        limiter.acquire.side_effect = [KeyboardInterrupt(), 0.0]
+
+        with self.assertRaises(KeyboardInterrupt):
+            call_with_retries(_failing([]), breaker=breaker, limiter=limiter)
+
+        self.assertEqual(
+            call_with_retries(_failing([]), breaker=breaker, limiter=limiter),
+            "ok")
+
+    def test_fatal_errors_are_neutral(self) -> None:
+        """Test that errors of the request (not the backend) don't count as
+        successes, nor as failures."""
+        breaker = CircuitBreaker(failure_threshold=2, clock=self._clock)
+        policy = RetryPolicy(max_attempts=1)
+
+        for error in (openai_error.Timeout(),
+                      openai_error.AuthenticationError("Bad key"),
+                      openai_error.Timeout()):
+            with self.assertRaises(type(error)):
+                self._call(MagicMock(side_effect=error),
+                           policy=policy,
+                           breaker=breaker)
+
+        self.assertTrue(breaker.is_open)
+
+
+class TestGetRequestTimeout(TestCase):
+    """Test the get_request_timeout function."""
+
+    def test_it_fits_the_deadline(self) -> None:
+        """Test that the timeout is shortened to the deadline."""
+        self.assertEqual(get_request_timeout(60), 60)
+        with deadline_scope(5):
+            timeout = get_request_timeout(60)
+            assert timeout is not None
+            self.assertLessEqual(timeout, 5)
+        self.assertIsNone(get_request_timeout(None))
@@ -0,0 +1,64 @@
+"""Test the cli startup cost, so it doesn't regress as commands are added."""
+
+import re
+import subprocess
+import sys
+from unittest import TestCase
+
+# Modules only the command implementations should need.
+_HEAVY_MODULES = ["langchain", "openai", "pydantic", "dotenv"]
+# Generous budget (in microseconds) for importing the cli entry point, the
+# backends alone take well over a second to import.
+_IMPORT_BUDGET_US = 400_000
+
+_IMPORT_TIME_PATTERN = re.compile(
+    r"^import time:\s+\d+ \|\s+(\d+) \|(\s*)([\w.]+)$")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Import the module in a fresh interpreter and collect the top level
+    cumulative import times (in microseconds) per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_PATTERN.match(line)
+        if match:
+            times[match.group(3)] = int(match.group(1))
+    return times
+
+
+class TestStartup(TestCase):
+    """Test the cost of importing the cli entry point."""
+
+    def test_does_not_import_backends(self) -> None:
+        """Test that the entry point doesn't import any of the backends."""
+        imported = _import_times("mochi_code.mochi")
+
+        self.assertIn("mochi_code.mochi", imported)
+        for module in _HEAVY_MODULES:
+            self.assertNotIn(module, imported)
+
+    def test_import_time_within_budget(self) -> None:
+        """Test that importing the entry point stays within the budget."""
+        imported = _import_times("mochi_code.mochi")
+
+        self.assertLess(imported["mochi_code.mochi"], _IMPORT_BUDGET_US)
+
+    def test_prints_the_help_without_a_terminal(self) -> None:
+        """Test that a bare mochi run by a script doesn't wait for input."""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "mochi_code.mochi"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=60)
+
+        self.assertIn("usage: mochi", result.stdout)
+        for module in _HEAVY_MODULES:
+            self.assertNotRegex(result.stderr, rf"(?m)\|\s*{module}$")
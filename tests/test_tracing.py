@@ -0,0 +1,150 @@
+"""Test the tracing module."""
+
+import io
+import json
+import os
+import pathlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from retry import retry
+
+from mochi_code import tracing
+from mochi_code.tracing import (TRACE_ENV_VAR, annotate, disable_tracing,
+                                enable_tracing, get_trace_output_path,
+                                get_tracer, mark, span, traced, write_trace)
+
+
+class TestDisabledTracing(TestCase):
+    """Test that tracing does nothing when disabled."""
+
+    def test_spans_are_no_ops(self) -> None:
+        """Test that nothing is recorded without a tracer."""
+        self.assertIsNone(get_tracer())
+
+        with span("disabled", some="arg"):
+            annotate(more="args")
+            mark("event")
+
+        self.assertIsNone(get_tracer())
+
+    def test_traced_calls_through(self) -> None:
+        """Test that traced functions behave the same when disabled."""
+
+        @traced("double")
+        def double(value: int) -> int:
+            return value * 2
+
+        self.assertEqual(double(21), 42)
+
+
+class TestEnabledTracing(TestCase):
+    """Test recording spans with tracing enabled."""
+
+    def setUp(self) -> None:
+        self._tracer = enable_tracing()
+
+    def tearDown(self) -> None:
+        disable_tracing()
+
+    def test_records_nested_spans(self) -> None:
+        """Test that nested spans are recorded with their depth and args."""
+        with span("outer", command="ask"):
+            with span("inner"):
+                annotate(tokens=10)
+            mark("first_token")
+
+        events = {event.name: event for event in self._tracer.events}
+        self.assertEqual(events["outer"].depth, 0)
+        self.assertEqual(events["outer"].args, {"command": "ask"})
+        self.assertEqual(events["inner"].depth, 1)
+        self.assertEqual(events["inner"].args, {"tokens": 10})
+        self.assertIsNone(events["first_token"].duration)
+        assert events["outer"].duration is not None
+        assert events["inner"].duration is not None
+        self.assertGreaterEqual(events["outer"].duration,
+                                events["inner"].duration)
+
+    def test_records_errors(self) -> None:
+        """Test that spans record the errors raised within them."""
+        with self.assertRaises(ValueError):
+            with span("failing"):
+                raise ValueError("Some error")
+
+        self.assertEqual(self._tracer.events[0].args, {"error": "ValueError"})
+
+    def test_retries_are_separate_spans(self) -> None:
+        """Test that each retried attempt of a traced function is a span."""
+        attempts = []
+
+        @retry(tries=3)
+        @traced("attempt")
+        def flaky() -> str:
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ValueError("Try again")
+            return "done"
+
+        self.assertEqual(flaky(), "done")
+
+        events = [e for e in self._tracer.events if e.name == "attempt"]
+        self.assertEqual(len(events), 3)
+        self.assertEqual([e.args.get("error") for e in events],
+                         ["ValueError", "ValueError", None])
+
+    def test_chrome_trace_format(self) -> None:
+        """Test the export to the Chrome trace event format."""
+        with span("work"):
+            mark("event")
+
+        trace = self._tracer.to_chrome_trace()
+        phases = {e["name"]: e["ph"] for e in trace["traceEvents"]}
+        self.assertEqual(phases, {"work": "X", "event": "i"})
+        json.dumps(trace)
+
+    def test_write_trace(self) -> None:
+        """Test that the trace file is written and the summary printed."""
+        with span("work"):
+            pass
+
+        with tempfile.TemporaryDirectory() as root_dir:
+            output_path = pathlib.Path(root_dir) / "trace.json"
+            summary = io.StringIO()
+            write_trace(self._tracer, output_path, summary)
+
+            with open(output_path, encoding="utf-8") as trace_file:
+                self.assertIn("traceEvents", json.load(trace_file))
+        self.assertIn("work", summary.getvalue())
+
+
+class TestGetTraceOutputPath(TestCase):
+    """Test the get_trace_output_path function."""
+
+    def test_disabled_by_default(self) -> None:
+        """Test that tracing is off without the flag or env."""
+        with patch.dict(os.environ, {TRACE_ENV_VAR: ""}):
+            self.assertIsNone(get_trace_output_path(False))
+        with patch.dict(os.environ, {TRACE_ENV_VAR: "0"}):
+            self.assertIsNone(get_trace_output_path(False))
+
+    def test_enabled_by_flag_or_env(self) -> None:
+        """Test that the flag or env enable tracing to a default path."""
+        with patch.dict(os.environ, {TRACE_ENV_VAR: ""}):
+            self.assertIsNotNone(get_trace_output_path(True))
+        with patch.dict(os.environ, {TRACE_ENV_VAR: "1"}):
+            self.assertIsNotNone(get_trace_output_path(False))
+
+    def test_env_path(self) -> None:
+        """Test that the env can set the trace path."""
+        with patch.dict(os.environ, {TRACE_ENV_VAR: "/tmp/trace.json"}):
+            self.assertEqual(get_trace_output_path(False),
+                             pathlib.Path("/tmp/trace.json"))
+
+    def test_module_level_tracer(self) -> None:
+        """Test that enabling twice keeps the same tracer."""
+        try:
+            self.assertIs(enable_tracing(), enable_tracing())
+            self.assertIs(tracing.get_tracer(), get_tracer())
+        finally:
+            disable_tracing()